@@ -0,0 +1,305 @@
+"""Dashboard and process capability aggregations.
+
+The aggregations are written once against a small dialect table and run on
+one of two engines:
+
+* ``duckdb``: the optional DuckDB package, which scans the SQLite file (the
+  analytics snapshot when enabled, see ``snapshot.py``) and the overlapping
+  archive databases through its ``sqlite`` extension with vectorised,
+  multi-threaded execution.  The file is attached read-only with all
+  columns read as text and converted explicitly, so SQLite's loose typing
+  never aborts a scan.
+* ``sqlite``: the same queries on a plain SQLite connection.
+
+``ANALYTICS_ENGINE = "auto"`` uses DuckDB when it is installed and falls back
+to SQLite when it is missing, its ``sqlite`` extension cannot be loaded or a
+query fails on it.  Every run is timed in ``minimes_analytics_seconds``.
+
+Both engines return partial aggregates per database (counts and sums, not
+averages), which are merged in Python, so the results do not depend on the
+engine or on how many archives the date range covers.
+"""
+
+import logging
+import math
+import os
+import time
+from contextlib import closing
+
+import archive
+import config
+import metrics
+
+try:
+    import duckdb
+except ImportError:  # 可选依赖：未安装时使用 SQLite
+    duckdb = None
+
+logger = logging.getLogger('minimes.analytics')
+
+ANALYTICS_DURATION = metrics.registry.register(metrics.Histogram(
+    'minimes_analytics_seconds', 'Duration of dashboard/capability aggregations by engine.', ('query', 'engine')))
+
+# SQL 方言：日期（YYYY-MM-DD）、数值与两个时间之间的小时数
+SQLITE_DIALECT = {
+    'date': 'DATE({})',
+    'number': '{}',
+    'hours': '(julianday({end}) - julianday({start})) * 24',
+}
+DUCKDB_DIALECT = {
+    'date': 'substr({}, 1, 10)',
+    'number': 'TRY_CAST({} AS DOUBLE)',
+    'hours': "date_diff('second', TRY_CAST({start} AS TIMESTAMP), TRY_CAST({end} AS TIMESTAMP)) / 3600.0",
+}
+
+
+class _SQLiteEngine:
+    name = 'sqlite'
+    dialect = SQLITE_DIALECT
+
+    def __init__(self, source):
+        self.conn = source.get_connection()
+
+    def schemas(self, start_date, end_date):
+        return ['main', *archive.attach_for_range(self.conn, start_date, end_date)]
+
+    def fetchall(self, sql, params=()):
+        return self.conn.execute(sql, params).fetchall()
+
+    def close(self):
+        self.conn.close()
+
+
+class _DuckDBEngine:
+    name = 'duckdb'
+    dialect = DUCKDB_DIALECT
+    _HOT_SCHEMA = 'production'
+
+    def __init__(self, source):
+        self.source = source
+        self.conn = duckdb.connect(':memory:')
+        try:
+            threads = getattr(config, 'ANALYTICS_DUCKDB_THREADS', None)
+            if threads:
+                self.conn.execute(f'SET threads = {int(threads)}')
+            memory_limit = getattr(config, 'ANALYTICS_DUCKDB_MEMORY_LIMIT', None)
+            if memory_limit:
+                self.conn.execute(f"SET memory_limit = '{memory_limit}'")
+            self.conn.execute('LOAD sqlite')
+            # SQLite 列类型不可靠，统一按文本读取后在 SQL 中显式转换
+            self.conn.execute('SET sqlite_all_varchar = true')
+            self._attach(getattr(source, 'path', None) or source.db_path, self._HOT_SCHEMA)
+        except BaseException:
+            self.conn.close()
+            raise
+
+    def _attach(self, path, schema):
+        literal = path.replace("'", "''")
+        self.conn.execute(f"ATTACH '{literal}' AS {schema} (TYPE SQLITE, READ_ONLY)")
+
+    def schemas(self, start_date, end_date):
+        with closing(self.source.get_connection()) as conn:
+            periods = archive.periods_for_range(conn, start_date, end_date)
+        schemas = [self._HOT_SCHEMA]
+        for period in periods:
+            path = archive.archive_path(period)
+            if not os.path.exists(path):
+                raise archive.ArchiveError(f'归档文件不存在: {os.path.basename(path)}')
+            schema = archive.schema_name(period)
+            self._attach(path, schema)
+            schemas.append(schema)
+        return schemas
+
+    def fetchall(self, sql, params=()):
+        return self.conn.execute(sql, list(params)).fetchall()
+
+    def close(self):
+        self.conn.close()
+
+
+def engine_name():
+    """Engine the next aggregation will try first."""
+    engine = getattr(config, 'ANALYTICS_ENGINE', 'auto')
+    if engine in ('auto', 'duckdb') and duckdb is not None:
+        return 'duckdb'
+    return 'sqlite'
+
+
+def _run(query, source, compute):
+    if engine_name() == 'duckdb':
+        started = time.perf_counter()
+        try:
+            with closing(_DuckDBEngine(source)) as engine:
+                result = compute(engine)
+        except duckdb.Error:
+            logger.warning('DuckDB %s aggregation failed, falling back to SQLite', query, exc_info=True)
+        else:
+            ANALYTICS_DURATION.observe(time.perf_counter() - started, query, 'duckdb')
+            return 'duckdb', result
+    started = time.perf_counter()
+    with closing(_SQLiteEngine(source)) as engine:
+        result = compute(engine)
+    ANALYTICS_DURATION.observe(time.perf_counter() - started, query, 'sqlite')
+    return 'sqlite', result
+
+
+def _time_condition(dialect, start_date, end_date):
+    date = dialect['date'].format('b.start_time')
+    condition, params = f' AND {date} >= ?', [start_date]
+    if end_date:
+        condition += f' AND {date} <= ?'
+        params.append(end_date)
+    return condition, params
+
+
+def dashboard_data(source, start_date, end_date=None):
+    """Dashboard figures for batches started in ``[start_date, end_date]``.
+
+    Returns ``(engine, data)``; raises ``archive.ArchiveError`` when an
+    overlapping archive file is missing.
+    """
+    def compute(engine):
+        dialect = engine.dialect
+        time_condition, params = _time_condition(dialect, start_date, end_date)
+        hours = dialect['hours'].format(start='e.start_time', end='e.end_time')
+        completed_status = getattr(config, 'BATCH_COMPLETED_STATUS', '已完成')
+
+        totals = {'total_batches': 0, 'active_batches': 0, 'completed_batches': 0}
+        segment_counts = {}
+        quality_totals = {}
+        recent_batches = []
+        equipment_totals = {}
+        schemas = engine.schemas(start_date, end_date)
+        for schema in schemas:
+            # 基本统计与各工艺段批号数量
+            for segment, count, active, completed in engine.fetchall(f'''
+                SELECT b.process_segment, COUNT(*),
+                       SUM(CASE WHEN b.status = '进行中' THEN 1 ELSE 0 END),
+                       SUM(CASE WHEN b.status = ? THEN 1 ELSE 0 END)
+                FROM {schema}.batches b
+                WHERE 1=1 {time_condition}
+                GROUP BY b.process_segment
+            ''', [completed_status] + params):
+                segment_counts[segment] = segment_counts.get(segment, 0) + count
+                totals['total_batches'] += count
+                totals['active_batches'] += active or 0
+                totals['completed_batches'] += completed or 0
+
+            # 质量合格率
+            for test_item, total, passed in engine.fetchall(f'''
+                SELECT q.test_item, COUNT(*), SUM(CASE WHEN q.result = '合格' THEN 1 ELSE 0 END)
+                FROM {schema}.quality_records q
+                JOIN {schema}.batches b ON q.batch_id = b.id
+                WHERE 1=1 {time_condition}
+                GROUP BY q.test_item
+            ''', params):
+                counts = quality_totals.setdefault(test_item, [0, 0])
+                counts[0] += total
+                counts[1] += passed or 0
+
+            # 最近完成的批号
+            for row in engine.fetchall(f'''
+                SELECT b.batch_number, b.product_name, b.process_segment,
+                       b.start_time, b.end_time, b.status
+                FROM {schema}.batches b
+                WHERE b.status = ? {time_condition}
+                ORDER BY b.end_time DESC
+                LIMIT 10
+            ''', [completed_status] + params):
+                recent_batches.append(dict(zip(
+                    ('batch_number', 'product_name', 'process_segment', 'start_time', 'end_time', 'status'), row
+                )))
+
+            # 设备运行数据：总时长与有效计时次数分开累计，合并后再求平均
+            for equipment_name, total_runs, total_hours, timed_runs in engine.fetchall(f'''
+                SELECT e.equipment_name, COUNT(*), SUM({hours}), COUNT({hours})
+                FROM {schema}.equipment_records e
+                JOIN {schema}.batches b ON e.batch_id = b.id
+                WHERE e.end_time IS NOT NULL {time_condition}
+                GROUP BY e.equipment_name
+            ''', params):
+                equipment = equipment_totals.setdefault(equipment_name, [0, 0.0, 0])
+                equipment[0] += total_runs
+                equipment[1] += total_hours or 0
+                equipment[2] += timed_runs
+
+        if len(schemas) > 1:
+            recent_batches.sort(key=lambda batch: (batch['end_time'] is not None, batch['end_time'] or ''), reverse=True)
+        return dict(
+            totals,
+            segment_counts=segment_counts,
+            quality_rates={
+                test_item: {'total': total, 'passed': passed, 'rate': passed / total if total > 0 else 0}
+                for test_item, (total, passed) in quality_totals.items()
+            },
+            recent_batches=recent_batches[:10],
+            equipment_data={
+                name: {'total_runs': runs, 'avg_hours': hours_sum / timed if timed else 0}
+                for name, (runs, hours_sum, timed) in equipment_totals.items()
+            },
+        )
+
+    return _run('dashboard', source, compute)
+
+
+def capability_stats(source, start_date, end_date=None, test_item=None):
+    """Process capability (Cp/Cpk) of the numeric quality results, per test item and spec limits.
+
+    Returns ``(engine, rows)``.  ``cp`` needs both limits, ``cpk`` at least
+    one; both are None when the sample standard deviation is 0 or undefined.
+    """
+    def compute(engine):
+        dialect = engine.dialect
+        time_condition, params = _time_condition(dialect, start_date, end_date)
+        value = dialect['number'].format('q.test_value')
+        lower = dialect['number'].format('q.standard_min')
+        upper = dialect['number'].format('q.standard_max')
+        item_condition = ''
+        if test_item:
+            item_condition = ' AND q.test_item = ?'
+            params = params + [test_item]
+
+        # 按 (检测项, 规格下限, 规格上限) 累计样本数、和与平方和，跨归档库合并
+        groups = {}
+        for schema in engine.schemas(start_date, end_date):
+            for item, lsl, usl, count, total, squares, minimum, maximum in engine.fetchall(f'''
+                SELECT q.test_item, {lower}, {upper}, COUNT({value}), SUM({value}),
+                       SUM({value} * {value}), MIN({value}), MAX({value})
+                FROM {schema}.quality_records q
+                JOIN {schema}.batches b ON q.batch_id = b.id
+                WHERE {value} IS NOT NULL {time_condition}{item_condition}
+                GROUP BY q.test_item, {lower}, {upper}
+            ''', params):
+                group = groups.get((item, lsl, usl))
+                if group is None:
+                    groups[(item, lsl, usl)] = [count, total, squares, minimum, maximum]
+                else:
+                    group[0] += count
+                    group[1] += total
+                    group[2] += squares
+                    group[3] = min(group[3], minimum)
+                    group[4] = max(group[4], maximum)
+
+        rows = []
+        for (item, lsl, usl), (count, total, squares, minimum, maximum) in groups.items():
+            mean = total / count
+            stddev = math.sqrt(max(0.0, (squares - total * total / count) / (count - 1))) if count > 1 else None
+            cp = cpk = None
+            if stddev:
+                if lsl is not None and usl is not None:
+                    cp = (usl - lsl) / (6 * stddev)
+                margins = [margin for margin in (
+                    None if usl is None else usl - mean,
+                    None if lsl is None else mean - lsl,
+                ) if margin is not None]
+                if margins:
+                    cpk = min(margins) / (3 * stddev)
+            rows.append({
+                'test_item': item, 'standard_min': lsl, 'standard_max': usl, 'count': count,
+                'mean': mean, 'stddev': stddev, 'min': minimum, 'max': maximum, 'cp': cp, 'cpk': cpk,
+            })
+        rows.sort(key=lambda row: (row['test_item'], row['standard_min'] is None, row['standard_min'] or 0,
+                                   row['standard_max'] is None, row['standard_max'] or 0))
+        return rows
+
+    return _run('capability', source, compute)
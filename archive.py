@@ -0,0 +1,270 @@
+"""Archive databases for closed batch groups.
+
+``archive_batches`` moves batch groups (all segments of one batch number and
+product) whose segments are all completed and ended more than
+``ARCHIVE_AFTER_MONTHS`` ago, together with their material, equipment and
+quality records, into per-period SQLite files under ``ARCHIVE_DIR``
+(``production_<period>.db``, period = year or month of the group's first
+start time).  The hot database keeps ``archive_index`` (date range of every
+archive file) and ``archived_batches`` (where each archived batch went).
+
+Each chunk is copied and committed into the archive first and only then
+deleted from the hot database, while a second connection holds the hot
+write lock; an interrupted run leaves duplicates that the next run replaces,
+never lost rows.  The deletes are journaled with op ``archive`` rather than
+``delete``, so change feeds report the groups as archived, not removed.
+
+Read paths call ``attach_for_range``/``attach_for_query`` to ATTACH the
+archives whose date range overlaps the requested one and build their SQL
+over the returned schemas (see ``query_builder.federated_query``);
+``connect`` opens a single archive for batch detail pages.
+"""
+
+import logging
+import os
+import sqlite3
+from contextlib import closing
+
+import config
+import metrics
+
+logger = logging.getLogger('minimes.archive')
+
+# 归档的表：表名 -> 关联批号的列
+ARCHIVED_TABLES = (
+    ('batches', 'id'),
+    ('material_records', 'batch_id'),
+    ('equipment_records', 'batch_id'),
+    ('quality_records', 'batch_id'),
+)
+
+# 归档库中的索引：(索引名, 表名, 列)
+ARCHIVE_INDEXES = (
+    ('idx_batches_start', 'batches', 'start_time'),
+    ('idx_batches_group', 'batches', 'batch_number, product_name'),
+    ('idx_material_batch', 'material_records', 'batch_id'),
+    ('idx_equipment_batch', 'equipment_records', 'batch_id'),
+    ('idx_quality_batch', 'quality_records', 'batch_id'),
+)
+
+_PERIOD_FORMATS = {'year': '%Y', 'month': '%Y-%m'}
+_TARGET_SCHEMA = 'archive_target'
+
+
+class ArchiveError(Exception):
+    pass
+
+
+def archive_path(period):
+    return os.path.join(config.ARCHIVE_DIR, f'production_{period}.db')
+
+
+def schema_name(period):
+    return 'archive_' + period.replace('-', '_')
+
+
+def _columns(conn, schema, table):
+    return [(row[1], row[2], row[5]) for row in conn.execute(f'PRAGMA {schema}.table_info({table})')]
+
+
+def _sync_schema(conn, schema):
+    """Create the archived tables in ``schema`` and add columns the hot tables gained since."""
+    for table, _ in ARCHIVED_TABLES:
+        existing = {name for name, _, _ in _columns(conn, schema, table)}
+        hot_columns = _columns(conn, 'main', table)
+        if not existing:
+            definitions = ', '.join(
+                f'{name} INTEGER PRIMARY KEY' if pk else f'{name} {column_type}'
+                for name, column_type, pk in hot_columns
+            )
+            conn.execute(f'CREATE TABLE {schema}.{table} ({definitions})')
+            continue
+        for name, column_type, _ in hot_columns:
+            if name not in existing:
+                conn.execute(f'ALTER TABLE {schema}.{table} ADD COLUMN {name} {column_type}')
+    for index_name, table, columns in ARCHIVE_INDEXES:
+        conn.execute(f'CREATE INDEX IF NOT EXISTS {schema}.{index_name} ON {table} ({columns})')
+
+
+def find_closed_groups(conn, months=None):
+    """Batch groups eligible for archiving, oldest period first."""
+    months = config.ARCHIVE_AFTER_MONTHS if months is None else months
+    period_format = _PERIOD_FORMATS[getattr(config, 'ARCHIVE_PERIOD', 'year')]
+    return conn.execute(f'''
+        SELECT batch_number, product_name, strftime('{period_format}', MIN(start_time)) AS period,
+               COUNT(*) AS batch_count
+          FROM batches
+         GROUP BY batch_number, product_name
+        HAVING SUM(status != ?) = 0
+           AND COUNT(end_time) = COUNT(*)
+           AND MIN(start_time) IS NOT NULL
+           AND MAX(end_time) < datetime('now', ?)
+         ORDER BY period, batch_number, product_name
+    ''', (getattr(config, 'BATCH_COMPLETED_STATUS', '已完成'), f'-{int(months)} months')).fetchall()
+
+
+def archive_batches(database, months=None, dry_run=False):
+    """Move closed batch groups into the period archives.
+
+    Returns ``{'groups', 'batches', 'records', 'periods'}``; with
+    ``dry_run`` nothing is moved and ``records`` stays 0.
+    """
+    summary = {'groups': 0, 'batches': 0, 'records': 0, 'periods': []}
+    with closing(database.get_connection()) as conn:
+        groups = find_closed_groups(conn, months)
+
+    by_period = {}
+    for group in groups:
+        by_period.setdefault(group['period'], []).append(group)
+    chunk_size = max(1, getattr(config, 'ARCHIVE_CHUNK_GROUPS', 200))
+
+    for period, period_groups in by_period.items():
+        summary['periods'].append(period)
+        summary['groups'] += len(period_groups)
+        if dry_run:
+            summary['batches'] += sum(group['batch_count'] for group in period_groups)
+            continue
+        os.makedirs(config.ARCHIVE_DIR, exist_ok=True)
+        with closing(database.get_connection()) as lock_conn, closing(database.get_connection()) as copy_conn:
+            lock_conn.isolation_level = None
+            copy_conn.isolation_level = None
+            copy_conn.execute(f'ATTACH DATABASE ? AS {_TARGET_SCHEMA}', (archive_path(period),))
+            _sync_schema(copy_conn, _TARGET_SCHEMA)
+            for start in range(0, len(period_groups), chunk_size):
+                batches, records = _move_chunk(lock_conn, copy_conn, period, period_groups[start:start + chunk_size])
+                summary['batches'] += batches
+                summary['records'] += records
+        logger.info('archived %d batch groups into %s', len(period_groups), archive_path(period))
+    return summary
+
+
+def _move_chunk(lock_conn, copy_conn, period, groups):
+    # 先持有主库写锁，保证复制与删除之间没有新的写入
+    lock_conn.execute('BEGIN IMMEDIATE')
+    try:
+        batch_ids = []
+        for group in groups:
+            batch_ids.extend(row[0] for row in lock_conn.execute(
+                'SELECT id FROM batches WHERE batch_number = ? AND product_name = ?',
+                (group['batch_number'], group['product_name'])
+            ))
+        placeholders = ', '.join('?' * len(batch_ids))
+
+        # 第一步：写入并提交归档库（只写归档文件）
+        records = 0
+        copy_conn.execute('BEGIN')
+        try:
+            for table, key in ARCHIVED_TABLES:
+                columns = ', '.join(name for name, _, _ in _columns(copy_conn, 'main', table))
+                cursor = copy_conn.execute(
+                    f'''INSERT OR REPLACE INTO {_TARGET_SCHEMA}.{table} ({columns})
+                        SELECT {columns} FROM main.{table} WHERE {key} IN ({placeholders})''',
+                    batch_ids
+                )
+                if table != 'batches':
+                    records += cursor.rowcount
+            copy_conn.execute('COMMIT')
+        except BaseException:
+            if copy_conn.in_transaction:
+                copy_conn.execute('ROLLBACK')
+            raise
+        min_date, max_date, batch_count = copy_conn.execute(
+            f'SELECT MIN(DATE(start_time)), MAX(DATE(start_time)), COUNT(*) FROM {_TARGET_SCHEMA}.batches'
+        ).fetchone()
+
+        # 第二步：登记并从主库删除
+        lock_conn.execute(
+            f'''INSERT OR REPLACE INTO archived_batches (batch_id, batch_number, product_name, period)
+                SELECT id, batch_number, product_name, ? FROM batches WHERE id IN ({placeholders})''',
+            [period] + batch_ids
+        )
+        journal_seq = lock_conn.execute(
+            "SELECT COALESCE(MAX(seq), 0) FROM sqlite_sequence WHERE name = 'change_journal'"
+        ).fetchone()[0]
+        for table, key in reversed(ARCHIVED_TABLES):
+            lock_conn.execute(f'DELETE FROM {table} WHERE {key} IN ({placeholders})', batch_ids)
+        # 删除触发器记下的是 delete；改记为 archive，客户端据此区分归档与删除
+        lock_conn.execute(
+            "UPDATE change_journal SET op = 'archive' WHERE seq > ? AND op = 'delete'", (journal_seq,)
+        )
+        lock_conn.execute(
+            '''INSERT OR REPLACE INTO archive_index
+               (period, file_name, min_start_date, max_start_date, batch_count, updated_at)
+               VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP)''',
+            (period, os.path.basename(archive_path(period)), min_date, max_date, batch_count)
+        )
+        lock_conn.execute('COMMIT')
+    except BaseException:
+        if lock_conn.in_transaction:
+            lock_conn.execute('ROLLBACK')
+        raise
+    return len(batch_ids), records
+
+
+# 读取
+def periods_for_range(conn, start_date=None, end_date=None):
+    """Archive periods whose date range overlaps ``[start_date, end_date]``."""
+    return [row[0] for row in conn.execute(
+        '''SELECT period FROM archive_index
+            WHERE (? IS NULL OR max_start_date >= ?) AND (? IS NULL OR min_start_date <= ?)
+            ORDER BY period''',
+        (start_date, start_date, end_date, end_date)
+    )]
+
+
+def attach_for_range(conn, start_date=None, end_date=None):
+    """ATTACH the archives overlapping ``[start_date, end_date]``; returns their schema names.
+
+    Dates are ``YYYY-MM-DD`` strings (``None`` = unbounded).  Archives
+    already attached to ``conn`` are reused.
+    """
+    periods = periods_for_range(conn, start_date, end_date)
+    if not periods:
+        return []
+
+    attached = {row[1] for row in conn.execute('PRAGMA database_list')}
+    limit = conn.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED) if hasattr(conn, 'getlimit') else 10
+    schemas = []
+    for period in periods:
+        schema = schema_name(period)
+        if schema not in attached:
+            path = archive_path(period)
+            if not os.path.exists(path):
+                raise ArchiveError(f'归档文件不存在: {os.path.basename(path)}')
+            # database_list 含 main 与 temp
+            if len(attached) - 2 >= limit:
+                raise ArchiveError('查询范围涉及的归档文件过多，请缩小日期范围')
+            conn.execute(f'ATTACH DATABASE ? AS {schema}', (path,))
+            attached.add(schema)
+        schemas.append(schema)
+    return schemas
+
+
+def attach_for_query(conn, args):
+    """``attach_for_range`` for the ``start_date``/``end_date`` query arguments."""
+    return attach_for_range(conn, args.get('start_date') or None, args.get('end_date') or None)
+
+
+def batch_period(conn, batch_id):
+    row = conn.execute('SELECT period FROM archived_batches WHERE batch_id = ?', (batch_id,)).fetchone()
+    return row[0] if row else None
+
+
+def connect(database, period):
+    """Connection to one archive with the hot ``users`` table visible, for batch detail reads."""
+    path = archive_path(period)
+    if not os.path.exists(path):
+        raise ArchiveError(f'归档文件不存在: {os.path.basename(path)}')
+    instrumented = getattr(config, 'METRICS_ENABLED', False) or getattr(config, 'SLOW_QUERY_THRESHOLD_MS', None)
+    conn = sqlite3.connect(
+        path, timeout=getattr(config, 'DATABASE_BUSY_TIMEOUT', 5),
+        factory=metrics.InstrumentedConnection if instrumented else sqlite3.Connection
+    )
+    conn.row_factory = sqlite3.Row
+    conn.execute('ATTACH DATABASE ? AS hot', (database.db_path,))
+    conn.execute('CREATE TEMP VIEW users AS SELECT * FROM hot.users')
+    return conn
+
+
+def list_archives(conn):
+    return [dict(row) for row in conn.execute('SELECT * FROM archive_index ORDER BY period')]
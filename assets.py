@@ -0,0 +1,55 @@
+"""Runtime lookup of fingerprinted assets built by ``tools/build_assets.py``.
+
+``asset_path('js/main.js')`` returns the hashed file name from
+``static/dist/manifest.json`` (``js/main.3fa2c1d0e4.js``) or ``None`` when
+the assets have not been built, in which case templates fall back to the
+plain ``/static`` file.  The manifest is re-read when its mtime changes.
+"""
+
+import json
+import os
+import threading
+
+import config
+
+_MANIFEST = {}
+_MANIFEST_MTIME = None
+_MANIFEST_LOCK = threading.Lock()
+
+# 预压缩文件：(Content-Encoding, 文件后缀)，按优先级排列
+PRECOMPRESSED_VARIANTS = (('br', '.br'), ('gzip', '.gz'))
+
+
+def load_manifest():
+    global _MANIFEST, _MANIFEST_MTIME
+    try:
+        mtime = os.path.getmtime(config.ASSET_MANIFEST_PATH)
+    except OSError:
+        _MANIFEST, _MANIFEST_MTIME = {}, None
+        return _MANIFEST
+
+    if mtime != _MANIFEST_MTIME:
+        with _MANIFEST_LOCK:
+            if mtime != _MANIFEST_MTIME:
+                try:
+                    with open(config.ASSET_MANIFEST_PATH, 'r', encoding='utf-8') as handle:
+                        manifest = json.load(handle) or {}
+                except (OSError, ValueError):
+                    manifest = {}
+                _MANIFEST, _MANIFEST_MTIME = manifest, mtime
+    return _MANIFEST
+
+
+def asset_path(filename):
+    return load_manifest().get(filename)
+
+
+def choose_variant(filename, accept_encodings):
+    """Pick the best precompressed sibling of ``filename`` the client accepts.
+
+    Returns ``(encoding, filename)``; ``encoding`` is ``None`` for the plain file.
+    """
+    for encoding, suffix in PRECOMPRESSED_VARIANTS:
+        if accept_encodings[encoding] and os.path.isfile(os.path.join(config.ASSET_DIST_DIR, filename + suffix)):
+            return encoding, filename + suffix
+    return None, filename
@@ -0,0 +1,216 @@
+"""Garbage collection of attachment files nothing references any more.
+
+Deleting batches or records, and updates that drop entries from
+``existing_attachments``, remove the database rows but leave their files
+under ``download/``.  ``collect`` reconciles the two sides as a sorted merge:
+
+* the files under the upload root, walked directory by directory in path
+  order (files directly in the root are not attachments and are ignored);
+* the distinct paths in the ``attachments_json`` columns of the record
+  tables, ordered by SQLite, of the production database and of every archive
+  database (``archive.py``), merged with ``heapq.merge``.
+
+Neither side is loaded into memory.  Files on disk without a reference and
+older than ``ATTACHMENT_GC_MIN_AGE`` (uploads are saved before their record
+is committed) are checked once more against the production database and then
+moved into a dated folder under ``ATTACHMENT_QUARANTINE_DIR``, keeping their
+relative path so they can be moved back.  Quarantine folders older than
+``ATTACHMENT_QUARANTINE_DAYS`` are deleted by ``purge_quarantine``.
+"""
+
+import heapq
+import logging
+import os
+import shutil
+import sqlite3
+import time
+from contextlib import ExitStack, closing
+from datetime import datetime, timedelta
+from urllib.parse import quote
+
+import archive
+import config
+
+logger = logging.getLogger('minimes.attachment_gc')
+
+ATTACHMENT_TABLES = ('material_records', 'equipment_records', 'quality_records')
+
+_QUARANTINE_FOLDER_FORMAT = '%Y%m%d%H%M%S'
+
+# 记录中的路径统一为 / 分隔，与遍历文件系统得到的相对路径一致
+_PATH_EXPRESSION = "replace(j.value, '\\', '/')"
+
+
+def _references_sql():
+    arms = [
+        f"""SELECT {_PATH_EXPRESSION} AS path
+              FROM {table} AS r,
+                   json_each(CASE WHEN json_valid(r.attachments_json) THEN r.attachments_json ELSE '[]' END) AS j
+             WHERE j.type = 'text' AND j.value != ''"""
+        for table in ATTACHMENT_TABLES
+    ]
+    # UNION 去重；SQLite 与 Python 的字符串排序一致（UTF-8 字节序即码点序）
+    return '\nUNION\n'.join(arms) + '\nORDER BY path'
+
+
+def _iter_references(conn):
+    for (path,) in conn.execute(_references_sql()):
+        yield path
+
+
+def _iter_files(root, relative=''):
+    """``(relative_path, stat)`` of the files below ``root``, in string order of the path."""
+    try:
+        entries = list(os.scandir(os.path.join(root, relative) if relative else root))
+    except FileNotFoundError:
+        return
+    # 目录按 "name/" 参与排序，保证与完整路径的字符串顺序一致（"a.txt" < "a/x"）
+    keyed = sorted(
+        (entry.name + '/' if entry.is_dir(follow_symlinks=False) else entry.name, entry) for entry in entries
+    )
+    for key, entry in keyed:
+        path = f'{relative}/{entry.name}' if relative else entry.name
+        if key.endswith('/'):
+            yield from _iter_files(root, path)
+        elif relative and entry.is_file(follow_symlinks=False):
+            yield path, entry.stat(follow_symlinks=False)
+
+
+def _archive_connections(database, stack):
+    with closing(database.get_connection()) as conn:
+        periods = [entry['period'] for entry in archive.list_archives(conn)]
+    connections = []
+    for period in periods:
+        path = archive.archive_path(period)
+        # 归档库缺失时无法确认其中的引用，不能清理
+        if not os.path.exists(path):
+            raise archive.ArchiveError(f'归档文件不存在: {os.path.basename(path)}')
+        connections.append(stack.enter_context(closing(sqlite3.connect(f'file:{quote(path)}?mode=ro', uri=True))))
+    return connections
+
+
+def _dedupe(paths):
+    previous = None
+    for path in paths:
+        if path != previous:
+            yield path
+            previous = path
+
+
+def _remove_empty_parents(root, relative):
+    parent = os.path.dirname(relative)
+    while parent:
+        try:
+            os.rmdir(os.path.join(root, parent))
+        except OSError:
+            break
+        parent = os.path.dirname(parent)
+
+
+def collect(database, root=None, dry_run=False, min_age=None):
+    """Quarantine unreferenced attachment files; returns a summary dict.
+
+    ``orphaned_files``/``orphaned_bytes`` count the unreferenced files found,
+    ``quarantined_*`` those moved (0 with ``dry_run``); ``missing_files``
+    counts references whose file does not exist.
+    """
+    root = os.path.abspath(root or config.UPLOAD_FOLDER)
+    min_age = getattr(config, 'ATTACHMENT_GC_MIN_AGE', 0) if min_age is None else min_age
+    cutoff = time.time() - min_age
+    quarantine = os.path.join(config.ATTACHMENT_QUARANTINE_DIR, datetime.now().strftime(_QUARANTINE_FOLDER_FORMAT))
+    summary = {
+        'scanned_files': 0, 'referenced_files': 0, 'missing_files': 0, 'recent_files': 0,
+        'orphaned_files': 0, 'orphaned_bytes': 0, 'quarantined_files': 0, 'quarantined_bytes': 0,
+        'quarantine_dir': None if dry_run else quarantine,
+    }
+
+    with ExitStack() as stack:
+        check_conn = stack.enter_context(closing(database.get_connection()))
+        # 候选文件暂存在临时表中（超出缓存时落盘），不占用进程内存
+        check_conn.execute('CREATE TEMP TABLE gc_candidates (path TEXT PRIMARY KEY, size INTEGER)')
+
+        # heapq.merge 按顺序启动各游标：先读主库再读归档库，
+        # 归档过程先提交归档库再删除主库记录，迁移中的引用不会两边都漏掉
+        main_conn = stack.enter_context(closing(database.get_connection()))
+        streams = [_iter_references(main_conn)]
+        streams.extend(_iter_references(conn) for conn in _archive_connections(database, stack))
+        references = _dedupe(heapq.merge(*streams))
+
+        reference = next(references, None)
+        for path, stat in _iter_files(root):
+            summary['scanned_files'] += 1
+            while reference is not None and reference < path:
+                summary['missing_files'] += 1
+                reference = next(references, None)
+            if reference == path:
+                summary['referenced_files'] += 1
+                reference = next(references, None)
+            elif stat.st_mtime > cutoff:
+                summary['recent_files'] += 1
+            else:
+                check_conn.execute('INSERT INTO gc_candidates (path, size) VALUES (?, ?)', (path, stat.st_size))
+        while reference is not None:
+            summary['missing_files'] += 1
+            reference = next(references, None)
+
+        # 扫描期间可能有新的引用（如复制批号），移动前按主库当前数据再确认一次
+        orphans = check_conn.execute(
+            f'SELECT path, size FROM gc_candidates WHERE path NOT IN (SELECT path FROM ({_references_sql()})) ORDER BY path'
+        )
+        for path, size in orphans:
+            summary['orphaned_files'] += 1
+            summary['orphaned_bytes'] += size
+            if dry_run:
+                continue
+            target = os.path.join(quarantine, path)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            try:
+                shutil.move(os.path.join(root, path), target)
+            except FileNotFoundError:
+                continue
+            _remove_empty_parents(root, path)
+            summary['quarantined_files'] += 1
+            summary['quarantined_bytes'] += size
+
+    logger.info(
+        '%s %d orphaned attachments (%d bytes) of %d files under %s',
+        'found' if dry_run else 'quarantined', summary['orphaned_files'], summary['orphaned_bytes'],
+        summary['scanned_files'], root
+    )
+    return summary
+
+
+def purge_quarantine(days=None, dry_run=False):
+    """Delete quarantine folders older than ``days``; returns ``{'purged_files', 'reclaimed_bytes'}``."""
+    days = getattr(config, 'ATTACHMENT_QUARANTINE_DAYS', 30) if days is None else days
+    cutoff = datetime.now() - timedelta(days=days)
+    summary = {'purged_files': 0, 'reclaimed_bytes': 0}
+    try:
+        folders = sorted(os.listdir(config.ATTACHMENT_QUARANTINE_DIR))
+    except FileNotFoundError:
+        return summary
+    for name in folders:
+        try:
+            quarantined_at = datetime.strptime(name, _QUARANTINE_FOLDER_FORMAT)
+        except ValueError:
+            continue
+        if quarantined_at >= cutoff:
+            continue
+        folder = os.path.join(config.ATTACHMENT_QUARANTINE_DIR, name)
+        for directory, _, files in os.walk(folder):
+            for file_name in files:
+                summary['purged_files'] += 1
+                summary['reclaimed_bytes'] += os.lstat(os.path.join(directory, file_name)).st_size
+        if not dry_run:
+            shutil.rmtree(folder)
+    if summary['purged_files']:
+        logger.info('%s %d quarantined attachments (%d bytes)', 'would purge' if dry_run else 'purged',
+                    summary['purged_files'], summary['reclaimed_bytes'])
+    return summary
+
+
+def run(database, root=None, dry_run=False):
+    """Quarantine new orphans and purge expired quarantine folders."""
+    summary = collect(database, root, dry_run=dry_run)
+    summary.update(purge_quarantine(dry_run=dry_run))
+    return summary
@@ -0,0 +1,235 @@
+"""WSGI middleware compressing large text responses.
+
+Responses are compressed with gzip (``zlib``) or, when the optional
+``brotli`` package is installed and the client accepts it, with Brotli.
+Bodies are compressed chunk by chunk as the application yields them, so
+streamed responses do not have to be buffered completely.  Small bodies
+(below ``COMPRESSION_MIN_SIZE``), event streams and responses that already
+carry a ``Content-Encoding`` are passed through unchanged.
+
+Compressed responses get an encoding suffix on their ETag (``"abc-gzip"``)
+because they are a different representation; the suffix is removed from
+``If-None-Match`` before the request reaches the app, so conditional GETs
+keep working.
+"""
+
+import zlib
+
+from werkzeug.http import parse_accept_header
+
+import config
+
+try:
+    import brotli
+except ImportError:  # 可选依赖：未安装时仅提供 gzip
+    brotli = None
+
+NO_COMPRESS_STATUS = ('204', '206', '304')
+
+
+class _GzipEncoder:
+    name = 'gzip'
+
+    def __init__(self, level):
+        # wbits=31：带 gzip 头的 deflate 流
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, chunk):
+        return self._compressor.compress(chunk)
+
+    def finish(self):
+        return self._compressor.flush()
+
+
+class _BrotliEncoder:
+    name = 'br'
+
+    def __init__(self, quality):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, chunk):
+        return self._compressor.process(chunk)
+
+    def finish(self):
+        return self._compressor.finish()
+
+
+def _strip_etag_suffixes(value):
+    for suffix in ('-gzip"', '-br"'):
+        value = value.replace(suffix, '"')
+    return value
+
+
+class CompressionMiddleware:
+    def __init__(self, app, min_size=None, level=None, brotli_quality=None, mimetypes=None):
+        self.app = app
+        self.min_size = config.COMPRESSION_MIN_SIZE if min_size is None else min_size
+        self.level = config.COMPRESSION_LEVEL if level is None else level
+        self.brotli_quality = config.COMPRESSION_BROTLI_QUALITY if brotli_quality is None else brotli_quality
+        self.mimetypes = frozenset(mimetypes or config.COMPRESSION_MIMETYPES)
+
+    def choose_encoding(self, environ):
+        accept = parse_accept_header(environ.get('HTTP_ACCEPT_ENCODING', ''))
+        if brotli is not None and accept['br']:
+            return 'br'
+        if accept['gzip']:
+            return 'gzip'
+        return None
+
+    def _make_encoder(self, encoding):
+        if encoding == 'br':
+            return _BrotliEncoder(self.brotli_quality)
+        return _GzipEncoder(self.level)
+
+    def _compressible(self, status, headers):
+        if status.split(' ', 1)[0] in NO_COMPRESS_STATUS:
+            return False
+        header_map = {name.lower(): value for name, value in headers}
+        if 'content-encoding' in header_map:
+            return False
+        if 'no-transform' in header_map.get('cache-control', ''):
+            return False
+        mimetype = header_map.get('content-type', '').split(';', 1)[0].strip().lower()
+        return mimetype in self.mimetypes
+
+    def __call__(self, environ, start_response):
+        encoding = self.choose_encoding(environ)
+        if_none_match = environ.get('HTTP_IF_NONE_MATCH')
+        if if_none_match:
+            environ['HTTP_IF_NONE_MATCH'] = _strip_etag_suffixes(if_none_match)
+        if encoding is None:
+            return self.app(environ, start_response)
+
+        state = {}
+
+        def capture_start_response(status, headers, exc_info=None):
+            if exc_info is not None and state.get('started'):
+                raise exc_info[1].with_traceback(exc_info[2])
+            state['status'] = status
+            state['headers'] = list(headers)
+            state['exc_info'] = exc_info
+            return state.setdefault('written', []).append
+
+        app_iter = self.app(environ, capture_start_response)
+        return self._respond(app_iter, state, encoding, start_response, if_none_match)
+
+    def _respond(self, app_iter, state, encoding, start_response, if_none_match):
+        try:
+            chunks = iter(app_iter)
+            buffered = list(state.get('written', ()))
+            status = state['status'] if 'status' in state else None
+
+            def start(headers):
+                state['started'] = True
+                start_response(status, headers, state.get('exc_info'))
+
+            if status is None:
+                # 应用在首次迭代时才调用 start_response
+                buffered.extend(self._first_chunk(chunks))
+                status = state['status']
+            headers = state['headers']
+
+            if not self._compressible(status, headers):
+                if status.startswith('304') and if_none_match:
+                    headers = self._restore_etag_suffix(headers, if_none_match)
+                start(headers)
+                yield from buffered
+                yield from chunks
+                return
+
+            vary_headers = self._add_vary(headers)
+            length = self._content_length(headers)
+            if length is not None and length < self.min_size:
+                start(vary_headers)
+                yield from buffered
+                yield from chunks
+                return
+
+            # 长度未知时先缓冲到阈值，避免压缩很小的流式响应
+            size = sum(len(chunk) for chunk in buffered)
+            exhausted = False
+            while size < self.min_size:
+                chunk = next(chunks, None)
+                if chunk is None:
+                    exhausted = True
+                    break
+                buffered.append(chunk)
+                size += len(chunk)
+
+            if exhausted and size < self.min_size:
+                start(vary_headers)
+                yield from buffered
+                return
+
+            encoder = self._make_encoder(encoding)
+            start(self._compressed_headers(vary_headers, encoder.name))
+            for chunk in buffered:
+                data = encoder.compress(chunk)
+                if data:
+                    yield data
+            for chunk in chunks:
+                data = encoder.compress(chunk)
+                if data:
+                    yield data
+            yield encoder.finish()
+        finally:
+            close = getattr(app_iter, 'close', None)
+            if close is not None:
+                close()
+
+    @staticmethod
+    def _first_chunk(chunks):
+        for chunk in chunks:
+            return [chunk]
+        return []
+
+    @staticmethod
+    def _content_length(headers):
+        for name, value in headers:
+            if name.lower() == 'content-length':
+                try:
+                    return int(value)
+                except ValueError:
+                    return None
+        return None
+
+    @staticmethod
+    def _add_vary(headers):
+        result = []
+        has_vary = False
+        for name, value in headers:
+            if name.lower() == 'vary':
+                has_vary = True
+                if 'accept-encoding' not in value.lower():
+                    value = f'{value}, Accept-Encoding'
+            result.append((name, value))
+        if not has_vary:
+            result.append(('Vary', 'Accept-Encoding'))
+        return result
+
+    @staticmethod
+    def _compressed_headers(headers, encoding):
+        result = []
+        for name, value in headers:
+            lowered = name.lower()
+            if lowered == 'content-length':
+                continue
+            if lowered == 'etag' and value.endswith('"'):
+                value = f'{value[:-1]}-{encoding}"'
+            result.append((name, value))
+        result.append(('Content-Encoding', encoding))
+        return result
+
+    @staticmethod
+    def _restore_etag_suffix(headers, if_none_match):
+        result = []
+        for name, value in headers:
+            if name.lower() == 'etag' and value.endswith('"'):
+                # 客户端缓存的是压缩后的表示，304 需沿用它的 ETag
+                for encoding in ('gzip', 'br'):
+                    suffixed = f'{value[:-1]}-{encoding}"'
+                    if suffixed in if_none_match:
+                        value = suffixed
+                        break
+            result.append((name, value))
+        return result
@@ -1,7 +1,10 @@
 import os
+import hashlib
+import re
 import json
-import copy
+import time
 import fnmatch
+import threading
 
 # 基础路径
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -58,12 +61,133 @@ DEFAULT_PROCESS_SEGMENTS = [
     "旋涂", "前烘烤", "曝光", "后烘烤", "显影", "刻蚀", "剥离"
 ]
 
+# SQLite 连接配置
+DATABASE_JOURNAL_MODE = "WAL"  # 多进程部署时允许读写并发；设为 None 保持文件原有模式
+DATABASE_BUSY_TIMEOUT = 10  # 秒，等待写锁的最长时间
+DATABASE_AUTO_VACUUM = "INCREMENTAL"  # 新建数据库的 auto_vacuum 模式，空闲页由维护任务分批归还
+
+# 记录写入队列（write_queue.py）：每个进程一个写线程，批量合并提交
+WRITE_QUEUE_ENABLED = True
+WRITE_QUEUE_WINDOW_MS = 1  # 收到第一个写操作后最多再等待的毫秒数，期间到达的写操作一起提交
+WRITE_QUEUE_MAX_BATCH = 64  # 单次合并提交的最大写操作数
+WRITE_QUEUE_TIMEOUT = 30  # 秒，请求等待写线程开始执行的最长时间
+
 # 应用配置
 SECRET_KEY = "production_line_manager_secret_key_2024"
 DEBUG = True
 HOST = "0.0.0.0"
 PORT = 5001
 
+# 生产服务配置（python serve.py）
+SERVER_WORKERS = os.cpu_count() or 1  # 预派生的工作进程数
+SERVER_THREADS = 8  # 每个工作进程的请求线程数
+SERVER_PRELOAD_APP = True  # 主进程预加载应用与配置后再派生工作进程
+SERVER_BACKLOG = 128
+SERVER_KEEPALIVE_TIMEOUT = 5  # 秒，空闲 keep-alive 连接的超时
+SERVER_GRACEFUL_TIMEOUT = 30  # 秒，平滑退出/重载时等待在途请求完成的时间
+SERVER_HEARTBEAT_INTERVAL = 5  # 秒
+SERVER_HEARTBEAT_TIMEOUT = 30  # 秒，超过该时间未心跳的工作进程会被替换
+SERVER_STREAMING_PATHS = ("/api/events",)  # 长连接流在独立线程中处理，不占用请求线程
+SERVER_STATE_DIR = os.path.join(BASE_DIR, "run")
+
+# 变更事件推送（/api/events，Server-Sent Events）
+EVENT_STREAM_KEEPALIVE = 15  # 秒，无事件时发送心跳注释的间隔
+EVENT_STREAM_QUEUE_SIZE = 256  # 每个连接的事件积压上限，超出后通知客户端整体刷新
+EVENT_STREAM_POLL_INTERVAL = 1  # 秒，轮询变更日志的间隔（事件来自 change_journal，跨工作进程可见）
+EVENT_STREAM_MAX_SUBSCRIBERS = 64  # 每个工作进程的连接上限，超出返回 503
+
+# 变更日志（增量同步 ?since=<seq>）
+CHANGE_JOURNAL_RETENTION_DAYS = 7  # 超过保留期的日志会被清理，过旧的 since 将返回全量数据
+
+# 响应压缩（compression.py，gzip；安装 brotli 包后自动支持 br）
+COMPRESSION_ENABLED = True
+COMPRESSION_MIN_SIZE = 1024  # 字节，小于该大小的响应不压缩
+COMPRESSION_LEVEL = 6  # gzip 压缩级别 1-9
+COMPRESSION_BROTLI_QUALITY = 5  # brotli 质量 0-11，动态响应取中等值兼顾 CPU
+COMPRESSION_MIMETYPES = (
+    "application/json", "text/html", "text/css", "text/plain", "text/csv",
+    "application/javascript", "text/javascript", "image/svg+xml"
+)
+
+# 运行指标（/api/admin/metrics，Prometheus 文本格式）
+METRICS_ENABLED = True
+METRICS_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)  # 秒
+METRICS_SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)  # 字节
+
+# 慢查询日志（/api/admin/slow_queries）
+SLOW_QUERY_THRESHOLD_MS = 200  # 单条语句执行+取数超过该耗时即记录；设为 None 关闭
+SLOW_QUERY_EXPLAIN = True  # 记录 EXPLAIN QUERY PLAN 输出
+SLOW_QUERY_LOG_PATH = os.path.join(BASE_DIR, "logs", "slow_queries.log")
+SLOW_QUERY_LOG_MAX_BYTES = 5 * 1024 * 1024
+SLOW_QUERY_LOG_BACKUP_COUNT = 5
+SLOW_QUERY_BUFFER_SIZE = 200  # 每个进程在内存中保留的最近条目数
+
+# /api/query 分页（?page=&page_size=）与图表降采样
+QUERY_PAGE_SIZE_DEFAULT = 25
+QUERY_PAGE_SIZE_MAX = 500  # 单页行数上限，超出时按上限截断
+QUERY_CHART_POINTS_DEFAULT = 1000  # /api/query/chart 每个序列降采样后的默认点数
+QUERY_CHART_POINTS_MAX = 5000
+
+# /api/query 结果缓存（query_cache.py）
+QUERY_CACHE_ENABLED = True
+QUERY_CACHE_MAX_BYTES = 64 * 1024 * 1024  # 所有缓存结果（JSON 字节）的总上限
+QUERY_CACHE_MAX_ENTRY_BYTES = 16 * 1024 * 1024  # 单个结果超过该大小时不缓存
+
+# 数据导出（/api/export 与 tools/export_data.py；Parquet/Arrow 需安装 pyarrow）
+EXPORT_CHUNK_SIZE = 20000  # 每次从数据库读取并写出的行数（Parquet 的行组大小）
+EXPORT_PARQUET_COMPRESSION = "zstd"
+EXPORT_ARROW_COMPRESSION = "zstd"  # Arrow IPC 缓冲区压缩；设为 None 不压缩
+EXPORT_JOB_DIR = os.path.join(BASE_DIR, "exports")  # 后台导出任务的结果文件
+EXPORT_JOB_WORKERS = 2  # 每个进程的导出线程数
+EXPORT_JOB_TTL_HOURS = 24  # 导出文件保留时长，过期后自动删除
+EXPORT_JOB_HEARTBEAT_INTERVAL = 10  # 秒，进程刷新其排队/执行中任务心跳的间隔
+EXPORT_JOB_HEARTBEAT_TIMEOUT = 60  # 秒，心跳超时的任务视为进程已退出并标记为失败（pid 可能被复用）
+EXPORT_JOB_PROGRESS_INTERVAL = 1.0  # 秒，导出进度（rows_written）写入数据库的最小间隔
+EXPORT_JOB_GZIP_LEVEL = 6  # CSV 结果以 gzip 压缩保存（Parquet/Arrow 文件自带压缩）
+
+# 分析快照（snapshot.py）：查询、看板与导出改为读取定期备份的只读副本
+ANALYTICS_SNAPSHOT_ENABLED = False
+ANALYTICS_SNAPSHOT_PATH = os.path.join(BASE_DIR, "snapshot", "production_snapshot.db")
+ANALYTICS_SNAPSHOT_INTERVAL = 300  # 秒，后台刷新间隔；数据无变化时不重新复制
+ANALYTICS_SNAPSHOT_MAX_STALENESS = 3600  # 秒，快照落后超过该时长时回退到主库
+ANALYTICS_SNAPSHOT_BACKUP_PAGES = -1  # 每步复制的页数；-1 表示一次完成
+
+# 分析引擎（analytics.py）：安装 duckdb 包后看板与过程能力统计由 DuckDB 列式执行
+ANALYTICS_ENGINE = "auto"  # "auto"：已安装 duckdb 时使用，失败时回退 SQLite；"sqlite"：始终使用 SQLite
+ANALYTICS_DUCKDB_THREADS = 2  # DuckDB 每次聚合使用的线程数，避免占满请求进程的 CPU
+ANALYTICS_DUCKDB_MEMORY_LIMIT = "512MB"
+
+# 历史数据归档（archive.py 与 tools/archive_batches.py）
+ARCHIVE_DIR = os.path.join(BASE_DIR, "archive")
+ARCHIVE_AFTER_MONTHS = 12  # 所有工艺段均已完成且结束超过该月数的批号组移入归档库
+ARCHIVE_PERIOD = "year"  # 归档文件按批号组开始时间划分："year" 或 "month"
+ARCHIVE_CHUNK_GROUPS = 200  # 每个事务移动的批号组数，避免长时间占用写锁
+
+# 数据库维护（maintenance.py 与 tools/db_maintenance.py）
+MAINTENANCE_ENABLED = True
+MAINTENANCE_CHECK_INTERVAL = 300  # 秒，后台线程检查到期任务的间隔
+MAINTENANCE_WINDOW = ("02:00", "05:00")  # 本地时间，窗口任务只在此时段执行；设为 None 不限时段
+MAINTENANCE_WINDOW_TASKS = ("analyze", "incremental_vacuum", "attachment_gc")
+MAINTENANCE_TASK_INTERVALS = {  # 秒，各任务的最小执行间隔；设为 None 只手动执行
+    "prune_journal": 3600,
+    "checkpoint": 900,
+    "optimize": 24 * 3600,
+    "analyze": 7 * 24 * 3600,
+    "incremental_vacuum": 24 * 3600,
+    "attachment_gc": 7 * 24 * 3600,
+    "expire_exports": 3600,
+}
+MAINTENANCE_CHECKPOINT_MODE = "TRUNCATE"  # PASSIVE / FULL / RESTART / TRUNCATE
+MAINTENANCE_ANALYSIS_LIMIT = 1000  # ANALYZE 每个索引抽样的行数；0 表示全量
+MAINTENANCE_VACUUM_PAGES = 5000  # 每次增量 VACUUM 最多归还的页数；0 表示全部
+
+# 静态资源构建（python tools/build_assets.py）
+STATIC_DIR = os.path.join(BASE_DIR, "static")
+ASSET_DIST_DIR = os.path.join(STATIC_DIR, "dist")
+ASSET_MANIFEST_PATH = os.path.join(ASSET_DIST_DIR, "manifest.json")
+ASSET_MAX_AGE = 365 * 24 * 3600  # 秒，带内容指纹的文件可长期缓存
+ASSET_RETIRED_GRACE_HOURS = 7 * 24  # 旧构建的指纹文件在被新清单替换后保留的时长（--prune 立即删除）
+
 # 附件存储配置
 DOWNLOAD_ROOT = os.path.join(BASE_DIR, "download")
 UPLOAD_FOLDER = DOWNLOAD_ROOT  # 兼容历史代码中引用的常量名
@@ -74,6 +198,11 @@ ALLOWED_ATTACHMENT_EXTENSIONS = {
 }
 MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB
 
+# 孤立附件清理（attachment_gc.py 与 tools/attachment_gc.py）
+ATTACHMENT_QUARANTINE_DIR = os.path.join(BASE_DIR, "attachment_quarantine")  # 未被引用的附件先移入此处，可手动恢复
+ATTACHMENT_QUARANTINE_DAYS = 30  # 隔离超过该天数的文件被删除
+ATTACHMENT_GC_MIN_AGE = 24 * 3600  # 秒，新于该时长的文件不清理（上传先于记录提交）
+
 # 会话配置
 SESSION_TOKEN_TTL_HOURS = 24
 MAX_SESSIONS_PER_USER = 5
@@ -86,8 +215,13 @@ BATCH_COMPLETED_STATUS = "已完成"
 
 # 自定义字段配置文件
 FIELDS_CONFIG_PATH = os.path.join(BASE_DIR, "fields_config.json")
+FIELDS_CONFIG_CHECK_INTERVAL = 2.0  # 秒，两次检查配置文件修改时间的最小间隔
+SEGMENT_INDEX_MAX_ENTRIES = 512  # 每个配置版本缓存的工段查询结果上限
 _FIELDS_CONFIG_CACHE = None
 _FIELDS_CONFIG_MTIME = None
+_FIELDS_CONFIG_CHECKED_AT = 0.0
+_FIELDS_CONFIG_VERSION = 0
+_SEGMENT_INDEX = None
 
 # 数据记录字段配置
 MATERIAL_RECORD_FIELDS = {
@@ -142,20 +276,35 @@ if not os.path.exists(DOWNLOAD_ROOT):
 
 
 def _load_fields_config():
-    """Load structured record definitions from JSON with caching."""
-    global _FIELDS_CONFIG_CACHE, _FIELDS_CONFIG_MTIME, PROCESS_SEGMENTS
+    """Load structured record definitions from JSON with caching.
+
+    The file's mtime is checked at most once per
+    ``FIELDS_CONFIG_CHECK_INTERVAL`` seconds; every reload bumps the config
+    version and discards the compiled segment index.
+    """
+    global _FIELDS_CONFIG_CACHE, _FIELDS_CONFIG_MTIME, _FIELDS_CONFIG_CHECKED_AT
+    global _FIELDS_CONFIG_VERSION, _SEGMENT_INDEX, PROCESS_SEGMENTS
+
+    now = time.monotonic()
+    if (_FIELDS_CONFIG_CACHE is not None
+            and now - _FIELDS_CONFIG_CHECKED_AT < FIELDS_CONFIG_CHECK_INTERVAL):
+        return _FIELDS_CONFIG_CACHE
+    _FIELDS_CONFIG_CHECKED_AT = now
 
     try:
         mtime = os.path.getmtime(FIELDS_CONFIG_PATH)
     except (FileNotFoundError, OSError):
-        _FIELDS_CONFIG_CACHE = {
-            'process_segments': list(DEFAULT_PROCESS_SEGMENTS),
-            'materials': [],
-            'equipment': [],
-            'quality': []
-        }
-        _FIELDS_CONFIG_MTIME = None
-        PROCESS_SEGMENTS = list(DEFAULT_PROCESS_SEGMENTS)
+        if _FIELDS_CONFIG_CACHE is None or _FIELDS_CONFIG_MTIME is not None:
+            _FIELDS_CONFIG_CACHE = {
+                'process_segments': list(DEFAULT_PROCESS_SEGMENTS),
+                'materials': [],
+                'equipment': [],
+                'quality': []
+            }
+            _FIELDS_CONFIG_MTIME = None
+            _FIELDS_CONFIG_VERSION += 1
+            _SEGMENT_INDEX = None
+            PROCESS_SEGMENTS = list(DEFAULT_PROCESS_SEGMENTS)
         return _FIELDS_CONFIG_CACHE
 
     if _FIELDS_CONFIG_CACHE is None or _FIELDS_CONFIG_MTIME != mtime:
@@ -172,67 +321,153 @@ def _load_fields_config():
             'quality': data.get('quality', []) or []
         }
         _FIELDS_CONFIG_MTIME = mtime
+        _FIELDS_CONFIG_VERSION += 1
+        _SEGMENT_INDEX = None
         PROCESS_SEGMENTS = list(_FIELDS_CONFIG_CACHE.get('process_segments', DEFAULT_PROCESS_SEGMENTS))
 
     return _FIELDS_CONFIG_CACHE
 
 
-def _filter_by_segment(items, segment):
-    if not items:
-        return []
-    if not segment:
-        return copy.deepcopy(items)
+def get_fields_config_version():
+    """Monotonic counter bumped whenever fields_config.json is reloaded."""
+    _load_fields_config()
+    return _FIELDS_CONFIG_VERSION
 
-    filtered = []
-    for item in items:
-        segments = item.get('segments')
 
-        if not segments:
-            filtered.append(item)
-            continue
+_FIELDS_CONFIG_DIGEST = (None, None)
 
-        if isinstance(segments, str):
-            segments = [segments]
 
-        include_item = False
-        for pattern in segments:
-            if pattern in (None, ''):
-                include_item = True
-                break
-            if pattern == '*':
-                include_item = True
-                break
-            if fnmatch.fnmatch(segment, str(pattern)):
-                include_item = True
-                break
+def get_fields_config_digest():
+    """Content hash of the loaded fields config.
+
+    Unlike the per-process version counter it is identical in every worker
+    process, so it can be used in HTTP validators such as ETags.
+    """
+    global _FIELDS_CONFIG_DIGEST
+    data = _load_fields_config()
+    version, digest = _FIELDS_CONFIG_DIGEST
+    if version != _FIELDS_CONFIG_VERSION:
+        payload = json.dumps(data, sort_keys=True, ensure_ascii=False, default=str)
+        digest = hashlib.sha1(payload.encode('utf-8')).hexdigest()[:16]
+        _FIELDS_CONFIG_DIGEST = (_FIELDS_CONFIG_VERSION, digest)
+    return digest
 
-        if include_item:
-            filtered.append(item)
 
-    return copy.deepcopy(filtered)
+class FrozenDict(dict):
+    """Read-only dict handed out from the shared definition index."""
 
+    def _readonly(self, *args, **kwargs):
+        raise TypeError('segment definitions are read-only')
 
-def get_material_definitions(segment=None):
+    __setitem__ = __delitem__ = _readonly
+    clear = pop = popitem = setdefault = update = _readonly
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+
+def _freeze(value):
+    if isinstance(value, dict):
+        return FrozenDict((key, _freeze(item)) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+def _compile_segment_matcher(segments):
+    """Return a predicate for an item's segment patterns, or None to match all."""
+    if not segments:
+        return None
+    if isinstance(segments, str):
+        segments = [segments]
+
+    literals = set()
+    regexes = []
+    for pattern in segments:
+        if pattern in (None, '', '*'):
+            return None
+        pattern = str(pattern)
+        if any(char in pattern for char in '*?['):
+            regexes.append(re.compile(fnmatch.translate(os.path.normcase(pattern))))
+        else:
+            literals.add(os.path.normcase(pattern))
+
+    def matches(segment):
+        segment = os.path.normcase(segment)
+        if segment in literals:
+            return True
+        return any(regex.match(segment) for regex in regexes)
+
+    return matches
+
+
+class _SegmentIndex:
+    """Segment -> definitions lookup compiled once per config version."""
+
+    CATEGORIES = ('materials', 'equipment', 'quality')
+
+    def __init__(self, config_data):
+        self._entries = {}
+        self._all = {}
+        for category in self.CATEGORIES:
+            entries = []
+            for item in config_data.get(category) or []:
+                entries.append((_freeze(item), _compile_segment_matcher(item.get('segments'))))
+            self._entries[category] = entries
+            self._all[category] = tuple(item for item, _ in entries)
+        self._by_segment = {}
+        self._lock = threading.Lock()
+
+    def lookup(self, segment):
+        if not segment:
+            return FrozenDict(self._all)
+
+        cached = self._by_segment.get(segment)
+        if cached is not None:
+            return cached
+
+        result = FrozenDict(
+            (category, tuple(
+                item for item, matcher in self._entries[category]
+                if matcher is None or matcher(segment)
+            ))
+            for category in self.CATEGORIES
+        )
+        with self._lock:
+            if len(self._by_segment) >= SEGMENT_INDEX_MAX_ENTRIES:
+                self._by_segment.clear()
+            self._by_segment[segment] = result
+        return result
+
+
+def _get_segment_index():
+    global _SEGMENT_INDEX
     config_data = _load_fields_config()
-    return _filter_by_segment(config_data.get('materials'), segment)
+    index = _SEGMENT_INDEX
+    if index is None:
+        index = _SegmentIndex(config_data)
+        _SEGMENT_INDEX = index
+    return index
+
+
+def get_material_definitions(segment=None):
+    return _get_segment_index().lookup(segment)['materials']
 
 
 def get_equipment_definitions(segment=None):
-    config_data = _load_fields_config()
-    return _filter_by_segment(config_data.get('equipment'), segment)
+    return _get_segment_index().lookup(segment)['equipment']
 
 
 def get_quality_definitions(segment=None):
-    config_data = _load_fields_config()
-    return _filter_by_segment(config_data.get('quality'), segment)
+    return _get_segment_index().lookup(segment)['quality']
 
 
 def get_segment_definitions(segment=None):
-    return {
-        'materials': get_material_definitions(segment),
-        'equipment': get_equipment_definitions(segment),
-        'quality': get_quality_definitions(segment)
-    }
+    """Return read-only definitions of all categories for ``segment``."""
+    return _get_segment_index().lookup(segment)
 
 
 def get_process_segments():
@@ -1,22 +1,127 @@
+import os
 import sqlite3
 import json
+import re
+import threading
+from contextlib import closing
 from datetime import datetime, timedelta
 import hashlib
 import config
+import metrics
+from write_queue import WriteQueue
 
 ALLOWED_USER_ROLES = ('admin', 'read', 'write', 'write_material', 'write_quality')
 
+# 扩展字段（attributes_json）表达式索引配置
+EXTRA_FIELD_INDEX_PREFIX = 'idx_extra_'
+EXTRA_FIELD_TABLES = {
+    'material_records': 'MATERIAL_RECORD_FIELDS',
+    'quality_records': 'QUALITY_RECORD_FIELDS'
+}
+_EXTRA_KEY_PATTERN = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+# 数据库结构迁移：(user_version, Database 方法名)，只追加不修改
+MIGRATIONS = (
+    (1, '_migrate_initial_schema'),
+    (2, '_migrate_change_journal'),
+    (3, '_migrate_reference_journal'),
+    (4, '_migrate_export_jobs'),
+    (5, '_migrate_archive_index'),
+    (6, '_migrate_export_job_heartbeat'),
+    (7, '_migrate_journal_archive_op'),
+)
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+# 变更日志覆盖的记录表：表名 -> 记录类别
+JOURNALED_RECORD_TABLES = {
+    'material_records': 'materials',
+    'equipment_records': 'equipment',
+    'quality_records': 'quality'
+}
+
+# 参与 ETag 版本计算的引用表（不按批号分组）
+JOURNALED_REFERENCE_TABLES = ('process_segments', 'custom_fields')
+
+# 默认自定义字段
+DEFAULT_CUSTOM_FIELDS = (
+    ('equipment', 'temperature', '温度', 'number', 1, 0, '{"unit": "℃"}'),
+    ('equipment', 'pressure', '压力', 'number', 1, 1, '{"unit": "MPa"}'),
+    ('equipment', 'speed', '转速', 'number', 0, 2, '{"unit": "rpm"}'),
+    ('quality', 'size', '尺寸', 'number', 1, 0, '{"unit": "mm"}'),
+    ('quality', 'weight', '重量', 'number', 1, 1, '{"unit": "g"}'),
+    ('quality', 'color', '颜色', 'text', 0, 2, '{}'),
+)
+
+
+def get_declared_extra_fields(table):
+    """Return extras declared in the record field config for ``table``.
+
+    Only keys that are safe to embed in a JSON path and an index name are
+    returned, since both are interpolated into SQL text.
+    """
+    field_config = getattr(config, EXTRA_FIELD_TABLES.get(table, ''), None) or {}
+    return [
+        field for field in field_config.get('extras', [])
+        if _EXTRA_KEY_PATTERN.match(str(field.get('key') or ''))
+    ]
+
+
+def json_extra_expression(key, alias=None):
+    """SQL expression reading an extra from ``attributes_json``.
+
+    Queries must use exactly this expression so that SQLite can match it
+    against the expression indexes created by ``sync_extra_field_indexes``.
+    """
+    if not _EXTRA_KEY_PATTERN.match(str(key or '')):
+        raise ValueError(f'invalid extra field key: {key!r}')
+    column = f'{alias}.attributes_json' if alias else 'attributes_json'
+    return f"json_extract({column}, '$.{key}')"
+
+
 class Database:
     def __init__(self, db_path):
         self.db_path = db_path
+        self._write_queue = WriteQueue(self)
         self.init_db()
         self.init_data()
+        self.configure_journal_mode()
     
     def get_connection(self):
-        conn = sqlite3.connect(self.db_path)
+        instrumented = getattr(config, 'METRICS_ENABLED', False) or getattr(config, 'SLOW_QUERY_THRESHOLD_MS', None)
+        factory = metrics.InstrumentedConnection if instrumented else sqlite3.Connection
+        conn = sqlite3.connect(
+            self.db_path, timeout=getattr(config, 'DATABASE_BUSY_TIMEOUT', 5), factory=factory
+        )
         conn.row_factory = sqlite3.Row
         return conn
 
+    def run_write(self, operation):
+        """Execute ``operation(conn)`` in a write transaction and return its result.
+
+        With ``WRITE_QUEUE_ENABLED`` the operation is group-committed by this
+        process's writer thread (see ``write_queue.py``); ``operation`` must
+        not commit itself.
+        """
+        if not getattr(config, 'WRITE_QUEUE_ENABLED', False):
+            with closing(self.get_connection()) as conn:
+                result = operation(conn)
+                conn.commit()
+                return result
+        return self._write_queue.run(operation, timeout=getattr(config, 'WRITE_QUEUE_TIMEOUT', None))
+
+    def configure_journal_mode(self):
+        """Switch the file to the configured journal mode (persistent for WAL)."""
+        journal_mode = getattr(config, 'DATABASE_JOURNAL_MODE', None)
+        if not journal_mode:
+            return
+        conn = self.get_connection()
+        try:
+            current = conn.execute('PRAGMA journal_mode').fetchone()[0]
+            if current.lower() != journal_mode.lower():
+                conn.execute(f'PRAGMA journal_mode = {journal_mode}')
+        finally:
+            conn.close()
+
     def _ensure_column(self, cursor, table, column, definition):
         cursor.execute(f"PRAGMA table_info({table})")
         existing_columns = {row[1] for row in cursor.fetchall()}
@@ -24,9 +129,44 @@ class Database:
             cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
 
     def init_db(self):
+        """Apply pending schema migrations keyed on ``PRAGMA user_version``.
+
+        An up-to-date database costs a single PRAGMA read; otherwise the
+        pending migrations run once under ``BEGIN IMMEDIATE`` so concurrent
+        workers cannot apply them twice.
+        """
         conn = self.get_connection()
+        conn.isolation_level = None
         c = conn.cursor()
-        
+        try:
+            c.execute('PRAGMA user_version')
+            if c.fetchone()[0] >= SCHEMA_VERSION:
+                return
+
+            # auto_vacuum 只能在建表之前设置（已有文件需 VACUUM 转换，见 maintenance.py）
+            auto_vacuum = getattr(config, 'DATABASE_AUTO_VACUUM', None)
+            c.execute("SELECT COUNT(*) FROM sqlite_master")
+            if auto_vacuum and c.fetchone()[0] == 0:
+                c.execute(f'PRAGMA auto_vacuum = {auto_vacuum}')
+
+            c.execute('BEGIN IMMEDIATE')
+            c.execute('PRAGMA user_version')
+            current_version = c.fetchone()[0]
+            for version, method_name in MIGRATIONS:
+                if version <= current_version:
+                    continue
+                getattr(self, method_name)(c)
+                c.execute(f'PRAGMA user_version = {int(version)}')
+            c.execute('COMMIT')
+        except BaseException:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def _migrate_initial_schema(self, c):
+        """Migration 1: base tables, including upgrades of pre-versioning files."""
         # 创建用户表
         allowed_roles_sql = "', '".join(ALLOWED_USER_ROLES)
         c.execute(f'''
@@ -197,6 +337,14 @@ class Database:
             )
         ''')
 
+        # 应用元数据表（记录种子数据指纹等）
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS app_meta (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            )
+        ''')
+
         # 导出日志表
         c.execute('''
             CREATE TABLE IF NOT EXISTS export_logs (
@@ -217,13 +365,304 @@ class Database:
         self._ensure_column(c, 'equipment_records', 'attachments_json', "TEXT DEFAULT '[]'")
         self._ensure_column(c, 'quality_records', 'attachments_json', "TEXT DEFAULT '[]'")
 
-        conn.commit()
-        conn.close()
+    def _migrate_change_journal(self, c):
+        """Migration 2: append-only change journal maintained by triggers."""
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS change_journal (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                table_name TEXT NOT NULL,
+                row_id INTEGER NOT NULL,
+                batch_id INTEGER,
+                batch_number TEXT,
+                product_name TEXT,
+                op TEXT NOT NULL CHECK(op IN ('insert', 'update', 'delete')),
+                changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        c.execute('CREATE INDEX IF NOT EXISTS idx_change_journal_batch ON change_journal (batch_id, seq)')
+
+        for op, ref in (('insert', 'NEW'), ('update', 'NEW'), ('delete', 'OLD')):
+            c.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_journal_batches_{op}
+                AFTER {op.upper()} ON batches
+                BEGIN
+                    INSERT INTO change_journal (table_name, row_id, batch_id, batch_number, product_name, op)
+                    VALUES ('batches', {ref}.id, {ref}.id, {ref}.batch_number, {ref}.product_name, '{op}');
+                END
+            ''')
+
+        # 批号/产品变更时，原分组同样需要通知客户端
+        c.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_journal_batches_regroup
+            AFTER UPDATE OF batch_number, product_name ON batches
+            WHEN OLD.batch_number IS NOT NEW.batch_number OR OLD.product_name IS NOT NEW.product_name
+            BEGIN
+                INSERT INTO change_journal (table_name, row_id, batch_id, batch_number, product_name, op)
+                VALUES ('batches', OLD.id, OLD.id, OLD.batch_number, OLD.product_name, 'update');
+            END
+        ''')
+
+        for table in JOURNALED_RECORD_TABLES:
+            for op, ref in (('insert', 'NEW'), ('update', 'NEW'), ('delete', 'OLD')):
+                c.execute(f'''
+                    CREATE TRIGGER IF NOT EXISTS trg_journal_{table}_{op}
+                    AFTER {op.upper()} ON {table}
+                    BEGIN
+                        INSERT INTO change_journal (table_name, row_id, batch_id, batch_number, product_name, op)
+                        SELECT '{table}', {ref}.id, {ref}.batch_id, b.batch_number, b.product_name, '{op}'
+                        FROM (SELECT 1) LEFT JOIN batches b ON b.id = {ref}.batch_id;
+                    END
+                ''')
+
+    def _migrate_reference_journal(self, c):
+        """Migration 3: journal reference tables and user renames for ETags."""
+        c.execute('CREATE INDEX IF NOT EXISTS idx_change_journal_table ON change_journal (table_name, seq)')
+
+        for table in JOURNALED_REFERENCE_TABLES:
+            for op, ref in (('insert', 'NEW'), ('update', 'NEW'), ('delete', 'OLD')):
+                c.execute(f'''
+                    CREATE TRIGGER IF NOT EXISTS trg_journal_{table}_{op}
+                    AFTER {op.upper()} ON {table}
+                    BEGIN
+                        INSERT INTO change_journal (table_name, row_id, op)
+                        VALUES ('{table}', {ref}.id, '{op}');
+                    END
+                ''')
+
+        # 用户名出现在批号/记录的 created_by_name 等字段中；登录时间等更新不计入
+        c.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_journal_users_rename
+            AFTER UPDATE OF username ON users
+            WHEN OLD.username IS NOT NEW.username
+            BEGIN
+                INSERT INTO change_journal (table_name, row_id, op)
+                VALUES ('users', NEW.id, 'update');
+            END
+        ''')
+
+        # 数据库实例标识：重建数据库后序号从头开始，版本号也不会与旧库混淆
+        c.execute(
+            "INSERT OR IGNORE INTO app_meta (key, value) VALUES ('database_id', lower(hex(randomblob(8))))"
+        )
+
+    def _migrate_export_jobs(self, c):
+        """Migration 4: background export jobs (export_jobs.py)."""
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS export_jobs (
+                id TEXT PRIMARY KEY,
+                user_id INTEGER,
+                username TEXT,
+                ip_address TEXT,
+                format TEXT NOT NULL,
+                params_json TEXT NOT NULL,
+                columns_json TEXT,
+                filename TEXT,
+                status TEXT NOT NULL DEFAULT 'queued',
+                worker_pid INTEGER,
+                rows_total INTEGER,
+                rows_written INTEGER NOT NULL DEFAULT 0,
+                file_path TEXT,
+                file_size_bytes INTEGER,
+                error TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                started_at TIMESTAMP,
+                finished_at TIMESTAMP,
+                expires_at TIMESTAMP,
+                FOREIGN KEY (user_id) REFERENCES users(id)
+            )
+        ''')
+        c.execute('CREATE INDEX IF NOT EXISTS idx_export_jobs_user ON export_jobs (user_id, created_at)')
+        c.execute('CREATE INDEX IF NOT EXISTS idx_export_jobs_status ON export_jobs (status, expires_at)')
+
+    def _migrate_archive_index(self, c):
+        """Migration 5: index of archived batch groups (archive.py)."""
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS archive_index (
+                period TEXT PRIMARY KEY,
+                file_name TEXT NOT NULL,
+                min_start_date TEXT,
+                max_start_date TEXT,
+                batch_count INTEGER NOT NULL DEFAULT 0,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS archived_batches (
+                batch_id INTEGER PRIMARY KEY,
+                batch_number TEXT NOT NULL,
+                product_name TEXT NOT NULL,
+                period TEXT NOT NULL,
+                archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        c.execute('CREATE INDEX IF NOT EXISTS idx_archived_batches_group ON archived_batches (batch_number, product_name)')
+
+    def _migrate_export_job_heartbeat(self, c):
+        """Migration 6: heartbeat of export jobs, so orphans are found even when their pid is reused."""
+        self._ensure_column(c, 'export_jobs', 'heartbeat_at', 'TIMESTAMP')
+
+    def _migrate_journal_archive_op(self, c):
+        """Migration 7: allow the ``archive`` journal op, so archived rows are not reported as deleted."""
+        # SQLite 无法修改 CHECK 约束，只能重建表；触发器按表名引用日志表，无需重建
+        c.execute("SELECT seq FROM sqlite_sequence WHERE name = 'change_journal'")
+        row = c.fetchone()
+        last_seq = row[0] if row else 0
+        c.execute('''
+            CREATE TABLE change_journal_new (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                table_name TEXT NOT NULL,
+                row_id INTEGER NOT NULL,
+                batch_id INTEGER,
+                batch_number TEXT,
+                product_name TEXT,
+                op TEXT NOT NULL CHECK(op IN ('insert', 'update', 'delete', 'archive')),
+                changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        c.execute('INSERT INTO change_journal_new SELECT * FROM change_journal')
+        c.execute('DROP TABLE change_journal')
+        # 旧式重命名不重新解析触发器（此时触发器引用的日志表暂不存在）
+        c.execute('PRAGMA legacy_alter_table = ON')
+        try:
+            c.execute('ALTER TABLE change_journal_new RENAME TO change_journal')
+        finally:
+            c.execute('PRAGMA legacy_alter_table = OFF')
+        # 清理过的日志可能为空，序号须延续旧表，否则增量客户端会误判数据库被重建
+        c.execute("DELETE FROM sqlite_sequence WHERE name = 'change_journal'")
+        c.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('change_journal', ?)", (last_seq,))
+        c.execute('CREATE INDEX IF NOT EXISTS idx_change_journal_batch ON change_journal (batch_id, seq)')
+        c.execute('CREATE INDEX IF NOT EXISTS idx_change_journal_table ON change_journal (table_name, seq)')
+
+    # 变更日志
+    def get_change_seq(self, cursor):
+        """Highest journal sequence ever assigned (0 for an empty journal)."""
+        cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = 'change_journal'")
+        row = cursor.fetchone()
+        return row[0] if row else 0
+
+    def get_data_version(self, cursor, tables=None):
+        """Opaque version string of the journaled data, used for ETags.
+
+        Without ``tables`` every journaled change counts; otherwise only
+        changes to the given tables (plus pruning, which keeps it monotonic).
+        """
+        database_id = getattr(self, '_database_id', None)
+        if database_id is None:
+            cursor.execute("SELECT value FROM app_meta WHERE key = 'database_id'")
+            row = cursor.fetchone()
+            database_id = self._database_id = row[0] if row else ''
+
+        if tables is None:
+            seq = self.get_change_seq(cursor)
+        else:
+            cursor.execute(
+                'SELECT MAX(seq) FROM change_journal WHERE table_name IN ({})'.format(', '.join('?' * len(tables))),
+                tuple(tables)
+            )
+            seq = max(cursor.fetchone()[0] or 0, self.get_pruned_change_seq(cursor))
+        return f'{database_id}:{seq}'
+
+    def get_pruned_change_seq(self, cursor):
+        """Journal entries up to this sequence have been pruned."""
+        cursor.execute("SELECT value FROM app_meta WHERE key = 'change_journal_pruned_seq'")
+        row = cursor.fetchone()
+        return int(row[0]) if row else 0
+
+    def prune_change_journal(self, retention_days=None):
+        """Delete journal entries older than the retention window."""
+        if retention_days is None:
+            retention_days = getattr(config, 'CHANGE_JOURNAL_RETENTION_DAYS', 7)
+        conn = self.get_connection()
+        try:
+            c = conn.cursor()
+            c.execute(
+                "SELECT MAX(seq) FROM change_journal WHERE changed_at < datetime('now', ?)",
+                (f'-{int(retention_days)} days',)
+            )
+            prune_through = c.fetchone()[0]
+            if prune_through is None:
+                return 0
+            c.execute("DELETE FROM change_journal WHERE seq <= ?", (prune_through,))
+            deleted = c.rowcount
+            c.execute(
+                "INSERT OR REPLACE INTO app_meta (key, value) VALUES ('change_journal_pruned_seq', ?)",
+                (str(prune_through),)
+            )
+            conn.commit()
+            return deleted
+        finally:
+            conn.close()
+
+    def sync_extra_field_indexes(self, cursor):
+        """Create/drop expression indexes so they match the declared extras."""
+        desired = {}
+        for table in EXTRA_FIELD_TABLES:
+            for field in get_declared_extra_fields(table):
+                index_name = f"{EXTRA_FIELD_INDEX_PREFIX}{table}_{field['key']}"
+                desired[index_name] = (table, field['key'])
+
+        cursor.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND name LIKE ?",
+            (f'{EXTRA_FIELD_INDEX_PREFIX}%',)
+        )
+        existing = {row[0] for row in cursor.fetchall()}
+
+        for index_name in existing - set(desired):
+            cursor.execute(f'DROP INDEX IF EXISTS "{index_name}"')
+
+        for index_name, (table, key) in desired.items():
+            if index_name in existing:
+                continue
+            cursor.execute(
+                f'CREATE INDEX IF NOT EXISTS "{index_name}" ON {table} ({json_extra_expression(key)})'
+            )
     
     def init_data(self):
+        """Seed default rows and sync extra-field indexes when their config changed.
+
+        The fingerprint of the seed inputs is stored in ``app_meta`` so that a
+        restart with unchanged config only performs one lookup.
+        """
+        fingerprint = self._seed_fingerprint()
         conn = self.get_connection()
+        conn.isolation_level = None
         c = conn.cursor()
-        
+        try:
+            c.execute("SELECT value FROM app_meta WHERE key = 'seed_fingerprint'")
+            row = c.fetchone()
+            if row and row[0] == fingerprint:
+                return
+
+            c.execute('BEGIN IMMEDIATE')
+            self._seed_defaults(c)
+            self.sync_extra_field_indexes(c)
+            c.execute(
+                "INSERT OR REPLACE INTO app_meta (key, value) VALUES ('seed_fingerprint', ?)",
+                (fingerprint,)
+            )
+            c.execute('COMMIT')
+        except BaseException:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def _seed_fingerprint(self):
+        seed_inputs = {
+            'schema_version': SCHEMA_VERSION,
+            'users': config.USERS,
+            'process_segments': config.get_process_segments(),
+            'custom_fields': DEFAULT_CUSTOM_FIELDS,
+            'extra_fields': {
+                table: [field['key'] for field in get_declared_extra_fields(table)]
+                for table in EXTRA_FIELD_TABLES
+            }
+        }
+        encoded = json.dumps(seed_inputs, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+    def _seed_defaults(self, c):
         # 插入默认用户
         for username, user_info in config.USERS.items():
             # 检查用户是否已存在
@@ -243,16 +682,7 @@ class Database:
             )
         
         # 插入默认自定义字段
-        default_fields = [
-            ('equipment', 'temperature', '温度', 'number', 1, 0, '{"unit": "℃"}'),
-            ('equipment', 'pressure', '压力', 'number', 1, 1, '{"unit": "MPa"}'),
-            ('equipment', 'speed', '转速', 'number', 0, 2, '{"unit": "rpm"}'),
-            ('quality', 'size', '尺寸', 'number', 1, 0, '{"unit": "mm"}'),
-            ('quality', 'weight', '重量', 'number', 1, 1, '{"unit": "g"}'),
-            ('quality', 'color', '颜色', 'text', 0, 2, '{}'),
-        ]
-        
-        for field in default_fields:
+        for field in DEFAULT_CUSTOM_FIELDS:
             c.execute(
                 'SELECT 1 FROM custom_fields WHERE field_type = ? AND field_name = ? LIMIT 1',
                 (field[0], field[1])
@@ -272,9 +702,7 @@ class Database:
                 SELECT MIN(id) FROM custom_fields GROUP BY field_type, field_name
             )
         ''')
-        
-        conn.commit()
-        conn.close()
+
     
     # 用户认证方法
     def authenticate_user(self, username, password):
@@ -456,5 +884,25 @@ class Database:
             }
         return None
 
-# 创建数据库实例
-db = Database(config.DATABASE)
+_DATABASES = {}
+_DATABASES_LOCK = threading.Lock()
+
+
+def get_database(db_path=None):
+    """Return the shared ``Database`` for ``db_path`` (defaults to config.DATABASE)."""
+    db_path = os.path.abspath(db_path or config.DATABASE)
+    database = _DATABASES.get(db_path)
+    if database is None:
+        with _DATABASES_LOCK:
+            database = _DATABASES.get(db_path)
+            if database is None:
+                database = Database(db_path)
+                _DATABASES[db_path] = database
+    return database
+
+
+def __getattr__(name):
+    # 兼容旧代码中的 ``from database import db``，首次访问时才初始化
+    if name == 'db':
+        return get_database()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
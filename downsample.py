@@ -0,0 +1,56 @@
+"""Downsampling of chart series.
+
+``lttb`` implements Largest-Triangle-Three-Buckets (Steinarsson, 2013): the
+first and last points are always kept and every bucket in between
+contributes the point that forms the largest triangle with the previously
+selected point and the average of the next bucket, which preserves peaks
+and the overall shape far better than taking every n-th point.
+"""
+
+
+def lttb(points, threshold):
+    """Reduce ``points`` to at most ``threshold`` points.
+
+    ``points`` is a sequence of tuples sorted by x whose first two items are
+    the numeric x and y; extra items are carried through unchanged.
+    """
+    count = len(points)
+    if threshold >= count:
+        return list(points)
+    if threshold < 3:
+        return [points[0], points[-1]][:max(threshold, 0)]
+
+    every = (count - 2) / (threshold - 2)
+    sampled = [points[0]]
+    selected = 0
+
+    for bucket in range(threshold - 2):
+        # 下一个桶的平均点
+        avg_start = int((bucket + 1) * every) + 1
+        avg_end = min(int((bucket + 2) * every) + 1, count)
+        avg_x = avg_y = 0.0
+        for point in points[avg_start:avg_end]:
+            avg_x += point[0]
+            avg_y += point[1]
+        avg_length = (avg_end - avg_start) or 1
+        avg_x /= avg_length
+        avg_y /= avg_length
+
+        # 当前桶中与上一个选中点、下一桶平均点构成最大三角形的点
+        ax, ay = points[selected][0], points[selected][1]
+        range_start = int(bucket * every) + 1
+        range_end = int((bucket + 1) * every) + 1
+        max_area = -1.0
+        next_selected = range_start
+        for index in range(range_start, range_end):
+            x, y = points[index][0], points[index][1]
+            area = abs((ax - avg_x) * (y - ay) - (ax - x) * (avg_y - ay))
+            if area > max_area:
+                max_area = area
+                next_selected = index
+
+        sampled.append(points[next_selected])
+        selected = next_selected
+
+    sampled.append(points[-1])
+    return sampled
@@ -0,0 +1,286 @@
+"""Change feed delivered to browsers as Server-Sent Events.
+
+The events are read from ``change_journal``, which the database triggers
+fill for every write no matter which worker process made it.  One
+``JournalFeed`` thread per process polls the journal every
+``EVENT_STREAM_POLL_INTERVAL`` seconds while clients are connected and hands
+the new entries to the in-process ``broker``; ``/api/events`` streams them to
+the subscribed clients, filtered by role the same way the read endpoints hide
+categories.  Event ids are journal sequences, so a reconnecting client
+(``Last-Event-ID``) gets the entries it missed replayed.
+"""
+
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from contextlib import closing
+from datetime import datetime, timezone
+
+import config
+from database import JOURNALED_RECORD_TABLES
+
+logger = logging.getLogger('minimes.events')
+
+# 各角色不可见的记录类别，与读取接口的权限判断保持一致
+HIDDEN_CATEGORIES_BY_ROLE = {
+    'write_material': frozenset(('quality',)),
+    'write_quality': frozenset(('materials', 'equipment')),
+}
+
+# 变更日志操作 -> 事件类型；引用表与用户表的变更不推送
+# 归档只推送批号事件，其记录随批号一并移入归档库
+_BATCH_EVENT_TYPES = {
+    'insert': 'batch.created', 'update': 'batch.updated', 'delete': 'batch.deleted', 'archive': 'batch.archived'
+}
+_RECORD_EVENT_TYPES = {'insert': 'record.added', 'update': 'record.updated', 'delete': 'record.deleted'}
+
+_JOURNAL_COLUMNS = 'seq, table_name, row_id, batch_id, batch_number, product_name, op, changed_at'
+
+
+def event_visible_to(role, event):
+    category = event.get('category')
+    return category not in HIDDEN_CATEGORIES_BY_ROLE.get(role or '', frozenset())
+
+
+class SubscriberLimitReached(Exception):
+    """The process already serves ``EVENT_STREAM_MAX_SUBSCRIBERS`` streams."""
+
+
+class Subscription:
+    def __init__(self, broker, role, max_queue):
+        self.broker = broker
+        self.role = role
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.overflowed = False
+
+    def offer(self, event):
+        if self.overflowed or not event_visible_to(self.role, event):
+            return
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            # 客户端消费过慢：丢弃积压并通知其整体刷新
+            self.overflowed = True
+
+    def get(self, timeout):
+        if self.overflowed:
+            self.overflowed = False
+            with self.queue.mutex:
+                self.queue.queue.clear()
+            return {'type': 'resync'}
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class ChangeBroker:
+    def __init__(self, max_queue=None):
+        self.max_queue = max_queue or getattr(config, 'EVENT_STREAM_QUEUE_SIZE', 256)
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self, role):
+        limit = getattr(config, 'EVENT_STREAM_MAX_SUBSCRIBERS', None)
+        subscription = Subscription(self, role, self.max_queue)
+        with self._lock:
+            if limit and len(self._subscribers) >= limit:
+                raise SubscriberLimitReached(f'event stream limit of {limit} reached')
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    @property
+    def subscriber_count(self):
+        return len(self._subscribers)
+
+    def publish(self, event):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            subscription.offer(event)
+
+
+broker = ChangeBroker()
+
+
+def format_sse(event):
+    lines = []
+    if event.get('id') is not None:
+        lines.append(f"id: {event['id']}")
+    lines.append(f"event: {event.get('type', 'message')}")
+    lines.append('data: ' + json.dumps(event, ensure_ascii=False, separators=(',', ':')))
+    return '\n'.join(lines) + '\n\n'
+
+
+def _journal_timestamp(changed_at):
+    try:
+        # CURRENT_TIMESTAMP 为 UTC
+        return datetime.strptime(changed_at, '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+def journal_event(row):
+    """Change event of one ``change_journal`` row, or None if it is not pushed."""
+    seq, table_name, row_id, batch_id, batch_number, product_name, op, changed_at = row
+    if table_name == 'batches':
+        event = {'id': seq, 'type': _BATCH_EVENT_TYPES.get(op), 'batch_id': row_id}
+    elif table_name in JOURNALED_RECORD_TABLES:
+        event = {
+            'id': seq, 'type': _RECORD_EVENT_TYPES.get(op), 'batch_id': batch_id,
+            'category': JOURNALED_RECORD_TABLES[table_name], 'record_id': row_id
+        }
+    else:
+        return None
+    if event['type'] is None:
+        return None
+    event['ts'] = _journal_timestamp(changed_at)
+    if batch_number is not None:
+        event['batch_number'] = batch_number
+        event['product_name'] = product_name
+    return event
+
+
+def read_journal_events(cursor, after_seq, through_seq):
+    """Events of the journal entries with ``after_seq < seq <= through_seq``."""
+    cursor.execute(
+        f'SELECT {_JOURNAL_COLUMNS} FROM change_journal WHERE seq > ? AND seq <= ? ORDER BY seq',
+        (after_seq, through_seq)
+    )
+    return [event for event in map(journal_event, cursor) if event is not None]
+
+
+class JournalFeed:
+    """Polls ``change_journal`` and publishes new entries to ``broker``."""
+
+    def __init__(self, database, broker):
+        self.database = database
+        self.broker = broker
+        self.last_seq = None
+        self._poll_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    def poll(self):
+        """Publish the entries written since the last poll; returns how many were published."""
+        with self._poll_lock, closing(self.database.get_connection()) as conn:
+            cursor = conn.cursor()
+            current = self.database.get_change_seq(cursor)
+            last_seq = self.last_seq
+            self.last_seq = current
+            # 首次轮询或无订阅者时只记录位置
+            if last_seq is None or current == last_seq or not self.broker.subscriber_count:
+                return 0
+            max_events = self.broker.max_queue
+            if (current < last_seq or current - last_seq > max_events
+                    or self.database.get_pruned_change_seq(cursor) > last_seq):
+                # 数据库被替换、日志已越过上次位置被清理（如批量导入）或积压过多：通知客户端整体刷新
+                self.broker.publish({'id': current, 'type': 'resync'})
+                return 1
+            published = read_journal_events(cursor, last_seq, current)
+        for event in published:
+            self.broker.publish(event)
+        return len(published)
+
+    def replay(self, after_seq):
+        """Events after ``after_seq`` (a client's Last-Event-ID) that are still in the journal.
+
+        Returns a single resync event when the entries have been pruned, there
+        are too many of them or the id does not belong to this journal.
+        """
+        with closing(self.database.get_connection()) as conn:
+            cursor = conn.cursor()
+            current = self.database.get_change_seq(cursor)
+            if after_seq == current:
+                return []
+            if (after_seq > current or after_seq < self.database.get_pruned_change_seq(cursor)
+                    or current - after_seq > self.broker.max_queue):
+                return [{'id': current, 'type': 'resync'}]
+            return read_journal_events(cursor, after_seq, current)
+
+    def ensure_started(self):
+        """Start the polling thread of this process (once per pid)."""
+        pid = os.getpid()
+        if self._thread is not None and self._pid == pid and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is not None and self._pid == pid and self._thread.is_alive():
+                return
+            self.last_seq = None
+            self._thread = threading.Thread(target=self._run, name='event-feed', daemon=True)
+            self._pid = pid
+            self._thread.start()
+
+    def _run(self):
+        interval = getattr(config, 'EVENT_STREAM_POLL_INTERVAL', 1)
+        while True:
+            try:
+                self.poll()
+            except Exception:
+                logger.exception('change journal poll failed')
+            time.sleep(interval)
+
+
+_FEEDS = {}
+_FEEDS_LOCK = threading.Lock()
+
+
+def get_feed(database):
+    """Shared ``JournalFeed`` of ``database``."""
+    key = os.path.abspath(database.db_path)
+    feed = _FEEDS.get(key)
+    if feed is None:
+        with _FEEDS_LOCK:
+            feed = _FEEDS.get(key)
+            if feed is None:
+                feed = _FEEDS[key] = JournalFeed(database, broker)
+    return feed
+
+
+def parse_last_event_id(value):
+    try:
+        seq = int(value)
+    except (TypeError, ValueError):
+        return None
+    return seq if seq >= 0 else None
+
+
+def stream_events(feed, subscription, last_event_id=None, keepalive=None):
+    """Generator yielding SSE frames for one client until it disconnects.
+
+    ``subscription`` comes from ``feed.broker.subscribe`` (which enforces the
+    per-process limit before the response starts) and is closed at the end.
+    """
+    keepalive = keepalive or getattr(config, 'EVENT_STREAM_KEEPALIVE', 15)
+    role = subscription.role
+    try:
+        feed.ensure_started()
+        yield 'retry: 3000\n\n'
+        replayed_seq = 0
+        if last_event_id is not None:
+            # 先订阅再补发，补发范围内的实时事件随后跳过
+            for event in feed.replay(last_event_id):
+                replayed_seq = event['id']
+                if event_visible_to(role, event):
+                    yield format_sse(event)
+        while True:
+            event = subscription.get(timeout=keepalive)
+            if event is None:
+                yield ': keepalive\n\n'
+                continue
+            if event.get('id') is not None and event['id'] <= replayed_seq:
+                continue
+            yield format_sse(event)
+    finally:
+        subscription.close()
@@ -0,0 +1,350 @@
+"""Background export jobs.
+
+``submit`` records a job in ``export_jobs`` and hands it to a small thread
+pool in the current process, so a long export never ties up a request
+thread.  The worker counts the matching rows, writes the export with
+``exporter.export_query`` to ``EXPORT_JOB_DIR`` (CSV gzip-compressed;
+Parquet/Arrow files are compressed internally), updates ``rows_written``
+at most every ``EXPORT_JOB_PROGRESS_INTERVAL`` seconds and finally records
+the ``export_logs`` entry.  All job writes go through ``Database.run_write``
+so they share the group commit of the request writes.
+
+Status and download requests only read the table and the file, so any
+worker process can serve them.  Finished files expire after
+``EXPORT_JOB_TTL_HOURS``: a job past ``expires_at`` is reported (and
+expired) as soon as it is read, and the ``expire_exports`` maintenance task
+deletes the remaining files.
+
+Every process refreshes ``heartbeat_at`` of its queued and running jobs
+every ``EXPORT_JOB_HEARTBEAT_INTERVAL`` seconds.  An active job whose
+process is gone or whose heartbeat is older than
+``EXPORT_JOB_HEARTBEAT_TIMEOUT`` (the pid may have been reused by another
+worker) is reported as failed.
+"""
+
+import gzip
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from datetime import datetime, timedelta, timezone
+
+import config
+import exporter
+
+logger = logging.getLogger('minimes.export_jobs')
+
+STATUS_QUEUED = 'queued'
+STATUS_RUNNING = 'running'
+STATUS_COMPLETED = 'completed'
+STATUS_FAILED = 'failed'
+STATUS_EXPIRED = 'expired'
+ACTIVE_STATUSES = (STATUS_QUEUED, STATUS_RUNNING)
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+# 本进程排队/执行中的任务：{job_id: database}，由心跳线程定期刷新 heartbeat_at
+_active_jobs = {}
+_heartbeat_thread = None
+_heartbeat_pid = None
+_heartbeat_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor, _executor_pid
+    pid = os.getpid()
+    # 预派生的工作进程不能复用父进程中的线程池
+    if _executor is None or _executor_pid != pid:
+        with _executor_lock:
+            if _executor is None or _executor_pid != pid:
+                _executor = ThreadPoolExecutor(
+                    max_workers=getattr(config, 'EXPORT_JOB_WORKERS', 2), thread_name_prefix='export-job'
+                )
+                _executor_pid = pid
+    return _executor
+
+
+def _heartbeat_loop():
+    interval = getattr(config, 'EXPORT_JOB_HEARTBEAT_INTERVAL', 10)
+    while True:
+        time.sleep(interval)
+        databases = {}
+        for job_id, database in list(_active_jobs.items()):
+            databases.setdefault(database, []).append(job_id)
+        for database, job_ids in databases.items():
+            try:
+                database.run_write(lambda conn, ids=json.dumps(job_ids): conn.execute(
+                    '''UPDATE export_jobs SET heartbeat_at = CURRENT_TIMESTAMP
+                        WHERE id IN (SELECT value FROM json_each(?)) AND status IN (?, ?)''',
+                    (ids, *ACTIVE_STATUSES)
+                ))
+            except Exception:
+                logger.exception('export job heartbeat failed')
+
+
+def _track(database, job_id):
+    global _heartbeat_thread, _heartbeat_pid
+    _active_jobs[job_id] = database
+    pid = os.getpid()
+    if _heartbeat_thread is None or _heartbeat_pid != pid or not _heartbeat_thread.is_alive():
+        with _heartbeat_lock:
+            if _heartbeat_thread is None or _heartbeat_pid != pid or not _heartbeat_thread.is_alive():
+                _heartbeat_thread = threading.Thread(target=_heartbeat_loop, name='export-heartbeat', daemon=True)
+                _heartbeat_pid = pid
+                _heartbeat_thread.start()
+
+
+def job_file_path(job_id, fmt):
+    suffix = exporter.EXPORT_FORMATS[fmt][1]
+    return os.path.join(config.EXPORT_JOB_DIR, f'{job_id}{suffix}' + ('.gz' if fmt == 'csv' else ''))
+
+
+def submit(database, args, fmt, selected=None, filename=None, user=None, ip_address='', source=None):
+    """Queue an export of the query selected by ``args``; returns the job id.
+
+    The rows are read from ``source`` (e.g. the analytics snapshot) when
+    given; the job itself is always tracked in ``database``.  Invalid
+    requests raise ``exporter.ExportError`` before anything is queued.
+    """
+    args = {key: value for key, value in dict(args).items() if value not in (None, '')}
+    exporter.validate(args, fmt, selected)
+    user = user or {}
+    job_id = secrets.token_hex(16)
+
+    database.run_write(lambda conn: conn.execute(
+        '''INSERT INTO export_jobs (id, user_id, username, ip_address, format, params_json, columns_json,
+                                    filename, status, worker_pid, heartbeat_at)
+           VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)''',
+        (job_id, user.get('id'), user.get('username') or '', ip_address, fmt,
+         json.dumps(args, ensure_ascii=False), json.dumps(selected or []), filename,
+         STATUS_QUEUED, os.getpid())
+    ))
+
+    expire_jobs(database)
+    _track(database, job_id)
+    _get_executor().submit(run_job, database, job_id, source)
+    return job_id
+
+
+def _update(database, job_id, **fields):
+    assignments = ', '.join(f'{name} = ?' for name in fields)
+    database.run_write(
+        lambda conn: conn.execute(f'UPDATE export_jobs SET {assignments} WHERE id = ?', (*fields.values(), job_id))
+    )
+
+
+def _progress_reporter(database, job_id):
+    """``progress`` callback writing ``rows_written`` at most once per ``EXPORT_JOB_PROGRESS_INTERVAL``."""
+    interval = getattr(config, 'EXPORT_JOB_PROGRESS_INTERVAL', 1.0)
+    last_report = time.monotonic()
+
+    def report(written):
+        nonlocal last_report
+        now = time.monotonic()
+        if now - last_report < interval:
+            return
+        last_report = now
+        _update(database, job_id, rows_written=written)
+    return report
+
+
+def run_job(database, job_id, source=None):
+    """Execute one queued job (runs on an export worker thread)."""
+    try:
+        _run_job(database, job_id, source)
+    finally:
+        _active_jobs.pop(job_id, None)
+
+
+def _run_job(database, job_id, source):
+    with closing(database.get_connection()) as conn:
+        job = conn.execute('SELECT * FROM export_jobs WHERE id = ?', (job_id,)).fetchone()
+    if job is None or job['status'] != STATUS_QUEUED:
+        return
+
+    fmt = job['format']
+    args = json.loads(job['params_json'])
+    selected = json.loads(job['columns_json'] or '[]') or None
+    path = job_file_path(job_id, fmt)
+    partial_path = path + '.part'
+    _update(database, job_id, status=STATUS_RUNNING, started_at=_now_sql(), heartbeat_at=_now_sql())
+
+    try:
+        os.makedirs(config.EXPORT_JOB_DIR, exist_ok=True)
+        # 进度经 run_write 由写入线程提交，不占用读取导出数据的连接与读事务
+        with closing((source or database).get_connection()) as conn:
+            _update(database, job_id, rows_total=exporter.count_rows(conn, args))
+            if fmt == 'csv':
+                handle = gzip.open(partial_path, 'wb', compresslevel=getattr(config, 'EXPORT_JOB_GZIP_LEVEL', 6))
+            else:
+                handle = open(partial_path, 'wb')
+            with handle:
+                rows = exporter.export_query(
+                    conn, args, fmt, handle, selected=selected,
+                    progress=_progress_reporter(database, job_id)
+                )
+        os.replace(partial_path, path)
+    except Exception as exc:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        _update(database, job_id, status=STATUS_FAILED, error=str(exc) or exc.__class__.__name__,
+                finished_at=_now_sql())
+        return
+
+    file_size = os.path.getsize(path)
+    ttl_hours = getattr(config, 'EXPORT_JOB_TTL_HOURS', 24)
+
+    def complete(conn):
+        conn.execute(
+            f'''UPDATE export_jobs
+                   SET status = ?, rows_written = ?, file_path = ?, file_size_bytes = ?,
+                       finished_at = CURRENT_TIMESTAMP, expires_at = datetime('now', '+{float(ttl_hours)} hours')
+                 WHERE id = ?''',
+            (STATUS_COMPLETED, rows, path, file_size, job_id)
+        )
+        conn.execute(
+            '''INSERT INTO export_logs (user_id, username, ip_address, file_size_bytes)
+               VALUES (?, ?, ?, ?)''',
+            (job['user_id'], job['username'], job['ip_address'], file_size)
+        )
+    database.run_write(complete)
+
+
+def _now_sql(offset_seconds=0):
+    # 与 CURRENT_TIMESTAMP 相同的 UTC 文本格式
+    return (datetime.now(timezone.utc) + timedelta(seconds=offset_seconds)).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _process_alive(pid):
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _is_orphaned(job):
+    """Active job whose process exited or stopped sending heartbeats."""
+    if job['status'] not in ACTIVE_STATUSES:
+        return False
+    if not _process_alive(job['worker_pid']):
+        return True
+    # pid 可能已被其它进程复用，以心跳时间为准
+    timeout = getattr(config, 'EXPORT_JOB_HEARTBEAT_TIMEOUT', 60)
+    heartbeat = job['heartbeat_at'] or job['started_at'] or job['created_at']
+    return not heartbeat or heartbeat <= _now_sql(-timeout)
+
+
+def _fail_orphaned(database, job_ids):
+    finished_at = _now_sql()
+    database.run_write(lambda conn: conn.executemany(
+        'UPDATE export_jobs SET status = ?, error = ?, finished_at = ? WHERE id = ? AND status IN (?, ?)',
+        [(STATUS_FAILED, '导出进程已退出', finished_at, job_id, *ACTIVE_STATUSES) for job_id in job_ids]
+    ))
+
+
+def _serialize(job):
+    total = job['rows_total']
+    written = job['rows_written'] or 0
+    if job['status'] == STATUS_COMPLETED:
+        progress = 1.0
+    elif total:
+        progress = round(min(written / total, 1.0), 4)
+    else:
+        progress = 0.0
+    return {
+        'id': job['id'],
+        'username': job['username'],
+        'format': job['format'],
+        'filename': job['filename'],
+        'status': STATUS_EXPIRED if _is_past_expiry(job) else job['status'],
+        'rows_total': total,
+        'rows_written': written,
+        'progress': progress,
+        'file_size_bytes': job['file_size_bytes'],
+        'error': job['error'],
+        'created_at': job['created_at'],
+        'started_at': job['started_at'],
+        'finished_at': job['finished_at'],
+        'expires_at': job['expires_at'],
+    }
+
+
+def _is_past_expiry(job):
+    # expires_at 与 _now_sql() 同为 UTC 文本，可直接按字符串比较
+    return job['status'] == STATUS_COMPLETED and bool(job['expires_at']) and job['expires_at'] <= _now_sql()
+
+
+def get_job(database, job_id):
+    """Job row as a dict (None when unknown); orphaned jobs are marked failed, overdue ones expired."""
+    with closing(database.get_connection()) as conn:
+        job = conn.execute('SELECT * FROM export_jobs WHERE id = ?', (job_id,)).fetchone()
+    if job is None:
+        return None
+    if _is_orphaned(job):
+        _fail_orphaned(database, [job_id])
+        return get_job(database, job_id)
+    if _is_past_expiry(job):
+        _expire(database, [job])
+        return get_job(database, job_id)
+    result = _serialize(job)
+    result['user_id'] = job['user_id']
+    result['file_path'] = job['file_path']
+    return result
+
+
+def list_jobs(database, user_id=None, limit=20):
+    query = 'SELECT * FROM export_jobs'
+    params = []
+    if user_id is not None:
+        query += ' WHERE user_id = ?'
+        params.append(user_id)
+    query += ' ORDER BY created_at DESC, rowid DESC LIMIT ?'
+    params.append(int(limit))
+    with closing(database.get_connection()) as conn:
+        return [_serialize(job) for job in conn.execute(query, params).fetchall()]
+
+
+def _expire(database, jobs):
+    for job in jobs:
+        if job['file_path'] and os.path.exists(job['file_path']):
+            os.remove(job['file_path'])
+    database.run_write(lambda conn: conn.executemany(
+        'UPDATE export_jobs SET status = ?, file_path = NULL WHERE id = ? AND status = ?',
+        [(STATUS_EXPIRED, job['id'], STATUS_COMPLETED) for job in jobs]
+    ))
+
+
+def fail_orphaned_jobs(database):
+    """Mark active jobs whose process is gone or silent as failed; returns the count."""
+    with closing(database.get_connection()) as conn:
+        jobs = conn.execute(
+            'SELECT * FROM export_jobs WHERE status IN (?, ?)', ACTIVE_STATUSES
+        ).fetchall()
+    orphaned = [job['id'] for job in jobs if _is_orphaned(job)]
+    if orphaned:
+        _fail_orphaned(database, orphaned)
+    return len(orphaned)
+
+
+def expire_jobs(database):
+    """Delete files of completed jobs past ``expires_at``; returns the count."""
+    with closing(database.get_connection()) as conn:
+        expired = conn.execute(
+            '''SELECT id, file_path FROM export_jobs
+                WHERE status = ? AND expires_at <= CURRENT_TIMESTAMP''',
+            (STATUS_COMPLETED,)
+        ).fetchall()
+    if expired:
+        _expire(database, expired)
+    return len(expired)
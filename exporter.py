@@ -0,0 +1,312 @@
+"""Export of query results as CSV, Parquet or Arrow IPC.
+
+Rows are read from the ``query_builder`` query in chunks of
+``EXPORT_CHUNK_SIZE`` and written chunk by chunk, so memory use does not
+grow with the size of the export.  Structured columns are flattened into
+typed columns: declared material/quality extras become ``material_<key>`` /
+``quality_<key>`` and declared equipment parameters become
+``equipment_param_<key>``; times are exported as timestamps.
+
+Parquet and Arrow IPC need the optional ``pyarrow`` package; CSV is always
+available.
+"""
+
+import csv
+import io
+import json
+from datetime import datetime
+
+import config
+from database import get_declared_extra_fields
+import archive
+from query_builder import (EXTRA_QUERY_SOURCES, QUERY_SELECT, build_query_conditions, federated_count,
+                           federated_query, query_order_terms)
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:  # 可选依赖：未安装时只能导出 CSV
+    pyarrow = None
+
+# 格式 -> (MIME 类型, 文件后缀)
+EXPORT_FORMATS = {
+    'csv': ('text/csv', '.csv'),
+    'parquet': ('application/vnd.apache.parquet', '.parquet'),
+    'arrow': ('application/vnd.apache.arrow.file', '.arrow'),
+}
+
+# 基础列：(列名, 结果列, 类型, 表头)
+BASE_COLUMNS = (
+    ('batch_number', 'batch_number', 'text', '批号'),
+    ('product_name', 'product_name', 'text', '产品名称'),
+    ('process_segment', 'process_segment', 'text', '工艺段'),
+    ('status', 'status', 'text', '状态'),
+    ('start_time', 'start_time', 'datetime', '开始时间'),
+    ('end_time', 'end_time', 'datetime', '结束时间'),
+    ('material_code', 'material_code', 'text', '物料编码'),
+    ('material_name', 'material_name', 'text', '物料名称'),
+    ('weight', 'weight', 'number', '重量'),
+    ('material_unit', 'material_unit', 'text', '单位'),
+    ('supplier', 'supplier', 'text', '供应商'),
+    ('equipment_code', 'equipment_code', 'text', '设备编码'),
+    ('equipment_name', 'equipment_name', 'text', '设备名称'),
+    ('equipment_start', 'equipment_start', 'datetime', '设备开始时间'),
+    ('equipment_end', 'equipment_end', 'datetime', '设备结束时间'),
+    ('equipment_status', 'equipment_status', 'text', '设备状态'),
+    ('parameters_json', 'parameters_json', 'text', '设备参数'),
+    ('test_item', 'test_item', 'text', '检测项目'),
+    ('test_value', 'test_value', 'number', '检测值'),
+    ('quality_unit', 'quality_unit', 'text', '检测单位'),
+    ('standard_min', 'standard_min', 'number', '标准下限'),
+    ('standard_max', 'standard_max', 'number', '标准上限'),
+    ('result', 'result', 'text', '结果'),
+)
+
+_FIELD_TYPES = {'number': 'number', 'integer': 'integer'}
+
+
+class ExportError(Exception):
+    pass
+
+
+class ExportColumn:
+    __slots__ = ('name', 'type', 'label', 'source', 'key')
+
+    def __init__(self, name, column_type, label, source, key=None):
+        self.name = name
+        self.type = column_type
+        self.label = label
+        # source：结果列名；key 不为空时表示从该 JSON 列中取出的键
+        self.source = source
+        self.key = key
+
+
+def available_formats():
+    return [name for name in EXPORT_FORMATS if name == 'csv' or pyarrow is not None]
+
+
+def _equipment_parameters():
+    """Declared equipment parameters ``{key: (type, label)}`` across all segments."""
+    parameters = {}
+    for definition in config.get_equipment_definitions():
+        for parameter in definition.get('parameters') or []:
+            key = parameter.get('key')
+            if not key:
+                continue
+            column_type = _FIELD_TYPES.get(parameter.get('type'), 'text')
+            if key in parameters and parameters[key][0] != column_type:
+                # 不同设备对同一参数声明了不同类型时按文本导出
+                column_type = 'text'
+            parameters[key] = (column_type, parameters.get(key, (None, parameter.get('label') or key))[1])
+    return parameters
+
+
+def export_columns(selected=None):
+    """All export columns in output order, optionally restricted to ``selected`` names."""
+    columns = [ExportColumn(name, column_type, label, source) for name, source, column_type, label in BASE_COLUMNS]
+    for alias, prefix, table in EXTRA_QUERY_SOURCES:
+        for field in get_declared_extra_fields(table):
+            columns.append(ExportColumn(
+                f"{prefix}_{field['key']}", _FIELD_TYPES.get(field.get('type'), 'text'),
+                field.get('label') or field['key'], f'{prefix}_attributes_json', field['key']
+            ))
+    for key, (column_type, label) in sorted(_equipment_parameters().items()):
+        columns.append(ExportColumn(f'equipment_param_{key}', column_type, label, 'parameters_json', key))
+
+    if selected:
+        wanted = set(selected)
+        unknown = wanted - {column.name for column in columns}
+        if unknown:
+            raise ExportError(f"不支持的导出列: {', '.join(sorted(unknown))}")
+        columns = [column for column in columns if column.name in wanted]
+    return columns
+
+
+def _to_number(value):
+    if value is None or value == '' or isinstance(value, bool):
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _to_integer(value):
+    number = _to_number(value)
+    return int(number) if number is not None and number.is_integer() else None
+
+
+def _to_datetime(value):
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(str(value).strip())
+    except ValueError:
+        return None
+    return parsed.replace(tzinfo=None)
+
+
+_CONVERTERS = {
+    'number': _to_number,
+    'integer': _to_integer,
+    'datetime': _to_datetime,
+    'text': lambda value: None if value is None else str(value),
+}
+
+
+def iter_column_chunks(conn, args, columns, chunk_size=None, limit=None, offset=0):
+    """Yield ``(row_count, {column name: [typed values]})`` chunks of the query result."""
+    where, params, order_terms = _query_parts(args)
+    sql, params = federated_query(QUERY_SELECT, where, params, order_terms, _attach_archives(conn, args))
+    if limit is not None:
+        sql += ' LIMIT ? OFFSET ?'
+        params = params + [limit, offset]
+
+    chunk_size = chunk_size or config.EXPORT_CHUNK_SIZE
+    json_sources = {column.source for column in columns if column.key}
+    cursor = conn.cursor()
+    cursor.execute(sql, params)
+    try:
+        for rows in iter(lambda: cursor.fetchmany(chunk_size), []):
+            data = {column.name: [] for column in columns}
+            for row in rows:
+                # 每行每个 JSON 列只解析一次
+                documents = {}
+                for source in json_sources:
+                    try:
+                        documents[source] = json.loads(row[source]) if row[source] else {}
+                    except (TypeError, ValueError):
+                        documents[source] = {}
+                    if not isinstance(documents[source], dict):
+                        documents[source] = {}
+                for column in columns:
+                    raw = documents[column.source].get(column.key) if column.key else row[column.source]
+                    data[column.name].append(_CONVERTERS[column.type](raw))
+            yield len(rows), data
+    finally:
+        cursor.close()
+
+
+def _format_csv_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return value
+
+
+def _write_csv(chunks, columns, handle):
+    # utf-8-sig：Excel 打开时能正确识别中文
+    text = io.TextIOWrapper(handle, encoding='utf-8-sig', newline='', write_through=True)
+    try:
+        writer = csv.writer(text)
+        writer.writerow([column.label for column in columns])
+        total = 0
+        for count, data in chunks:
+            values = [data[column.name] for column in columns]
+            writer.writerows([_format_csv_value(value) for value in row] for row in zip(*values))
+            total += count
+        text.flush()
+        return total
+    finally:
+        text.detach()
+
+
+def arrow_schema(columns):
+    types = {
+        'number': pyarrow.float64(),
+        'integer': pyarrow.int64(),
+        'datetime': pyarrow.timestamp('s'),
+        'text': pyarrow.string(),
+    }
+    return pyarrow.schema(
+        [pyarrow.field(column.name, types[column.type]) for column in columns],
+        metadata={f'label.{column.name}': column.label for column in columns}
+    )
+
+
+def _write_arrow(chunks, columns, handle, fmt):
+    schema = arrow_schema(columns)
+    compression = getattr(config, 'EXPORT_ARROW_COMPRESSION', None)
+    if fmt == 'parquet':
+        writer = pyarrow.parquet.ParquetWriter(
+            handle, schema, compression=getattr(config, 'EXPORT_PARQUET_COMPRESSION', 'snappy')
+        )
+    else:
+        options = pyarrow.ipc.IpcWriteOptions(compression=compression)
+        writer = pyarrow.ipc.new_file(handle, schema, options=options)
+    total = 0
+    try:
+        for count, data in chunks:
+            batch = pyarrow.RecordBatch.from_pydict(data, schema=schema)
+            if fmt == 'parquet':
+                writer.write_table(pyarrow.Table.from_batches([batch], schema=schema))
+            else:
+                writer.write_batch(batch)
+            total += count
+    finally:
+        writer.close()
+    return total
+
+
+def check_format(fmt):
+    if fmt not in EXPORT_FORMATS:
+        raise ExportError(f'不支持的导出格式: {fmt}')
+    if fmt != 'csv' and pyarrow is None:
+        raise ExportError('导出 Parquet/Arrow 需要安装 pyarrow')
+
+
+def _query_parts(args):
+    where, params, sort_columns, error = build_query_conditions(args)
+    if error:
+        raise ExportError(error)
+    order_terms, error = query_order_terms(args, sort_columns)
+    if error:
+        raise ExportError(error)
+    return where, params, order_terms
+
+
+def _attach_archives(conn, args):
+    try:
+        return archive.attach_for_query(conn, args)
+    except archive.ArchiveError as exc:
+        raise ExportError(str(exc))
+
+
+def validate(args, fmt, selected=None):
+    """Raise ``ExportError`` for an export request that cannot run."""
+    check_format(fmt)
+    export_columns(selected)
+    _query_parts(args)
+
+
+def count_rows(conn, args):
+    where, params, _ = _query_parts(args)
+    return conn.execute(*federated_count(where, params, _attach_archives(conn, args))).fetchone()[0] or 0
+
+
+def _report_progress(chunks, progress):
+    written = 0
+    for count, data in chunks:
+        yield count, data
+        written += count
+        progress(written)
+
+
+def export_query(conn, args, fmt, handle, selected=None, chunk_size=None, limit=None, offset=0, progress=None):
+    """Write the query result selected by ``args`` to the binary file ``handle``.
+
+    ``progress`` is called with the number of rows written after every
+    chunk.  Returns the number of exported rows.
+    """
+    check_format(fmt)
+    columns = export_columns(selected)
+    chunks = iter_column_chunks(conn, args, columns, chunk_size=chunk_size, limit=limit, offset=offset)
+    if progress is not None:
+        chunks = _report_progress(chunks, progress)
+    if fmt == 'csv':
+        return _write_csv(chunks, columns, handle)
+    return _write_arrow(chunks, columns, handle, fmt)
@@ -0,0 +1,40 @@
+"""Non-blocking inter-process lock based on ``flock``.
+
+Used where only one worker process should do a job at a time (snapshot
+refreshes, database maintenance).  ``with FileLock(path) as acquired`` yields
+False when another process holds the lock; on platforms without ``fcntl``
+(Windows runs a single process) the lock is always acquired.
+"""
+
+import os
+
+try:
+    import fcntl
+except ImportError:  # Windows：单进程运行，无需跨进程锁
+    fcntl = None
+
+
+class FileLock:
+    def __init__(self, path):
+        self.path = path
+        self._handle = None
+
+    def __enter__(self):
+        if fcntl is None:
+            return True
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._handle = open(self.path, 'a')
+        try:
+            fcntl.flock(self._handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            self._handle.close()
+            self._handle = None
+            return False
+        return True
+
+    def __exit__(self, *exc_info):
+        if self._handle is not None:
+            fcntl.flock(self._handle, fcntl.LOCK_UN)
+            self._handle.close()
+            self._handle = None
+        return False
@@ -0,0 +1,270 @@
+"""Scheduled SQLite maintenance of the production database.
+
+The tasks in ``TASKS`` run in order:
+
+* ``prune_journal``: drop change-journal entries older than
+  ``CHANGE_JOURNAL_RETENTION_DAYS`` (formerly done once at startup).
+* ``checkpoint``: ``PRAGMA wal_checkpoint`` so the WAL file does not grow
+  without bound between the automatic passive checkpoints.
+* ``optimize``: ``PRAGMA optimize``, which re-analyzes the tables whose
+  statistics the planner found out of date.
+* ``analyze``: a full ``ANALYZE`` bounded by ``PRAGMA analysis_limit``.
+* ``incremental_vacuum``: return up to ``MAINTENANCE_VACUUM_PAGES`` free pages
+  (left behind by batch deletes and archiving) to the file system.  Needs
+  ``auto_vacuum = INCREMENTAL``; new databases are created that way, existing
+  ones are converted once with ``tools/db_maintenance.py
+  --convert-incremental-vacuum``.
+* ``attachment_gc``: quarantine attachment files no record references and
+  purge expired quarantine folders (``attachment_gc.py``).
+* ``expire_exports``: delete the files of background exports past their
+  ``expires_at`` and fail jobs whose worker stopped sending heartbeats
+  (``export_jobs.py``).
+
+A background thread per process (``get_scheduler(db).ensure_started()``) checks every
+``MAINTENANCE_CHECK_INTERVAL`` seconds which tasks are due according to
+``MAINTENANCE_TASK_INTERVALS``; the tasks in ``MAINTENANCE_WINDOW_TASKS`` only
+run inside ``MAINTENANCE_WINDOW``.  The last run of every task is stored in
+``app_meta`` and a lock file keeps worker processes from running maintenance
+at the same time.  Every task is timed, logged to ``minimes.maintenance``
+and observed in ``minimes_maintenance_task_seconds``.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import closing
+from datetime import datetime
+
+import attachment_gc
+import config
+import export_jobs
+import metrics
+from file_lock import FileLock
+
+logger = logging.getLogger('minimes.maintenance')
+
+TASK_DURATION = metrics.registry.register(metrics.Histogram(
+    'minimes_maintenance_task_seconds', 'Duration of database maintenance tasks.', ('task',),
+    buckets=(0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0)))
+
+_CHECKPOINT_MODES = ('PASSIVE', 'FULL', 'RESTART', 'TRUNCATE')
+_LAST_RUN_KEY = 'maintenance_last_{}'
+
+
+class MaintenanceError(Exception):
+    pass
+
+
+class MaintenanceBusy(MaintenanceError):
+    """Another process is running maintenance."""
+
+
+def _prune_journal(database, conn):
+    return {'deleted': database.prune_change_journal()}
+
+
+def _checkpoint(database, conn):
+    mode = str(getattr(config, 'MAINTENANCE_CHECKPOINT_MODE', 'TRUNCATE')).upper()
+    if mode not in _CHECKPOINT_MODES:
+        raise MaintenanceError(f'invalid MAINTENANCE_CHECKPOINT_MODE: {mode}')
+    busy, log_pages, checkpointed = conn.execute(f'PRAGMA wal_checkpoint({mode})').fetchone()
+    # 非 WAL 模式下两个页数均为 -1
+    return {'mode': mode, 'busy': bool(busy), 'log_pages': log_pages, 'checkpointed_pages': checkpointed}
+
+
+def _optimize(database, conn):
+    conn.execute('PRAGMA optimize').fetchall()
+    return {}
+
+
+def _analyze(database, conn):
+    limit = int(getattr(config, 'MAINTENANCE_ANALYSIS_LIMIT', 0) or 0)
+    conn.execute(f'PRAGMA analysis_limit = {limit}').fetchall()
+    conn.execute('ANALYZE')
+    return {'analysis_limit': limit}
+
+
+def _incremental_vacuum(database, conn):
+    if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+        return {'skipped': 'auto_vacuum is not INCREMENTAL, run tools/db_maintenance.py --convert-incremental-vacuum'}
+    page_size = conn.execute('PRAGMA page_size').fetchone()[0]
+    free_before = conn.execute('PRAGMA freelist_count').fetchone()[0]
+    if free_before:
+        pages = int(getattr(config, 'MAINTENANCE_VACUUM_PAGES', 0) or 0)
+        # execute 只单步执行一次（只释放一页），executescript 会执行到结束
+        conn.executescript(f'PRAGMA incremental_vacuum({pages})')
+    free_after = conn.execute('PRAGMA freelist_count').fetchone()[0]
+    return {
+        'freed_pages': free_before - free_after,
+        'freed_bytes': (free_before - free_after) * page_size,
+        'free_pages_left': free_after,
+    }
+
+
+def _attachment_gc(database, conn):
+    return attachment_gc.run(database)
+
+
+def _expire_exports(database, conn):
+    return {'expired': export_jobs.expire_jobs(database), 'orphaned': export_jobs.fail_orphaned_jobs(database)}
+
+
+# 维护任务：按顺序执行
+TASKS = (
+    ('prune_journal', _prune_journal),
+    ('checkpoint', _checkpoint),
+    ('optimize', _optimize),
+    ('analyze', _analyze),
+    ('incremental_vacuum', _incremental_vacuum),
+    ('attachment_gc', _attachment_gc),
+    ('expire_exports', _expire_exports),
+)
+TASK_NAMES = tuple(name for name, _ in TASKS)
+
+
+def in_window(now=None):
+    """Whether ``now`` (local time) falls inside ``MAINTENANCE_WINDOW``."""
+    window = getattr(config, 'MAINTENANCE_WINDOW', None)
+    if not window:
+        return True
+    current = (now or datetime.now()).strftime('%H:%M')
+    start, end = window
+    if start <= end:
+        return start <= current < end
+    # 跨越午夜的窗口，如 ("23:00", "02:00")
+    return current >= start or current < end
+
+
+def last_runs(database):
+    """``{task: last run record or None}`` read from ``app_meta``."""
+    with closing(database.get_connection()) as conn:
+        rows = dict(conn.execute(
+            "SELECT key, value FROM app_meta WHERE key LIKE 'maintenance_last_%'"
+        ).fetchall())
+    return {name: json.loads(rows[_LAST_RUN_KEY.format(name)]) if _LAST_RUN_KEY.format(name) in rows else None
+            for name in TASK_NAMES}
+
+
+def due_tasks(database, now=None):
+    """Names of the tasks whose interval has elapsed (respecting the window)."""
+    intervals = getattr(config, 'MAINTENANCE_TASK_INTERVALS', {})
+    window_tasks = getattr(config, 'MAINTENANCE_WINDOW_TASKS', ())
+    inside_window = in_window(now)
+    epoch = time.time() if now is None else now.timestamp()
+    due = []
+    for name, last in last_runs(database).items():
+        interval = intervals.get(name)
+        if interval is None:
+            continue
+        if name in window_tasks and not inside_window:
+            continue
+        if last is None or epoch - last['finished_at'] >= interval:
+            due.append(name)
+    return due
+
+
+def _lock_path():
+    return os.path.join(config.SERVER_STATE_DIR, 'maintenance.lock')
+
+
+def run_tasks(database, names=None):
+    """Run the given tasks (default: all, in ``TASKS`` order) and return their records.
+
+    Raises ``MaintenanceBusy`` when another process holds the maintenance
+    lock.  A failing task is logged and recorded with its error; the
+    remaining tasks still run.
+    """
+    names = TASK_NAMES if names is None else tuple(names)
+    unknown = [name for name in names if name not in TASK_NAMES]
+    if unknown:
+        raise MaintenanceError(f'unknown maintenance tasks: {", ".join(unknown)}')
+
+    results = {}
+    with FileLock(_lock_path()) as acquired:
+        if not acquired:
+            raise MaintenanceBusy('maintenance is already running in another process')
+        with closing(database.get_connection()) as conn:
+            # PRAGMA 与检查点需在事务之外执行
+            conn.isolation_level = None
+            for name, task in TASKS:
+                if name not in names:
+                    continue
+                started = time.perf_counter()
+                record = {'started_at': time.time()}
+                try:
+                    record['result'] = task(database, conn)
+                except Exception as exc:
+                    logger.exception('maintenance task %s failed', name)
+                    record['error'] = str(exc)
+                seconds = time.perf_counter() - started
+                record['seconds'] = round(seconds, 3)
+                record['finished_at'] = time.time()
+                TASK_DURATION.observe(seconds, name)
+                if 'error' not in record:
+                    logger.info('maintenance task %s finished in %.3fs: %s', name, seconds, record['result'])
+                conn.execute(
+                    'INSERT OR REPLACE INTO app_meta (key, value) VALUES (?, ?)',
+                    (_LAST_RUN_KEY.format(name), json.dumps(record, ensure_ascii=False))
+                )
+                results[name] = record
+    return results
+
+
+class Scheduler:
+    def __init__(self, database):
+        self.database = database
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    def ensure_started(self):
+        """Start the maintenance thread of this process (once per pid)."""
+        pid = os.getpid()
+        if self._thread is not None and self._pid == pid and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == pid and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name='db-maintenance', daemon=True)
+            self._pid = pid
+            self._thread.start()
+
+    def _run(self):
+        interval = getattr(config, 'MAINTENANCE_CHECK_INTERVAL', 300)
+        while True:
+            try:
+                names = due_tasks(self.database)
+                if names:
+                    run_tasks(self.database, names)
+            except MaintenanceBusy:
+                pass
+            except Exception:
+                logger.exception('database maintenance check failed')
+            time.sleep(interval)
+
+
+_SCHEDULERS = {}
+_SCHEDULERS_LOCK = threading.Lock()
+
+
+def get_scheduler(database):
+    """Shared ``Scheduler`` of ``database``."""
+    key = os.path.abspath(database.db_path)
+    scheduler = _SCHEDULERS.get(key)
+    if scheduler is None:
+        with _SCHEDULERS_LOCK:
+            scheduler = _SCHEDULERS.get(key)
+            if scheduler is None:
+                scheduler = _SCHEDULERS[key] = Scheduler(database)
+    return scheduler
+
+
+def convert_to_incremental_vacuum(database):
+    """Switch an existing file to ``auto_vacuum = INCREMENTAL`` (runs a full VACUUM)."""
+    with closing(database.get_connection()) as conn:
+        conn.isolation_level = None
+        conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        conn.execute('VACUUM')
+        return conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 2
@@ -0,0 +1,334 @@
+"""In-process metrics rendered in the Prometheus text exposition format.
+
+``server.py`` records per-endpoint request latency, status codes and
+response sizes; ``InstrumentedConnection`` (used by
+``Database.get_connection``) times every SQL statement and attributes it to
+the request running on the current thread.  JSON serialisation and
+attachment I/O are timed as named sections, so a slow endpoint can be split
+into SQL, ``json`` and ``attachments`` time.  Slow statements are handed to
+``slow_queries``.
+
+Each worker process keeps its own registry; ``/api/admin/metrics`` reports
+the process that served the scrape (see the ``pid`` in
+``minimes_process_info``).
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+import config
+import slow_queries
+
+DEFAULT_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DEFAULT_SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+DEFAULT_COUNT_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100, 250, 1000)
+NO_REQUEST = '-'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_number(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels):
+        return self._values.get(labels, 0)
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, value in items:
+            yield f'{self.name}{_format_labels(self.labelnames, labels)} {_format_number(value)}'
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def set(self, value, *labels):
+        with self._lock:
+            self._values[labels] = value
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # 每组标签：[各桶计数..., +Inf 计数, 总和]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                state = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            state[index] += 1
+            state[-1] += value
+
+    def count(self, *labels):
+        state = self._values.get(labels)
+        return sum(state[:-1]) if state else 0
+
+    def samples(self):
+        with self._lock:
+            items = sorted((labels, list(state)) for labels, state in self._values.items())
+        for labels, state in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), state[:-1]):
+                cumulative += bucket_count
+                le = f'le="{_format_number(float(bound))}"'
+                yield f'{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}'
+            yield f'{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_number(state[-1])}'
+            yield f'{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}'
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = [
+            '# HELP minimes_process_info Process serving this scrape.',
+            '# TYPE minimes_process_info gauge',
+            f'minimes_process_info{{pid="{os.getpid()}"}} 1',
+        ]
+        for metric in self._metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+_latency_buckets = getattr(config, 'METRICS_LATENCY_BUCKETS', DEFAULT_LATENCY_BUCKETS)
+
+REQUESTS = registry.register(Counter(
+    'minimes_http_requests_total', 'HTTP requests by endpoint, method and status.',
+    ('endpoint', 'method', 'status')))
+REQUEST_DURATION = registry.register(Histogram(
+    'minimes_http_request_duration_seconds', 'Time spent in the view including SQL and serialisation.',
+    ('endpoint', 'method'), _latency_buckets))
+RESPONSE_SIZE = registry.register(Histogram(
+    'minimes_http_response_size_bytes', 'Uncompressed response body size.',
+    ('endpoint',), getattr(config, 'METRICS_SIZE_BUCKETS', DEFAULT_SIZE_BUCKETS)))
+SQL_STATEMENTS = registry.register(Counter(
+    'minimes_sql_statements_total', 'SQL statements executed, by request endpoint.', ('endpoint',)))
+SQL_DURATION = registry.register(Counter(
+    'minimes_sql_seconds_total', 'Time spent in SQLite (execute and fetch), by request endpoint.', ('endpoint',)))
+REQUEST_SQL_STATEMENTS = registry.register(Histogram(
+    'minimes_http_request_sql_statements', 'SQL statements per request.', ('endpoint',), DEFAULT_COUNT_BUCKETS))
+REQUEST_SQL_DURATION = registry.register(Histogram(
+    'minimes_http_request_sql_seconds', 'SQLite time per request.', ('endpoint',), _latency_buckets))
+REQUEST_SECTION_DURATION = registry.register(Histogram(
+    'minimes_http_request_section_seconds', 'Time per request spent in named sections (json, attachments).',
+    ('endpoint', 'section'), _latency_buckets))
+
+
+class RequestStats:
+    __slots__ = ('endpoint', 'started', 'sql_statements', 'sql_seconds', 'sections')
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.started = time.perf_counter()
+        self.sql_statements = 0
+        self.sql_seconds = 0.0
+        self.sections = {}
+
+
+_local = threading.local()
+
+
+def begin_request(endpoint):
+    stats = RequestStats(endpoint or '<unmatched>')
+    _local.stats = stats
+    return stats
+
+
+def current_request():
+    return getattr(_local, 'stats', None)
+
+
+def end_request(method, status, size=None):
+    """Record the finished request of the current thread."""
+    stats = getattr(_local, 'stats', None)
+    if stats is None:
+        return None
+    _local.stats = None
+    endpoint = stats.endpoint
+    REQUESTS.inc(endpoint, method, str(status))
+    REQUEST_DURATION.observe(time.perf_counter() - stats.started, endpoint, method)
+    if size is not None:
+        RESPONSE_SIZE.observe(size, endpoint)
+    REQUEST_SQL_STATEMENTS.observe(stats.sql_statements, endpoint)
+    REQUEST_SQL_DURATION.observe(stats.sql_seconds, endpoint)
+    for section, seconds in stats.sections.items():
+        REQUEST_SECTION_DURATION.observe(seconds, endpoint, section)
+    return stats
+
+
+def record_sql(seconds, statements=1):
+    stats = getattr(_local, 'stats', None)
+    endpoint = NO_REQUEST
+    if stats is not None:
+        stats.sql_seconds += seconds
+        stats.sql_statements += statements
+        endpoint = stats.endpoint
+    if statements:
+        SQL_STATEMENTS.inc(endpoint, amount=statements)
+    SQL_DURATION.inc(endpoint, amount=seconds)
+
+
+@contextmanager
+def section(name):
+    """Attribute the enclosed time to ``name`` for the current request."""
+    stats = getattr(_local, 'stats', None)
+    if stats is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats.sections[name] = stats.sections.get(name, 0.0) + time.perf_counter() - started
+
+
+# SQLite 计时
+class InstrumentedCursor(sqlite3.Cursor):
+    """Cursor timing execute/fetch calls and feeding the slow-query log.
+
+    A statement counts as finished when its rows are exhausted, when the
+    cursor runs the next statement or when it is closed; only then is its
+    total execute + fetch time compared with the slow-query threshold.
+    """
+
+    _statement = None
+
+    def _run(self, method, sql, params, many=False):
+        self._finish_statement()
+        started = time.perf_counter()
+        try:
+            return method(sql, params) if params is not None else method(sql)
+        finally:
+            seconds = time.perf_counter() - started
+            record_sql(seconds)
+            self._statement = [sql, params, seconds, many]
+            if self.description is None:
+                self._finish_statement()
+
+    def _fetched(self, started, exhausted):
+        seconds = time.perf_counter() - started
+        record_sql(seconds, statements=0)
+        if self._statement is not None:
+            self._statement[2] += seconds
+            if exhausted:
+                self._finish_statement()
+
+    def _finish_statement(self):
+        statement, self._statement = self._statement, None
+        threshold = slow_queries.threshold_seconds()
+        if statement is None or threshold is None or statement[2] < threshold:
+            return
+        sql, params, seconds, many = statement
+        stats = current_request()
+        slow_queries.record(self.connection, sql, params, seconds,
+                            endpoint=stats.endpoint if stats else None, many=many)
+
+    def execute(self, sql, parameters=None):
+        return self._run(super().execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        if not isinstance(seq_of_parameters, (list, tuple)):
+            seq_of_parameters = list(seq_of_parameters)
+        return self._run(super().executemany, sql, seq_of_parameters, many=True)
+
+    def executescript(self, sql_script):
+        self._finish_statement()
+        started = time.perf_counter()
+        try:
+            return super().executescript(sql_script)
+        finally:
+            record_sql(time.perf_counter() - started)
+
+    # 取数同样在 SQLite 中逐行执行语句，计入 SQL 时间但不计语句数
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        self._fetched(started, row is None)
+        return row
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        started = time.perf_counter()
+        rows = super().fetchmany(size)
+        self._fetched(started, len(rows) < size)
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(started, True)
+        return rows
+
+    def close(self):
+        self._finish_statement()
+        super().close()
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Connection whose cursors (including ``conn.execute``) are timed."""
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=None):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, parameters):
+        return self.cursor().executemany(sql, parameters)
+
+    def executescript(self, sql_script):
+        return self.cursor().executescript(sql_script)
+
+
+def render():
+    return registry.render()
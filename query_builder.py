@@ -0,0 +1,241 @@
+"""SQL for the joined batch/material/equipment/quality query.
+
+``/api/query``, its chart series and the exports share these building
+blocks so that every view of "the query result" applies the same filters,
+in-result search and ordering.  Filters are read from a mapping of request
+arguments (``request.args`` or a plain dict from the command line).
+"""
+
+from database import get_declared_extra_fields, json_extra_expression
+
+# 查询中可筛选/排序的扩展字段来源：(表别名, 参数前缀, 表名)
+EXTRA_QUERY_SOURCES = (
+    ('m', 'material', 'material_records'),
+    ('q', 'quality', 'quality_records')
+)
+
+
+def build_extra_filter(param_name, expression, field, args):
+    """Translate query args for a declared extra into SQL conditions.
+
+    Numeric extras accept ``<param>_min``/``<param>_max`` ranges as well as an
+    exact ``<param>`` value; text extras use a LIKE match, select extras an
+    exact match.
+    """
+    field_type = field.get('type', 'text')
+    label = field.get('label') or field['key']
+    conditions = ''
+    params = []
+
+    if field_type in ('number', 'integer'):
+        for suffix, operator in (('', '='), ('_min', '>='), ('_max', '<=')):
+            raw_value = args.get(f'{param_name}{suffix}', '')
+            if raw_value == '':
+                continue
+            try:
+                params.append(float(raw_value))
+            except ValueError:
+                return '', [], f"{label} 需要为数值类型"
+            conditions += f" AND {expression} {operator} ?"
+        return conditions, params, None
+
+    raw_value = args.get(param_name, '')
+    if raw_value == '':
+        return '', [], None
+    if field_type == 'select':
+        return f" AND {expression} = ?", [raw_value], None
+    return f" AND {expression} LIKE ?", [f'%{raw_value}%'], None
+
+
+QUERY_SELECT = '''
+    SELECT
+        b.batch_number,
+        b.product_name,
+        b.process_segment,
+        b.status,
+        b.start_time,
+        b.end_time,
+        m.material_code,
+        m.material_name,
+        m.weight,
+        m.unit as material_unit,
+        m.supplier,
+        m.attachments_json as material_attachments_json,
+        m.attributes_json as material_attributes_json,
+        e.equipment_code,
+        e.equipment_name,
+        e.parameters_json,
+        e.start_time as equipment_start,
+        e.end_time as equipment_end,
+        e.status as equipment_status,
+        e.attachments_json as equipment_attachments_json,
+        q.test_item,
+        q.test_value,
+        q.unit as quality_unit,
+        q.result,
+        q.standard_min,
+        q.standard_max,
+        q.attachments_json as quality_attachments_json,
+        q.attributes_json as quality_attributes_json
+'''
+
+_QUERY_FROM_TEMPLATE = '''
+    FROM {schema}batches b
+    LEFT JOIN {schema}material_records m ON b.id = m.batch_id
+    LEFT JOIN {schema}equipment_records e ON b.id = e.batch_id
+    LEFT JOIN {schema}quality_records q ON b.id = q.batch_id
+'''
+
+
+def query_from(schema=None):
+    """FROM clause of the joined query, optionally on an attached schema."""
+    return _QUERY_FROM_TEMPLATE.format(schema=f'{schema}.' if schema else '')
+
+
+QUERY_FROM = query_from()
+
+# 可排序的基础列：sort 参数 -> SQL 表达式（扩展字段按 <前缀>_<key> 追加）
+QUERY_SORT_COLUMNS = {
+    'batch_number': 'b.batch_number',
+    'product_name': 'b.product_name',
+    'process_segment': 'b.process_segment',
+    'status': 'b.status',
+    'start_time': 'b.start_time',
+    'end_time': 'b.end_time',
+    'material_code': 'm.material_code',
+    'material_name': 'm.material_name',
+    'weight': 'm.weight',
+    'supplier': 'm.supplier',
+    'equipment_code': 'e.equipment_code',
+    'equipment_name': 'e.equipment_name',
+    'equipment_status': 'e.status',
+    'test_item': 'q.test_item',
+    'test_value': 'q.test_value',
+    'result': 'q.result'
+}
+
+# 结果内搜索（?q=）匹配的列
+QUERY_SEARCH_COLUMNS = (
+    'b.batch_number', 'b.product_name', 'b.process_segment', 'b.status', 'b.start_time', 'b.end_time',
+    'm.material_code', 'm.material_name', 'm.weight', 'm.supplier',
+    'e.equipment_code', 'e.equipment_name', 'e.status',
+    'q.test_item', 'q.test_value', 'q.result'
+)
+
+# 连接结果没有唯一键，翻页时用各表主键保证顺序稳定
+QUERY_ORDER_TIEBREAK = (('b.id', 'DESC'), ('m.id', ''), ('e.id', ''), ('q.id', ''))
+
+# 与查询条件对应的参数：(参数名, SQL 表达式, 运算符)
+QUERY_FILTERS = (
+    ('batch_number', 'b.batch_number', 'LIKE'),
+    ('product_name', 'b.product_name', 'LIKE'),
+    ('process_segment', 'b.process_segment', '='),
+    ('start_date', 'DATE(b.start_time)', '>='),
+    ('end_date', 'DATE(b.start_time)', '<='),
+    ('material_code', 'm.material_code', 'LIKE'),
+    ('material_name', 'm.material_name', 'LIKE'),
+    ('supplier', 'm.supplier', 'LIKE'),
+    ('equipment_code', 'e.equipment_code', 'LIKE'),
+    ('equipment_name', 'e.equipment_name', 'LIKE'),
+    ('equipment_status', 'e.status', '='),
+    ('test_item', 'q.test_item', 'LIKE'),
+    ('test_result', 'q.result', '='),
+)
+
+
+def build_query_conditions(args):
+    """Translate ``/api/query`` filter args into a WHERE clause.
+
+    Returns ``(where, params, sort_columns, error)``; ``sort_columns`` maps
+    every accepted ``sort`` value (base columns and declared extras) to its
+    SQL expression.
+    """
+    where = ' WHERE 1=1'
+    params = []
+
+    for param_name, expression, operator in QUERY_FILTERS:
+        value = args.get(param_name, '')
+        if not value:
+            continue
+        where += f" AND {expression} {operator} ?"
+        params.append(f'%{value}%' if operator == 'LIKE' else value)
+
+    for param_name, operator in (('min_value', '>='), ('max_value', '<=')):
+        value = args.get(param_name, '')
+        if not value:
+            continue
+        try:
+            params.append(float(value))
+        except ValueError:
+            return '', [], {}, '检测值范围需要为数值类型'
+        where += f" AND q.test_value {operator} ?"
+
+    # 已声明的扩展字段（attributes_json）筛选
+    sort_columns = dict(QUERY_SORT_COLUMNS)
+    for alias, prefix, table in EXTRA_QUERY_SOURCES:
+        for field in get_declared_extra_fields(table):
+            param_name = f"{prefix}_{field['key']}"
+            expression = json_extra_expression(field['key'], alias)
+            sort_columns[param_name] = expression
+            extra_filter, extra_params, error = build_extra_filter(param_name, expression, field, args)
+            if error:
+                return '', [], {}, error
+            where += extra_filter
+            params.extend(extra_params)
+
+    # 结果内二次搜索
+    search = args.get('q', '').strip()
+    if search:
+        where += ' AND (' + ' OR '.join(f'{column} LIKE ?' for column in QUERY_SEARCH_COLUMNS) + ')'
+        params.extend([f'%{search}%'] * len(QUERY_SEARCH_COLUMNS))
+
+    return where, params, sort_columns, None
+
+
+def query_order_terms(args, sort_columns):
+    """``([(expression, direction)], error)`` for the ``sort``/``order`` args."""
+    sort_key = args.get('sort', '')
+    sort_order = 'ASC' if args.get('order', '').lower() == 'asc' else 'DESC'
+    if not sort_key:
+        return [('b.start_time', 'DESC'), *QUERY_ORDER_TIEBREAK], None
+    if sort_key not in sort_columns:
+        return [], f'不支持的排序字段: {sort_key}'
+    # 空值始终排在最后，与排序方向无关
+    expression = sort_columns[sort_key]
+    return [(f'{expression} IS NULL', ''), (expression, sort_order),
+            ('b.start_time', 'DESC'), *QUERY_ORDER_TIEBREAK], None
+
+
+def order_clause(terms):
+    if not terms:
+        return ''
+    return ' ORDER BY ' + ', '.join(f'{expression} {direction}'.rstrip() for expression, direction in terms)
+
+
+def query_order_clause(args, sort_columns):
+    terms, error = query_order_terms(args, sort_columns)
+    return ('', error) if error else (order_clause(terms), None)
+
+
+def federated_query(select, where, params, order_terms=(), archives=()):
+    """``(sql, params)`` of ``select`` over the hot tables plus attached ``archives``.
+
+    Without archives this is the plain query.  Otherwise every schema gets
+    its own join (batches and their records are never split across files)
+    combined with UNION ALL; the order expressions are selected as extra
+    ``_order_<n>`` columns so the compound can be ordered globally.
+    """
+    if not archives:
+        return select + QUERY_FROM + where + order_clause(order_terms), list(params)
+    hidden = ''.join(f', {expression} AS _order_{index}' for index, (expression, _) in enumerate(order_terms))
+    arms = [select + hidden + query_from(schema) + where for schema in ('main', *archives)]
+    order_by = order_clause([(f'_order_{index}', direction) for index, (_, direction) in enumerate(order_terms)])
+    return ' UNION ALL '.join(arms) + order_by, list(params) * len(arms)
+
+
+def federated_count(where, params, archives=()):
+    """``(sql, params)`` counting the joined rows over the hot tables plus ``archives``."""
+    if not archives:
+        return 'SELECT COUNT(*)' + QUERY_FROM + where, list(params)
+    arms = ['SELECT COUNT(*) AS row_count' + query_from(schema) + where for schema in ('main', *archives)]
+    return 'SELECT SUM(row_count) FROM (' + ' UNION ALL '.join(arms) + ')', list(params) * len(arms)
@@ -0,0 +1,103 @@
+"""Memory-bounded LRU cache for serialized ``/api/query`` results.
+
+Entries hold the encoded JSON body, so a hit skips both SQLite and JSON
+serialisation.  Each entry remembers the data version it was computed at
+(change-journal sequence plus fields-config digest); an entry whose version
+differs from the current one is treated as a miss and replaced.  Because the
+journal is bumped by triggers on every write, writes from any worker process
+invalidate the cache.
+"""
+
+import threading
+from collections import OrderedDict
+
+import config
+import metrics
+
+CACHE_REQUESTS = metrics.registry.register(metrics.Counter(
+    'minimes_query_cache_requests_total', 'Query result cache lookups by result (hit, miss, stale).', ('result',)))
+CACHE_BYTES = metrics.registry.register(metrics.Gauge(
+    'minimes_query_cache_bytes', 'Bytes of JSON currently held by the query result cache.'))
+CACHE_EVICTIONS = metrics.registry.register(metrics.Counter(
+    'minimes_query_cache_evictions_total', 'Entries evicted to stay within the memory bound.'))
+
+# 不参与缓存键的参数（前端防缓存用的时间戳等）
+IGNORED_PARAMS = frozenset(('_',))
+
+
+def normalize_args(args, role):
+    """Cache key for a request's query arguments: order-insensitive, empty parameters ignored.
+
+    Values are kept exactly as sent: the query handlers use the raw
+    ``args.get`` value (a filter of ``" "`` is not the same as no filter), so
+    only parameters whose values are all ``''`` are left out.
+    """
+    items = []
+    for key in sorted(args.keys()):
+        if key in IGNORED_PARAMS:
+            continue
+        values = tuple(args.getlist(key))
+        if any(value != '' for value in values):
+            items.append((key, values))
+    return (role or '', tuple(items))
+
+
+class QueryResultCache:
+    def __init__(self, max_bytes=None, max_entry_bytes=None):
+        self.max_bytes = max_bytes if max_bytes is not None else config.QUERY_CACHE_MAX_BYTES
+        self.max_entry_bytes = (max_entry_bytes if max_entry_bytes is not None
+                                else getattr(config, 'QUERY_CACHE_MAX_ENTRY_BYTES', self.max_bytes // 4))
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key, version):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                CACHE_REQUESTS.inc('miss')
+                return None
+            if entry[0] != version:
+                self._remove(key)
+                CACHE_REQUESTS.inc('stale')
+                return None
+            self._entries.move_to_end(key)
+        CACHE_REQUESTS.inc('hit')
+        return entry[1]
+
+    def put(self, key, version, body):
+        size = len(body)
+        if size > self.max_entry_bytes:
+            return False
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (version, body)
+            self._size += size
+            while self._size > self.max_bytes and self._entries:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                CACHE_EVICTIONS.inc()
+            CACHE_BYTES.set(self._size)
+        return True
+
+    def _remove(self, key):
+        _, body = self._entries.pop(key)
+        self._size -= len(body)
+        CACHE_BYTES.set(self._size)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+            CACHE_BYTES.set(0)
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def size(self):
+        return self._size
+
+
+query_results = QueryResultCache()
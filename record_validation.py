@@ -0,0 +1,245 @@
+"""Compiled validators for the structured record field configs.
+
+``MATERIAL_RECORD_FIELDS`` / ``EQUIPMENT_RECORD_FIELDS`` /
+``QUALITY_RECORD_FIELDS`` are turned into ``RecordValidator`` objects once
+and reused for every request.  A validator is recompiled automatically when
+the config attribute is replaced with a new dict; call
+``invalidate_validators()`` after mutating a config dict in place.
+"""
+
+import threading
+
+import config
+
+_EMPTY = (None, '')
+_TRUE_STRINGS = frozenset(('true', '1', 'yes', 'y', '是'))
+_FALSE_STRINGS = frozenset(('false', '0', 'no', 'n', '否'))
+
+
+def _field_label(field):
+    return field.get('label') or field.get('key')
+
+
+def compile_converter(field):
+    """Return ``convert(value) -> (converted, error)`` specialised for ``field``.
+
+    The returned callable expects a non-empty value; empty handling is done
+    by the validator so that defaults and required checks stay in one place.
+    """
+    field_type = field.get('type', 'text')
+    label = _field_label(field)
+
+    if field_type in ('text', 'textarea'):
+        def convert(value):
+            return str(value).strip(), None
+        return convert
+
+    if field_type == 'number':
+        message = f"{label} 需要为数值类型"
+
+        def convert(value):
+            try:
+                return float(value), None
+            except (TypeError, ValueError):
+                return None, message
+        return convert
+
+    if field_type == 'integer':
+        message = f"{label} 需要为整数"
+
+        def convert(value):
+            try:
+                return int(value), None
+            except (TypeError, ValueError):
+                return None, message
+        return convert
+
+    if field_type == 'boolean':
+        message = f"{label} 需要为布尔类型"
+
+        def convert(value):
+            if isinstance(value, bool):
+                return value, None
+            str_val = str(value).strip().lower()
+            if str_val in _TRUE_STRINGS:
+                return True, None
+            if str_val in _FALSE_STRINGS:
+                return False, None
+            return None, message
+        return convert
+
+    if field_type == 'select':
+        options = list(field.get('options') or [])
+        if options:
+            message = f"{label} 的取值必须在 {options} 中"
+
+            def convert(value):
+                if value not in options:
+                    return None, message
+                return value, None
+            return convert
+
+    # datetime/date/time 等类型默认以字符串处理
+    def convert(value):
+        return value, None
+    return convert
+
+
+class RecordValidator:
+    """Validate payloads against one record field config.
+
+    Calling the validator returns ``(columns, extras, errors)`` exactly like
+    the former per-request interpreter; ``validate_many`` does the same for a
+    list of payloads, processing one field at a time across all rows (used by
+    bulk loads such as ``tools/generate_dataset.py``).
+    """
+
+    def __init__(self, field_config, extra_section='extras'):
+        self.extra_section = extra_section
+        self.columns = tuple(
+            (
+                field['key'],
+                field.get('column', field['key']),
+                'default' in field,
+                field.get('default'),
+                f"{_field_label(field)} 为必填项" if field.get('required') else None,
+                compile_converter(field)
+            )
+            for field in field_config.get('columns', [])
+        )
+        self.extras = tuple(
+            (
+                field['key'],
+                f"{_field_label(field)} 为必填项" if field.get('required') else None,
+                compile_converter(field)
+            )
+            for field in field_config.get(extra_section, [])
+        )
+        self.column_keys = tuple(spec[0] for spec in self.columns)
+        self.extra_keys = tuple(spec[0] for spec in self.extras)
+
+    def _extra_payload(self, payload):
+        section = payload.get(self.extra_section)
+        extra_payload = dict(section) if isinstance(section, dict) else {}
+        # 支持顶层直接传递扩展字段
+        for key in self.extra_keys:
+            if key in payload and key not in extra_payload:
+                extra_payload[key] = payload[key]
+        return extra_payload
+
+    @staticmethod
+    def _convert_column(spec, payload, columns, errors):
+        key, column_name, has_default, default, required_message, convert = spec
+        raw_value = payload.get(key)
+
+        if raw_value in _EMPTY:
+            if has_default:
+                raw_value = default
+            elif required_message:
+                errors.append(required_message)
+                return
+
+        if raw_value in _EMPTY:
+            columns[column_name] = None
+            return
+
+        converted, error = convert(raw_value)
+        if error:
+            errors.append(error)
+            return
+        columns[column_name] = converted
+
+    @staticmethod
+    def _convert_extra(spec, extra_payload, extras, errors):
+        key, required_message, convert = spec
+        value = extra_payload.get(key)
+        if value in _EMPTY:
+            if required_message:
+                errors.append(required_message)
+            return
+
+        converted, error = convert(value)
+        if error:
+            errors.append(error)
+            return
+        extras[key] = converted
+
+    @staticmethod
+    def _keep_unconfigured(extra_payload, extras):
+        # 保留未配置但传入的扩展字段，便于前端自定义
+        for key, value in extra_payload.items():
+            if key not in extras and value not in _EMPTY:
+                extras[key] = value
+
+    def __call__(self, payload):
+        payload = payload or {}
+        errors = []
+        columns = {}
+        for spec in self.columns:
+            self._convert_column(spec, payload, columns, errors)
+
+        extras = {}
+        extra_payload = self._extra_payload(payload)
+        for spec in self.extras:
+            self._convert_extra(spec, extra_payload, extras, errors)
+        self._keep_unconfigured(extra_payload, extras)
+
+        return columns, extras, errors
+
+    def validate_many(self, payloads):
+        """Validate a batch of payloads; returns a list of result triples."""
+        payloads = [payload or {} for payload in payloads]
+        columns_list = [{} for _ in payloads]
+        extras_list = [{} for _ in payloads]
+        errors_list = [[] for _ in payloads]
+        extra_payloads = [self._extra_payload(payload) for payload in payloads]
+
+        for spec in self.columns:
+            convert_column = self._convert_column
+            for payload, columns, errors in zip(payloads, columns_list, errors_list):
+                convert_column(spec, payload, columns, errors)
+
+        for spec in self.extras:
+            convert_extra = self._convert_extra
+            for extra_payload, extras, errors in zip(extra_payloads, extras_list, errors_list):
+                convert_extra(spec, extra_payload, extras, errors)
+
+        for extra_payload, extras in zip(extra_payloads, extras_list):
+            self._keep_unconfigured(extra_payload, extras)
+
+        return list(zip(columns_list, extras_list, errors_list))
+
+
+_VALIDATORS = {}
+_VALIDATORS_LOCK = threading.Lock()
+
+
+def get_validator(field_config, extra_section='extras'):
+    """Return the compiled validator for ``field_config``, compiling on demand."""
+    cache_key = (id(field_config), extra_section)
+    cached = _VALIDATORS.get(cache_key)
+    if cached is not None and cached[0] is field_config:
+        return cached[1]
+
+    validator = RecordValidator(field_config, extra_section)
+    with _VALIDATORS_LOCK:
+        _VALIDATORS[cache_key] = (field_config, validator)
+    return validator
+
+
+def invalidate_validators():
+    """Drop all compiled validators (e.g. after editing a config dict in place)."""
+    with _VALIDATORS_LOCK:
+        _VALIDATORS.clear()
+
+
+def material_validator():
+    return get_validator(config.MATERIAL_RECORD_FIELDS, 'extras')
+
+
+def equipment_validator():
+    return get_validator(config.EQUIPMENT_RECORD_FIELDS, 'parameters')
+
+
+def quality_validator():
+    return get_validator(config.QUALITY_RECORD_FIELDS, 'extras')
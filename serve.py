@@ -0,0 +1,408 @@
+#!/usr/bin/env python3
+"""Pre-forking production server for MiniMES.
+
+``python serve.py`` starts a master process that binds the listening socket,
+optionally preloads the Flask app (and with it config + schema migrations),
+then forks ``SERVER_WORKERS`` workers.  Each worker serves requests from a
+fixed pool of ``SERVER_THREADS`` threads and opens its own SQLite
+connections after the fork.  Long-lived streams (``SERVER_STREAMING_PATHS``,
+i.e. ``/api/events``) are handed to a dedicated thread once their request
+line is parsed, so they do not hold a pool thread.
+
+Signals understood by the master:
+
+* ``SIGTERM`` / ``SIGINT`` – graceful shutdown (in-flight requests finish).
+* ``SIGHUP`` – graceful reload: a new generation of workers is forked and
+  the old one drained.  Without preloading the workers re-import the app,
+  which also picks up code changes.
+* ``SIGQUIT`` – immediate shutdown.
+
+Workers publish heartbeats to ``SERVER_STATE_DIR``; the master replaces
+workers that exit or stop heart-beating, and ``/api/admin/workers`` reports
+the same state.  On platforms without ``fork`` a single pooled process is
+used instead.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import select
+import signal
+import socket
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+import config
+
+WORKER_STATE_PREFIX = 'worker-'
+
+
+def load_app():
+    from server import app
+    return app
+
+
+class PooledRequestHandler(WSGIRequestHandler):
+    # 空闲的 keep-alive 连接不能长期占用线程池中的线程
+    timeout = getattr(config, 'SERVER_KEEPALIVE_TIMEOUT', 5)
+    detached = False
+
+    def run_wsgi(self):
+        path = urlsplit(self.path).path
+        if self.detached or path not in getattr(config, 'SERVER_STREAMING_PATHS', ()):
+            super().run_wsgi()
+            return
+        # 长连接流（SSE）交给独立线程，释放线程池中的线程；连接在流结束后关闭
+        self.detached = True
+        self.close_connection = True
+        threading.Thread(target=self._run_detached, name='minimes-stream', daemon=True).start()
+
+    def _run_detached(self):
+        try:
+            super().run_wsgi()
+        except Exception:
+            self.server.handle_error(self.request, self.client_address)
+        finally:
+            try:
+                super().finish()
+            finally:
+                self.server.shutdown_request(self.request)
+
+    def finish(self):
+        if not self.detached:
+            super().finish()
+
+
+class PooledWSGIServer(BaseWSGIServer):
+    """WSGI server handling requests on a bounded thread pool."""
+
+    multithread = True
+    daemon_threads = True
+
+    def __init__(self, host, port, app, threads, fd=None):
+        super().__init__(host, port, app, handler=PooledRequestHandler, fd=fd)
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='minimes-http')
+        self.requests_handled = 0
+        self._count_lock = threading.Lock()
+
+    def process_request(self, request, client_address):
+        with self._count_lock:
+            self.requests_handled += 1
+        self.executor.submit(self._process_request_worker, request, client_address)
+
+    def finish_request(self, request, client_address):
+        return self.RequestHandlerClass(request, client_address, self)
+
+    def _process_request_worker(self, request, client_address):
+        handler = None
+        try:
+            handler = self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            # 已转交独立线程的流式连接由该线程关闭
+            if not getattr(handler, 'detached', False):
+                self.shutdown_request(request)
+
+    def drain(self):
+        self.executor.shutdown(wait=True)
+
+
+def _write_json_atomic(path, data):
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as handle:
+        json.dump(data, handle)
+    os.replace(tmp_path, path)
+
+
+def read_worker_states(state_dir=None):
+    """Return heartbeat records of all workers known in ``state_dir``."""
+    state_dir = state_dir or config.SERVER_STATE_DIR
+    timeout = config.SERVER_HEARTBEAT_TIMEOUT
+    now = time.time()
+    states = []
+    try:
+        names = sorted(os.listdir(state_dir))
+    except OSError:
+        return states
+
+    for name in names:
+        if not (name.startswith(WORKER_STATE_PREFIX) and name.endswith('.json')):
+            continue
+        try:
+            with open(os.path.join(state_dir, name), 'r', encoding='utf-8') as handle:
+                state = json.load(handle)
+        except (OSError, ValueError):
+            continue
+        age = now - state.get('heartbeat', 0)
+        state['heartbeat_age'] = round(age, 3)
+        state['healthy'] = age <= timeout
+        states.append(state)
+    return states
+
+
+class Worker:
+    def __init__(self, arbiter, generation):
+        self.arbiter = arbiter
+        self.generation = generation
+        self.pid = None
+        self.started_at = time.time()
+        self.stop_requested_at = None
+
+    @property
+    def state_path(self):
+        return os.path.join(self.arbiter.state_dir, f'{WORKER_STATE_PREFIX}{self.pid}.json')
+
+    def run(self):
+        """Body of the forked worker process; never returns."""
+        exit_code = 0
+        try:
+            self._serve()
+        except Exception:
+            import traceback
+            traceback.print_exc()
+            exit_code = 1
+        finally:
+            try:
+                os.remove(self.state_path)
+            except OSError:
+                pass
+        os._exit(exit_code)
+
+    def _serve(self):
+        self.pid = os.getpid()
+        for sig in (signal.SIGTERM, signal.SIGCHLD):
+            signal.signal(sig, signal.SIG_DFL)
+        for sig in (signal.SIGHUP, signal.SIGINT):
+            signal.signal(sig, signal.SIG_IGN)
+        signal.signal(signal.SIGQUIT, lambda *_: os._exit(1))
+
+        app = self.arbiter.app or load_app()
+        httpd = PooledWSGIServer(
+            self.arbiter.host, self.arbiter.port, app,
+            threads=self.arbiter.threads, fd=self.arbiter.sock.fileno()
+        )
+        stopping = threading.Event()
+
+        def handle_term(*_):
+            if not stopping.is_set():
+                stopping.set()
+                threading.Thread(target=httpd.shutdown, daemon=True).start()
+
+        signal.signal(signal.SIGTERM, handle_term)
+
+        def heartbeat():
+            while True:
+                _write_json_atomic(self.state_path, {
+                    'pid': self.pid,
+                    'generation': self.generation,
+                    'started_at': self.started_at,
+                    'heartbeat': time.time(),
+                    'threads': self.arbiter.threads,
+                    'requests': httpd.requests_handled,
+                    'stopping': stopping.is_set()
+                })
+                if stopping.wait(self.arbiter.heartbeat_interval):
+                    return
+
+        threading.Thread(target=heartbeat, name='minimes-heartbeat', daemon=True).start()
+        httpd.serve_forever()
+        httpd.drain()
+
+
+class Arbiter:
+    """Master process: owns the socket and keeps the worker pool alive."""
+
+    def __init__(self, host, port, workers, threads, preload=True):
+        self.host = host
+        self.port = port
+        self.num_workers = max(1, workers)
+        self.threads = max(1, threads)
+        self.preload = preload
+        self.state_dir = config.SERVER_STATE_DIR
+        self.heartbeat_interval = config.SERVER_HEARTBEAT_INTERVAL
+        self.heartbeat_timeout = config.SERVER_HEARTBEAT_TIMEOUT
+        self.graceful_timeout = config.SERVER_GRACEFUL_TIMEOUT
+        self.app = None
+        self.sock = None
+        self.workers = {}
+        self.generation = 0
+        self._signals = []
+        self._wakeup_r, self._wakeup_w = os.pipe()
+
+    def _create_socket(self):
+        family = socket.AF_INET6 if ':' in self.host else socket.AF_INET
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((self.host, self.port))
+        sock.listen(config.SERVER_BACKLOG)
+        sock.set_inheritable(True)
+        return sock
+
+    def _on_signal(self, signum, frame):
+        self._signals.append(signum)
+        try:
+            os.write(self._wakeup_w, b'.')
+        except OSError:
+            pass
+
+    def spawn_worker(self):
+        worker = Worker(self, self.generation)
+        pid = os.fork()
+        if pid == 0:
+            os.close(self._wakeup_r)
+            os.close(self._wakeup_w)
+            worker.run()
+        worker.pid = pid
+        self.workers[pid] = worker
+        return worker
+
+    def _current_workers(self):
+        return [w for w in self.workers.values() if w.generation == self.generation and w.stop_requested_at is None]
+
+    def _stop_worker(self, worker, sig=signal.SIGTERM):
+        if worker.stop_requested_at is None:
+            worker.stop_requested_at = time.time()
+        try:
+            os.kill(worker.pid, sig)
+        except ProcessLookupError:
+            pass
+
+    def _reap(self):
+        while True:
+            try:
+                pid, _ = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            worker = self.workers.pop(pid, None)
+            if worker is not None:
+                try:
+                    os.remove(worker.state_path)
+                except OSError:
+                    pass
+
+    def _check_health(self):
+        now = time.time()
+        for worker in list(self.workers.values()):
+            if worker.stop_requested_at is not None:
+                if now - worker.stop_requested_at > self.graceful_timeout:
+                    self._stop_worker(worker, signal.SIGKILL)
+                continue
+            try:
+                heartbeat = os.path.getmtime(worker.state_path)
+            except OSError:
+                heartbeat = worker.started_at
+            if now - heartbeat > self.heartbeat_timeout:
+                print(f'[serve] worker {worker.pid} missed heartbeats, replacing', file=sys.stderr)
+                self._stop_worker(worker, signal.SIGKILL)
+
+    def _maintain_pool(self):
+        current = self._current_workers()
+        for _ in range(self.num_workers - len(current)):
+            self.spawn_worker()
+
+    def reload(self):
+        self.generation += 1
+        old_workers = [w for w in self.workers.values() if w.generation < self.generation]
+        if not self.preload:
+            self.app = None
+        self._maintain_pool()
+        for worker in old_workers:
+            self._stop_worker(worker)
+
+    def stop(self, graceful=True):
+        sig = signal.SIGTERM if graceful else signal.SIGQUIT
+        for worker in list(self.workers.values()):
+            self._stop_worker(worker, sig)
+        deadline = time.time() + (self.graceful_timeout if graceful else 1)
+        while self.workers and time.time() < deadline:
+            self._reap()
+            time.sleep(0.1)
+        for worker in list(self.workers.values()):
+            self._stop_worker(worker, signal.SIGKILL)
+        self._reap()
+
+    def run(self):
+        os.makedirs(self.state_dir, exist_ok=True)
+        self.sock = self._create_socket()
+        if self.preload:
+            self.app = load_app()
+
+        for sig in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP, signal.SIGQUIT, signal.SIGCHLD):
+            signal.signal(sig, self._on_signal)
+
+        print(
+            f'[serve] master {os.getpid()} listening on {self.host}:{self.port} '
+            f'with {self.num_workers} workers x {self.threads} threads',
+            file=sys.stderr
+        )
+        self._maintain_pool()
+
+        try:
+            while True:
+                try:
+                    ready, _, _ = select.select([self._wakeup_r], [], [], 1.0)
+                    if ready:
+                        os.read(self._wakeup_r, 512)
+                except InterruptedError:
+                    pass
+
+                while self._signals:
+                    signum = self._signals.pop(0)
+                    if signum in (signal.SIGTERM, signal.SIGINT):
+                        self.stop(graceful=True)
+                        return
+                    if signum == signal.SIGQUIT:
+                        self.stop(graceful=False)
+                        return
+                    if signum == signal.SIGHUP:
+                        print('[serve] reloading workers', file=sys.stderr)
+                        self.reload()
+
+                self._reap()
+                self._check_health()
+                self._maintain_pool()
+        finally:
+            self.sock.close()
+
+
+def run_single_process(host, port, threads):
+    """Fallback for platforms without ``os.fork`` (e.g. Windows)."""
+    httpd = PooledWSGIServer(host, port, load_app(), threads=threads)
+    print(f'[serve] single process listening on {host}:{port} with {threads} threads', file=sys.stderr)
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.drain()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='MiniMES production server')
+    parser.add_argument('--host', default=config.HOST)
+    parser.add_argument('--port', type=int, default=config.PORT)
+    parser.add_argument('--workers', type=int, default=config.SERVER_WORKERS)
+    parser.add_argument('--threads', type=int, default=config.SERVER_THREADS)
+    parser.add_argument('--no-preload', dest='preload', action='store_false', default=config.SERVER_PRELOAD_APP,
+                        help='import the app in each worker instead of once in the master')
+    args = parser.parse_args()
+
+    if not hasattr(os, 'fork'):
+        run_single_process(args.host, args.port, args.threads)
+        return
+
+    Arbiter(args.host, args.port, args.workers, args.threads, preload=args.preload).run()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,14 +1,35 @@
 import secrets
+import hashlib
 import sqlite3
 import os
+import mimetypes
+import math
 from contextlib import closing
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for, send_file, send_from_directory, g
-from database import Database
+from flask.json.provider import DefaultJSONProvider
+from flask import Flask, render_template, request, jsonify, session, redirect, url_for, send_file, send_from_directory, g, make_response
+from database import get_database, get_declared_extra_fields, json_extra_expression
+from query_builder import (EXTRA_QUERY_SOURCES, QUERY_SELECT, build_query_conditions, federated_count,
+                           federated_query, query_order_terms)
 import config
+import events
+import record_validation
+import assets
+import metrics
+import slow_queries
+import query_cache
+import downsample
+import exporter
+import export_jobs
+import maintenance
+import snapshot
+import analytics
+import archive
+import attachment_gc
+from compression import CompressionMiddleware
 import json
-import csv
-import io
-from datetime import datetime, timedelta
+import gzip
+import tempfile
+from datetime import datetime, timedelta, timezone
 from functools import wraps
 from werkzeug.utils import secure_filename
 
@@ -25,8 +46,21 @@ app = Flask(__name__)
 app.secret_key = config.SECRET_KEY
 app.config['UPLOAD_FOLDER'] = config.UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = config.MAX_CONTENT_LENGTH
+if getattr(config, 'COMPRESSION_ENABLED', False):
+    app.wsgi_app = CompressionMiddleware(app.wsgi_app)
 
-db = Database(config.DATABASE)
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """JSON provider that reports serialisation time to the metrics."""
+
+    def dumps(self, obj, **kwargs):
+        with metrics.section('json'):
+            return super().dumps(obj, **kwargs)
+
+
+app.json = TimedJSONProvider(app)
+
+db = get_database()
 
 
 def _row_to_dict(row):
@@ -93,6 +127,11 @@ def _serialize_quality(row):
     return data
 
 
+def _execute_write(sql, params=()):
+    """Run one write statement through the group-commit writer; returns ``lastrowid``."""
+    return db.run_write(lambda conn: conn.execute(sql, params).lastrowid)
+
+
 def _delete_batch_records(cursor, batch_id):
     """Remove a batch and its related detail records."""
     cursor.execute("DELETE FROM material_records WHERE batch_id = ?", (batch_id,))
@@ -186,7 +225,8 @@ def _save_attachments(file_storage_list, product_name, batch_number, process_seg
         relative_path = os.path.join(relative_folder, unique_name)
         absolute_path = os.path.join(base_folder, unique_name)
 
-        storage.save(absolute_path)
+        with metrics.section('attachments'):
+            storage.save(absolute_path)
         new_relative_paths.append(relative_path)
         new_absolute_paths.append(absolute_path)
 
@@ -382,121 +422,17 @@ def _safe_load_json(raw_value, default=None):
         return default if default is not None else {}
 
 
-def _convert_field_value(value, field_type, field_config):
-    if value in (None, ''):
-        return None, None
-
-    if field_type in ('text', 'textarea'):
-        return str(value).strip(), None
-
-    if field_type == 'number':
-        try:
-            return float(value), None
-        except (TypeError, ValueError):
-            label = field_config.get('label') or field_config.get('key')
-            return None, f"{label} 需要为数值类型"
-
-    if field_type == 'integer':
-        try:
-            return int(value), None
-        except (TypeError, ValueError):
-            label = field_config.get('label') or field_config.get('key')
-            return None, f"{label} 需要为整数"
-
-    if field_type == 'boolean':
-        if isinstance(value, bool):
-            return value, None
-        str_val = str(value).strip().lower()
-        if str_val in ('true', '1', 'yes', 'y', '是'):
-            return True, None
-        if str_val in ('false', '0', 'no', 'n', '否'):
-            return False, None
-        label = field_config.get('label') or field_config.get('key')
-        return None, f"{label} 需要为布尔类型"
-
-    if field_type == 'select':
-        options = field_config.get('options') or []
-        if options and value not in options:
-            label = field_config.get('label') or field_config.get('key')
-            return None, f"{label} 的取值必须在 {options} 中"
-        return value, None
-
-    # datetime/date/time 等类型默认以字符串处理
-    return value, None
-
-
-def _collect_structured_data(payload, field_config, extra_section='extras'):
-    payload = payload or {}
-    errors = []
-    columns = {}
-
-    for field in field_config.get('columns', []):
-        key = field['key']
-        column_name = field.get('column', key)
-        raw_value = payload.get(key)
-
-        if raw_value in (None, ''):
-            if 'default' in field:
-                raw_value = field['default']
-            elif field.get('required'):
-                label = field.get('label') or key
-                errors.append(f"{label} 为必填项")
-                continue
-
-        if raw_value in (None, ''):
-            columns[column_name] = None
-            continue
-
-        converted, error = _convert_field_value(raw_value, field.get('type', 'text'), field)
-        if error:
-            errors.append(error)
-            continue
-        columns[column_name] = converted
-
-    extras = {}
-    extra_payload = {}
-    configured_extra_fields = {field['key']: field for field in field_config.get(extra_section, [])}
-
-    if isinstance(payload.get(extra_section), dict):
-        extra_payload.update(payload.get(extra_section))
-
-    # 支持顶层直接传递扩展字段
-    for key in configured_extra_fields.keys():
-        if key in payload and key not in extra_payload:
-            extra_payload[key] = payload.get(key)
-
-    for key, field in configured_extra_fields.items():
-        value = extra_payload.get(key)
-        if value in (None, ''):
-            if field.get('required'):
-                label = field.get('label') or key
-                errors.append(f"{label} 为必填项")
-            continue
-
-        converted, error = _convert_field_value(value, field.get('type', 'text'), field)
-        if error:
-            errors.append(error)
-            continue
-        extras[key] = converted
-
-    # 保留未配置但传入的扩展字段，便于前端自定义
-    for key, value in extra_payload.items():
-        if key not in extras and value not in (None, ''):
-            extras[key] = value
-
-    return columns, extras, errors
-
-
 def _prepare_material_payload(data):
-    return _collect_structured_data(data, config.MATERIAL_RECORD_FIELDS, extra_section='extras')
+    return record_validation.material_validator()(data)
 
 
 def _prepare_quality_payload(data):
-    return _collect_structured_data(data, config.QUALITY_RECORD_FIELDS, extra_section='extras')
+    return record_validation.quality_validator()(data)
 
 
 def _prepare_equipment_payload(data):
-    columns, params, errors = _collect_structured_data(data, config.EQUIPMENT_RECORD_FIELDS, extra_section='parameters')
+    validator = record_validation.equipment_validator()
+    columns, params, errors = validator(data)
     if errors:
         return columns, params, errors
 
@@ -509,8 +445,8 @@ def _prepare_equipment_payload(data):
     params = {**existing_params, **params}
 
     # 移除与列同名的键，避免覆盖
-    for field in config.EQUIPMENT_RECORD_FIELDS.get('columns', []):
-        params.pop(field['key'], None)
+    for key in validator.column_keys:
+        params.pop(key, None)
 
     return columns, params, errors
 # 登录验证装饰器
@@ -527,6 +463,164 @@ def login_required(role=None):
         return decorated_function
     return decorator
 
+# 条件请求（ETag / If-None-Match）
+def etag_versioned(version_func):
+    """Serve 304 when the client's ETag matches the current data version.
+
+    ``version_func(*view_args)`` must be cheap (a journal sequence or config
+    digest); the ETag also covers the endpoint, query string and role, since
+    role filtering changes the body.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            role = (get_current_user() or {}).get('role') or ''
+            version = version_func(*args, **kwargs)
+            raw = '|'.join((request.endpoint or '', request.query_string.decode('latin-1'), role, str(version)))
+            etag = hashlib.sha1(raw.encode('utf-8')).hexdigest()[:20]
+
+            if request.if_none_match.contains(etag):
+                response = app.response_class(status=304)
+            else:
+                response = make_response(f(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag)
+            # 允许浏览器缓存，但每次使用前必须向服务端验证
+            response.headers['Cache-Control'] = 'private, no-cache'
+            return response
+        return decorated_function
+    return decorator
+
+
+def _journal_version(*tables):
+    def version(*args, **kwargs):
+        with closing(db.get_connection()) as conn:
+            return db.get_data_version(conn.cursor(), tables or None)
+    return version
+
+
+def _batches_version(*args, **kwargs):
+    # 批号列表的进度依赖工艺段顺序（fields_config.json）
+    return f'{_journal_version()()}/{config.get_fields_config_digest()}'
+
+
+def _fields_config_version(*args, **kwargs):
+    return config.get_fields_config_digest()
+
+
+_RECORD_FIELDS_DIGEST = (None, None)
+
+
+def _record_fields_version(*args, **kwargs):
+    global _RECORD_FIELDS_DIGEST
+    sources = (
+        config.MATERIAL_RECORD_FIELDS,
+        config.EQUIPMENT_RECORD_FIELDS,
+        config.QUALITY_RECORD_FIELDS,
+        getattr(config, 'BATCH_STATUS_OPTIONS', None),
+        getattr(config, 'BATCH_COMPLETED_STATUS', None)
+    )
+    identity = tuple(id(source) for source in sources)
+    cached_identity, digest = _RECORD_FIELDS_DIGEST
+    if cached_identity != identity:
+        payload = json.dumps(sources, sort_keys=True, ensure_ascii=False, default=str)
+        digest = hashlib.sha1(payload.encode('utf-8')).hexdigest()[:16]
+        _RECORD_FIELDS_DIGEST = (identity, digest)
+    return digest
+
+
+def cached_query_result(f):
+    """Serve repeated queries from ``query_cache`` while the data is unchanged."""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if not getattr(config, 'QUERY_CACHE_ENABLED', False):
+            return f(*args, **kwargs)
+
+        role = (get_current_user() or {}).get('role') or ''
+        key = (request.endpoint,) + query_cache.normalize_args(request.args, role)
+        source = _analytics_db()
+        with closing(source.get_connection()) as conn:
+            version = (source.get_change_seq(conn.cursor()), config.get_fields_config_digest())
+
+        body = query_cache.query_results.get(key, version)
+        if body is not None:
+            response = app.response_class(body, mimetype='application/json')
+            response.headers['X-Query-Cache'] = 'hit'
+            return response
+
+        response = make_response(f(*args, **kwargs))
+        if response.status_code == 200 and not response.is_streamed:
+            query_cache.query_results.put(key, version, response.get_data())
+        response.headers['X-Query-Cache'] = 'miss'
+        return response
+    return decorated_function
+
+
+# 分析快照（snapshot.py）
+def _analytics_db():
+    """Database the analytical endpoints read from during this request.
+
+    The snapshot when ``ANALYTICS_SNAPSHOT_ENABLED`` and it is younger than
+    ``ANALYTICS_SNAPSHOT_MAX_STALENESS``; otherwise the primary database.
+    """
+    if 'analytics_db' in g:
+        return g.analytics_db
+    source = db
+    if getattr(config, 'ANALYTICS_SNAPSHOT_ENABLED', False):
+        analytics_snapshot = snapshot.get_snapshot(db)
+        # 快照缺失时调度线程会立即生成，本次请求先读主库
+        analytics_snapshot.ensure_scheduler()
+        staleness = analytics_snapshot.staleness()
+        max_staleness = getattr(config, 'ANALYTICS_SNAPSHOT_MAX_STALENESS', None)
+        if staleness is not None and (max_staleness is None or staleness <= max_staleness):
+            source = analytics_snapshot
+            g.snapshot_staleness = staleness
+            g.snapshot_taken_at = analytics_snapshot.metadata()['taken_at']
+    g.analytics_db = source
+    return source
+
+
+@app.after_request
+def _report_data_source(response):
+    if 'analytics_db' not in g:
+        return response
+    if g.analytics_db is db:
+        response.headers['X-Data-Source'] = 'primary'
+    else:
+        response.headers['X-Data-Source'] = 'snapshot'
+        response.headers['X-Data-Staleness'] = str(int(g.snapshot_staleness))
+        response.headers['X-Snapshot-Taken-At'] = _utc_timestamp(g.snapshot_taken_at)
+    return response
+
+
+def _utc_timestamp(epoch):
+    return datetime.fromtimestamp(epoch, timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+# 数据库维护（maintenance.py）
+@app.before_request
+def _ensure_maintenance_scheduler():
+    if getattr(config, 'MAINTENANCE_ENABLED', False):
+        maintenance.get_scheduler(db).ensure_started()
+
+
+# 请求计时（metrics.py）
+@app.before_request
+def _begin_request_metrics():
+    if getattr(config, 'METRICS_ENABLED', False):
+        metrics.begin_request(request.endpoint)
+
+
+@app.after_request
+def _record_request_metrics(response):
+    if getattr(config, 'METRICS_ENABLED', False):
+        # 流式响应（如事件推送）没有确定的长度
+        size = None if response.is_streamed else response.content_length
+        metrics.end_request(request.method, response.status_code, size)
+    return response
+
+
 # 路由定义
 @app.route('/')
 def index():
@@ -619,6 +713,7 @@ def dashboard_page():
 
 @app.route('/api/config/record_fields', methods=['GET'])
 @login_required()
+@etag_versioned(_record_fields_version)
 def record_field_config():
     return jsonify({
         'materials': config.MATERIAL_RECORD_FIELDS,
@@ -631,6 +726,7 @@ def record_field_config():
 
 @app.route('/api/segment_definitions', methods=['GET'])
 @login_required()
+@etag_versioned(_fields_config_version)
 def segment_definitions_config():
     segment = request.args.get('segment')
     definition_type = request.args.get('type')
@@ -642,36 +738,113 @@ def segment_definitions_config():
     return jsonify(definitions)
 
 
+@app.route('/api/events', methods=['GET'])
+@login_required()
+def event_stream():
+    """Server-Sent Events feed of batch/record changes visible to the caller."""
+    role = (get_current_user() or {}).get('role') or ''
+    feed = events.get_feed(db)
+    try:
+        subscription = feed.broker.subscribe(role)
+    except events.SubscriberLimitReached:
+        # EventSource 收到 503 后不会自动重连，由前端退避后重新订阅
+        response = jsonify({'error': '实时推送连接数已满，请稍后重试'})
+        response.status_code = 503
+        response.headers['Retry-After'] = str(getattr(config, 'EVENT_STREAM_KEEPALIVE', 15))
+        return response
+    last_event_id = events.parse_last_event_id(request.headers.get('Last-Event-ID'))
+    stream = events.stream_events(feed, subscription, last_event_id)
+    response = app.response_class(stream, mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@app.context_processor
+def inject_asset_url():
+    def asset_url(filename):
+        """URL of a built (fingerprinted) asset, falling back to /static."""
+        built = assets.asset_path(filename)
+        if built:
+            return url_for('serve_asset', filename=built)
+        return url_for('static', filename=filename)
+    return {'asset_url': asset_url}
+
+
+@app.route('/assets/<path:filename>')
+def serve_asset(filename):
+    # 文件名包含内容哈希，可以永久缓存；优先返回预压缩版本
+    encoding, variant = assets.choose_variant(filename, request.accept_encodings)
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    response = send_from_directory(
+        config.ASSET_DIST_DIR, variant, mimetype=mimetype, max_age=config.ASSET_MAX_AGE
+    )
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Cache-Control'] = f'public, max-age={config.ASSET_MAX_AGE}, immutable'
+    response.vary.add('Accept-Encoding')
+    return response
+
+
 @app.route('/download/<path:filename>')
 @login_required()
 def download_attachment(filename):
     safe_path = os.path.normpath(filename)
     if safe_path.startswith('..'):
         return jsonify({'error': '无效的文件路径'}), 400
-    return send_from_directory(app.config['UPLOAD_FOLDER'], safe_path, as_attachment=True)
+    with metrics.section('attachments'):
+        return send_from_directory(app.config['UPLOAD_FOLDER'], safe_path, as_attachment=True)
+
+def _parse_since_param():
+    """Return the ``since`` journal sequence of the request (None when absent)."""
+    raw = request.args.get('since')
+    if raw in (None, ''):
+        return None
+    try:
+        since = int(raw)
+    except (TypeError, ValueError):
+        raise ValueError('since 参数必须为整数')
+    if since < 0:
+        raise ValueError('since 参数必须为整数')
+    return since
 
-# API端点 - 批号管理
-@app.route('/api/batches', methods=['GET'])
-@login_required()
-def get_batches():
-    current_user = get_current_user() or {}
-    role = current_user.get('role') or ''
-    hide_quality = role == 'write_material'
 
-    with closing(db.get_connection()) as conn:
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT b.*, u.username as created_by_name,
-                   (SELECT COUNT(*) FROM material_records WHERE batch_id = b.id) as material_count,
-                   (SELECT COUNT(*) FROM equipment_records WHERE batch_id = b.id) as equipment_count,
-                   (SELECT COUNT(*) FROM quality_records WHERE batch_id = b.id) as quality_count,
-                   (SELECT MIN(start_time) FROM equipment_records WHERE batch_id = b.id) as equipment_start_time,
-                   (SELECT MAX(COALESCE(end_time, start_time)) FROM equipment_records WHERE batch_id = b.id) as equipment_end_time
-            FROM batches b
-            JOIN users u ON b.created_by = u.id
-            ORDER BY b.start_time DESC
-        ''')
-        rows = cursor.fetchall()
+def _delta_requires_full(cursor, since, seq):
+    # since 早于已清理的日志或超过当前序号（数据库被重建）时无法给出增量
+    return since < db.get_pruned_change_seq(cursor) or since > seq
+
+
+def _build_batch_groups(cursor, hide_quality, keys=None):
+    """Aggregate batch rows into the grouped list returned by ``/api/batches``.
+
+    ``keys`` restricts the result to the given (batch_number, product_name)
+    groups, which is how the delta mode recomputes only changed groups.
+    """
+    query = '''
+        SELECT b.*, u.username as created_by_name,
+               (SELECT COUNT(*) FROM material_records WHERE batch_id = b.id) as material_count,
+               (SELECT COUNT(*) FROM equipment_records WHERE batch_id = b.id) as equipment_count,
+               (SELECT COUNT(*) FROM quality_records WHERE batch_id = b.id) as quality_count,
+               (SELECT MIN(start_time) FROM equipment_records WHERE batch_id = b.id) as equipment_start_time,
+               (SELECT MAX(COALESCE(end_time, start_time)) FROM equipment_records WHERE batch_id = b.id) as equipment_end_time
+        FROM batches b
+        JOIN users u ON b.created_by = u.id
+    '''
+    params = []
+    if keys is not None:
+        keys = list(keys)
+        if not keys:
+            return []
+        # 分组键以一个 JSON 参数传入：语句文本固定，也不受 SQLite 变量数上限限制
+        query += '''
+            WHERE (b.batch_number, b.product_name) IN (
+                SELECT json_extract(value, '$[0]'), json_extract(value, '$[1]') FROM json_each(?)
+            )
+        '''
+        params.append(json.dumps([list(key) for key in keys], ensure_ascii=False))
+    query += ' ORDER BY b.start_time DESC'
+    cursor.execute(query, params)
+    rows = cursor.fetchall()
 
     pipeline_segments = config.get_process_segments()
     pipeline_length = len(pipeline_segments) if pipeline_segments else 1
@@ -749,8 +922,71 @@ def get_batches():
         response.append(display_batch)
 
     response.sort(key=lambda item: (item.get('start_time') or ''), reverse=True)
+    return response
 
-    return jsonify(response)
+
+# API端点 - 批号管理
+@app.route('/api/batches', methods=['GET'])
+@login_required()
+@etag_versioned(_batches_version)
+def get_batches():
+    current_user = get_current_user() or {}
+    role = current_user.get('role') or ''
+    hide_quality = role == 'write_material'
+
+    try:
+        since = _parse_since_param()
+    except ValueError as exc:
+        return jsonify({'error': str(exc)}), 400
+
+    with closing(db.get_connection()) as conn:
+        cursor = conn.cursor()
+        # 先读取序号再读取数据：期间发生的写入会在下一次增量中重复出现，但不会丢失
+        seq = db.get_change_seq(cursor)
+
+        if since is None:
+            response = jsonify(_build_batch_groups(cursor, hide_quality))
+            response.headers['X-Change-Seq'] = str(seq)
+            return response
+
+        if _delta_requires_full(cursor, since, seq):
+            return jsonify({
+                'since': since,
+                'seq': seq,
+                'full': True,
+                'changed': _build_batch_groups(cursor, hide_quality),
+                'deleted': [],
+                'archived': []
+            })
+
+        cursor.execute('''
+            SELECT batch_number, product_name, MAX(op = 'archive') AS archived
+            FROM change_journal
+            WHERE seq > ? AND seq <= ? AND batch_number IS NOT NULL
+            GROUP BY batch_number, product_name
+        ''', (since, seq))
+        rows = cursor.fetchall()
+        keys = [(row['batch_number'], row['product_name']) for row in rows]
+        archived_keys = {(row['batch_number'], row['product_name']) for row in rows if row['archived']}
+        changed = _build_batch_groups(cursor, hide_quality, keys)
+
+    present = {(item.get('batch_number'), item.get('product_name')) for item in changed}
+    # 已归档的分组不在热库中，但仍可查询，不能按删除处理
+    deleted, archived = [], []
+    for batch_number, product_name in keys:
+        if (batch_number, product_name) in present:
+            continue
+        target = archived if (batch_number, product_name) in archived_keys else deleted
+        target.append({'batch_number': batch_number, 'product_name': product_name})
+
+    return jsonify({
+        'since': since,
+        'seq': seq,
+        'full': False,
+        'changed': changed,
+        'deleted': deleted,
+        'archived': archived
+    })
 
 @app.route('/api/batches', methods=['POST'])
 @login_required(role=['admin', 'write', 'write_material'])
@@ -767,12 +1003,10 @@ def create_batch():
     try:
         with closing(db.get_connection()) as conn:
             cursor = conn.cursor()
-            cursor.execute(
+            batch_id = _execute_write(
                 "INSERT INTO batches (batch_number, product_name, process_segment, created_by) VALUES (?, ?, ?, ?)",
                 (batch_number, product_name, process_segment, current_user['id'])
             )
-            batch_id = cursor.lastrowid
-            conn.commit()
 
             cursor.execute('''
                 SELECT b.*, u.username as created_by_name FROM batches b 
@@ -833,95 +1067,98 @@ def duplicate_batch(batch_id):
             default_status = '进行中'
         new_status = requested_status or default_status
 
-        cursor.execute(
-            '''INSERT INTO batches (batch_number, product_name, process_segment, status, created_by)
-               VALUES (?, ?, ?, ?, ?)''',
-            (new_batch_number, new_product_name, target_segment, new_status, current_user['id'])
-        )
-        new_batch_id = cursor.lastrowid
+        def copy_batch(writer):
+            cursor = writer.cursor()
+            cursor.execute(
+                '''INSERT INTO batches (batch_number, product_name, process_segment, status, created_by)
+                   VALUES (?, ?, ?, ?, ?)''',
+                (new_batch_number, new_product_name, target_segment, new_status, current_user['id'])
+            )
+            new_batch_id = cursor.lastrowid
 
-        if copy_records:
-            cursor.execute('''
-                SELECT material_code, material_name, weight, unit, supplier, lot_number,
-                       record_time, recorded_by, attributes_json, attachments_json
-                FROM material_records
-                WHERE batch_id = ?
-            ''', (batch_id,))
-            material_rows = cursor.fetchall()
-            for material in material_rows:
+            if copy_records:
                 cursor.execute('''
-                    INSERT INTO material_records 
-                    (batch_id, material_code, material_name, weight, unit, supplier, lot_number,
-                     record_time, recorded_by, attributes_json, attachments_json)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    new_batch_id,
-                    material['material_code'],
-                    material['material_name'],
-                    material['weight'],
-                    material['unit'],
-                    material['supplier'],
-                    material['lot_number'],
-                    material['record_time'],
-                    material['recorded_by'],
-                    material['attributes_json'] or '{}',
-                    material['attachments_json'] or '[]'
-                ))
+                    SELECT material_code, material_name, weight, unit, supplier, lot_number,
+                           record_time, recorded_by, attributes_json, attachments_json
+                    FROM material_records
+                    WHERE batch_id = ?
+                ''', (batch_id,))
+                material_rows = cursor.fetchall()
+                for material in material_rows:
+                    cursor.execute('''
+                        INSERT INTO material_records 
+                        (batch_id, material_code, material_name, weight, unit, supplier, lot_number,
+                         record_time, recorded_by, attributes_json, attachments_json)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ''', (
+                        new_batch_id,
+                        material['material_code'],
+                        material['material_name'],
+                        material['weight'],
+                        material['unit'],
+                        material['supplier'],
+                        material['lot_number'],
+                        material['record_time'],
+                        material['recorded_by'],
+                        material['attributes_json'] or '{}',
+                        material['attachments_json'] or '[]'
+                    ))
 
-            cursor.execute('''
-                SELECT equipment_code, equipment_name, parameters_json, start_time, end_time,
-                       status, recorded_by, attachments_json
-                FROM equipment_records
-                WHERE batch_id = ?
-            ''', (batch_id,))
-            equipment_rows = cursor.fetchall()
-            for equipment in equipment_rows:
                 cursor.execute('''
-                    INSERT INTO equipment_records
-                    (batch_id, equipment_code, equipment_name, parameters_json, start_time, end_time,
-                     status, recorded_by, attachments_json)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    new_batch_id,
-                    equipment['equipment_code'],
-                    equipment['equipment_name'],
-                    equipment['parameters_json'] or '{}',
-                    equipment['start_time'],
-                    equipment['end_time'],
-                    equipment['status'],
-                    equipment['recorded_by'],
-                    equipment['attachments_json'] or '[]'
-                ))
+                    SELECT equipment_code, equipment_name, parameters_json, start_time, end_time,
+                           status, recorded_by, attachments_json
+                    FROM equipment_records
+                    WHERE batch_id = ?
+                ''', (batch_id,))
+                equipment_rows = cursor.fetchall()
+                for equipment in equipment_rows:
+                    cursor.execute('''
+                        INSERT INTO equipment_records
+                        (batch_id, equipment_code, equipment_name, parameters_json, start_time, end_time,
+                         status, recorded_by, attachments_json)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ''', (
+                        new_batch_id,
+                        equipment['equipment_code'],
+                        equipment['equipment_name'],
+                        equipment['parameters_json'] or '{}',
+                        equipment['start_time'],
+                        equipment['end_time'],
+                        equipment['status'],
+                        equipment['recorded_by'],
+                        equipment['attachments_json'] or '[]'
+                    ))
 
-            cursor.execute('''
-                SELECT test_item, test_value, unit, standard_min, standard_max, result,
-                       test_time, tested_by, notes, attributes_json, attachments_json
-                FROM quality_records
-                WHERE batch_id = ?
-            ''', (batch_id,))
-            quality_rows = cursor.fetchall()
-            for quality in quality_rows:
                 cursor.execute('''
-                    INSERT INTO quality_records
-                    (batch_id, test_item, test_value, unit, standard_min, standard_max, result,
-                     test_time, tested_by, notes, attributes_json, attachments_json)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    new_batch_id,
-                    quality['test_item'],
-                    quality['test_value'],
-                    quality['unit'],
-                    quality['standard_min'],
-                    quality['standard_max'],
-                    quality['result'],
-                    quality['test_time'],
-                    quality['tested_by'],
-                    quality['notes'],
-                    quality['attributes_json'] or '{}',
-                    quality['attachments_json'] or '[]'
-                ))
-
-        conn.commit()
+                    SELECT test_item, test_value, unit, standard_min, standard_max, result,
+                           test_time, tested_by, notes, attributes_json, attachments_json
+                    FROM quality_records
+                    WHERE batch_id = ?
+                ''', (batch_id,))
+                quality_rows = cursor.fetchall()
+                for quality in quality_rows:
+                    cursor.execute('''
+                        INSERT INTO quality_records
+                        (batch_id, test_item, test_value, unit, standard_min, standard_max, result,
+                         test_time, tested_by, notes, attributes_json, attachments_json)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ''', (
+                        new_batch_id,
+                        quality['test_item'],
+                        quality['test_value'],
+                        quality['unit'],
+                        quality['standard_min'],
+                        quality['standard_max'],
+                        quality['result'],
+                        quality['test_time'],
+                        quality['tested_by'],
+                        quality['notes'],
+                        quality['attributes_json'] or '{}',
+                        quality['attachments_json'] or '[]'
+                    ))
+            return new_batch_id
+
+        new_batch_id = db.run_write(copy_batch)
 
         cursor.execute('''
             SELECT b.*, u.username as created_by_name
@@ -973,11 +1210,10 @@ def update_batch(batch_id):
 
         params.append(batch_id)
 
-        cursor.execute(
+        _execute_write(
             f"UPDATE batches SET {', '.join(updates)} WHERE id = ?",
             params
         )
-        conn.commit()
 
         cursor.execute('''
             SELECT b.*, u.username as created_by_name
@@ -999,8 +1235,7 @@ def delete_batch(batch_id):
         if not cursor.fetchone():
             return jsonify({'error': '批号不存在'}), 404
 
-        _delete_batch_records(cursor, batch_id)
-        conn.commit()
+        db.run_write(lambda writer: _delete_batch_records(writer.cursor(), batch_id))
 
     return jsonify({'success': True, 'deleted': 1})
 
@@ -1032,20 +1267,20 @@ def delete_batch_by_details():
         if not rows:
             return jsonify({'error': '未找到匹配的批号记录'}), 404
 
-        deleted = 0
-        for row in rows:
-            batch_id = row['id'] if isinstance(row, dict) else row[0]
-            _delete_batch_records(cursor, batch_id)
-            deleted += 1
+        deleted_ids = [row['id'] if isinstance(row, dict) else row[0] for row in rows]
 
-        conn.commit()
+    def delete_batches(writer):
+        for batch_id in deleted_ids:
+            _delete_batch_records(writer.cursor(), batch_id)
 
-    return jsonify({'success': True, 'deleted': deleted})
+    db.run_write(delete_batches)
+    return jsonify({'success': True, 'deleted': len(deleted_ids)})
 
 
 # API端点 - 工艺段配置
 @app.route('/api/process_segments', methods=['GET'])
 @login_required()
+@etag_versioned(_journal_version('process_segments'))
 def get_process_segments():
     conn = db.get_connection()
     c = conn.cursor()
@@ -1064,6 +1299,63 @@ def get_process_segments():
     conn.close()
     return jsonify(segments)
 
+def _record_list_response(table_name, alias, query, batch_id, serializer):
+    """Full list or ``?since=`` delta of one record table for ``batch_id``.
+
+    ``query`` selects the batch's rows and contains a ``{filter}`` placeholder
+    which the delta mode fills with an id restriction.
+    """
+    try:
+        since = _parse_since_param()
+    except ValueError as exc:
+        return jsonify({'error': str(exc)}), 400
+
+    with closing(db.get_connection()) as conn:
+        cursor = conn.cursor()
+        seq = db.get_change_seq(cursor)
+
+        if since is None:
+            cursor.execute(query.format(filter=''), (batch_id,))
+            response = jsonify([serializer(row) for row in cursor.fetchall()])
+            response.headers['X-Change-Seq'] = str(seq)
+            return response
+
+        if _delta_requires_full(cursor, since, seq):
+            cursor.execute(query.format(filter=''), (batch_id,))
+            return jsonify({
+                'since': since,
+                'seq': seq,
+                'full': True,
+                'changed': [serializer(row) for row in cursor.fetchall()],
+                'deleted': [],
+                'archived': []
+            })
+
+        cursor.execute('''
+            SELECT row_id, MAX(op = 'archive') AS archived FROM change_journal
+            WHERE table_name = ? AND batch_id = ? AND seq > ? AND seq <= ?
+            GROUP BY row_id
+        ''', (table_name, batch_id, since, seq))
+        rows = cursor.fetchall()
+        ids = [row['row_id'] for row in rows]
+        archived_ids = {row['row_id'] for row in rows if row['archived']}
+        changed = []
+        if ids:
+            # 复用 json_each 传入 id 列表，避免拼接大量占位符
+            id_filter = f'AND {alias}.id IN (SELECT value FROM json_each(?))'
+            cursor.execute(query.format(filter=id_filter), (batch_id, json.dumps(ids)))
+            changed = [serializer(row) for row in cursor.fetchall()]
+
+    present = {item.get('id') for item in changed}
+    return jsonify({
+        'since': since,
+        'seq': seq,
+        'full': False,
+        'changed': changed,
+        'deleted': [record_id for record_id in ids if record_id not in present and record_id not in archived_ids],
+        'archived': [record_id for record_id in ids if record_id not in present and record_id in archived_ids]
+    })
+
 # API端点 - 物料记录
 @app.route('/api/batches/<int:batch_id>/materials', methods=['GET'])
 @login_required()
@@ -1072,18 +1364,13 @@ def get_materials(batch_id):
     if current_user and current_user.get('role') == 'write_quality':
         return jsonify({'error': '权限不足'}), 403
 
-    with closing(db.get_connection()) as conn:
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT m.*, u.username as recorded_by_name 
-            FROM material_records m 
-            JOIN users u ON m.recorded_by = u.id 
-            WHERE m.batch_id = ? 
-            ORDER BY m.record_time DESC
-        ''', (batch_id,))
-        rows = cursor.fetchall()
-
-    return jsonify([_serialize_material(row) for row in rows])
+    return _record_list_response('material_records', 'm', '''
+        SELECT m.*, u.username as recorded_by_name
+        FROM material_records m
+        JOIN users u ON m.recorded_by = u.id
+        WHERE m.batch_id = ? {filter}
+        ORDER BY m.record_time DESC
+    ''', batch_id, _serialize_material)
 
 @app.route('/api/batches/<int:batch_id>/materials', methods=['POST'])
 @login_required(role=['admin', 'write', 'write_material'])
@@ -1110,7 +1397,7 @@ def add_material(batch_id):
         except AttachmentValidationError as error:
             return jsonify({'error': str(error)}), 400
 
-        cursor.execute('''
+        material_id = _execute_write('''
             INSERT INTO material_records 
             (batch_id, material_code, material_name, weight, unit, supplier, lot_number, recorded_by, attributes_json, attachments_json)
             VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
@@ -1127,9 +1414,6 @@ def add_material(batch_id):
             json.dumps(attachments, ensure_ascii=False)
         ))
 
-        material_id = cursor.lastrowid
-        conn.commit()
-
         cursor.execute('''
             SELECT m.*, u.username as recorded_by_name 
             FROM material_records m 
@@ -1174,7 +1458,7 @@ def update_material(batch_id, material_id):
         except AttachmentValidationError as error:
             return jsonify({'error': str(error)}), 400
 
-        cursor.execute(
+        _execute_write(
             '''UPDATE material_records
                SET material_code = ?, material_name = ?, weight = ?, unit = ?, supplier = ?, lot_number = ?,
                    attributes_json = ?, attachments_json = ?, recorded_by = ?, record_time = ?
@@ -1195,8 +1479,6 @@ def update_material(batch_id, material_id):
             )
         )
 
-        conn.commit()
-
         cursor.execute('''
             SELECT m.*, u.username as recorded_by_name
             FROM material_records m
@@ -1215,18 +1497,13 @@ def get_equipment_records(batch_id):
     if current_user and current_user.get('role') == 'write_quality':
         return jsonify({'error': '权限不足'}), 403
 
-    with closing(db.get_connection()) as conn:
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT e.*, u.username as recorded_by_name 
-            FROM equipment_records e 
-            JOIN users u ON e.recorded_by = u.id 
-            WHERE e.batch_id = ? 
-            ORDER BY e.start_time DESC
-        ''', (batch_id,))
-        rows = cursor.fetchall()
-
-    return jsonify([_serialize_equipment(row) for row in rows])
+    return _record_list_response('equipment_records', 'e', '''
+        SELECT e.*, u.username as recorded_by_name
+        FROM equipment_records e
+        JOIN users u ON e.recorded_by = u.id
+        WHERE e.batch_id = ? {filter}
+        ORDER BY e.start_time DESC
+    ''', batch_id, _serialize_equipment)
 
 @app.route('/api/batches/<int:batch_id>/equipment', methods=['POST'])
 @login_required(role=['admin', 'write', 'write_material'])
@@ -1254,7 +1531,7 @@ def add_equipment_record(batch_id):
         except AttachmentValidationError as error:
             return jsonify({'error': str(error)}), 400
 
-        cursor.execute('''
+        record_id = _execute_write('''
             INSERT INTO equipment_records 
             (batch_id, equipment_code, equipment_name, parameters_json, start_time, end_time, status, recorded_by, attachments_json)
             VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
@@ -1270,9 +1547,6 @@ def add_equipment_record(batch_id):
             json.dumps(attachments, ensure_ascii=False)
         ))
 
-        record_id = cursor.lastrowid
-        conn.commit()
-
         cursor.execute('''
             SELECT e.*, u.username as recorded_by_name 
             FROM equipment_records e 
@@ -1319,7 +1593,7 @@ def update_equipment_record(batch_id, equipment_id):
         except AttachmentValidationError as error:
             return jsonify({'error': str(error)}), 400
 
-        cursor.execute(
+        _execute_write(
             '''UPDATE equipment_records
                SET equipment_code = ?, equipment_name = ?, parameters_json = ?, start_time = ?, end_time = ?,
                    status = ?, attachments_json = ?, recorded_by = ?
@@ -1338,8 +1612,6 @@ def update_equipment_record(batch_id, equipment_id):
             )
         )
 
-        conn.commit()
-
         cursor.execute('''
             SELECT e.*, u.username as recorded_by_name
             FROM equipment_records e
@@ -1358,18 +1630,13 @@ def get_quality_records(batch_id):
     if current_user and current_user.get('role') == 'write_material':
         return jsonify({'error': '权限不足'}), 403
 
-    with closing(db.get_connection()) as conn:
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT q.*, u.username as tested_by_name 
-            FROM quality_records q 
-            JOIN users u ON q.tested_by = u.id 
-            WHERE q.batch_id = ? 
-            ORDER BY q.test_time DESC
-        ''', (batch_id,))
-        rows = cursor.fetchall()
-
-    return jsonify([_serialize_quality(row) for row in rows])
+    return _record_list_response('quality_records', 'q', '''
+        SELECT q.*, u.username as tested_by_name
+        FROM quality_records q
+        JOIN users u ON q.tested_by = u.id
+        WHERE q.batch_id = ? {filter}
+        ORDER BY q.test_time DESC
+    ''', batch_id, _serialize_quality)
 
 @app.route('/api/batches/<int:batch_id>/quality', methods=['POST'])
 @login_required(role=['admin', 'write', 'write_quality'])
@@ -1408,7 +1675,7 @@ def add_quality_record(batch_id):
         except AttachmentValidationError as error:
             return jsonify({'error': str(error)}), 400
 
-        cursor.execute('''
+        record_id = _execute_write('''
             INSERT INTO quality_records 
             (batch_id, test_item, test_value, unit, standard_min, standard_max, result, test_time, tested_by, notes, attributes_json, attachments_json)
             VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
@@ -1427,9 +1694,6 @@ def add_quality_record(batch_id):
             json.dumps(attachments, ensure_ascii=False)
         ))
 
-        record_id = cursor.lastrowid
-        conn.commit()
-
         cursor.execute('''
             SELECT q.*, u.username as tested_by_name 
             FROM quality_records q 
@@ -1486,7 +1750,7 @@ def update_quality_record(batch_id, quality_id):
             else:
                 result = '不合格'
 
-        cursor.execute(
+        _execute_write(
             '''UPDATE quality_records
                SET test_item = ?, test_value = ?, unit = ?, standard_min = ?, standard_max = ?, result = ?,
                    test_time = ?, tested_by = ?, notes = ?, attributes_json = ?, attachments_json = ?
@@ -1508,8 +1772,6 @@ def update_quality_record(batch_id, quality_id):
         )
     )
 
-        conn.commit()
-
         cursor.execute('''
             SELECT q.*, u.username as tested_by_name
             FROM quality_records q
@@ -1523,6 +1785,7 @@ def update_quality_record(batch_id, quality_id):
 # API端点 - 自定义字段配置
 @app.route('/api/custom_fields', methods=['GET'])
 @login_required()
+@etag_versioned(_journal_version('custom_fields'))
 def get_custom_fields():
     field_type = request.args.get('type')  # 'equipment' 或 'quality'
     with closing(db.get_connection()) as conn:
@@ -1551,228 +1814,401 @@ def get_custom_fields():
     return jsonify(fields)
 
 # API端点 - 查询和导出
+def _parse_page_args(args):
+    """Return ``(page, page_size)`` for a paged query, or None when not paged."""
+    if 'page' not in args and 'page_size' not in args:
+        return None
+    try:
+        page = int(args.get('page') or 1)
+        page_size = int(args.get('page_size') or config.QUERY_PAGE_SIZE_DEFAULT)
+    except ValueError:
+        raise ValueError('page 与 page_size 参数必须为整数')
+    if page < 1 or page_size < 1:
+        raise ValueError('page 与 page_size 参数必须为正整数')
+    return page, min(page_size, config.QUERY_PAGE_SIZE_MAX)
+
+
+def _serialize_query_row(row):
+    result = {
+        'batch_number': row['batch_number'],
+        'product_name': row['product_name'],
+        'process_segment': row['process_segment'],
+        'status': row['status'],
+        'start_time': row['start_time'],
+        'end_time': row['end_time'],
+        'material_code': row['material_code'],
+        'material_name': row['material_name'],
+        'weight': row['weight'],
+        'material_unit': row['material_unit'],
+        'supplier': row['supplier'],
+        'material_attachments': [
+            os.path.basename(path) for path in _safe_load_json(row['material_attachments_json'], [])
+        ],
+        'equipment_code': row['equipment_code'],
+        'equipment_name': row['equipment_name'],
+        'parameters_json': row['parameters_json'],
+        'equipment_start': row['equipment_start'],
+        'equipment_end': row['equipment_end'],
+        'equipment_status': row['equipment_status'],
+        'equipment_attachments': [
+            os.path.basename(path) for path in _safe_load_json(row['equipment_attachments_json'], [])
+        ],
+        'test_item': row['test_item'],
+        'test_value': row['test_value'],
+        'quality_unit': row['quality_unit'],
+        'result': row['result'],
+        'standard_min': row['standard_min'],
+        'standard_max': row['standard_max'],
+        'quality_attachments': [
+            os.path.basename(path) for path in _safe_load_json(row['quality_attachments_json'], [])
+        ]
+    }
+
+    for alias, prefix, table in EXTRA_QUERY_SOURCES:
+        attributes = _safe_load_json(row[f'{prefix}_attributes_json'], {})
+        for field in get_declared_extra_fields(table):
+            result[f"{prefix}_{field['key']}"] = attributes.get(field['key'])
+    return result
+
+
 @app.route('/api/query', methods=['GET'])
 @login_required()
+@cached_query_result
 def query_data():
-    # 获取查询参数
-    batch_number = request.args.get('batch_number', '')
-    product_name = request.args.get('product_name', '')
-    process_segment = request.args.get('process_segment', '')
-    start_date = request.args.get('start_date', '')
-    end_date = request.args.get('end_date', '')
-    material_code = request.args.get('material_code', '')
-    material_name = request.args.get('material_name', '')
-    supplier = request.args.get('supplier', '')
-    equipment_code = request.args.get('equipment_code', '')
-    equipment_name = request.args.get('equipment_name', '')
-    equipment_status = request.args.get('equipment_status', '')
-    test_item = request.args.get('test_item', '')
-    test_result = request.args.get('test_result', '')
-    min_value = request.args.get('min_value', '')
-    max_value = request.args.get('max_value', '')
-    
-    conn = db.get_connection()
-    c = conn.cursor()
-    
-    # 构建复杂的多表查询
-    query = '''
-        SELECT 
-            b.batch_number,
-            b.product_name,
-            b.process_segment,
-            b.status,
-            b.start_time,
-            b.end_time,
-            m.material_code,
-            m.material_name,
-            m.weight,
-            m.unit as material_unit,
-            m.supplier,
-            m.attachments_json as material_attachments_json,
-            e.equipment_code,
-            e.equipment_name,
-            e.parameters_json,
-            e.start_time as equipment_start,
-            e.end_time as equipment_end,
-            e.status as equipment_status,
-            e.attachments_json as equipment_attachments_json,
-            q.test_item,
-            q.test_value,
-            q.unit as quality_unit,
-            q.result,
-            q.standard_min,
-            q.standard_max,
-            q.attachments_json as quality_attachments_json
-        FROM batches b
-        LEFT JOIN material_records m ON b.id = m.batch_id
-        LEFT JOIN equipment_records e ON b.id = e.batch_id
-        LEFT JOIN quality_records q ON b.id = q.batch_id
-        WHERE 1=1
-    '''
-    
-    params = []
-    
-    # 添加批号条件
-    if batch_number:
-        query += " AND b.batch_number LIKE ?"
-        params.append(f'%{batch_number}%')
-    
-    # 添加产品名称条件
-    if product_name:
-        query += " AND b.product_name LIKE ?"
-        params.append(f'%{product_name}%')
-    
-    # 添加工艺段条件
-    if process_segment:
-        query += " AND b.process_segment = ?"
-        params.append(process_segment)
-    
-    # 添加时间范围条件
-    if start_date:
-        query += " AND DATE(b.start_time) >= ?"
-        params.append(start_date)
-    
-    if end_date:
-        query += " AND DATE(b.start_time) <= ?"
-        params.append(end_date)
-    
-    # 添加物料条件
-    if material_code:
-        query += " AND m.material_code LIKE ?"
-        params.append(f'%{material_code}%')
-    
-    if material_name:
-        query += " AND m.material_name LIKE ?"
-        params.append(f'%{material_name}%')
-    
-    if supplier:
-        query += " AND m.supplier LIKE ?"
-        params.append(f'%{supplier}%')
-    
-    # 添加设备条件
-    if equipment_code:
-        query += " AND e.equipment_code LIKE ?"
-        params.append(f'%{equipment_code}%')
-    
-    if equipment_name:
-        query += " AND e.equipment_name LIKE ?"
-        params.append(f'%{equipment_name}%')
-    
-    if equipment_status:
-        query += " AND e.status = ?"
-        params.append(equipment_status)
-    
-    # 添加品质条件
-    if test_item:
-        query += " AND q.test_item LIKE ?"
-        params.append(f'%{test_item}%')
-    
-    if test_result:
-        query += " AND q.result = ?"
-        params.append(test_result)
-    
-    if min_value:
-        query += " AND q.test_value >= ?"
-        params.append(float(min_value))
-    
-    if max_value:
-        query += " AND q.test_value <= ?"
-        params.append(float(max_value))
-    
-    query += " ORDER BY b.start_time DESC"
-    
-    c.execute(query, params)
-    
-    # 处理查询结果
-    results = []
-    for row in c.fetchall():
-        material_attachments = [os.path.basename(path) for path in _safe_load_json(row['material_attachments_json'], [])]
-        equipment_attachments = [os.path.basename(path) for path in _safe_load_json(row['equipment_attachments_json'], [])]
-        quality_attachments = [os.path.basename(path) for path in _safe_load_json(row['quality_attachments_json'], [])]
-
-        result = {
-            'batch_number': row['batch_number'],
-            'product_name': row['product_name'],
-            'process_segment': row['process_segment'],
-            'status': row['status'],
-            'start_time': row['start_time'],
-            'end_time': row['end_time'],
-            'material_code': row['material_code'],
-            'material_name': row['material_name'],
-            'weight': row['weight'],
-            'material_unit': row['material_unit'],
-            'supplier': row['supplier'],
-            'material_attachments': material_attachments,
-            'equipment_code': row['equipment_code'],
-            'equipment_name': row['equipment_name'],
-            'parameters_json': row['parameters_json'],
-            'equipment_start': row['equipment_start'],
-            'equipment_end': row['equipment_end'],
-            'equipment_status': row['equipment_status'],
-            'equipment_attachments': equipment_attachments,
-            'test_item': row['test_item'],
-            'test_value': row['test_value'],
-            'quality_unit': row['quality_unit'],
-            'result': row['result'],
-            'standard_min': row['standard_min'],
-            'standard_max': row['standard_max'],
-            'quality_attachments': quality_attachments
-        }
+    """Joined batch/material/equipment/quality rows matching the filters.
+
+    With ``page``/``page_size`` the response is one page
+    ``{rows, total, page, page_size}``; without them the full list is
+    returned as before.  ``sort``/``order`` and the in-result text filter
+    ``q`` are applied in SQL either way.
+    """
+    where, params, sort_columns, error = build_query_conditions(request.args)
+    if error:
+        return jsonify({'error': error}), 400
+    order_terms, error = query_order_terms(request.args, sort_columns)
+    if error:
+        return jsonify({'error': error}), 400
+    try:
+        paging = _parse_page_args(request.args)
+    except ValueError as exc:
+        return jsonify({'error': str(exc)}), 400
 
-        results.append(result)
+    with closing(_analytics_db().get_connection()) as conn:
+        try:
+            # 日期范围涉及归档时合并查询归档库
+            archives = archive.attach_for_query(conn, request.args)
+        except archive.ArchiveError as exc:
+            return jsonify({'error': str(exc)}), 400
+        c = conn.cursor()
+        sql, query_params = federated_query(QUERY_SELECT, where, params, order_terms, archives)
+        if paging is None:
+            c.execute(sql, query_params)
+            return jsonify([_serialize_query_row(row) for row in c.fetchall()])
+
+        page, page_size = paging
+        c.execute(*federated_count(where, params, archives))
+        total = c.fetchone()[0] or 0
+        c.execute(sql + ' LIMIT ? OFFSET ?', query_params + [page_size, (page - 1) * page_size])
+        rows = [_serialize_query_row(row) for row in c.fetchall()]
+
+    return jsonify({'rows': rows, 'total': total, 'page': page, 'page_size': page_size})
+
+# 图表可用列：key -> (SQL 表达式, 类型)；扩展字段按声明类型追加
+QUERY_CHART_COLUMNS = {
+    'batch_number': ('b.batch_number', 'text'),
+    'product_name': ('b.product_name', 'text'),
+    'process_segment': ('b.process_segment', 'text'),
+    'status': ('b.status', 'text'),
+    'start_time': ('b.start_time', 'datetime'),
+    'end_time': ('b.end_time', 'datetime'),
+    'material_code': ('m.material_code', 'text'),
+    'material_name': ('m.material_name', 'text'),
+    'weight': ('m.weight', 'number'),
+    'supplier': ('m.supplier', 'text'),
+    'equipment_code': ('e.equipment_code', 'text'),
+    'equipment_name': ('e.equipment_name', 'text'),
+    'equipment_start': ('e.start_time', 'datetime'),
+    'equipment_end': ('e.end_time', 'datetime'),
+    'equipment_status': ('e.status', 'text'),
+    'test_item': ('q.test_item', 'text'),
+    'test_value': ('q.test_value', 'number'),
+    'standard_min': ('q.standard_min', 'number'),
+    'standard_max': ('q.standard_max', 'number'),
+    'result': ('q.result', 'text')
+}
+
+
+def _query_chart_columns():
+    """Chartable columns ``{key: (expression, type, label)}`` including extras."""
+    columns = {key: (expression, column_type, None) for key, (expression, column_type) in QUERY_CHART_COLUMNS.items()}
+    for alias, prefix, table in EXTRA_QUERY_SOURCES:
+        for field in get_declared_extra_fields(table):
+            column_type = 'number' if field.get('type') in ('number', 'integer') else 'text'
+            columns[f"{prefix}_{field['key']}"] = (
+                json_extra_expression(field['key'], alias), column_type, field.get('label')
+            )
+    return columns
+
+
+def _chart_number(value):
+    if value is None or isinstance(value, bool):
+        return None
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return number if math.isfinite(number) else None
+
+
+@app.route('/api/query/chart', methods=['GET'])
+@login_required()
+@cached_query_result
+def query_chart():
+    """Downsampled chart series for the rows matched by the ``/api/query`` filters.
+
+    ``x`` names the X column and ``y`` (repeatable) the numeric Y columns;
+    every series is reduced with LTTB to at most ``points`` points.  Number
+    and datetime X values are sent as numbers (datetimes as epoch
+    milliseconds); text X values as the row position plus a ``labels`` map.
+    Without ``x`` only the column metadata is returned.
+    """
+    columns = _query_chart_columns()
+    column_meta = {
+        key: ({'type': column_type, 'label': label} if label else {'type': column_type})
+        for key, (expression, column_type, label) in columns.items()
+    }
+    x_key = request.args.get('x', '')
+    if not x_key:
+        return jsonify({'columns': column_meta})
+
+    y_keys = [key for key in request.args.getlist('y') if key]
+    if x_key not in columns:
+        return jsonify({'error': f'不支持的图表字段: {x_key}'}), 400
+    if not y_keys:
+        return jsonify({'error': '请至少选择一个Y轴字段'}), 400
+    for key in y_keys:
+        if key not in columns or columns[key][1] != 'number':
+            return jsonify({'error': f'Y轴字段必须为数值类型: {key}'}), 400
+    try:
+        points = int(request.args.get('points') or config.QUERY_CHART_POINTS_DEFAULT)
+    except ValueError:
+        return jsonify({'error': 'points 参数必须为整数'}), 400
+    points = max(3, min(points, config.QUERY_CHART_POINTS_MAX))
+
+    where, params, sort_columns, error = build_query_conditions(request.args)
+    if error:
+        return jsonify({'error': error}), 400
+
+    x_expression, x_type, _ = columns[x_key]
+    if x_type == 'datetime':
+        x_expression = f"(julianday({x_expression}) - 2440587.5) * 86400000.0"
+    if x_type == 'text':
+        # 文本 X 轴按表格的排序展示
+        order_terms, error = query_order_terms(request.args, sort_columns)
+        if error:
+            return jsonify({'error': error}), 400
+    else:
+        where += f' AND {x_expression} IS NOT NULL'
+        order_terms = [(x_expression, '')]
+
+    y_expressions = ', '.join(columns[key][0] for key in y_keys)
+    series = [[] for _ in y_keys]
+    total = 0
+    with closing(_analytics_db().get_connection()) as conn:
+        try:
+            archives = archive.attach_for_query(conn, request.args)
+        except archive.ArchiveError as exc:
+            return jsonify({'error': str(exc)}), 400
+        c = conn.cursor()
+        c.execute(*federated_query(f'SELECT {x_expression}, {y_expressions}', where, params, order_terms, archives))
+        # 分块读取，只在内存中保留 (x, y[, 标签]) 元组
+        for chunk in iter(lambda: c.fetchmany(2000), []):
+            for row in chunk:
+                if x_type == 'text':
+                    x_value = total
+                else:
+                    x_value = _chart_number(row[0])
+                    if x_value is None:
+                        continue
+                total += 1
+                for index, values in enumerate(series):
+                    y_value = _chart_number(row[index + 1])
+                    if y_value is not None:
+                        values.append((x_value, y_value, row[0]))
+
+    labels = {}
+    payload_series = []
+    for key, values in zip(y_keys, series):
+        sampled = downsample.lttb(values, points)
+        if x_type == 'text':
+            labels.update((str(point[0]), point[2]) for point in sampled)
+        payload_series.append({
+            'key': key,
+            'count': len(values),
+            'points': [[point[0], point[1]] for point in sampled]
+        })
+
+    payload = {
+        'x': {'key': x_key, 'type': x_type},
+        'series': payload_series,
+        'total': total,
+        'columns': column_meta
+    }
+    if x_type == 'text':
+        payload['labels'] = labels
+    return jsonify(payload)
+
+def _client_ip():
+    forwarded_for = request.headers.get('X-Forwarded-For', '')
+    return forwarded_for.split(',')[0].strip() if forwarded_for else request.remote_addr or ''
+
+
+def _record_export_log(file_size):
+    current_user = get_current_user() or {}
+
+    _execute_write(
+        '''INSERT INTO export_logs (user_id, username, ip_address, file_size_bytes)
+           VALUES (?, ?, ?, ?)''',
+        (current_user.get('id'), current_user.get('username') or '', _client_ip(), file_size)
+    )
 
-    conn.close()
-    return jsonify(results)
 
 @app.route('/api/export', methods=['GET'])
 @login_required()
 def export_data():
-    # 获取查询参数（与查询API相同）
-    batch_number = request.args.get('batch_number', '')
-    process_segment = request.args.get('process_segment', '')
-    test_item = request.args.get('test_item', '')
-    material_code = request.args.get('material_code', '')
-    equipment_code = request.args.get('equipment_code', '')
-    
-    # 获取数据（这里简化处理，实际应该复用查询逻辑）
-    # 这里为了简化，直接调用上面的查询函数
-    # 在实际应用中，应该重构代码以避免重复
-    
-    # 创建CSV输出
-    output = io.StringIO()
-    writer = csv.writer(output)
-    
-    # 写入标题行
-    writer.writerow([
-        '批号', '产品名称', '工艺段', '状态', '开始时间', '结束时间',
-        '物料编码', '物料名称', '重量', '单位',
-        '设备编码', '设备名称', '设备参数', '设备开始时间', '设备结束时间',
-        '检测项目', '检测值', '检测单位', '结果'
-    ])
-    
-    # 获取数据并写入CSV
-    # 这里简化处理，实际应该调用查询函数获取数据
-    # 为了演示，我们只写入一些示例数据
-    writer.writerow([
-        'BATCH001', '产品A', '混合搅拌', '已完成', '2024-01-01 08:00:00', '2024-01-01 10:00:00',
-        'MAT001', '原料A', 100.5, 'kg',
-        'EQ001', '混合机', '{"speed": 100, "temperature": 50}', '2024-01-01 08:30:00', '2024-01-01 09:30:00',
-        '尺寸', 25.5, 'mm', '合格'
-    ])
-    
-    # 准备响应
-    output.seek(0)
-    
-    # 创建响应
-    response = app.response_class(
-        response=output.getvalue(),
-        mimetype='text/csv',
-        headers={'Content-Disposition': 'attachment; filename=production_data.csv'}
-    )
-    
+    """Export the ``/api/query`` result as CSV, Parquet or Arrow IPC.
+
+    Accepts the query filters (including ``q``/``sort``/``order``) plus
+    ``format``, ``columns`` (comma separated export column names) and
+    ``filename``; ``page``/``page_size`` restrict the export to one page.
+    The file is written in chunks to a temporary file and the download is
+    recorded in ``export_logs``.
+    """
+    fmt = request.args.get('format', 'csv').lower()
+    if fmt not in exporter.EXPORT_FORMATS:
+        return jsonify({'error': f'不支持的导出格式: {fmt}'}), 400
+    selected = [name.strip() for name in request.args.get('columns', '').split(',') if name.strip()]
+    try:
+        paging = _parse_page_args(request.args)
+    except ValueError as exc:
+        return jsonify({'error': str(exc)}), 400
+    limit, offset = (paging[1], (paging[0] - 1) * paging[1]) if paging else (None, 0)
+
+    handle = tempfile.TemporaryFile()
+    try:
+        with closing(_analytics_db().get_connection()) as conn:
+            exporter.export_query(conn, request.args, fmt, handle, selected=selected, limit=limit, offset=offset)
+    except exporter.ExportError as exc:
+        handle.close()
+        return jsonify({'error': str(exc)}), 400
+    except Exception:
+        handle.close()
+        raise
+
+    file_size = handle.tell()
+    handle.seek(0)
+    _record_export_log(file_size)
+
+    mimetype, suffix = exporter.EXPORT_FORMATS[fmt]
+    base_name = os.path.basename((request.args.get('filename') or '').replace('\\', '/')).strip()
+    return send_file(handle, mimetype=mimetype, as_attachment=True,
+                     download_name=(base_name or 'production_data') + suffix)
+
+
+def _visible_export_job(job_id):
+    """Return the job when the current user may see it (own jobs, or admin)."""
+    job = export_jobs.get_job(db, job_id)
+    user = get_current_user() or {}
+    if job is None or (user.get('role') != 'admin' and job['user_id'] != user.get('id')):
+        return None
+    return job
+
+
+def _public_export_job(job):
+    public = {key: value for key, value in job.items() if key not in ('file_path', 'user_id')}
+    if job['status'] == export_jobs.STATUS_COMPLETED:
+        public['download_url'] = url_for('download_export_job', job_id=job['id'])
+    return public
+
+
+@app.route('/api/export/jobs', methods=['POST'])
+@login_required()
+def create_export_job():
+    """Queue a background export; body ``{params, format, columns, filename}``."""
+    data = request.get_json(silent=True) or {}
+    params = data.get('params') or {}
+    columns = data.get('columns') or []
+    if not isinstance(params, dict) or not isinstance(columns, list):
+        return jsonify({'error': '无效的导出参数'}), 400
+    try:
+        job_id = export_jobs.submit(
+            db, params, (data.get('format') or 'csv').lower(), selected=columns,
+            filename=os.path.basename(str(data.get('filename') or '').replace('\\', '/')).strip() or None,
+            user=get_current_user(), ip_address=_client_ip(), source=_analytics_db()
+        )
+    except exporter.ExportError as exc:
+        return jsonify({'error': str(exc)}), 400
+    return jsonify(_public_export_job(export_jobs.get_job(db, job_id))), 202
+
+
+@app.route('/api/export/jobs', methods=['GET'])
+@login_required()
+def list_export_jobs():
+    user = get_current_user() or {}
+    user_id = None if user.get('role') == 'admin' and request.args.get('all') else user.get('id')
+    return jsonify(export_jobs.list_jobs(db, user_id=user_id))
+
+
+@app.route('/api/export/jobs/<job_id>', methods=['GET'])
+@login_required()
+def get_export_job(job_id):
+    job = _visible_export_job(job_id)
+    if job is None:
+        return jsonify({'error': '导出任务不存在'}), 404
+    return jsonify(_public_export_job(job))
+
+
+@app.route('/api/export/jobs/<job_id>/download', methods=['GET'])
+@login_required()
+def download_export_job(job_id):
+    job = _visible_export_job(job_id)
+    if job is None:
+        return jsonify({'error': '导出任务不存在'}), 404
+    if job['status'] == export_jobs.STATUS_EXPIRED:
+        return jsonify({'error': '导出文件已过期，请重新导出'}), 410
+    if job['status'] != export_jobs.STATUS_COMPLETED or not os.path.exists(job['file_path'] or ''):
+        return jsonify({'error': '导出尚未完成'}), 409
+
+    mimetype, suffix = exporter.EXPORT_FORMATS[job['format']]
+    download_name = (job['filename'] or 'production_data') + suffix
+    if job['format'] != 'csv':
+        return send_file(job['file_path'], mimetype=mimetype, as_attachment=True, download_name=download_name)
+
+    # CSV 以 gzip 保存：客户端支持时原样发送，否则在服务端解压
+    if request.accept_encodings['gzip']:
+        response = send_file(job['file_path'], mimetype=mimetype, as_attachment=True,
+                             download_name=download_name, conditional=False)
+        response.headers['Content-Encoding'] = 'gzip'
+        response.vary.add('Accept-Encoding')
+        return response
+    response = send_file(gzip.open(job['file_path'], 'rb'), mimetype=mimetype, as_attachment=True,
+                         download_name=download_name)
+    response.vary.add('Accept-Encoding')
     return response
 
 
+@app.route('/api/export/columns', methods=['GET'])
+@login_required()
+def export_columns():
+    return jsonify({
+        'columns': [
+            {'name': column.name, 'label': column.label, 'type': column.type}
+            for column in exporter.export_columns()
+        ],
+        'formats': exporter.available_formats()
+    })
+
+
 @app.route('/api/export/log', methods=['POST'])
 @login_required()
 def log_export_event():
@@ -1784,23 +2220,118 @@ def log_export_event():
     except (TypeError, ValueError):
         return jsonify({'error': '无效的文件大小'}), 400
 
-    current_user = get_current_user() or {}
-    user_id = current_user.get('id')
-    username = current_user.get('username') or ''
+    _record_export_log(file_size)
+    return jsonify({'success': True})
+
+
+# 运行状态
+@app.route('/api/health', methods=['GET'])
+def health_check():
+    return jsonify({'status': 'ok', 'pid': os.getpid()})
+
+
+@app.route('/api/admin/workers', methods=['GET'])
+@login_required(role=['admin'])
+def worker_status():
+    import serve
+
+    workers = serve.read_worker_states()
+    return jsonify({
+        'workers': workers,
+        'healthy': sum(1 for worker in workers if worker.get('healthy')),
+        'configured': config.SERVER_WORKERS
+    })
+
+
+@app.route('/api/admin/metrics', methods=['GET'])
+@login_required(role=['admin'])
+def metrics_endpoint():
+    return app.response_class(metrics.render(), mimetype='text/plain; version=0.0.4')
 
-    forwarded_for = request.headers.get('X-Forwarded-For', '')
-    ip_address = forwarded_for.split(',')[0].strip() if forwarded_for else request.remote_addr or ''
 
+@app.route('/api/admin/slow_queries', methods=['GET'])
+@login_required(role=['admin'])
+def slow_query_log():
+    limit = request.args.get('limit', type=int)
+    return jsonify({
+        'threshold_ms': getattr(config, 'SLOW_QUERY_THRESHOLD_MS', None),
+        'pid': os.getpid(),
+        'entries': slow_queries.recent(limit)
+    })
+
+
+@app.route('/api/admin/snapshot', methods=['GET', 'POST'])
+@login_required(role=['admin'])
+def analytics_snapshot_status():
+    """Analytics snapshot state; POST refreshes it now (copies even when unchanged)."""
+    analytics_snapshot = snapshot.get_snapshot(db)
+    refreshed = None
+    if request.method == 'POST':
+        refreshed = analytics_snapshot.refresh(force=True)
+    meta = analytics_snapshot.metadata()
+    staleness = analytics_snapshot.staleness()
+    return jsonify({
+        'enabled': bool(getattr(config, 'ANALYTICS_SNAPSHOT_ENABLED', False)),
+        'path': analytics_snapshot.path,
+        'exists': meta is not None,
+        'taken_at': meta and _utc_timestamp(meta['taken_at']),
+        'change_seq': meta and meta['change_seq'],
+        'staleness_seconds': None if staleness is None else round(staleness, 1),
+        'refreshed': refreshed
+    })
+
+
+@app.route('/api/admin/archive', methods=['GET', 'POST'])
+@login_required(role=['admin'])
+def archive_status():
+    """Archive files and eligible groups; POST ``{months, dry_run}`` runs the archival."""
+    data = request.get_json(silent=True) or {}
+    months = data.get('months', request.args.get('months'))
+    try:
+        months = None if months in (None, '') else int(months)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'months 参数必须为整数'}), 400
+    dry_run = request.method == 'GET' or bool(data.get('dry_run'))
+    summary = archive.archive_batches(db, months=months, dry_run=dry_run)
     with closing(db.get_connection()) as conn:
-        cursor = conn.cursor()
-        cursor.execute(
-            '''INSERT INTO export_logs (user_id, username, ip_address, file_size_bytes)
-               VALUES (?, ?, ?, ?)''',
-            (user_id, username, ip_address, file_size)
-        )
-        conn.commit()
+        archives = archive.list_archives(conn)
+    return jsonify({'dry_run': dry_run, 'summary': summary, 'archives': archives})
 
-    return jsonify({'success': True})
+
+@app.route('/api/admin/maintenance', methods=['GET', 'POST'])
+@login_required(role=['admin'])
+def maintenance_status():
+    """Last run of every maintenance task; POST ``{tasks}`` runs them now (default: all)."""
+    results = None
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or {}
+        try:
+            results = maintenance.run_tasks(db, data.get('tasks') or None)
+        except maintenance.MaintenanceBusy as exc:
+            return jsonify({'error': str(exc)}), 409
+        except maintenance.MaintenanceError as exc:
+            return jsonify({'error': str(exc)}), 400
+    return jsonify({
+        'enabled': bool(getattr(config, 'MAINTENANCE_ENABLED', False)),
+        'window': getattr(config, 'MAINTENANCE_WINDOW', None),
+        'in_window': maintenance.in_window(),
+        'due': maintenance.due_tasks(db),
+        'last_runs': maintenance.last_runs(db),
+        'results': results
+    })
+
+
+@app.route('/api/admin/attachments/gc', methods=['GET', 'POST'])
+@login_required(role=['admin'])
+def attachment_gc_run():
+    """Orphaned attachment report; POST ``{dry_run}`` quarantines them and purges expired quarantine."""
+    data = request.get_json(silent=True) or {}
+    dry_run = request.method == 'GET' or bool(data.get('dry_run'))
+    try:
+        summary = attachment_gc.run(db, app.config['UPLOAD_FOLDER'], dry_run=dry_run)
+    except archive.ArchiveError as exc:
+        return jsonify({'error': str(exc)}), 400
+    return jsonify({'dry_run': dry_run, 'summary': summary})
 
 
 # 错误处理
@@ -1814,35 +2345,55 @@ def internal_error(error):
 
 @app.route('/api/batches/<int:batch_id>', methods=['GET'])
 @login_required()
+@etag_versioned(_journal_version())
 def get_batch(batch_id):
     with closing(db.get_connection()) as conn:
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT b.*, u.username as created_by_name 
-            FROM batches b 
-            JOIN users u ON b.created_by = u.id 
-            WHERE b.id = ?
-        ''', (batch_id,))
-        row = cursor.fetchone()
+        detail = _batch_detail(conn, batch_id)
+        period = archive.batch_period(conn, batch_id) if detail is None else None
 
-        if not row:
-            return jsonify({'error': '批号不存在'}), 404
+    if period is not None:
+        # 已归档的批号从对应的归档库读取
+        try:
+            with closing(archive.connect(db, period)) as conn:
+                detail = _batch_detail(conn, batch_id)
+        except archive.ArchiveError as exc:
+            return jsonify({'error': str(exc)}), 404
+        if detail is not None:
+            detail['batch']['archived'] = True
 
-        batch = _serialize_batch(row)
-        segments = _collect_batch_segments(conn, batch.get('batch_number'), batch.get('product_name'))
+    if detail is None:
+        return jsonify({'error': '批号不存在'}), 404
+    return jsonify(detail)
 
-        summary = {
-            'segment_count': len(segments),
-            'material_total': sum(len(seg.get('materials', [])) for seg in segments),
-            'equipment_total': sum(len(seg.get('equipment', [])) for seg in segments),
-            'quality_total': sum(len(seg.get('quality', [])) for seg in segments)
-        }
 
-    return jsonify({
+def _batch_detail(conn, batch_id):
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT b.*, u.username as created_by_name 
+        FROM batches b 
+        JOIN users u ON b.created_by = u.id 
+        WHERE b.id = ?
+    ''', (batch_id,))
+    row = cursor.fetchone()
+
+    if not row:
+        return None
+
+    batch = _serialize_batch(row)
+    segments = _collect_batch_segments(conn, batch.get('batch_number'), batch.get('product_name'))
+
+    summary = {
+        'segment_count': len(segments),
+        'material_total': sum(len(seg.get('materials', [])) for seg in segments),
+        'equipment_total': sum(len(seg.get('equipment', [])) for seg in segments),
+        'quality_total': sum(len(seg.get('quality', [])) for seg in segments)
+    }
+
+    return {
         'batch': batch,
         'segments': segments,
         'summary': summary
-    })
+    }
     
 # 删除物料记录
 @app.route('/api/batches/<int:batch_id>/materials/<int:material_id>', methods=['DELETE'])
@@ -1856,12 +2407,11 @@ def delete_material_record(batch_id, material_id):
     if not c.fetchone():
         conn.close()
         return jsonify({'error': '记录不存在'}), 404
-    
-    # 删除记录
-    c.execute("DELETE FROM material_records WHERE id = ?", (material_id,))
-    conn.commit()
     conn.close()
-    
+
+    # 删除记录
+    _execute_write("DELETE FROM material_records WHERE id = ?", (material_id,))
+
     return jsonify({'success': True})
 
 # 删除设备记录
@@ -1876,12 +2426,11 @@ def delete_equipment_record(batch_id, equipment_id):
     if not c.fetchone():
         conn.close()
         return jsonify({'error': '记录不存在'}), 404
-    
-    # 删除记录
-    c.execute("DELETE FROM equipment_records WHERE id = ?", (equipment_id,))
-    conn.commit()
     conn.close()
-    
+
+    # 删除记录
+    _execute_write("DELETE FROM equipment_records WHERE id = ?", (equipment_id,))
+
     return jsonify({'success': True})
 
 # 删除质量记录
@@ -1896,128 +2445,53 @@ def delete_quality_record(batch_id, quality_id):
     if not c.fetchone():
         conn.close()
         return jsonify({'error': '记录不存在'}), 404
-    
-    # 删除记录
-    c.execute("DELETE FROM quality_records WHERE id = ?", (quality_id,))
-    conn.commit()
     conn.close()
-    
+
+    # 删除记录
+    _execute_write("DELETE FROM quality_records WHERE id = ?", (quality_id,))
+
     return jsonify({'success': True})
 
-# API端点 - 制程能力看板数据
-@app.route('/api/dashboard/data', methods=['GET'])
-@login_required()
-def get_dashboard_data():
-    # 获取查询参数
-    days = request.args.get('days', '30')
+# API端点 - 制程能力看板数据（analytics.py）
+def _dashboard_range():
+    """``(start_date, end_date)`` of the dashboard request; the last ``days`` (UTC) by default."""
     start_date = request.args.get('start_date')
     end_date = request.args.get('end_date')
-    
-    conn = db.get_connection()
-    c = conn.cursor()
-    
-    # 构建时间条件
-    time_condition = ""
-    params = []
-    
     if start_date and end_date:
-        time_condition = " AND DATE(b.start_time) BETWEEN ? AND ?"
-        params.extend([start_date, end_date])
-    else:
-        # 默认最近N天
-        days = int(days)
-        time_condition = " AND DATE(b.start_time) >= DATE('now', ?)"
-        params.append(f'-{days} days')
-    
-    # 获取基本统计
-    c.execute(f"SELECT COUNT(*) FROM batches b WHERE 1=1 {time_condition}", params)
-    total_batches = c.fetchone()[0]
-    
-    c.execute(f"SELECT COUNT(*) FROM batches b WHERE b.status = '进行中' {time_condition}", params)
-    active_batches = c.fetchone()[0]
-    
-    c.execute(f"SELECT COUNT(*) FROM batches b WHERE b.status = '已完成' {time_condition}", params)
-    completed_batches = c.fetchone()[0]
-    
-    # 获取各工艺段的批号数量
-    c.execute(f'''
-        SELECT process_segment, COUNT(*) as count 
-        FROM batches b 
-        WHERE 1=1 {time_condition}
-        GROUP BY process_segment
-    ''', params)
-    segment_counts = {row[0]: row[1] for row in c.fetchall()}
-    
-    # 获取质量合格率
-    c.execute(f'''
-        SELECT 
-            q.test_item,
-            COUNT(*) as total,
-            SUM(CASE WHEN q.result = '合格' THEN 1 ELSE 0 END) as passed
-        FROM quality_records q
-        JOIN batches b ON q.batch_id = b.id
-        WHERE 1=1 {time_condition}
-        GROUP BY q.test_item
-    ''', params)
-    quality_rates = {}
-    for row in c.fetchall():
-        test_item, total, passed = row
-        quality_rates[test_item] = {
-            'total': total,
-            'passed': passed,
-            'rate': passed / total if total > 0 else 0
-        }
-    
-    # 获取最近完成的批号
-    c.execute(f'''
-        SELECT b.batch_number, b.product_name, b.process_segment, 
-               b.start_time, b.end_time, b.status
-        FROM batches b 
-        WHERE b.status = '已完成' {time_condition}
-        ORDER BY b.end_time DESC 
-        LIMIT 10
-    ''', params)
-    recent_batches = []
-    for row in c.fetchall():
-        recent_batches.append({
-            'batch_number': row[0],
-            'product_name': row[1],
-            'process_segment': row[2],
-            'start_time': row[3],
-            'end_time': row[4],
-            'status': row[5]
-        })
-    
-    # 获取设备运行数据（简化版）
-    c.execute(f'''
-        SELECT 
-            e.equipment_name,
-            COUNT(*) as total_runs,
-            AVG((julianday(e.end_time) - julianday(e.start_time)) * 24) as avg_hours
-        FROM equipment_records e
-        JOIN batches b ON e.batch_id = b.id
-        WHERE e.end_time IS NOT NULL {time_condition}
-        GROUP BY e.equipment_name
-    ''', params)
-    equipment_data = {}
-    for row in c.fetchall():
-        equipment_name, total_runs, avg_hours = row
-        equipment_data[equipment_name] = {
-            'total_runs': total_runs,
-            'avg_hours': avg_hours or 0
-        }
-    
-    conn.close()
-    
-    return jsonify({
-        'total_batches': total_batches,
-        'active_batches': active_batches,
-        'completed_batches': completed_batches,
-        'segment_counts': segment_counts,
-        'quality_rates': quality_rates,
-        'recent_batches': recent_batches,
-        'equipment_data': equipment_data
-    })
+        return start_date, end_date
+    days = int(request.args.get('days', '30'))
+    return (datetime.now(timezone.utc).date() - timedelta(days=days)).isoformat(), None
+
+
+def _analytics_response(engine, payload):
+    response = jsonify(payload)
+    response.headers['X-Analytics-Engine'] = engine
+    return response
+
+
+@app.route('/api/dashboard/data', methods=['GET'])
+@login_required()
+def get_dashboard_data():
+    start_date, end_date = _dashboard_range()
+    try:
+        engine, data = analytics.dashboard_data(_analytics_db(), start_date, end_date)
+    except archive.ArchiveError as exc:
+        return jsonify({'error': str(exc)}), 400
+    return _analytics_response(engine, data)
+
+
+@app.route('/api/dashboard/capability', methods=['GET'])
+@login_required()
+def get_capability_stats():
+    """Cp/Cpk of the numeric quality results in the dashboard date range (``?test_item=`` filters)."""
+    start_date, end_date = _dashboard_range()
+    try:
+        engine, rows = analytics.capability_stats(
+            _analytics_db(), start_date, end_date, test_item=request.args.get('test_item') or None
+        )
+    except archive.ArchiveError as exc:
+        return jsonify({'error': str(exc)}), 400
+    return _analytics_response(engine, {'items': rows})
 
 if __name__ == '__main__':
     app.run(debug=config.DEBUG, host=config.HOST, port=config.PORT)
@@ -0,0 +1,136 @@
+"""Slow-query log.
+
+Statements executed through ``metrics.InstrumentedCursor`` whose execute +
+fetch time reaches ``SLOW_QUERY_THRESHOLD_MS`` are recorded with their
+normalized SQL, bound parameters, elapsed time, the request endpoint and the
+``EXPLAIN QUERY PLAN`` output.  Entries are appended as JSON lines to a
+rotating log file and kept in a bounded in-memory buffer that
+``/api/admin/slow_queries`` serves.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+from logging.handlers import RotatingFileHandler
+
+import config
+
+_WHITESPACE = re.compile(r'\s+')
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r'(?<![\w.])-?\d+(?:\.\d+)?(?![\w.])')
+_PLACEHOLDER_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+# 只对数据语句做执行计划分析
+_EXPLAINABLE = ('select', 'with', 'insert', 'update', 'delete', 'replace')
+MAX_PARAM_LENGTH = 200
+
+_entries = deque(maxlen=getattr(config, 'SLOW_QUERY_BUFFER_SIZE', 200))
+_logger = None
+_logger_lock = threading.Lock()
+
+
+def threshold_seconds():
+    threshold = getattr(config, 'SLOW_QUERY_THRESHOLD_MS', None)
+    return threshold / 1000.0 if threshold else None
+
+
+def normalize_sql(sql):
+    """Collapse whitespace and literals so variants of one query group together."""
+    normalized = _STRING_LITERAL.sub('?', sql)
+    normalized = _NUMBER_LITERAL.sub('?', normalized)
+    normalized = _WHITESPACE.sub(' ', normalized).strip()
+    return _PLACEHOLDER_LIST.sub('(...)', normalized)
+
+
+def _format_params(params):
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        items = params.items()
+        return {key: _format_value(value) for key, value in items}
+    return [_format_value(value) for value in params]
+
+
+def _format_value(value):
+    if isinstance(value, (bytes, bytearray)):
+        return f'<{len(value)} bytes>'
+    if isinstance(value, str) and len(value) > MAX_PARAM_LENGTH:
+        return value[:MAX_PARAM_LENGTH] + '…'
+    return value
+
+
+def explain(connection, sql, params):
+    if not sql.lstrip().lower().startswith(_EXPLAINABLE):
+        return None
+    # 使用普通游标，避免执行计划查询本身再被计时/记录
+    cursor = sqlite3.Cursor(connection)
+    try:
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params if params is not None else ())
+        return [row[3] for row in cursor.fetchall()]
+    except sqlite3.Error as exc:
+        return [f'EXPLAIN failed: {exc}']
+    finally:
+        cursor.close()
+
+
+def _get_logger():
+    global _logger
+    if _logger is not None:
+        return _logger
+    with _logger_lock:
+        if _logger is None:
+            logger = logging.getLogger('minimes.slow_queries')
+            logger.propagate = False
+            path = getattr(config, 'SLOW_QUERY_LOG_PATH', None)
+            if path:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                handler = RotatingFileHandler(
+                    path,
+                    maxBytes=getattr(config, 'SLOW_QUERY_LOG_MAX_BYTES', 5 * 1024 * 1024),
+                    backupCount=getattr(config, 'SLOW_QUERY_LOG_BACKUP_COUNT', 5),
+                    encoding='utf-8'
+                )
+                handler.setFormatter(logging.Formatter('%(message)s'))
+                logger.addHandler(handler)
+                logger.setLevel(logging.INFO)
+            _logger = logger
+    return _logger
+
+
+def record(connection, sql, params, seconds, endpoint=None, many=False):
+    """Log one slow statement; returns the entry."""
+    sample_params = params
+    if many:
+        # executemany 只记录首组参数
+        sample_params = next(iter(params), None) if params is not None else None
+    plan = explain(connection, sql, sample_params) if getattr(config, 'SLOW_QUERY_EXPLAIN', True) else None
+    normalized = normalize_sql(sql)
+    entry = {
+        'ts': round(time.time(), 3),
+        'pid': os.getpid(),
+        'endpoint': endpoint,
+        'elapsed_ms': round(seconds * 1000, 3),
+        'fingerprint': hashlib.sha1(normalized.encode('utf-8')).hexdigest()[:12],
+        'sql': normalized,
+        'params': _format_params(sample_params),
+        'executemany': many,
+        'plan': plan
+    }
+    _entries.append(entry)
+    _get_logger().info(json.dumps(entry, ensure_ascii=False, default=str))
+    return entry
+
+
+def recent(limit=None):
+    entries = list(_entries)
+    entries.reverse()
+    return entries[:limit] if limit else entries
+
+
+def clear():
+    _entries.clear()
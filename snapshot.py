@@ -0,0 +1,173 @@
+"""Read-only analytics snapshot of the production database.
+
+With ``ANALYTICS_SNAPSHOT_ENABLED`` the analytical endpoints (``/api/query``,
+its chart series, ``/api/dashboard/data`` and exports) read from a copy of
+production.db instead of the live file.  Long month-end scans then never
+hold read transactions, page cache or CPU on the file the terminals write
+to.
+
+The copy is taken with the SQLite online backup API into a temporary file,
+switched to rollback-journal mode, stamped with the time and change-journal
+sequence it reflects and atomically renamed over the previous snapshot.
+Connections opened on the old file keep reading it until they close.  A
+background thread per process refreshes the snapshot every
+``ANALYTICS_SNAPSHOT_INTERVAL`` seconds, skipping the copy when the journal
+sequence has not moved; a lock file keeps worker processes from copying at
+the same time.  Snapshots are opened ``immutable`` so readers take no locks
+at all.
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from urllib.parse import quote
+
+import config
+import metrics
+from file_lock import FileLock
+
+logger = logging.getLogger('minimes.snapshot')
+
+
+class Snapshot:
+    def __init__(self, source, path):
+        self.source = source
+        self.path = os.path.abspath(path)
+        self._meta = (None, None)
+        self.verified_path = self.path + '.verified'
+        self._refresh_lock = threading.Lock()
+        self._thread_lock = threading.Lock()
+        self._thread = None
+        self._thread_pid = None
+
+    # 读取
+    def get_connection(self):
+        instrumented = getattr(config, 'METRICS_ENABLED', False) or getattr(config, 'SLOW_QUERY_THRESHOLD_MS', None)
+        conn = sqlite3.connect(
+            f'file:{quote(self.path)}?mode=ro&immutable=1', uri=True,
+            factory=metrics.InstrumentedConnection if instrumented else sqlite3.Connection
+        )
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def metadata(self):
+        """``{'taken_at', 'change_seq'}`` of the current snapshot, or None when missing."""
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        identity = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        cached_identity, meta = self._meta
+        if cached_identity != identity:
+            try:
+                with closing(self.get_connection()) as conn:
+                    rows = dict(conn.execute(
+                        "SELECT key, value FROM app_meta WHERE key IN ('snapshot_taken_at', 'snapshot_change_seq')"
+                    ).fetchall())
+                meta = {
+                    'taken_at': float(rows['snapshot_taken_at']),
+                    'change_seq': int(rows['snapshot_change_seq'])
+                }
+            except (sqlite3.Error, KeyError, ValueError):
+                meta = None
+            self._meta = (identity, meta)
+        return meta
+
+    def staleness(self):
+        """Seconds since the snapshot was last known to match the source (None when missing)."""
+        meta = self.metadata()
+        if meta is None:
+            return None
+        try:
+            verified_at = max(meta['taken_at'], os.path.getmtime(self.verified_path))
+        except OSError:
+            verified_at = meta['taken_at']
+        return max(0.0, time.time() - verified_at)
+
+    def get_change_seq(self, cursor):
+        return self.source.get_change_seq(cursor)
+
+    # 刷新
+    def refresh(self, force=False):
+        """Copy the source database when it changed; returns True when a new snapshot was written."""
+        with self._refresh_lock, self._process_lock() as acquired:
+            if not acquired:
+                return False
+            with closing(self.source.get_connection()) as source_conn:
+                seq = self.source.get_change_seq(source_conn.cursor())
+                meta = self.metadata()
+                if not force and meta is not None and meta['change_seq'] == seq:
+                    # 数据未变化：只记录核对时间，快照仍然是最新的
+                    with open(self.verified_path, 'a'):
+                        os.utime(self.verified_path)
+                    return False
+
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                partial_path = f'{self.path}.{os.getpid()}.part'
+                started = time.perf_counter()
+                try:
+                    with closing(sqlite3.connect(partial_path)) as target:
+                        # 在 WAL 模式下备份只持有读快照，不阻塞写入
+                        source_conn.backup(target, pages=getattr(config, 'ANALYTICS_SNAPSHOT_BACKUP_PAGES', -1))
+                        # 备份期间可能有新的写入，记录备份内容实际对应的序号
+                        seq = self.source.get_change_seq(target.cursor())
+                        target.execute('PRAGMA journal_mode = DELETE')
+                        target.executemany(
+                            'INSERT OR REPLACE INTO app_meta (key, value) VALUES (?, ?)',
+                            (('snapshot_taken_at', repr(time.time())), ('snapshot_change_seq', str(seq)))
+                        )
+                        target.commit()
+                    os.replace(partial_path, self.path)
+                except BaseException:
+                    if os.path.exists(partial_path):
+                        os.remove(partial_path)
+                    raise
+        logger.info('analytics snapshot refreshed at seq %s in %.2fs', seq, time.perf_counter() - started)
+        return True
+
+    def _process_lock(self):
+        return FileLock(self.path + '.lock')
+
+    def ensure_scheduler(self):
+        """Start the refresh thread of this process (once per pid)."""
+        pid = os.getpid()
+        if self._thread is not None and self._thread_pid == pid and self._thread.is_alive():
+            return
+        with self._thread_lock:
+            if self._thread is not None and self._thread_pid == pid and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run_scheduler, name='analytics-snapshot', daemon=True)
+            self._thread_pid = pid
+            self._thread.start()
+
+    def _run_scheduler(self):
+        interval = getattr(config, 'ANALYTICS_SNAPSHOT_INTERVAL', 300)
+        while True:
+            try:
+                # 其它进程刚刷新过时跳过
+                staleness = self.staleness()
+                if staleness is None or staleness >= interval:
+                    self.refresh()
+            except Exception:
+                logger.exception('analytics snapshot refresh failed')
+            time.sleep(interval)
+
+
+_SNAPSHOTS = {}
+_SNAPSHOTS_LOCK = threading.Lock()
+
+
+def get_snapshot(source, path=None):
+    """Shared ``Snapshot`` of ``source`` (defaults to ``ANALYTICS_SNAPSHOT_PATH``)."""
+    path = os.path.abspath(path or config.ANALYTICS_SNAPSHOT_PATH)
+    key = (os.path.abspath(source.db_path), path)
+    snapshot = _SNAPSHOTS.get(key)
+    if snapshot is None:
+        with _SNAPSHOTS_LOCK:
+            snapshot = _SNAPSHOTS.get(key)
+            if snapshot is None:
+                snapshot = _SNAPSHOTS[key] = Snapshot(source, path)
+    return snapshot
@@ -2,6 +2,7 @@ document.addEventListener('DOMContentLoaded', function() {
     // 全局变量
     let currentUser = {};
     let dashboardData = {};
+    let capabilityData = [];
     let charts = {};
     let currentTimeRange = '30';
     
@@ -74,6 +75,35 @@ document.addEventListener('DOMContentLoaded', function() {
         
         // 加载看板数据
         loadDashboardData();
+
+        // 订阅数据变更推送
+        subscribeToChanges();
+    }
+
+    // 数据变更后延迟刷新看板，避免连续录入时频繁重算
+    function subscribeToChanges() {
+        if (typeof EventSource === 'undefined') {
+            return;
+        }
+        let refreshTimer = null;
+        const scheduleRefresh = () => {
+            clearTimeout(refreshTimer);
+            refreshTimer = setTimeout(loadDashboardData, 5000);
+        };
+        let source = null;
+        const connect = () => {
+            source = new EventSource('/api/events');
+            ['batch.created', 'batch.updated', 'batch.deleted', 'batch.archived', 'record.added', 'record.updated', 'record.deleted', 'resync']
+                .forEach(type => source.addEventListener(type, scheduleRefresh));
+            // 连接被拒绝（如 503 连接数已满）时浏览器不会自动重连，稍后重新订阅
+            source.addEventListener('error', () => {
+                if (source.readyState === EventSource.CLOSED) {
+                    setTimeout(connect, 30000);
+                }
+            });
+        };
+        connect();
+        window.addEventListener('beforeunload', () => source.close());
     }
     
     // 获取角色显示名称
@@ -195,6 +225,21 @@ document.addEventListener('DOMContentLoaded', function() {
                 showNotification('加载看板数据失败', 'error');
                 showLoadingState(false);
             });
+        
+        loadCapabilityData(params);
+    }
+    
+    // 加载过程能力统计
+    function loadCapabilityData(params) {
+        fetch(`/api/dashboard/capability?${params.toString()}`)
+            .then(response => response.json())
+            .then(data => {
+                capabilityData = data.items || [];
+                updateCpkChart('all');
+            })
+            .catch(error => {
+                console.error('加载过程能力数据失败:', error);
+            });
     }
     
     // 显示/隐藏加载状态
@@ -311,9 +356,6 @@ document.addEventListener('DOMContentLoaded', function() {
         // 不良品分析图表
         updateDefectChart(data);
         
-        // 过程能力指数图表
-        updateCpkChart('all');
-        
         // 设备效率分析图表
         updateOeeChart('all');
     }
@@ -543,9 +585,14 @@ document.addEventListener('DOMContentLoaded', function() {
             charts.cpk.destroy();
         }
         
-        // 生成模拟数据（实际应该从API获取）
-        const metrics = ['尺寸', '重量', '硬度', '颜色', '纯度'];
-        const cpkValues = metrics.map(() => (Math.random() * 2).toFixed(2));
+        // 同一检测项存在多组规格时在名称后标注规格范围
+        const itemCounts = {};
+        capabilityData.forEach(item => {
+            itemCounts[item.test_item] = (itemCounts[item.test_item] || 0) + 1;
+        });
+        const metrics = capabilityData.map(item => itemCounts[item.test_item] > 1 ?
+            `${item.test_item} (${item.standard_min ?? '-'}~${item.standard_max ?? '-'})` : item.test_item);
+        const cpkValues = capabilityData.map(item => item.cpk === null ? null : item.cpk.toFixed(2));
         
         // 过滤数据（如果选择了特定指标）
         let displayMetrics = metrics;
@@ -561,6 +608,7 @@ document.addEventListener('DOMContentLoaded', function() {
         
         // 设置颜色基于CPK值
         const backgroundColors = displayCpkValues.map(value => {
+            if (value === null) return '#bdc3c7';
             const num = parseFloat(value);
             if (num >= 1.67) return '#27ae60'; // 优秀
             if (num >= 1.33) return '#3498db'; // 良好
@@ -4,6 +4,7 @@ document.addEventListener('DOMContentLoaded', () => {
         processSegments: [],
         currentUser: {},
         activeBatchId: null,
+        changeSeq: null,
         permissions: {
             createBatch: false,
             gotoRecord: false,
@@ -168,6 +169,22 @@ document.addEventListener('DOMContentLoaded', () => {
         return payload;
     };
 
+    // 完整加载批号列表，同时记录变更日志序号供后续增量同步
+    const fetchBatchList = async () => {
+        const response = await fetch('/api/batches');
+        const payload = await response.json().catch(() => null);
+        if (!response.ok) {
+            const err = new Error(payload?.error || `请求失败(${response.status})`);
+            err.status = response.status;
+            throw err;
+        }
+        const seq = Number(response.headers.get('X-Change-Seq'));
+        state.changeSeq = Number.isFinite(seq) ? seq : null;
+        return Array.isArray(payload) ? payload : [];
+    };
+
+    const batchGroupKey = batch => `${batch.batch_number}\u0000${batch.product_name}`;
+
     const findBatchById = batchId => state.batches.find(batch => batch.id === batchId);
 
     // 初始化应用
@@ -225,6 +242,61 @@ document.addEventListener('DOMContentLoaded', () => {
         loadProcessSegments();
         loadBatches();
         setupEventListeners();
+        subscribeToChanges();
+    }
+
+    // 订阅服务端变更推送，批号或记录变化时静默刷新列表
+    function subscribeToChanges() {
+        if (typeof EventSource === 'undefined') {
+            return;
+        }
+        const refresh = debounce(refreshBatchesQuietly, 500);
+        let source = null;
+        const connect = () => {
+            source = new EventSource('/api/events');
+            ['batch.created', 'batch.updated', 'batch.deleted', 'batch.archived', 'record.added', 'record.updated', 'record.deleted', 'resync']
+                .forEach(type => source.addEventListener(type, refresh));
+            // 连接被拒绝（如 503 连接数已满）时浏览器不会自动重连，稍后重新订阅
+            source.addEventListener('error', () => {
+                if (source.readyState === EventSource.CLOSED) {
+                    setTimeout(connect, 30000);
+                }
+            });
+        };
+        connect();
+        window.addEventListener('beforeunload', () => source.close());
+    }
+
+    async function refreshBatchesQuietly() {
+        try {
+            if (state.changeSeq === null) {
+                state.batches = await fetchBatchList();
+            } else {
+                // 仅拉取自上次同步以来变更的批号分组
+                const delta = await fetchJSON(`/api/batches?since=${state.changeSeq}`);
+                if (delta.full) {
+                    state.batches = delta.changed || [];
+                } else {
+                    // 已归档的分组同样移出热库列表
+                    const removed = new Set([...(delta.deleted || []), ...(delta.archived || [])].map(batchGroupKey));
+                    const merged = new Map();
+                    state.batches.forEach(batch => {
+                        const key = batchGroupKey(batch);
+                        if (!removed.has(key)) {
+                            merged.set(key, batch);
+                        }
+                    });
+                    (delta.changed || []).forEach(batch => merged.set(batchGroupKey(batch), batch));
+                    state.batches = Array.from(merged.values())
+                        .sort((a, b) => (b.start_time || '').localeCompare(a.start_time || ''));
+                }
+                state.changeSeq = delta.seq;
+            }
+            filterBatches();
+            updateStats(state.batches);
+        } catch (error) {
+            console.error('刷新批号数据失败:', error);
+        }
     }
     
     // 获取角色显示名称
@@ -343,8 +415,7 @@ document.addEventListener('DOMContentLoaded', () => {
         `;
 
         try {
-            const data = await fetchJSON('/api/batches');
-            state.batches = Array.isArray(data) ? data : [];
+            state.batches = await fetchBatchList();
             renderBatches(state.batches);
             updateStats(state.batches);
         } catch (error) {
@@ -2,15 +2,22 @@ document.addEventListener('DOMContentLoaded', function() {
     // 全局变量
     let currentUser = {};
     let processSegments = [];
-    let queryResults = [];
-    let filteredResults = [];
+    // 浏览器只保留当前页的数据，排序/搜索/分页均由 /api/query 在 SQL 中完成
+    let queryParams = new URLSearchParams();
+    let pageResults = [];
+    let totalResults = 0;
     let currentPage = 1;
     let pageSize = 25;
+    let searchTerm = '';
+    let searchTimer = null;
+    let pageRequestId = 0;
     let sortColumn = '';
     let sortDirection = 'asc';
     let chartInstance = null;
     let chartHasRendered = false;
     let chartColumnMeta = {};
+    let chartRequestId = 0;
+    let chartStale = false;
     
     // DOM元素
     const batchNumberInput = document.getElementById('batchNumber');
@@ -193,11 +200,14 @@ document.addEventListener('DOMContentLoaded', function() {
         pageSizeSelect.addEventListener('change', function() {
             pageSize = parseInt(this.value);
             currentPage = 1;
-            renderTable();
+            loadPage();
         });
         
         prevPageBtn.addEventListener('click', goToPrevPage);
         nextPageBtn.addEventListener('click', goToNextPage);
+
+        // 表头排序
+        addTableSorting();
         
         // 模态框关闭
         document.querySelectorAll('.modal-close, .modal-cancel').forEach(btn => {
@@ -283,41 +293,81 @@ document.addEventListener('DOMContentLoaded', function() {
         if (minValueInput.value) params.append('min_value', minValueInput.value);
         if (maxValueInput.value) params.append('max_value', maxValueInput.value);
         
-        // 发送查询请求
+        queryParams = params;
+        currentPage = 1;
+        destroyChart();
+        chartHasRendered = false;
+        chartStale = true;
+        loadPage();
+    }
+
+    // 请求当前页（筛选条件 + 结果内搜索 + 排序 + 分页）
+    function loadPage() {
+        const params = new URLSearchParams(queryParams);
+        if (searchTerm) params.append('q', searchTerm);
+        if (sortColumn) {
+            params.append('sort', sortColumn);
+            params.append('order', sortDirection);
+        }
+        params.append('page', currentPage);
+        params.append('page_size', pageSize);
+
+        // 快速翻页/输入时只采用最后一次请求的结果
+        const requestId = ++pageRequestId;
         fetch(`/api/query?${params.toString()}`)
-            .then(response => response.json())
+            .then(response => response.json().then(data => {
+                if (!response.ok) {
+                    throw new Error(data.error || '查询失败');
+                }
+                return data;
+            }))
             .then(data => {
-                queryResults = data;
-                filteredResults = [...data];
+                if (requestId !== pageRequestId) {
+                    return;
+                }
+                const totalPages = Math.max(1, Math.ceil(data.total / data.page_size));
+                if (data.page > totalPages) {
+                    // 数据减少后当前页已越界，回到最后一页
+                    currentPage = totalPages;
+                    loadPage();
+                    return;
+                }
+
+                pageResults = data.rows;
+                totalResults = data.total;
 
-                destroyChart();
-                chartHasRendered = false;
-                updateChartControls();
-                
                 // 更新结果计数
-                resultsCount.textContent = data.length;
-                
-                // 重置分页
-                currentPage = 1;
-                
+                resultsCount.textContent = totalResults;
+
                 // 渲染表格
                 renderTable();
-                
+                // 翻页不影响图表，只有筛选/搜索/排序变化时才重新请求
+                if (chartStale) {
+                    chartStale = false;
+                    updateChartControls();
+                }
+
                 // 显示结果区域
                 resultsLoading.style.display = 'none';
-                
-                if (data.length > 0) {
+
+                if (totalResults > 0 || searchTerm) {
                     resultsTableContainer.style.display = 'block';
-                    exportBtn.disabled = false;
+                    resultsEmpty.style.display = 'none';
+                    exportBtn.disabled = totalResults === 0;
                 } else {
+                    resultsTableContainer.style.display = 'none';
                     resultsEmpty.style.display = 'block';
+                    exportBtn.disabled = true;
                 }
             })
             .catch(error => {
+                if (requestId !== pageRequestId) {
+                    return;
+                }
                 console.error('查询失败:', error);
                 resultsLoading.style.display = 'none';
                 resultsEmpty.style.display = 'block';
-                showNotification('查询失败，请检查网络连接', 'error');
+                showNotification(error.message || '查询失败，请检查网络连接', 'error');
             });
     }
     
@@ -342,8 +392,13 @@ document.addEventListener('DOMContentLoaded', function() {
         exportBtn.disabled = true;
 
         // 清空结果数据
-        queryResults = [];
-        filteredResults = [];
+        pageRequestId++;
+        chartRequestId++;
+        queryParams = new URLSearchParams();
+        pageResults = [];
+        totalResults = 0;
+        searchTerm = '';
+        tableSearch.value = '';
 
         destroyChart();
         chartHasRendered = false;
@@ -358,36 +413,20 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     }
     
-    // 过滤表格结果（客户端搜索）
+    // 结果内搜索（由服务端在 SQL 中过滤）
     function filterTableResults() {
-        const searchTerm = tableSearch.value.toLowerCase();
-        
-        if (!searchTerm) {
-            filteredResults = [...queryResults];
-        } else {
-            filteredResults = queryResults.filter(result => {
-                // 搜索所有文本字段
-                return Object.values(result).some(value => 
-                    value && value.toString().toLowerCase().includes(searchTerm)
-                );
-            });
-        }
-        
-        currentPage = 1;
-        resultsCount.textContent = filteredResults.length;
-        updateChartControls();
-        renderTable();
-        renderResultsChart(false);
+        clearTimeout(searchTimer);
+        searchTimer = setTimeout(() => {
+            searchTerm = tableSearch.value.trim();
+            currentPage = 1;
+            chartStale = true;
+            loadPage();
+        }, 300);
     }
     
     // 渲染表格
     function renderTable() {
-        // 计算分页数据
-        const totalResults = filteredResults.length;
-        const totalPages = Math.ceil(totalResults / pageSize);
-        const startIndex = (currentPage - 1) * pageSize;
-        const endIndex = Math.min(startIndex + pageSize, totalResults);
-        const pageResults = filteredResults.slice(startIndex, endIndex);
+        const totalPages = Math.max(1, Math.ceil(totalResults / pageSize));
         
         // 更新分页信息
         paginationInfo.textContent = `第 ${currentPage} 页，共 ${totalPages} 页`;
@@ -434,12 +473,6 @@ document.addEventListener('DOMContentLoaded', function() {
             });
         });
         
-        // 添加表头排序事件
-        addTableSorting();
-
-        if (chartHasRendered) {
-            renderResultsChart(false);
-        }
     }
     
     // 创建普通表格单元格
@@ -512,89 +545,65 @@ document.addEventListener('DOMContentLoaded', function() {
     function goToPrevPage() {
         if (currentPage > 1) {
             currentPage--;
-            renderTable();
+            loadPage();
         }
     }
     
     // 添加下一页
     function goToNextPage() {
-        const totalPages = Math.ceil(filteredResults.length / pageSize);
+        const totalPages = Math.ceil(totalResults / pageSize);
         if (currentPage < totalPages) {
             currentPage++;
-            renderTable();
+            loadPage();
         }
     }
     
-    // 添加表格排序功能
+    // 表头对应的排序字段（附件列不可排序）
+    const HEADER_SORT_KEYS = [
+        'batch_number', 'product_name', 'process_segment', 'status',
+        'start_time', 'end_time', 'material_code', 'material_name',
+        'weight', null, 'equipment_code', 'equipment_name', null,
+        'test_item', 'test_value', null, 'result'
+    ];
+
+    // 添加表格排序功能（排序在服务端执行）
     function addTableSorting() {
         const headers = resultsTable.querySelectorAll('th');
         
         headers.forEach((header, index) => {
+            const key = HEADER_SORT_KEYS[index];
+            if (!key) {
+                return;
+            }
             header.style.cursor = 'pointer';
             header.addEventListener('click', function() {
                 // 更新排序状态
-                if (sortColumn === index) {
+                if (sortColumn === key) {
                     sortDirection = sortDirection === 'asc' ? 'desc' : 'asc';
                 } else {
-                    sortColumn = index;
+                    sortColumn = key;
                     sortDirection = 'asc';
                 }
                 
                 // 添加排序指示器
                 headers.forEach(h => {
-                    h.innerHTML = h.innerHTML.replace(/ ?[↑↓]/, '');
+                    h.textContent = h.textContent.replace(/ ?[↑↓]/, '');
                 });
                 
                 const indicator = sortDirection === 'asc' ? ' ↑' : ' ↓';
-                header.innerHTML += indicator;
+                header.textContent += indicator;
                 
-                // 执行排序
-                sortResults(index);
-                renderTable();
+                currentPage = 1;
+                chartStale = true;
+                loadPage();
             });
         });
     }
     
-    // 排序结果
-    function sortResults(columnIndex) {
-        const columnKeys = [
-            'batch_number', 'product_name', 'process_segment', 'status', 
-            'start_time', 'end_time', 'material_code', 'material_name', 
-            'weight', 'equipment_code', 'equipment_name', 'test_item', 
-            'test_value', 'result'
-        ];
-        
-        const key = columnKeys[columnIndex];
-        
-        filteredResults.sort((a, b) => {
-            let aValue = a[key] || '';
-            let bValue = b[key] || '';
-            
-            // 处理空值
-            if (aValue === '' && bValue !== '') return 1;
-            if (aValue !== '' && bValue === '') return -1;
-            if (aValue === '' && bValue === '') return 0;
-            
-            // 特殊处理数字和日期
-            if (key === 'weight' || key === 'test_value') {
-                aValue = parseFloat(aValue) || 0;
-                bValue = parseFloat(bValue) || 0;
-            } else if (key === 'start_time' || key === 'end_time') {
-                aValue = new Date(aValue).getTime();
-                bValue = new Date(bValue).getTime();
-            }
-            
-            // 比较值
-            if (aValue < bValue) return sortDirection === 'asc' ? -1 : 1;
-            if (aValue > bValue) return sortDirection === 'asc' ? 1 : -1;
-            return 0;
-        });
-    }
-    
     // 查看批号详情
     function viewBatchDetail(batchNumber) {
         // 查找批号详情
-        const batch = queryResults.find(r => r.batch_number === batchNumber);
+        const batch = pageResults.find(r => r.batch_number === batchNumber);
         
         if (batch) {
             const content = `
@@ -709,38 +718,40 @@ document.addEventListener('DOMContentLoaded', function() {
     }
     
     // 显示导出模态框
+    // 默认勾选的导出列，其余列（扩展字段、设备参数等）按需勾选
+    const DEFAULT_EXPORT_COLUMNS = [
+        'batch_number', 'product_name', 'process_segment', 'status', 'start_time', 'end_time',
+        'material_code', 'material_name', 'weight', 'equipment_code', 'equipment_name',
+        'test_item', 'test_value', 'result'
+    ];
+
     function showExportModal() {
-        // 填充列选项
-        columnsList.innerHTML = '';
-        
-        const columns = [
-            { id: 'batch_number', name: '批号', checked: true },
-            { id: 'product_name', name: '产品名称', checked: true },
-            { id: 'process_segment', name: '工艺段', checked: true },
-            { id: 'status', name: '状态', checked: true },
-            { id: 'start_time', name: '开始时间', checked: true },
-            { id: 'end_time', name: '结束时间', checked: true },
-            { id: 'material_code', name: '物料编码', checked: true },
-            { id: 'material_name', name: '物料名称', checked: true },
-            { id: 'weight', name: '重量', checked: true },
-            { id: 'equipment_code', name: '设备编码', checked: true },
-            { id: 'equipment_name', name: '设备名称', checked: true },
-            { id: 'test_item', name: '检测项目', checked: true },
-            { id: 'test_value', name: '检测值', checked: true },
-            { id: 'result', name: '结果', checked: true }
-        ];
-        
-        columns.forEach(column => {
-            const item = document.createElement('div');
-            item.className = 'column-item';
-            item.innerHTML = `
-                <input type="checkbox" id="col_${column.id}" name="columns" value="${column.id}" ${column.checked ? 'checked' : ''}>
-                <label for="col_${column.id}">${column.name}</label>
-            `;
-            columnsList.appendChild(item);
-        });
-        
-        exportModal.style.display = 'flex';
+        // 填充列选项（列清单与可用格式来自服务端）
+        fetch('/api/export/columns')
+            .then(response => response.json())
+            .then(data => {
+                columnsList.innerHTML = '';
+                data.columns.forEach(column => {
+                    const item = document.createElement('div');
+                    item.className = 'column-item';
+                    const checked = DEFAULT_EXPORT_COLUMNS.includes(column.name) ? 'checked' : '';
+                    item.innerHTML = `
+                        <input type="checkbox" id="col_${column.name}" name="columns" value="${column.name}" ${checked}>
+                        <label for="col_${column.name}">${column.label}</label>
+                    `;
+                    columnsList.appendChild(item);
+                });
+
+                document.querySelectorAll('#exportFormat option').forEach(option => {
+                    option.disabled = !data.formats.includes(option.value);
+                });
+
+                exportModal.style.display = 'flex';
+            })
+            .catch(error => {
+                console.error('加载导出列失败:', error);
+                showNotification('加载导出选项失败', 'error');
+            });
     }
     
     // 处理导出
@@ -749,6 +760,7 @@ document.addEventListener('DOMContentLoaded', function() {
         
         const fileName = document.getElementById('exportFileName').value;
         const exportScope = document.getElementById('exportScope').value;
+        const exportFormat = document.getElementById('exportFormat').value;
         
         // 获取选中的列
         const selectedColumns = [];
@@ -761,91 +773,100 @@ document.addEventListener('DOMContentLoaded', function() {
             return;
         }
         
-        // 确定要导出的数据
-        let dataToExport = [];
-        if (exportScope === 'current') {
-            const startIndex = (currentPage - 1) * pageSize;
-            const endIndex = Math.min(startIndex + pageSize, filteredResults.length);
-            dataToExport = filteredResults.slice(startIndex, endIndex);
-        } else {
-            dataToExport = filteredResults;
+        // 导出由服务端按当前筛选/搜索/排序分块生成文件，浏览器只负责下载
+        const params = new URLSearchParams(queryParams);
+        if (searchTerm) params.append('q', searchTerm);
+        if (sortColumn) {
+            params.append('sort', sortColumn);
+            params.append('order', sortDirection);
         }
-        
-        // 生成CSV内容
-        const csvContent = generateCSV(dataToExport, selectedColumns);
-        
-        // 创建下载链接
-        const blob = new Blob([csvContent], { type: 'text/csv;charset=utf-8;' });
-        logExportEvent(blob.size);
+
+        closeModals();
+
+        // 全部结果交给后台导出任务，避免长时间占用请求
+        if (exportScope !== 'current') {
+            startExportJob(Object.fromEntries(params), exportFormat, selectedColumns, fileName);
+            return;
+        }
+
+        params.append('page', currentPage);
+        params.append('page_size', pageSize);
+        params.append('format', exportFormat);
+        params.append('columns', selectedColumns.join(','));
+        params.append('filename', fileName);
+        triggerDownload(`/api/export?${params.toString()}`);
+        showNotification('导出已开始，文件生成后将自动下载', 'success');
+    }
+
+    function triggerDownload(url) {
         const link = document.createElement('a');
-        const url = URL.createObjectURL(blob);
-        
         link.setAttribute('href', url);
-        link.setAttribute('download', `${fileName}.csv`);
         link.style.visibility = 'hidden';
         
         document.body.appendChild(link);
         link.click();
         document.body.removeChild(link);
-        
-        // 关闭模态框
-        closeModals();
-        showNotification('CSV文件导出成功', 'success');
     }
-    
-    // 生成CSV内容
-    function generateCSV(data, columns) {
-        // CSV标题行
-        const headers = columns.map(col => {
-            const columnNames = {
-                'batch_number': '批号',
-                'product_name': '产品名称',
-                'process_segment': '工艺段',
-                'status': '状态',
-                'start_time': '开始时间',
-                'end_time': '结束时间',
-                'material_code': '物料编码',
-                'material_name': '物料名称',
-                'weight': '重量',
-                'equipment_code': '设备编码',
-                'equipment_name': '设备名称',
-                'test_item': '检测项目',
-                'test_value': '检测值',
-                'result': '结果'
-            };
-            return columnNames[col] || col;
-        });
-        
-        let csvContent = headers.join(',') + '\n';
-        
-        // 数据行
-        data.forEach(row => {
-            const values = columns.map(col => {
-                let value = row[col] || '';
-                
-                // 处理包含逗号的值
-                if (value.toString().includes(',')) {
-                    value = `"${value}"`;
+
+    function startExportJob(filters, format, columns, fileName) {
+        fetch('/api/export/jobs', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ params: filters, format, columns, filename: fileName })
+        })
+            .then(response => response.json().then(data => {
+                if (!response.ok) {
+                    throw new Error(data.error || '提交导出任务失败');
                 }
-                
-                return value;
+                return data;
+            }))
+            .then(job => {
+                showNotification('导出任务已提交，完成后将自动下载', 'info');
+                exportBtn.disabled = true;
+                pollExportJob(job.id);
+            })
+            .catch(error => showNotification(error.message, 'error'));
+    }
+
+    function pollExportJob(jobId) {
+        fetch(`/api/export/jobs/${jobId}`)
+            .then(response => response.json())
+            .then(job => {
+                if (job.status === 'completed') {
+                    resetExportButton();
+                    triggerDownload(job.download_url);
+                    showNotification(`导出完成，共 ${job.rows_written} 行`, 'success');
+                } else if (job.status === 'queued' || job.status === 'running') {
+                    exportBtn.innerHTML = `<i class="fas fa-spinner fa-spin"></i> 导出中 ${Math.floor(job.progress * 100)}%`;
+                    setTimeout(() => pollExportJob(jobId), 1000);
+                } else {
+                    resetExportButton();
+                    showNotification(job.error || '导出失败', 'error');
+                }
+            })
+            .catch(error => {
+                resetExportButton();
+                console.error('查询导出进度失败:', error);
+                showNotification('查询导出进度失败', 'error');
             });
-            
-            csvContent += values.join(',') + '\n';
-        });
-        
-        return csvContent;
     }
 
-    function logExportEvent(fileSizeBytes) {
-        if (!Number.isFinite(fileSizeBytes)) {
-            return;
+    function resetExportButton() {
+        exportBtn.innerHTML = '<i class="fas fa-download"></i> 导出';
+        exportBtn.disabled = totalResults === 0;
+    }
+
+    // 图表字段元数据来自服务端（列类型按表结构与字段配置声明，无需扫描结果行）
+    function loadChartColumnMeta() {
+        if (Object.keys(chartColumnMeta).length) {
+            return Promise.resolve(chartColumnMeta);
         }
-        fetch('/api/export/log', {
-            method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ file_size: fileSizeBytes })
-        }).catch(error => console.warn('记录导出日志失败:', error));
+        return fetch('/api/query/chart')
+            .then(response => response.json())
+            .then(data => {
+                chartColumnMeta = data.columns || {};
+                return chartColumnMeta;
+            });
     }
 
     function updateChartControls() {
@@ -853,94 +874,43 @@ document.addEventListener('DOMContentLoaded', function() {
             return;
         }
 
-        if (!filteredResults.length) {
+        if (!totalResults) {
             chartSection.style.display = 'none';
-            chartColumnMeta = {};
-            chartXAxisSelect.innerHTML = '';
-            chartYAxisSelect.innerHTML = '';
             destroyChart();
             chartHasRendered = false;
             return;
         }
 
-        chartColumnMeta = buildChartColumnMeta(filteredResults);
-        const availableKeys = Object.keys(chartColumnMeta);
-        if (!availableKeys.length) {
-            chartSection.style.display = 'none';
-            chartColumnMeta = {};
-            chartXAxisSelect.innerHTML = '';
-            chartYAxisSelect.innerHTML = '';
-            return;
-        }
-
-        chartSection.style.display = 'flex';
-
-        const previousX = chartXAxisSelect.value;
-        const previousY = Array.from(chartYAxisSelect.selectedOptions || []).map(option => option.value);
-
-        populateChartSelect(chartXAxisSelect, availableKeys, previousX, false);
-
-        const numericKeys = availableKeys.filter(isNumericColumn);
-        if (!numericKeys.length) {
-            chartSection.style.display = 'none';
-            chartYAxisSelect.innerHTML = '';
-            if (chartHasRendered) {
-                destroyChart();
-                chartHasRendered = false;
-            }
-            return;
-        }
+        loadChartColumnMeta()
+            .then(meta => {
+                const availableKeys = Object.keys(meta);
+                const numericKeys = availableKeys.filter(isNumericColumn);
+                if (!availableKeys.length || !numericKeys.length) {
+                    chartSection.style.display = 'none';
+                    return;
+                }
 
-        populateChartSelect(chartYAxisSelect, numericKeys, previousY, true);
+                chartSection.style.display = 'flex';
 
-        if (!chartXAxisSelect.value && availableKeys.length) {
-            chartXAxisSelect.value = availableKeys[0];
-        }
+                const previousX = chartXAxisSelect.value;
+                const previousY = Array.from(chartYAxisSelect.selectedOptions || []).map(option => option.value);
 
-        if (!Array.from(chartYAxisSelect.selectedOptions || []).length && numericKeys.length) {
-            chartYAxisSelect.value = numericKeys[0];
-        }
+                populateChartSelect(chartXAxisSelect, availableKeys, previousX, false);
+                populateChartSelect(chartYAxisSelect, numericKeys, previousY, true);
 
-        if (chartHasRendered) {
-            renderResultsChart(false);
-        }
-    }
-
-    function buildChartColumnMeta(results) {
-        const meta = {};
-        results.forEach(row => {
-            Object.entries(row).forEach(([key, value]) => {
-                if (key.endsWith('_attachments') || key === 'parameters_json') {
-                    return;
+                if (!chartXAxisSelect.value && availableKeys.length) {
+                    chartXAxisSelect.value = availableKeys[0];
                 }
 
-                if (value === null || value === undefined || value === '') {
-                    if (!meta[key]) {
-                        meta[key] = { numeric: true, hasValue: false };
-                    }
-                    return;
+                if (!Array.from(chartYAxisSelect.selectedOptions || []).length && numericKeys.length) {
+                    chartYAxisSelect.value = numericKeys[0];
                 }
 
-                if (Array.isArray(value) || typeof value === 'object') {
-                    return;
+                if (chartHasRendered) {
+                    renderResultsChart(false);
                 }
-
-                const entry = meta[key] || { numeric: true, hasValue: false };
-                entry.hasValue = true;
-                if (typeof value !== 'number') {
-                    entry.numeric = false;
-                }
-                meta[key] = entry;
-            });
-        });
-
-        Object.keys(meta).forEach(key => {
-            if (!meta[key].hasValue) {
-                delete meta[key];
-            }
-        });
-
-        return meta;
+            })
+            .catch(error => console.warn('加载图表字段失败:', error));
     }
 
     function populateChartSelect(selectEl, keys, previous, isMultiple) {
@@ -967,7 +937,7 @@ document.addEventListener('DOMContentLoaded', function() {
     }
 
     function columnDisplayName(key) {
-        return COLUMN_LABELS[key] || key;
+        return COLUMN_LABELS[key] || chartColumnMeta[key]?.label || key;
     }
 
     function destroyChart() {
@@ -977,12 +947,13 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     }
 
+    // 图表数据由 /api/query/chart 按当前筛选条件在服务端降采样（LTTB）
     function renderResultsChart(triggeredByUser = true) {
         if (!chartSection || !chartCanvas) {
             return;
         }
 
-        if (!filteredResults.length) {
+        if (!totalResults) {
             if (triggeredByUser) {
                 showNotification('暂无可用于绘图的数据', 'warning');
             }
@@ -1021,82 +992,99 @@ document.addEventListener('DOMContentLoaded', function() {
             return;
         }
 
-        let chartConfig;
-
-        if (chartType === 'scatter') {
-            const datasets = yKeys.map((key, index) => {
-                const dataPoints = filteredResults.map(row => {
-                    const xValue = Number(row[xKey]);
-                    const yValue = Number(row[key]);
-                    if (!Number.isFinite(xValue) || !Number.isFinite(yValue)) {
-                        return null;
-                    }
-                    return { x: xValue, y: yValue };
-                }).filter(Boolean);
-
-                return {
-                    label: columnDisplayName(key),
-                    data: dataPoints,
-                    showLine: false,
-                    borderColor: getChartColor(index, false),
-                    backgroundColor: getChartColor(index, true)
-                };
-            }).filter(dataset => dataset.data.length);
+        const params = new URLSearchParams(queryParams);
+        if (searchTerm) params.append('q', searchTerm);
+        if (sortColumn) {
+            params.append('sort', sortColumn);
+            params.append('order', sortDirection);
+        }
+        params.append('x', xKey);
+        yKeys.forEach(key => params.append('y', key));
+        // 目标点数与画布像素宽度相当即可
+        params.append('points', Math.max(200, Math.min(2000, (chartCanvas.clientWidth || 800) * 2)));
 
-            if (!datasets.length) {
-                if (triggeredByUser) {
-                    showNotification('所选字段无法生成有效的散点数据', 'warning');
+        const requestId = ++chartRequestId;
+        fetch(`/api/query/chart?${params.toString()}`)
+            .then(response => response.json().then(data => {
+                if (!response.ok) {
+                    throw new Error(data.error || '图表数据加载失败');
                 }
-                return;
-            }
-
-            chartConfig = {
-                type: 'scatter',
-                data: { datasets },
-                options: {
-                    responsive: true,
-                    maintainAspectRatio: false,
-                    scales: {
-                        x: { title: { display: true, text: columnDisplayName(xKey) } },
-                        y: { title: { display: true, text: '数值' } }
-                    }
+                return data;
+            }))
+            .then(data => {
+                if (requestId !== chartRequestId) {
+                    return;
                 }
-            };
-        } else {
-            const labels = filteredResults.map(row => formatChartLabel(row[xKey]));
-            const datasets = yKeys.map((key, index) => ({
-                label: columnDisplayName(key),
-                data: filteredResults.map(row => toNumericValue(row[key])),
-                fill: false,
-                tension: chartType === 'line' ? 0.2 : 0,
-                borderWidth: 2,
-                borderColor: getChartColor(index, false),
-                backgroundColor: getChartColor(index, true)
-            })).filter(dataset => dataset.data.some(value => value !== null && value !== undefined));
-
-            if (!datasets.length) {
+                drawChart(chartType, data, triggeredByUser);
+            })
+            .catch(error => {
+                console.error('图表数据加载失败:', error);
                 if (triggeredByUser) {
-                    showNotification('所选字段无法生成有效的图表数据', 'warning');
+                    showNotification(error.message || '图表数据加载失败', 'error');
                 }
-                return;
+            });
+    }
+
+    function drawChart(chartType, data, triggeredByUser) {
+        const xType = data.x.type;
+        const labels = data.labels || {};
+        const datasets = data.series.map((series, index) => ({
+            label: columnDisplayName(series.key),
+            data: series.points.map(([x, y]) => ({ x, y })),
+            fill: false,
+            showLine: chartType === 'line',
+            tension: chartType === 'line' ? 0.2 : 0,
+            borderWidth: chartType === 'scatter' ? 1 : 2,
+            pointRadius: chartType === 'line' ? 0 : 3,
+            borderColor: getChartColor(index, false),
+            backgroundColor: getChartColor(index, true)
+        })).filter(dataset => dataset.data.length);
+
+        if (!datasets.length) {
+            if (triggeredByUser) {
+                showNotification('所选字段无法生成有效的图表数据', 'warning');
             }
+            return;
+        }
 
-            chartConfig = {
-                type: chartType,
-                data: { labels, datasets },
-                options: {
-                    responsive: true,
-                    maintainAspectRatio: false,
-                    scales: {
-                        x: { title: { display: true, text: columnDisplayName(xKey) } },
-                        y: {
-                            title: { display: true, text: '数值' },
-                            beginAtZero: chartType === 'bar'
+        // X 轴统一为数值轴：日期为毫秒时间戳，文本为行序号（由 labels 还原）
+        const formatTick = value => {
+            if (xType === 'datetime') {
+                return new Date(value).toLocaleString('zh-CN');
+            }
+            if (xType === 'text') {
+                return formatChartLabel(labels[String(value)]);
+            }
+            return formatChartLabel(value);
+        };
+
+        const chartConfig = {
+            type: chartType === 'bar' ? 'bar' : 'scatter',
+            data: { datasets },
+            options: {
+                responsive: true,
+                maintainAspectRatio: false,
+                parsing: false,
+                scales: {
+                    x: {
+                        type: 'linear',
+                        title: { display: true, text: columnDisplayName(data.x.key) },
+                        ticks: { callback: formatTick }
+                    },
+                    y: {
+                        title: { display: true, text: '数值' },
+                        beginAtZero: chartType === 'bar'
+                    }
+                },
+                plugins: {
+                    tooltip: {
+                        callbacks: {
+                            title: items => items.length ? formatTick(items[0].parsed.x) : ''
                         }
                     }
                 }
-            };
-        }
+            }
+        };
 
         destroyChart();
         const context = chartCanvas.getContext('2d');
@@ -1110,31 +1098,16 @@ document.addEventListener('DOMContentLoaded', function() {
     }
 
     function isNumericColumn(key) {
-        return Boolean(chartColumnMeta[key]?.numeric);
+        return chartColumnMeta[key]?.type === 'number';
     }
 
     function formatChartLabel(value) {
         if (value === null || value === undefined || value === '') {
             return '-';
         }
-        if (typeof value === 'number') {
-            return value.toString();
-        }
-        const parsed = Date.parse(value);
-        if (!Number.isNaN(parsed) && typeof value === 'string') {
-            return new Date(parsed).toLocaleString('zh-CN');
-        }
         return value.toString();
     }
 
-    function toNumericValue(value) {
-        if (value === null || value === undefined || value === '') {
-            return null;
-        }
-        const numberValue = Number(value);
-        return Number.isFinite(numberValue) ? numberValue : null;
-    }
-
     // 关闭所有模态框
     function closeModals() {
         document.querySelectorAll('.modal').forEach(modal => {
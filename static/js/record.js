@@ -2,6 +2,9 @@ document.addEventListener('DOMContentLoaded', function() {
     // 全局变量
     let currentBatch = null;
     let batches = [];
+    let batchGroups = [];
+    let batchChangeSeq = null;
+    const recordSyncCache = new Map();
     let filteredBatches = [];
     let processSegments = [];
     let currentUser = {};
@@ -225,6 +228,89 @@ document.addEventListener('DOMContentLoaded', function() {
         
         // 设置事件监听器
         setupEventListeners();
+        subscribeToChanges();
+    }
+
+    // 订阅服务端变更推送：批号变化刷新下拉列表，当前批号的记录变化刷新对应表格
+    function subscribeToChanges() {
+        if (typeof EventSource === 'undefined') {
+            return;
+        }
+
+        const timers = {};
+        const schedule = (key, fn) => {
+            clearTimeout(timers[key]);
+            timers[key] = setTimeout(fn, 500);
+        };
+        const recordLoaders = {
+            materials: () => permissions.viewMaterials && loadMaterialRecords(),
+            equipment: () => permissions.viewEquipment && loadEquipmentRecords(),
+            quality: () => permissions.viewQuality && loadQualityRecords()
+        };
+
+        const handleBatchEvent = () => schedule('batches', refreshBatchesQuietly);
+        const handleRecordEvent = event => {
+            let payload = {};
+            try {
+                payload = JSON.parse(event.data || '{}');
+            } catch (error) {
+                return;
+            }
+            if (currentBatch && String(payload.batch_id) === String(currentBatch.id) && recordLoaders[payload.category]) {
+                schedule(payload.category, recordLoaders[payload.category]);
+            }
+            handleBatchEvent();
+        };
+
+        let source = null;
+        const connect = () => {
+            source = new EventSource('/api/events');
+            ['batch.created', 'batch.updated', 'batch.deleted', 'batch.archived'].forEach(type => source.addEventListener(type, handleBatchEvent));
+            ['record.added', 'record.updated', 'record.deleted'].forEach(type => source.addEventListener(type, handleRecordEvent));
+            source.addEventListener('resync', () => {
+                handleBatchEvent();
+                schedule('records', loadRecordData);
+            });
+            // 连接被拒绝（如 503 连接数已满）时浏览器不会自动重连，稍后重新订阅
+            source.addEventListener('error', () => {
+                if (source.readyState === EventSource.CLOSED) {
+                    setTimeout(connect, 30000);
+                }
+            });
+        };
+        connect();
+        window.addEventListener('beforeunload', () => source.close());
+    }
+
+    function refreshBatchesQuietly() {
+        if (batchChangeSeq === null) {
+            loadBatches();
+            return;
+        }
+        // 增量同步：只拉取自上次同步以来变更的批号分组
+        fetch(`/api/batches?since=${batchChangeSeq}`)
+            .then(response => response.json())
+            .then(delta => {
+                if (!delta || !Array.isArray(delta.changed)) {
+                    return;
+                }
+                const groupKey = group => `${group.batch_number}\u0000${group.product_name}`;
+                if (delta.full) {
+                    batchGroups = delta.changed;
+                } else {
+                    const replaced = new Set([
+                        ...(delta.deleted || []).map(groupKey),
+                        ...(delta.archived || []).map(groupKey),
+                        ...delta.changed.map(groupKey)
+                    ]);
+                    batchGroups = batchGroups.filter(group => !replaced.has(groupKey(group))).concat(delta.changed);
+                }
+                batchChangeSeq = delta.seq;
+                batches = sortBatches(expandBatchEntries(batchGroups));
+                refreshBatchOptions({ preserveSelection: true });
+                populateDeletionControls();
+            })
+            .catch(error => console.error('刷新批号数据失败:', error));
     }
     
     // 获取角色显示名称
@@ -496,9 +582,14 @@ document.addEventListener('DOMContentLoaded', function() {
     // 加载批号数据
     function loadBatches() {
         fetch('/api/batches')
-            .then(response => response.json())
+            .then(response => {
+                const seq = Number(response.headers.get('X-Change-Seq'));
+                batchChangeSeq = Number.isFinite(seq) ? seq : null;
+                return response.json();
+            })
             .then(data => {
-                const expanded = expandBatchEntries(data || []);
+                batchGroups = Array.isArray(data) ? data : [];
+                const expanded = expandBatchEntries(batchGroups);
                 batches = sortBatches(expanded);
                 refreshBatchOptions({ initial: true });
                 populateDeletionControls();
@@ -1528,14 +1619,53 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     }
     
+    // 记录列表的增量同步：首次完整加载，之后仅拉取 since 以来变更/删除的记录
+    const recordSortFields = { materials: 'record_time', equipment: 'start_time', quality: 'test_time' };
+
+    function fetchRecordList(category) {
+        const batchId = currentBatch.id;
+        const cacheKey = `${batchId}:${category}`;
+        const cached = recordSyncCache.get(cacheKey);
+        const baseUrl = `/api/batches/${batchId}/${category}`;
+
+        if (!cached) {
+            return fetch(baseUrl).then(response => {
+                const seq = Number(response.headers.get('X-Change-Seq'));
+                return response.json().catch(() => ({})).then(data => {
+                    if (Array.isArray(data) && Number.isFinite(seq)) {
+                        recordSyncCache.set(cacheKey, { seq, records: data });
+                    }
+                    return data;
+                });
+            });
+        }
+
+        return fetch(`${baseUrl}?since=${cached.seq}`)
+            .then(response => response.json().catch(() => ({})))
+            .then(delta => {
+                if (!delta || !Array.isArray(delta.changed)) {
+                    recordSyncCache.delete(cacheKey);
+                    return delta;
+                }
+                let records = delta.changed;
+                if (!delta.full) {
+                    const replaced = new Set([...delta.deleted, ...(delta.archived || []), ...delta.changed.map(record => record.id)]);
+                    const sortField = recordSortFields[category];
+                    records = cached.records.filter(record => !replaced.has(record.id)).concat(delta.changed);
+                    records.sort((a, b) => String(b[sortField] || '').localeCompare(String(a[sortField] || '')));
+                }
+                recordSyncCache.set(cacheKey, { seq: delta.seq, records });
+                return records.slice();
+            });
+    }
+
     // 加载物料记录
     function loadMaterialRecords() {
         if (!permissions.viewMaterials) {
             resetMaterialTable();
             return;
         }
-        fetch(`/api/batches/${currentBatch.id}/materials`)
-            .then(response => response.json().catch(() => ({})))
+        fetchRecordList('materials')
             .then(materials => {
                 if (!Array.isArray(materials)) {
                     resetMaterialTable();
@@ -1626,8 +1756,7 @@ document.addEventListener('DOMContentLoaded', function() {
             resetEquipmentTable();
             return;
         }
-        fetch(`/api/batches/${currentBatch.id}/equipment`)
-            .then(response => response.json().catch(() => ({})))
+        fetchRecordList('equipment')
             .then(equipment => {
                 if (!Array.isArray(equipment)) {
                     resetEquipmentTable();
@@ -2107,8 +2236,7 @@ document.addEventListener('DOMContentLoaded', function() {
             resetQualityTable();
             return;
         }
-        fetch(`/api/batches/${currentBatch.id}/quality`)
-            .then(response => response.json().catch(() => ({})))
+        fetchRecordList('quality')
             .then(quality => {
                 if (!Array.isArray(quality)) {
                     resetQualityTable();
@@ -0,0 +1,34 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+import config
+import server
+from database import Database
+
+
+@pytest.fixture
+def temp_db(tmp_path, monkeypatch):
+    database = Database(str(tmp_path / "test.db"))
+    monkeypatch.setattr(server, 'db', database)
+    # 测试中不启动后台维护线程
+    monkeypatch.setattr(config, 'MAINTENANCE_ENABLED', False)
+    return database
+
+
+@pytest.fixture
+def admin_client(temp_db):
+    with temp_db.get_connection() as conn:
+        admin_id = conn.execute("SELECT id FROM users WHERE username = 'admin'").fetchone()[0]
+
+    client = server.app.test_client()
+    with client.session_transaction() as sess:
+        sess['user_id'] = admin_id
+        sess['username'] = 'admin'
+        sess['role'] = 'admin'
+    return client
@@ -0,0 +1,53 @@
+import types
+
+import pytest
+
+import analytics
+
+
+def _seed(client):
+    response = client.post('/api/batches', json={'batch_number': 'B-1', 'product_name': 'P', 'process_segment': 'TJ'})
+    batch_id = response.get_json()['id']
+    for value in (9.8, 10.0, 10.2, 10.0):
+        client.post(f'/api/batches/{batch_id}/quality', json={
+            'test_item': '尺寸', 'test_value': value, 'standard_min': 9.0, 'standard_max': 11.0
+        })
+    client.post(f'/api/batches/{batch_id}/quality', json={'test_item': '重量', 'test_value': 5, 'standard_max': 6})
+    return batch_id
+
+
+def test_capability_stats(admin_client, temp_db):
+    _seed(admin_client)
+
+    response = admin_client.get('/api/dashboard/capability?days=30')
+    assert response.headers['X-Analytics-Engine'] == analytics.engine_name()
+    size, weight = response.get_json()['items']
+    assert (size['test_item'], size['count'], size['min'], size['max']) == ('尺寸', 4, 9.8, 10.2)
+    assert size['mean'] == pytest.approx(10.0)
+    assert size['stddev'] == pytest.approx(0.163299, rel=1e-4)
+    assert size['cp'] == pytest.approx(2.0 / (6 * 0.163299), rel=1e-4)
+    assert size['cpk'] == pytest.approx(size['cp'])
+    # 单个样本无法估计标准差
+    assert (weight['count'], weight['stddev'], weight['cpk']) == (1, None, None)
+
+    filtered = admin_client.get('/api/dashboard/capability?test_item=重量').get_json()['items']
+    assert [item['test_item'] for item in filtered] == ['重量']
+
+
+def test_failing_duckdb_falls_back_to_sqlite(admin_client, temp_db, monkeypatch):
+    _seed(admin_client)
+
+    class FakeError(Exception):
+        pass
+
+    def connect(database):
+        raise FakeError('sqlite extension not available')
+
+    monkeypatch.setattr(analytics, 'duckdb', types.SimpleNamespace(Error=FakeError, connect=connect))
+    monkeypatch.setattr(analytics.config, 'ANALYTICS_ENGINE', 'auto')
+
+    response = admin_client.get('/api/dashboard/data?days=30')
+    assert response.headers['X-Analytics-Engine'] == 'sqlite'
+    data = response.get_json()
+    assert (data['total_batches'], data['active_batches']) == (1, 1)
+    assert data['quality_rates']['尺寸']['total'] == 4
@@ -0,0 +1,95 @@
+import os
+from contextlib import closing
+
+import pytest
+
+import archive
+import config
+import events
+import query_cache
+
+
+@pytest.fixture
+def archive_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, 'ARCHIVE_DIR', str(tmp_path / 'archive'))
+    monkeypatch.setattr(config, 'ARCHIVE_PERIOD', 'year')
+    query_cache.query_results.clear()
+    return tmp_path / 'archive'
+
+
+def _seed(client, database):
+    ids = {}
+    for number, segment in (('B-OLD', 'TJ'), ('B-OLD', 'CT'), ('B-NEW', 'TJ')):
+        response = client.post('/api/batches', json={'batch_number': number, 'product_name': 'P', 'process_segment': segment})
+        batch_id = response.get_json()['id']
+        ids[(number, segment)] = batch_id
+        client.post(f'/api/batches/{batch_id}/quality', json={'test_item': f'{number}-{segment}', 'test_value': 1})
+    with database.get_connection() as conn:
+        conn.execute(
+            "UPDATE batches SET status = '已完成', start_time = '2022-03-01 08:00:00', end_time = '2022-03-02 08:00:00' "
+            "WHERE batch_number = 'B-OLD'"
+        )
+        conn.commit()
+    return ids
+
+
+def test_archive_moves_closed_groups_and_reads_federate(admin_client, temp_db, archive_dir):
+    ids = _seed(admin_client, temp_db)
+
+    assert archive.archive_batches(temp_db, months=12, dry_run=True)['groups'] == 1
+    summary = archive.archive_batches(temp_db, months=12)
+    assert summary == {'groups': 1, 'batches': 2, 'records': 2, 'periods': ['2022']}
+    assert os.path.exists(archive_dir / 'production_2022.db')
+    assert archive.archive_batches(temp_db, months=12)['groups'] == 0
+
+    with temp_db.get_connection() as conn:
+        assert [row[0] for row in conn.execute('SELECT batch_number FROM batches')] == ['B-NEW']
+        assert conn.execute('SELECT COUNT(*) FROM quality_records').fetchone()[0] == 1
+        index = archive.list_archives(conn)
+    assert index[0]['min_start_date'] == '2022-03-01' and index[0]['batch_count'] == 2
+
+    rows = admin_client.get('/api/query?sort=test_item&order=asc').get_json()
+    assert [row['test_item'] for row in rows] == ['B-NEW-TJ', 'B-OLD-CT', 'B-OLD-TJ']
+    page = admin_client.get('/api/query?page=1&page_size=2&sort=test_item&order=asc').get_json()
+    assert page['total'] == 3
+    assert [row['test_item'] for row in page['rows']] == ['B-NEW-TJ', 'B-OLD-CT']
+    recent = admin_client.get('/api/query?start_date=2023-01-01').get_json()
+    assert [row['batch_number'] for row in recent] == ['B-NEW']
+
+    detail = admin_client.get(f"/api/batches/{ids[('B-OLD', 'TJ')]}").get_json()
+    assert detail['batch']['archived'] is True
+    assert detail['summary'] == {'segment_count': 2, 'material_total': 0, 'equipment_total': 0, 'quality_total': 2}
+
+    dashboard = admin_client.get('/api/dashboard/data?start_date=2022-01-01&end_date=2030-12-31').get_json()
+    assert dashboard['total_batches'] == 3
+    assert dashboard['completed_batches'] == 2
+    assert dashboard['quality_rates']['B-OLD-TJ']['total'] == 1
+
+
+def test_missing_archive_file_is_reported(admin_client, temp_db, archive_dir):
+    _seed(admin_client, temp_db)
+    archive.archive_batches(temp_db, months=12)
+    os.remove(archive_dir / 'production_2022.db')
+
+    response = admin_client.get('/api/query')
+    assert response.status_code == 400
+    assert 'production_2022.db' in response.get_json()['error']
+
+
+def test_archive_is_journaled_as_archive_not_delete(admin_client, temp_db, archive_dir):
+    ids = _seed(admin_client, temp_db)
+    old_id = ids[('B-OLD', 'TJ')]
+    seq = int(admin_client.get('/api/batches').headers['X-Change-Seq'])
+    record_seq = int(admin_client.get(f'/api/batches/{old_id}/quality').headers['X-Change-Seq'])
+
+    archive.archive_batches(temp_db, months=12)
+
+    delta = admin_client.get(f'/api/batches?since={seq}').get_json()
+    assert delta['deleted'] == []
+    assert delta['archived'] == [{'batch_number': 'B-OLD', 'product_name': 'P'}]
+    records = admin_client.get(f'/api/batches/{old_id}/quality?since={record_seq}').get_json()
+    assert records['deleted'] == [] and len(records['archived']) == 1
+
+    with closing(temp_db.get_connection()) as conn:
+        types = [event['type'] for event in events.read_journal_events(conn.cursor(), seq, temp_db.get_change_seq(conn.cursor()))]
+    assert types == ['batch.archived', 'batch.archived']
@@ -0,0 +1,80 @@
+import gzip
+import json
+import sys
+from pathlib import Path
+
+import config
+import server
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'tools'))
+from build_assets import build, minify_css, minify_js, retire_stale  # noqa: E402
+
+
+def test_minifiers_keep_literals_and_line_structure():
+    source = (
+        "const url = 'http://example.com'; // trailing\n"
+        "    /* block */\n"
+        "const re = /\\/\\/+/g;\n"
+        "const html = `\n    <td>${ value ? `${a}` : '' }</td>`;\n"
+    )
+    assert minify_js(source) == (
+        "const url = 'http://example.com';\n"
+        "const re = /\\/\\/+/g;\n"
+        "const html = `\n    <td>${ value ? `${a}` : '' }</td>`;\n"
+    )
+    assert minify_css("a :hover { color: red; /* x */ content: ' a ; b '; }\n") == \
+        "a :hover{color: red;content: ' a ; b '}\n"
+
+
+def test_templates_use_built_assets(tmp_path, monkeypatch):
+    static_dir = tmp_path / 'static'
+    (static_dir / 'css').mkdir(parents=True)
+    (static_dir / 'js').mkdir()
+    (static_dir / 'css' / 'login.css').write_text('body {\n    margin: 0;\n}\n' * 100, encoding='utf-8')
+    (static_dir / 'js' / 'login.js').write_text('// login\nconsole.log(1);\n', encoding='utf-8')
+    dist_dir = tmp_path / 'dist'
+    manifest = build(static_dir, dist_dir)
+
+    monkeypatch.setattr(config, 'ASSET_DIST_DIR', str(dist_dir))
+    monkeypatch.setattr(config, 'ASSET_MANIFEST_PATH', str(dist_dir / 'manifest.json'))
+    client = server.app.test_client()
+
+    page = client.get('/login').get_data(as_text=True)
+    css_url = f"/assets/{manifest['css/login.css']}"
+    assert css_url in page
+    assert f"/assets/{manifest['js/login.js']}" in page
+
+    response = client.get(css_url, headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert response.headers['Content-Type'].startswith('text/css')
+    assert 'immutable' in response.headers['Cache-Control']
+    assert gzip.decompress(response.data) == (dist_dir / manifest['css/login.css']).read_bytes()
+
+
+def test_rebuild_keeps_previous_files_until_pruned(tmp_path):
+    static_dir = tmp_path / 'static'
+    (static_dir / 'js').mkdir(parents=True)
+    source = static_dir / 'js' / 'app.js'
+    dist_dir = tmp_path / 'dist'
+
+    source.write_text('console.log(1);\n', encoding='utf-8')
+    old = build(static_dir, dist_dir)['js/app.js']
+    source.write_text('console.log(2);\n', encoding='utf-8')
+    new = build(static_dir, dist_dir)['js/app.js']
+
+    # 按旧清单渲染的页面仍能取到旧文件
+    assert new != old
+    assert (dist_dir / old).exists() and (dist_dir / new).exists()
+
+    retired = json.loads((dist_dir / 'retired.json').read_text(encoding='utf-8'))
+    assert set(retired) == {old, old + '.gz'}
+    # 宽限期按退役时间计算，而不是文件的修改时间
+    assert retire_stale(dist_dir, {new, new + '.gz'}, grace_seconds=3600, now=max(retired.values()) + 60) == []
+    assert sorted(retire_stale(dist_dir, {new, new + '.gz'}, grace_seconds=3600,
+                               now=max(retired.values()) + 7200)) == [old, old + '.gz']
+
+    source.write_text('console.log(3);\n', encoding='utf-8')
+    latest = build(static_dir, dist_dir, prune=True)['js/app.js']
+    assert sorted(path.relative_to(dist_dir).as_posix() for path in (dist_dir / 'js').iterdir()) == [
+        latest, latest + '.gz'
+    ]
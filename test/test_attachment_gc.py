@@ -0,0 +1,83 @@
+import json
+import os
+import time
+
+import pytest
+
+import attachment_gc
+import config
+
+
+@pytest.fixture
+def gc_dirs(tmp_path, monkeypatch):
+    root = tmp_path / 'download'
+    root.mkdir()
+    monkeypatch.setattr(config, 'UPLOAD_FOLDER', str(root))
+    monkeypatch.setattr(config, 'ATTACHMENT_QUARANTINE_DIR', str(tmp_path / 'quarantine'))
+    monkeypatch.setattr(config, 'ARCHIVE_DIR', str(tmp_path / 'archive'))
+    return root
+
+
+def _write(root, relative, content=b'data', age=7 * 24 * 3600):
+    path = root / relative
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(content)
+    old = time.time() - age
+    os.utime(path, (old, old))
+    return path
+
+
+def _insert_quality(database, attachments):
+    with database.get_connection() as conn:
+        batch_id = conn.execute(
+            "INSERT INTO batches (batch_number, product_name, process_segment, created_by) VALUES ('B-1', 'P', 'TJ', 1)"
+        ).lastrowid
+        conn.execute(
+            "INSERT INTO quality_records (batch_id, test_item, test_value, tested_by, attachments_json) VALUES (?, 'x', 1, 1, ?)",
+            (batch_id, json.dumps(attachments))
+        )
+        conn.commit()
+
+
+def test_collect_quarantines_only_unreferenced_files(temp_db, gc_dirs):
+    root = gc_dirs
+    _write(root, 'placeholder.txt')
+    _write(root, 'P/B-1/TJ/quality/kept.txt')
+    _write(root, 'P/B-1/TJ/quality/orphan.txt', b'x' * 100)
+    _write(root, 'P/B-1/TJ/quality.txt/sorted-after-dir.txt')
+    _write(root, 'P/B-2/TJ/quality/fresh.txt', age=0)
+    _write(root, 'P/B-3/TJ/material/gone.txt', b'y' * 50)
+    _insert_quality(temp_db, [
+        'P/B-1/TJ/quality/kept.txt', 'P/B-1/TJ/quality.txt/sorted-after-dir.txt', 'P/B-1/TJ/quality/missing.txt'
+    ])
+
+    report = attachment_gc.collect(temp_db, dry_run=True)
+    assert (report['scanned_files'], report['referenced_files'], report['recent_files']) == (5, 2, 1)
+    assert (report['orphaned_files'], report['orphaned_bytes'], report['missing_files']) == (2, 150, 1)
+    assert (root / 'P/B-1/TJ/quality/orphan.txt').exists()
+
+    summary = attachment_gc.collect(temp_db)
+    assert summary['quarantined_bytes'] == 150
+    assert not (root / 'P/B-1/TJ/quality/orphan.txt').exists()
+    assert not (root / 'P/B-3').exists()
+    assert (root / 'placeholder.txt').exists() and (root / 'P/B-1/TJ/quality/kept.txt').exists()
+    quarantined = os.path.join(summary['quarantine_dir'], 'P/B-1/TJ/quality/orphan.txt')
+    assert open(quarantined, 'rb').read() == b'x' * 100
+
+    assert attachment_gc.purge_quarantine(days=1) == {'purged_files': 0, 'reclaimed_bytes': 0}
+    assert attachment_gc.purge_quarantine(days=-1) == {'purged_files': 2, 'reclaimed_bytes': 150}
+    assert not os.path.exists(summary['quarantine_dir'])
+
+
+def test_admin_endpoint_reports_dry_run(admin_client, temp_db, gc_dirs, monkeypatch):
+    monkeypatch.setitem(admin_client.application.config, 'UPLOAD_FOLDER', str(gc_dirs))
+    _write(gc_dirs, 'P/B-1/TJ/quality/orphan.txt')
+
+    payload = admin_client.get('/api/admin/attachments/gc').get_json()
+    assert payload['dry_run'] is True
+    assert payload['summary']['orphaned_files'] == 1
+    assert (gc_dirs / 'P/B-1/TJ/quality/orphan.txt').exists()
+
+    payload = admin_client.post('/api/admin/attachments/gc', json={}).get_json()
+    assert payload['summary']['quarantined_files'] == 1
+    assert not (gc_dirs / 'P/B-1/TJ/quality/orphan.txt').exists()
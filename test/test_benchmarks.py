@@ -0,0 +1,172 @@
+"""Endpoint latency benchmarks (opt-in).
+
+Run with::
+
+    MINIMES_BENCHMARK=1 python -m pytest -q -s test/test_benchmarks.py
+
+Environment variables:
+
+* ``MINIMES_BENCHMARK_SIZES`` – comma separated batch counts to seed
+  (default ``1000``; e.g. ``1000,10000,100000``).
+* ``MINIMES_BENCHMARK_TOLERANCE`` – allowed slowdown factor against the
+  stored baseline median (default ``2.0``).
+* ``MINIMES_BENCHMARK_UPDATE=1`` – record the measured medians as the new
+  baselines in ``test/benchmark_baselines.json`` instead of comparing.
+
+Baselines are machine specific; re-record them on the reference machine
+when the hardware changes.
+"""
+
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+import config
+import query_cache
+import server
+from database import Database
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'tools'))
+from generate_dataset import generate_dataset  # noqa: E402
+
+pytestmark = pytest.mark.skipif(
+    not os.environ.get('MINIMES_BENCHMARK'),
+    reason='benchmarks are opt-in: set MINIMES_BENCHMARK=1'
+)
+
+SIZES = [int(size) for size in os.environ.get('MINIMES_BENCHMARK_SIZES', '1000').split(',') if size.strip()]
+TOLERANCE = float(os.environ.get('MINIMES_BENCHMARK_TOLERANCE', '2.0'))
+UPDATE_BASELINES = bool(os.environ.get('MINIMES_BENCHMARK_UPDATE'))
+# 绝对容差，避免毫秒级接口因计时抖动误报
+ABSOLUTE_SLACK_MS = 2.0
+BASELINE_PATH = Path(__file__).with_name('benchmark_baselines.json')
+
+_DATASETS = {}
+_BASELINE_LOCK = threading.Lock()
+
+
+def _seed_database(path, batch_count):
+    """Generate a deterministic dataset of ``batch_count`` batch rows."""
+    generate_dataset(str(path), batch_count, seed=20240601, days=90)
+    database = Database(str(path))
+    with database.get_connection() as conn:
+        admin_id = conn.execute("SELECT id FROM users WHERE username = 'admin'").fetchone()[0]
+    return database, admin_id
+
+
+@pytest.fixture(scope='module')
+def dataset(request, tmp_path_factory):
+    size = request.param
+    if size not in _DATASETS:
+        path = tmp_path_factory.mktemp(f'bench_{size}') / 'bench.db'
+        _DATASETS[size] = _seed_database(path, size)
+    return size, _DATASETS[size]
+
+
+@pytest.fixture
+def bench_client(dataset, monkeypatch):
+    size, (database, admin_id) = dataset
+    monkeypatch.setattr(server, 'db', database)
+    client = server.app.test_client()
+    with client.session_transaction() as sess:
+        sess['user_id'] = admin_id
+        sess['username'] = 'admin'
+        sess['role'] = 'admin'
+    return size, client
+
+
+def _measure(call, iterations):
+    call()  # 预热：模板、字段配置缓存等
+    samples = []
+    started = time.perf_counter()
+    for _ in range(iterations):
+        begin = time.perf_counter()
+        response = call()
+        samples.append((time.perf_counter() - begin) * 1000)
+        assert response.status_code in (200, 201), response.get_data(as_text=True)[:200]
+    elapsed = time.perf_counter() - started
+    samples.sort()
+    return {
+        'median_ms': round(statistics.median(samples), 3),
+        'p95_ms': round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 3),
+        'throughput_rps': round(iterations / elapsed, 1) if elapsed else None
+    }
+
+
+def _uncached(call):
+    # 查询结果缓存会掩盖 SQL 本身的回退，冷查询每次先清空缓存
+    def run():
+        query_cache.query_results.clear()
+        return call()
+    return run
+
+
+def _read_cases(client):
+    filtered_url = '/api/query?product_name=LF-100&process_segment=' + config.get_process_segments()[0]
+    return {
+        'batches_list': (lambda: client.get('/api/batches'), 5),
+        'batch_detail': (lambda: client.get('/api/batches/1'), 30),
+        'query_all': (_uncached(lambda: client.get('/api/query')), 3),
+        'query_filtered': (_uncached(lambda: client.get(filtered_url)), 5),
+        'query_page': (_uncached(lambda: client.get('/api/query?page=2&page_size=25&sort=test_value')), 5),
+        'query_repeat': (lambda: client.get(filtered_url), 30),
+        'dashboard_data': (lambda: client.get('/api/dashboard/data?days=30'), 5),
+    }
+
+
+def _write_cases(client):
+    counter = iter(range(1, 10 ** 9))
+    return {
+        'material_write': (lambda: client.post('/api/batches/1/materials', json={
+            'material_code': f'BM{next(counter)}', 'material_name': '基准原料', 'weight': 1.5
+        }), 30),
+        'equipment_write': (lambda: client.post('/api/batches/1/equipment', json={
+            'equipment_code': f'BE{next(counter)}', 'equipment_name': '基准设备',
+            'start_time': '2024-06-01 08:00:00', 'parameters': {'temperature': 120}
+        }), 30),
+        'quality_write': (lambda: client.post('/api/batches/1/quality', json={
+            'test_item': f'基准检测{next(counter)}', 'test_value': 5
+        }), 30),
+    }
+
+
+CASE_NAMES = (
+    'batches_list', 'batch_detail', 'query_all', 'query_filtered', 'query_page', 'query_repeat', 'dashboard_data',
+    'material_write', 'equipment_write', 'quality_write'
+)
+
+
+def _check_against_baseline(size, case, result):
+    with _BASELINE_LOCK:
+        baselines = json.loads(BASELINE_PATH.read_text(encoding='utf-8')) if BASELINE_PATH.exists() else {}
+        if UPDATE_BASELINES:
+            baselines.setdefault(str(size), {})[case] = {'median_ms': result['median_ms']}
+            BASELINE_PATH.write_text(json.dumps(baselines, indent=2, sort_keys=True) + '\n', encoding='utf-8')
+            return
+
+    baseline = baselines.get(str(size), {}).get(case)
+    if baseline is None:
+        pytest.skip(f'no baseline for {case} at {size} batches; record with MINIMES_BENCHMARK_UPDATE=1')
+    limit = baseline['median_ms'] * TOLERANCE + ABSOLUTE_SLACK_MS
+    assert result['median_ms'] <= limit, (
+        f"{case} regressed at {size} batches: median {result['median_ms']}ms > "
+        f"{limit:.3f}ms (baseline {baseline['median_ms']}ms x {TOLERANCE})"
+    )
+
+
+@pytest.mark.parametrize('dataset', SIZES, indirect=True, ids=lambda size: f'{size}batches')
+@pytest.mark.parametrize('case', CASE_NAMES)
+def test_endpoint_latency(bench_client, case):
+    size, client = bench_client
+    cases = {**_read_cases(client), **_write_cases(client)}
+    call, iterations = cases[case]
+    result = _measure(call, iterations)
+    print(f"\n[bench] {size:>7} batches  {case:<16} median {result['median_ms']:>9.3f}ms  "
+          f"p95 {result['p95_ms']:>9.3f}ms  {result['throughput_rps']} req/s")
+    _check_against_baseline(size, case, result)
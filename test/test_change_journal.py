@@ -0,0 +1,96 @@
+import sys
+from contextlib import closing
+from pathlib import Path
+
+import server
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'tools'))
+from generate_dataset import generate_dataset  # noqa: E402
+
+
+def _create_batch(client, batch_number):
+    response = client.post('/api/batches', json={
+        'batch_number': batch_number, 'product_name': 'P', 'process_segment': 'TJ'
+    })
+    return response.get_json()['id']
+
+
+def test_batches_delta_returns_changed_and_deleted_groups(admin_client):
+    keep_id = _create_batch(admin_client, 'B-KEEP')
+    drop_id = _create_batch(admin_client, 'B-DROP')
+
+    full = admin_client.get('/api/batches')
+    seq = int(full.headers['X-Change-Seq'])
+    assert {item['batch_number'] for item in full.get_json()} == {'B-KEEP', 'B-DROP'}
+
+    admin_client.post(f'/api/batches/{keep_id}/materials', json={
+        'material_code': 'M1', 'material_name': '原料', 'weight': 1
+    })
+    admin_client.delete(f'/api/batches/{drop_id}')
+
+    delta = admin_client.get(f'/api/batches?since={seq}').get_json()
+    assert delta['full'] is False
+    assert delta['seq'] > seq
+    assert [item['batch_number'] for item in delta['changed']] == ['B-KEEP']
+    assert delta['changed'][0]['material_count'] == 1
+    assert delta['deleted'] == [{'batch_number': 'B-DROP', 'product_name': 'P'}]
+
+    assert admin_client.get(f"/api/batches?since={delta['seq']}").get_json()['changed'] == []
+
+
+def test_batch_groups_accept_more_keys_than_sql_variables(temp_db, admin_client):
+    _create_batch(admin_client, '0042')
+    _create_batch(admin_client, 'B-OTHER')
+    # 分组键作为一个 JSON 参数传入，数量不受 SQLite 变量上限限制，数字样式的批号仍按文本匹配
+    keys = [('0042', 'P')] + [(f'X-{index}', 'P') for index in range(40000)]
+    with closing(temp_db.get_connection()) as conn:
+        groups = server._build_batch_groups(conn.cursor(), hide_quality=False, keys=keys)
+    assert [group['batch_number'] for group in groups] == ['0042']
+
+
+def test_record_list_delta(admin_client):
+    batch_id = _create_batch(admin_client, 'B-REC')
+    first = admin_client.post(f'/api/batches/{batch_id}/materials', json={
+        'material_code': 'M1', 'material_name': '原料', 'weight': 1
+    }).get_json()
+
+    response = admin_client.get(f'/api/batches/{batch_id}/materials')
+    seq = int(response.headers['X-Change-Seq'])
+
+    second = admin_client.post(f'/api/batches/{batch_id}/materials', json={
+        'material_code': 'M2', 'material_name': '辅料', 'weight': 2
+    }).get_json()
+    admin_client.delete(f"/api/batches/{batch_id}/materials/{first['id']}")
+
+    delta = admin_client.get(f'/api/batches/{batch_id}/materials?since={seq}').get_json()
+    assert [record['id'] for record in delta['changed']] == [second['id']]
+    assert delta['deleted'] == [first['id']]
+
+
+def test_since_before_pruned_journal_returns_full_list(admin_client, temp_db):
+    _create_batch(admin_client, 'B-OLD')
+    with temp_db.get_connection() as conn:
+        conn.execute("UPDATE change_journal SET changed_at = datetime('now', '-30 days')")
+    temp_db.prune_change_journal(retention_days=7)
+
+    delta = admin_client.get('/api/batches?since=0').get_json()
+    assert delta['full'] is True
+    assert [item['batch_number'] for item in delta['changed']] == ['B-OLD']
+
+    assert admin_client.get('/api/batches?since=abc').status_code == 400
+
+
+def test_generated_dataset_invalidates_journal_positions(temp_db, admin_client):
+    _create_batch(admin_client, 'B-BEFORE')
+    full = admin_client.get('/api/batches')
+    seq = int(full.headers['X-Change-Seq'])
+
+    generate_dataset(temp_db.db_path, 3, seed=7, days=5)
+
+    # 批量导入不逐行写日志：旧位置的增量请求与 ETag 都必须失效
+    delta = admin_client.get(f'/api/batches?since={seq}').get_json()
+    assert delta['full'] is True
+    assert len(delta['changed']) > 1
+    assert admin_client.get('/api/batches', headers={'If-None-Match': full.headers['ETag']}).status_code == 200
+    with closing(temp_db.get_connection()) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM sqlite_master WHERE name LIKE 'trg_journal_%'").fetchone()[0]
@@ -0,0 +1,64 @@
+import gzip
+
+from compression import CompressionMiddleware
+
+
+def _make_app(body, content_type='application/json', chunks=1, extra_headers=()):
+    def app(environ, start_response):
+        start_response('200 OK', [('Content-Type', content_type), *extra_headers])
+        size = len(body) // chunks or len(body)
+        return [body[i:i + size] for i in range(0, len(body), size)]
+    return app
+
+
+def _call(app, accept='gzip'):
+    captured = {}
+
+    def start_response(status, headers, exc_info=None):
+        captured['status'] = status
+        captured['headers'] = dict(headers)
+
+    body = b''.join(app({'HTTP_ACCEPT_ENCODING': accept}, start_response))
+    return captured['headers'], body
+
+
+def test_large_json_is_gzipped_across_chunks():
+    payload = b'{"batch_number": "B-001", "product_name": "P"},' * 200
+    app = CompressionMiddleware(_make_app(payload, chunks=7, extra_headers=[('ETag', '"v1"')]), min_size=256)
+    headers, body = _call(app)
+
+    assert headers['Content-Encoding'] == 'gzip'
+    assert headers['Vary'] == 'Accept-Encoding'
+    assert headers['ETag'] == '"v1-gzip"'
+    assert gzip.decompress(body) == payload
+    assert len(body) < len(payload) // 10
+
+
+def test_small_stream_and_unaccepted_responses_pass_through():
+    app = CompressionMiddleware(_make_app(b'{"ok": true}'), min_size=256)
+    headers, body = _call(app)
+    assert 'Content-Encoding' not in headers and body == b'{"ok": true}'
+
+    events = CompressionMiddleware(_make_app(b'data: x\n\n' * 200, content_type='text/event-stream'), min_size=16)
+    headers, _ = _call(events)
+    assert 'Content-Encoding' not in headers
+
+    identity = CompressionMiddleware(_make_app(b'x' * 4096), min_size=16)
+    headers, _ = _call(identity, accept='identity')
+    assert 'Content-Encoding' not in headers
+
+
+def test_conditional_get_through_compressed_etag(admin_client):
+    for index in range(20):
+        admin_client.post('/api/batches', json={
+            'batch_number': f'B-GZ-{index:03d}', 'product_name': 'P', 'process_segment': 'TJ'
+        })
+
+    first = admin_client.get('/api/batches', headers={'Accept-Encoding': 'gzip'})
+    assert first.headers['Content-Encoding'] == 'gzip'
+    etag = first.headers['ETag']
+    assert etag.endswith('-gzip"')
+
+    cached = admin_client.get('/api/batches', headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag})
+    assert cached.status_code == 304
+    assert cached.headers['ETag'] == etag
@@ -0,0 +1,48 @@
+import sqlite3
+from contextlib import closing
+
+import database
+from database import Database, SCHEMA_VERSION
+
+
+def test_new_database_is_at_latest_schema_version(tmp_path):
+    db_path = tmp_path / "fresh.db"
+    Database(str(db_path))
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute('PRAGMA user_version').fetchone()[0] == SCHEMA_VERSION
+        assert conn.execute("SELECT COUNT(*) FROM users").fetchone()[0] > 0
+
+
+def test_restart_skips_migrations_and_seeding(tmp_path, monkeypatch):
+    db_path = str(tmp_path / "warm.db")
+    Database(db_path)
+
+    def fail(*args, **kwargs):
+        raise AssertionError('should not run on an up-to-date database')
+
+    monkeypatch.setattr(Database, '_migrate_initial_schema', fail)
+    monkeypatch.setattr(Database, '_seed_defaults', fail)
+    Database(db_path)
+
+
+def test_get_database_returns_shared_instance(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, '_DATABASES', {})
+    db_path = str(tmp_path / "shared.db")
+    assert database.get_database(db_path) is database.get_database(db_path)
+
+
+def test_journal_rebuild_keeps_sequence(tmp_path):
+    db_path = str(tmp_path / "journal.db")
+    db = Database(db_path)
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("INSERT INTO process_segments (segment_name) VALUES ('测试工段')")
+        seq = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'change_journal'").fetchone()[0]
+        # 日志已被清空的旧库：重建后序号仍须延续
+        conn.execute('DELETE FROM change_journal')
+        conn.execute('PRAGMA user_version = 6')
+
+    Database(db_path)
+    with closing(db.get_connection()) as conn:
+        assert db.get_change_seq(conn.cursor()) == seq
+        conn.execute("INSERT INTO change_journal (table_name, row_id, op) VALUES ('batches', 1, 'archive')")
+        assert conn.execute('SELECT MAX(seq) FROM change_journal').fetchone()[0] == seq + 1
@@ -0,0 +1,32 @@
+def test_batches_etag_revalidates_until_data_changes(admin_client):
+    first = admin_client.get('/api/batches')
+    etag = first.headers['ETag']
+
+    cached = admin_client.get('/api/batches', headers={'If-None-Match': etag})
+    assert cached.status_code == 304
+    assert cached.data == b''
+
+    admin_client.post('/api/batches', json={'batch_number': 'B-ETAG', 'product_name': 'P', 'process_segment': 'TJ'})
+    changed = admin_client.get('/api/batches', headers={'If-None-Match': etag})
+    assert changed.status_code == 200
+    assert changed.headers['ETag'] != etag
+
+
+def test_reference_table_etags_track_their_own_tables(admin_client, temp_db):
+    segments_etag = admin_client.get('/api/process_segments').headers['ETag']
+    fields_etag = admin_client.get('/api/custom_fields').headers['ETag']
+
+    with temp_db.get_connection() as conn:
+        conn.execute("UPDATE custom_fields SET sort_order = sort_order + 1")
+
+    assert admin_client.get('/api/process_segments', headers={'If-None-Match': segments_etag}).status_code == 304
+    assert admin_client.get('/api/custom_fields', headers={'If-None-Match': fields_etag}).status_code == 200
+
+
+def test_config_etags_depend_on_query(admin_client):
+    etag = admin_client.get('/api/segment_definitions?segment=TJ').headers['ETag']
+    assert admin_client.get('/api/segment_definitions?segment=TJ', headers={'If-None-Match': etag}).status_code == 304
+    assert admin_client.get('/api/segment_definitions?segment=XX', headers={'If-None-Match': etag}).status_code == 200
+
+    fields_etag = admin_client.get('/api/config/record_fields').headers['ETag']
+    assert admin_client.get('/api/config/record_fields', headers={'If-None-Match': fields_etag}).status_code == 304
@@ -0,0 +1,87 @@
+from contextlib import closing
+
+import config
+import events
+
+
+def test_role_filter_mirrors_read_permissions():
+    quality_event = {'type': 'record.added', 'category': 'quality'}
+    material_event = {'type': 'record.added', 'category': 'materials'}
+    batch_event = {'type': 'batch.updated'}
+
+    assert not events.event_visible_to('write_material', quality_event)
+    assert events.event_visible_to('write_material', material_event)
+    assert not events.event_visible_to('write_quality', material_event)
+    assert events.event_visible_to('write_quality', batch_event)
+    assert events.event_visible_to('admin', quality_event)
+
+
+def _drain(subscription):
+    received = []
+    while True:
+        event = subscription.get(timeout=0.01)
+        if event is None:
+            return received
+        received.append(event)
+
+
+def test_journal_changes_reach_subscribers(temp_db, admin_client):
+    feed = events.JournalFeed(temp_db, events.ChangeBroker())
+    feed.poll()
+    subscription = feed.broker.subscribe('write_material')
+    try:
+        response = admin_client.post('/api/batches', json={
+            'batch_number': 'B-SSE', 'product_name': 'P', 'process_segment': 'TJ'
+        })
+        batch_id = response.get_json()['id']
+        admin_client.post(f'/api/batches/{batch_id}/quality', json={'test_item': 'D10', 'test_value': 1})
+        admin_client.post(f'/api/batches/{batch_id}/materials', json={
+            'material_code': 'M1', 'material_name': '原料', 'weight': 1
+        })
+
+        # 写入来自任意进程，均经由变更日志送达
+        feed.poll()
+        received = _drain(subscription)
+    finally:
+        subscription.close()
+
+    assert [(event['type'], event.get('category')) for event in received] == [
+        ('batch.created', None), ('record.added', 'materials')
+    ]
+    assert all(event['batch_id'] == batch_id for event in received)
+    assert received[0]['batch_number'] == 'B-SSE'
+
+
+def test_replay_after_last_event_id(temp_db, admin_client):
+    feed = events.JournalFeed(temp_db, events.ChangeBroker())
+    with closing(temp_db.get_connection()) as conn:
+        start_seq = temp_db.get_change_seq(conn.cursor())
+    response = admin_client.post('/api/batches', json={
+        'batch_number': 'B-REPLAY', 'product_name': 'P', 'process_segment': 'TJ'
+    })
+    batch_id = response.get_json()['id']
+
+    replayed = feed.replay(start_seq)
+    assert [(event['type'], event['batch_id']) for event in replayed] == [('batch.created', batch_id)]
+    assert feed.replay(replayed[-1]['id']) == []
+    # 超出日志范围的 id 需要整体刷新
+    assert [event['type'] for event in feed.replay(replayed[-1]['id'] + 100)] == ['resync']
+
+
+def test_format_sse_frame():
+    frame = events.format_sse({'id': 3, 'type': 'batch.created', 'batch_id': 1})
+    assert frame.startswith('id: 3\nevent: batch.created\ndata: {')
+    assert frame.endswith('\n\n')
+
+
+def test_event_stream_limit_returns_503(admin_client, monkeypatch):
+    monkeypatch.setattr(config, 'EVENT_STREAM_MAX_SUBSCRIBERS', 1)
+    subscription = events.broker.subscribe('admin')
+    try:
+        response = admin_client.get('/api/events')
+    finally:
+        subscription.close()
+
+    assert response.status_code == 503
+    assert response.headers['Retry-After']
+    assert events.broker.subscriber_count == 0
@@ -0,0 +1,67 @@
+import csv
+import io
+import sys
+from pathlib import Path
+
+import pytest
+
+import exporter
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'tools'))
+import export_data  # noqa: E402
+
+
+def _seed(client):
+    response = client.post('/api/batches', json={
+        'batch_number': 'B-EX', 'product_name': 'P', 'process_segment': 'GK', 'start_time': '2024-06-01 08:00:00'
+    })
+    batch_id = response.get_json()['id']
+    client.post(f'/api/batches/{batch_id}/equipment', json={
+        'equipment_code': 'GY940', 'equipment_name': 'GY940', 'start_time': '2024-06-01 08:30:00',
+        'parameters': {'powder': 52.5}
+    })
+    client.post(f'/api/batches/{batch_id}/quality', json={'test_item': '粒径D10', 'test_value': 12.5})
+
+
+def test_csv_export_streams_real_rows_and_logs(admin_client, temp_db):
+    _seed(admin_client)
+
+    response = admin_client.get(
+        '/api/export?batch_number=B-EX&columns=batch_number,test_value,equipment_param_powder&filename=结果'
+    )
+    assert response.status_code == 200
+    assert 'attachment' in response.headers['Content-Disposition']
+    rows = list(csv.reader(io.StringIO(response.get_data().decode('utf-8-sig'))))
+    assert rows == [['批号', '检测值', '功率'], ['B-EX', '12.5', '52.5']]
+
+    with temp_db.get_connection() as conn:
+        logged = conn.execute('SELECT file_size_bytes FROM export_logs').fetchall()
+    assert [row[0] for row in logged] == [len(response.get_data())]
+
+    assert admin_client.get('/api/export?format=xlsx').status_code == 400
+    assert admin_client.get('/api/export?columns=nope').status_code == 400
+
+
+def test_parquet_export_has_typed_flattened_columns(admin_client, temp_db):
+    pyarrow_parquet = pytest.importorskip('pyarrow.parquet')
+    _seed(admin_client)
+
+    buffer = io.BytesIO()
+    with temp_db.get_connection() as conn:
+        count = exporter.export_query(conn, {'batch_number': 'B-EX'}, 'parquet', buffer, chunk_size=1)
+    assert count == 1
+    buffer.seek(0)
+    table = pyarrow_parquet.read_table(buffer)
+    assert str(table.schema.field('equipment_param_powder').type) == 'double'
+    # Parquet 没有秒级时间戳，读回时为毫秒
+    assert str(table.schema.field('start_time').type).startswith('timestamp')
+    assert table.column('test_value').to_pylist() == [12.5]
+
+
+def test_export_cli_writes_csv(admin_client, temp_db, tmp_path, capsys):
+    _seed(admin_client)
+    output = tmp_path / 'out.csv'
+
+    assert export_data.main(['--db', temp_db.db_path, '--output', str(output),
+                             '--filter', 'test_item=粒径', '--columns', 'batch_number,test_item']) == 0
+    assert output.read_text(encoding='utf-8-sig').splitlines() == ['批号,检测项目', 'B-EX,粒径D10']
@@ -0,0 +1,131 @@
+import csv
+import gzip
+import io
+import os
+import time
+
+import pytest
+
+import config
+import export_jobs
+import maintenance
+
+
+@pytest.fixture
+def job_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, 'EXPORT_JOB_DIR', str(tmp_path / 'exports'))
+    return tmp_path / 'exports'
+
+
+def _wait_for(client, job_id, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = client.get(f'/api/export/jobs/{job_id}').get_json()
+        if job['status'] not in export_jobs.ACTIVE_STATUSES:
+            return job
+        time.sleep(0.02)
+    raise AssertionError('export job did not finish')
+
+
+def _seed(client, count):
+    response = client.post('/api/batches', json={'batch_number': 'B-JOB', 'product_name': 'P', 'process_segment': 'TJ'})
+    batch_id = response.get_json()['id']
+    for index in range(count):
+        client.post(f'/api/batches/{batch_id}/quality', json={'test_item': f'检测{index}', 'test_value': index})
+
+
+def test_export_job_writes_gzip_file_and_log(admin_client, temp_db, job_dir):
+    _seed(admin_client, 5)
+
+    response = admin_client.post('/api/export/jobs', json={
+        'params': {'batch_number': 'B-JOB', 'sort': 'test_value', 'order': 'asc'},
+        'columns': ['batch_number', 'test_value'], 'filename': '全年数据'
+    })
+    assert response.status_code == 202
+    job = _wait_for(admin_client, response.get_json()['id'])
+    assert job['status'] == 'completed'
+    assert job['rows_total'] == job['rows_written'] == 5
+    assert job['progress'] == 1.0
+
+    stored = list(job_dir.iterdir())
+    assert [path.suffix for path in stored] == ['.gz']
+    with gzip.open(stored[0], 'rt', encoding='utf-8-sig') as handle:
+        assert list(csv.reader(handle))[1] == ['B-JOB', '0']
+
+    compressed = admin_client.get(job['download_url'], headers={'Accept-Encoding': 'gzip'})
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    plain = admin_client.get(job['download_url'])
+    assert 'Content-Encoding' not in plain.headers
+    assert gzip.decompress(compressed.get_data()) == plain.get_data()
+    assert len(list(csv.reader(io.StringIO(plain.get_data().decode('utf-8-sig'))))) == 6
+
+    with temp_db.get_connection() as conn:
+        sizes = [row[0] for row in conn.execute('SELECT file_size_bytes FROM export_logs')]
+    assert sizes == [job['file_size_bytes']]
+
+
+def test_expired_jobs_remove_their_files(admin_client, temp_db, job_dir):
+    _seed(admin_client, 1)
+    read_id = admin_client.post('/api/export/jobs', json={'params': {}}).get_json()['id']
+    read_job = _wait_for(admin_client, read_id)
+    swept_id = admin_client.post('/api/export/jobs', json={'params': {}}).get_json()['id']
+    _wait_for(admin_client, swept_id)
+
+    with temp_db.get_connection() as conn:
+        conn.execute("UPDATE export_jobs SET expires_at = datetime('now', '-1 minute')")
+        conn.commit()
+    # 过期判断不依赖清理任务：读取时即返回 410
+    assert admin_client.get(read_job['download_url']).status_code == 410
+    assert admin_client.get(f'/api/export/jobs/{read_id}').get_json()['status'] == 'expired'
+    assert len(list(job_dir.iterdir())) == 1
+
+    # 其余文件由定期维护任务删除
+    results = maintenance.run_tasks(temp_db, ['expire_exports'])
+    assert results['expire_exports']['result'] == {'expired': 1, 'orphaned': 0}
+    assert list(job_dir.iterdir()) == []
+
+
+def test_jobs_with_stale_heartbeat_fail_even_if_pid_is_alive(admin_client, temp_db, job_dir):
+    with temp_db.get_connection() as conn:
+        # 本进程 pid 存活，模拟 pid 被其它进程复用的情况
+        for job_id, heartbeat in (('stale', '-10 minutes'), ('fresh', '-1 seconds')):
+            conn.execute(
+                f"""INSERT INTO export_jobs (id, format, params_json, status, worker_pid, heartbeat_at)
+                    VALUES (?, 'csv', '{{}}', 'running', ?, datetime('now', '{heartbeat}'))""",
+                (job_id, os.getpid())
+            )
+        conn.commit()
+
+    assert admin_client.get('/api/export/jobs/stale').get_json()['status'] == 'failed'
+    assert admin_client.get('/api/export/jobs/fresh').get_json()['status'] == 'running'
+
+    with temp_db.get_connection() as conn:
+        conn.execute("UPDATE export_jobs SET heartbeat_at = datetime('now', '-10 minutes') WHERE id = 'fresh'")
+        conn.commit()
+    assert export_jobs.fail_orphaned_jobs(temp_db) == 1
+    assert admin_client.get('/api/export/jobs/fresh').get_json()['status'] == 'failed'
+
+
+def test_progress_updates_are_throttled(monkeypatch):
+    writes = []
+
+    class RecordingDatabase:
+        def run_write(self, operation):
+            writes.append(operation)
+
+    monkeypatch.setattr(config, 'EXPORT_JOB_PROGRESS_INTERVAL', 60)
+    report = export_jobs._progress_reporter(RecordingDatabase(), 'job')
+    for written in range(0, 100000, 5000):
+        report(written)
+    assert writes == []
+
+    monkeypatch.setattr(config, 'EXPORT_JOB_PROGRESS_INTERVAL', 0)
+    report = export_jobs._progress_reporter(RecordingDatabase(), 'job')
+    report(5000)
+    assert len(writes) == 1
+
+
+def test_invalid_export_job_is_rejected(admin_client, job_dir):
+    assert admin_client.post('/api/export/jobs', json={'format': 'xlsx'}).status_code == 400
+    assert admin_client.post('/api/export/jobs', json={'params': {'sort': 'bogus'}}).status_code == 400
+    assert admin_client.get('/api/export/jobs/unknown').status_code == 404
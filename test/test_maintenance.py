@@ -0,0 +1,52 @@
+from datetime import datetime
+
+import pytest
+
+import config
+import maintenance
+
+
+def test_new_database_uses_incremental_vacuum(temp_db):
+    with temp_db.get_connection() as conn:
+        assert conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 2
+
+
+def test_run_tasks_reclaims_pages_and_records_last_run(admin_client, temp_db, tmp_path, monkeypatch):
+    monkeypatch.setattr(config, 'MAINTENANCE_VACUUM_PAGES', 0)
+    monkeypatch.setattr(config, 'UPLOAD_FOLDER', str(tmp_path / 'download'))
+    monkeypatch.setattr(config, 'ATTACHMENT_QUARANTINE_DIR', str(tmp_path / 'quarantine'))
+    response = admin_client.post('/api/batches', json={'batch_number': 'B-1', 'product_name': 'P', 'process_segment': 'TJ'})
+    batch_id = response.get_json()['id']
+    for index in range(200):
+        admin_client.post(f'/api/batches/{batch_id}/quality', json={'test_item': 'x' * 500, 'test_value': index})
+    assert admin_client.delete(f'/api/batches/{batch_id}').status_code == 200
+
+    payload = admin_client.post('/api/admin/maintenance', json={}).get_json()
+    results = payload['results']
+    assert set(results) == set(maintenance.TASK_NAMES)
+    assert all('error' not in record for record in results.values())
+    assert results['incremental_vacuum']['result']['freed_pages'] > 0
+    assert results['incremental_vacuum']['result']['free_pages_left'] == 0
+    assert payload['last_runs']['analyze']['seconds'] == results['analyze']['seconds']
+
+    with temp_db.get_connection() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM sqlite_master WHERE name = 'sqlite_stat1'").fetchone()[0] == 1
+
+
+def test_due_tasks_respect_intervals_and_window(temp_db, monkeypatch):
+    monkeypatch.setattr(config, 'MAINTENANCE_WINDOW', ('02:00', '05:00'))
+    monkeypatch.setattr(config, 'MAINTENANCE_WINDOW_TASKS', ('analyze',))
+    monkeypatch.setattr(config, 'MAINTENANCE_TASK_INTERVALS', {'checkpoint': 900, 'analyze': 3600, 'optimize': None})
+
+    assert maintenance.due_tasks(temp_db, datetime(2026, 1, 1, 12, 0)) == ['checkpoint']
+    assert maintenance.due_tasks(temp_db, datetime(2026, 1, 1, 3, 0)) == ['checkpoint', 'analyze']
+
+    maintenance.run_tasks(temp_db, ['checkpoint'])
+    assert maintenance.due_tasks(temp_db) in ([], ['analyze'])
+
+
+def test_unknown_task_is_rejected(admin_client):
+    response = admin_client.post('/api/admin/maintenance', json={'tasks': ['defrag']})
+    assert response.status_code == 400
+    with pytest.raises(maintenance.MaintenanceError):
+        maintenance.run_tasks(None, ['defrag'])
@@ -0,0 +1,33 @@
+import metrics
+
+
+def test_metrics_endpoint_reports_requests_and_sql(admin_client):
+    before = metrics.REQUEST_SQL_STATEMENTS.count('get_batches')
+    admin_client.post('/api/batches', json={'batch_number': 'B-MET', 'product_name': 'P', 'process_segment': 'TJ'})
+    admin_client.get('/api/batches')
+
+    assert metrics.REQUEST_SQL_STATEMENTS.count('get_batches') == before + 1
+    assert metrics.SQL_STATEMENTS.value('get_batches') > 0
+
+    response = admin_client.get('/api/admin/metrics')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    body = response.get_data(as_text=True)
+    assert 'minimes_http_requests_total{endpoint="get_batches",method="GET",status="200"}' in body
+    assert 'minimes_http_request_duration_seconds_bucket{endpoint="get_batches",method="GET",le="+Inf"}' in body
+    assert 'minimes_http_request_section_seconds_count{endpoint="get_batches",section="json"}' in body
+    assert '# TYPE minimes_sql_seconds_total counter' in body
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = metrics.Histogram('demo_seconds', 'demo', ('endpoint',), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 3.0):
+        histogram.observe(value, 'x')
+
+    lines = list(histogram.samples())
+    assert lines[:3] == [
+        'demo_seconds_bucket{endpoint="x",le="0.1"} 1',
+        'demo_seconds_bucket{endpoint="x",le="1"} 3',
+        'demo_seconds_bucket{endpoint="x",le="+Inf"} 4',
+    ]
+    assert lines[-1] == 'demo_seconds_count{endpoint="x"} 4'
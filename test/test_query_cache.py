@@ -0,0 +1,50 @@
+import query_cache
+
+
+def test_repeat_query_hits_cache_until_data_changes(admin_client):
+    query_cache.query_results.clear()
+    response = admin_client.post('/api/batches', json={'batch_number': 'B-QC', 'product_name': 'P', 'process_segment': 'TJ'})
+    batch_id = response.get_json()['id']
+
+    first = admin_client.get('/api/query?batch_number=B-QC&product_name=')
+    assert first.headers['X-Query-Cache'] == 'miss'
+
+    # 参数顺序与空值不影响缓存键
+    second = admin_client.get('/api/query?product_name=&batch_number=B-QC')
+    assert second.headers['X-Query-Cache'] == 'hit'
+    assert second.get_json() == first.get_json()
+
+    admin_client.post(f'/api/batches/{batch_id}/materials', json={
+        'material_code': 'M1', 'material_name': '原料', 'weight': 1
+    })
+    third = admin_client.get('/api/query?batch_number=B-QC')
+    assert third.headers['X-Query-Cache'] == 'miss'
+    assert third.get_json()[0]['material_code'] == 'M1'
+
+
+def test_whitespace_filter_does_not_hit_unfiltered_entry(admin_client):
+    query_cache.query_results.clear()
+    admin_client.post('/api/batches', json={'batch_number': 'B-WS', 'product_name': 'P', 'process_segment': 'TJ'})
+
+    unfiltered = admin_client.get('/api/query')
+    assert unfiltered.headers['X-Query-Cache'] == 'miss'
+    assert unfiltered.get_json()
+
+    # 处理函数按原值过滤（LIKE '% %'），缓存键不能把空白当作未填写
+    whitespace = admin_client.get('/api/query?batch_number=%20')
+    assert whitespace.headers['X-Query-Cache'] == 'miss'
+    assert whitespace.get_json() == []
+
+
+def test_cache_evicts_least_recently_used_within_memory_bound():
+    cache = query_cache.QueryResultCache(max_bytes=10, max_entry_bytes=8)
+    cache.put('a', 1, b'aaaa')
+    cache.put('b', 1, b'bbbb')
+    assert cache.get('a', 1) == b'aaaa'
+    cache.put('c', 1, b'cccc')
+
+    assert cache.get('b', 1) is None
+    assert cache.get('a', 1) == b'aaaa'
+    assert cache.size == 8
+    assert cache.put('d', 1, b'x' * 9) is False
+    assert cache.get('a', 2) is None
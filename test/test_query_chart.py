@@ -0,0 +1,47 @@
+import math
+
+import downsample
+
+
+def test_lttb_keeps_endpoints_and_peaks():
+    points = [(x, math.sin(x / 10.0)) for x in range(1000)]
+    points[437] = (437, 25.0)
+
+    sampled = downsample.lttb(points, 50)
+
+    assert len(sampled) == 50
+    assert sampled[0] == points[0] and sampled[-1] == points[-1]
+    assert (437, 25.0) in sampled
+    assert [point[0] for point in sampled] == sorted(point[0] for point in sampled)
+    assert downsample.lttb(points[:10], 50) == points[:10]
+
+
+def _seed(client, count):
+    response = client.post('/api/batches', json={'batch_number': 'B-CH', 'product_name': 'P', 'process_segment': 'TJ'})
+    batch_id = response.get_json()['id']
+    for index in range(count):
+        client.post(f'/api/batches/{batch_id}/quality', json={
+            'test_item': f'检测{index}', 'test_value': index, 'standard_min': 0, 'standard_max': 100
+        })
+
+
+def test_chart_endpoint_downsamples_series(admin_client):
+    _seed(admin_client, 40)
+
+    meta = admin_client.get('/api/query/chart').get_json()['columns']
+    assert meta['test_value']['type'] == 'number'
+    assert meta['start_time']['type'] == 'datetime'
+
+    data = admin_client.get('/api/query/chart?x=test_value&y=test_value&y=standard_max&points=10').get_json()
+    assert data['total'] == 40
+    series = {item['key']: item for item in data['series']}
+    assert series['test_value']['count'] == 40
+    assert len(series['test_value']['points']) == 10
+    assert series['test_value']['points'][0] == [0.0, 0.0]
+    assert series['test_value']['points'][-1] == [39.0, 39.0]
+
+    text_axis = admin_client.get('/api/query/chart?x=test_item&y=test_value&points=5').get_json()
+    assert set(text_axis['labels']) == {str(int(x)) for x, _ in text_axis['series'][0]['points']}
+
+    assert admin_client.get('/api/query/chart?x=test_value&y=test_item').status_code == 400
+    assert admin_client.get('/api/query/chart?x=unknown&y=test_value').status_code == 400
@@ -0,0 +1,43 @@
+import json
+
+from database import EXTRA_FIELD_INDEX_PREFIX
+
+
+def _seed_quality(database, values):
+    with database.get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "INSERT INTO batches (batch_number, product_name, process_segment, created_by) VALUES ('B1', 'P1', 'TJ', 1)"
+        )
+        batch_id = cursor.lastrowid
+        for inspector, value in values:
+            cursor.execute(
+                '''INSERT INTO quality_records (batch_id, test_item, test_value, tested_by, attributes_json)
+                   VALUES (?, 'D10', ?, 1, ?)''',
+                (batch_id, value, json.dumps({'inspector': inspector, 'method': 'laser'}))
+            )
+
+
+def test_extra_indexes_created_for_declared_fields(temp_db):
+    with temp_db.get_connection() as conn:
+        names = {
+            row[0] for row in conn.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'index' AND name LIKE ?",
+                (f'{EXTRA_FIELD_INDEX_PREFIX}%',)
+            )
+        }
+    assert f'{EXTRA_FIELD_INDEX_PREFIX}quality_records_inspector' in names
+    assert f'{EXTRA_FIELD_INDEX_PREFIX}material_records_moisture' in names
+
+
+def test_query_filters_and_sorts_on_extras(admin_client, temp_db):
+    _seed_quality(temp_db, [('张三', 1.0), ('李四', 2.0), ('张三', 3.0)])
+
+    response = admin_client.get('/api/query?quality_inspector=张三&sort=quality_inspector&order=asc')
+    assert response.status_code == 200
+    rows = response.get_json()
+    assert sorted(row['test_value'] for row in rows) == [1.0, 3.0]
+    assert all(row['quality_inspector'] == '张三' for row in rows)
+
+    response = admin_client.get('/api/query?sort=unknown')
+    assert response.status_code == 400
@@ -0,0 +1,36 @@
+def _seed_batches(client, count):
+    for index in range(count):
+        response = client.post('/api/batches', json={
+            'batch_number': f'B-PG{index:02d}', 'product_name': 'P', 'process_segment': 'TJ',
+            'start_time': f'2024-06-{index + 1:02d} 08:00:00'
+        })
+        batch_id = response.get_json()['id']
+        client.post(f'/api/batches/{batch_id}/quality', json={'test_item': f'检测{index}', 'test_value': index % 4})
+
+
+def test_query_pages_sort_and_search_in_sql(admin_client):
+    _seed_batches(admin_client, 7)
+
+    first = admin_client.get('/api/query?page=1&page_size=3&sort=batch_number&order=asc').get_json()
+    assert first['total'] == 7
+    assert first['page_size'] == 3
+    assert [row['batch_number'] for row in first['rows']] == ['B-PG00', 'B-PG01', 'B-PG02']
+
+    last = admin_client.get('/api/query?page=3&page_size=3&sort=batch_number&order=asc').get_json()
+    assert [row['batch_number'] for row in last['rows']] == ['B-PG06']
+
+    by_value = admin_client.get('/api/query?page=1&page_size=10&sort=test_value&order=desc').get_json()
+    assert [row['test_value'] for row in by_value['rows']][:3] == [3, 2, 2]
+
+    searched = admin_client.get('/api/query?page=1&page_size=10&q=检测5').get_json()
+    assert searched['total'] == 1
+    assert searched['rows'][0]['batch_number'] == 'B-PG05'
+
+    # 不带分页参数时保持原有的列表响应
+    assert len(admin_client.get('/api/query').get_json()) == 7
+
+
+def test_query_rejects_invalid_paging(admin_client):
+    assert admin_client.get('/api/query?page=0').status_code == 400
+    assert admin_client.get('/api/query?page_size=abc').status_code == 400
+    assert admin_client.get('/api/query?min_value=abc').status_code == 400
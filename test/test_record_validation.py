@@ -0,0 +1,70 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+import config
+import record_validation
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'tools'))
+import generate_dataset  # noqa: E402
+
+
+def test_validator_converts_columns_and_extras():
+    validator = record_validation.material_validator()
+    columns, extras, errors = validator({
+        'material_code': ' M1 ',
+        'material_name': '原料',
+        'weight': '12.5',
+        'moisture': '0.3',
+        'extras': {'custom': 'x'}
+    })
+    assert errors == []
+    assert columns['material_code'] == 'M1'
+    assert columns['weight'] == 12.5
+    assert columns['unit'] == 'kg'
+    assert extras == {'moisture': 0.3, 'custom': 'x'}
+
+
+def test_validator_reports_errors_in_field_order():
+    validator = record_validation.equipment_validator()
+    _, _, errors = validator({'equipment_code': 'E1', 'status': '未知', 'temperature': 'hot'})
+    assert errors == [
+        '设备名称 为必填项',
+        '开始时间 为必填项',
+        "状态 的取值必须在 ['正常运行', '故障', '维护'] 中",
+        '温度 需要为数值类型'
+    ]
+
+
+def test_validate_many_matches_single_validation():
+    validator = record_validation.quality_validator()
+    payloads = [
+        {'test_item': 'D10', 'test_value': '1.5', 'inspector': '张三'},
+        {'test_item': '', 'test_value': 'abc'},
+        None
+    ]
+    assert validator.validate_many(payloads) == [validator(payload) for payload in payloads]
+
+
+def test_bulk_load_rows_go_through_validate_many():
+    validator = record_validation.material_validator()
+    rows = [
+        (1, ' M1 ', '原料', '2.5', None, None, 'L1', '2024-01-01 08:00:00', 1, '{"moisture": "0.3"}'),
+    ]
+    assert generate_dataset.validate_rows(validator, generate_dataset.MATERIAL_COLUMNS, rows, 'attributes_json') == [
+        (1, 'M1', '原料', 2.5, 'kg', None, 'L1', '2024-01-01 08:00:00', 1, '{"moisture": 0.3}'),
+    ]
+
+    invalid = [(1, 'M1', '原料', 'heavy', 'kg', None, 'L1', '2024-01-01 08:00:00', 1, '{}')]
+    with pytest.raises(ValueError, match='重量 需要为数值类型'):
+        generate_dataset.validate_rows(validator, generate_dataset.MATERIAL_COLUMNS, invalid, 'attributes_json')
+
+
+def test_validator_recompiled_when_config_replaced(monkeypatch):
+    first = record_validation.quality_validator()
+    replaced = dict(config.QUALITY_RECORD_FIELDS, extras=[])
+    monkeypatch.setattr(config, 'QUALITY_RECORD_FIELDS', replaced)
+    second = record_validation.quality_validator()
+    assert second is not first
+    assert second.extra_keys == ()
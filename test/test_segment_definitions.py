@@ -0,0 +1,38 @@
+import json
+
+import pytest
+
+import config
+
+
+@pytest.fixture
+def fields_config(tmp_path, monkeypatch):
+    path = tmp_path / "fields_config.json"
+    path.write_text(json.dumps({
+        "process_segments": ["TJ", "GK"],
+        "materials": [
+            {"code": "ALL", "segments": ["*"]},
+            {"code": "GK-only", "segments": ["GK"]},
+            {"code": "G-glob", "segments": ["G?"]}
+        ],
+        "equipment": [{"code": "EQ", "segments": []}],
+        "quality": []
+    }), encoding="utf-8")
+    monkeypatch.setattr(config, 'FIELDS_CONFIG_PATH', str(path))
+    monkeypatch.setattr(config, '_FIELDS_CONFIG_CACHE', None)
+    monkeypatch.setattr(config, '_SEGMENT_INDEX', None)
+    return path
+
+
+def test_segment_definitions_match_patterns(fields_config):
+    codes = [item['code'] for item in config.get_material_definitions('GK')]
+    assert codes == ['ALL', 'GK-only', 'G-glob']
+    assert [item['code'] for item in config.get_material_definitions('TJ')] == ['ALL']
+    assert len(config.get_equipment_definitions('TJ')) == 1
+
+
+def test_segment_definitions_are_shared_and_read_only(fields_config):
+    first = config.get_segment_definitions('GK')
+    assert config.get_segment_definitions('GK') is first
+    with pytest.raises(TypeError):
+        first['materials'][0]['code'] = 'changed'
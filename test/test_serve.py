@@ -0,0 +1,61 @@
+import json
+import socket
+import threading
+import time
+import urllib.request
+
+import config
+import serve
+
+
+def test_read_worker_states_flags_stale_workers(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, 'SERVER_HEARTBEAT_TIMEOUT', 30)
+    now = time.time()
+    (tmp_path / 'worker-1.json').write_text(json.dumps({'pid': 1, 'heartbeat': now}))
+    (tmp_path / 'worker-2.json').write_text(json.dumps({'pid': 2, 'heartbeat': now - 120}))
+    (tmp_path / 'unrelated.txt').write_text('x')
+
+    states = {state['pid']: state for state in serve.read_worker_states(str(tmp_path))}
+    assert set(states) == {1, 2}
+    assert states[1]['healthy'] is True
+    assert states[2]['healthy'] is False
+
+
+def test_worker_status_endpoint(admin_client, tmp_path, monkeypatch):
+    monkeypatch.setattr(config, 'SERVER_STATE_DIR', str(tmp_path))
+    (tmp_path / 'worker-7.json').write_text(json.dumps({'pid': 7, 'heartbeat': time.time()}))
+
+    payload = admin_client.get('/api/admin/workers').get_json()
+    assert payload['healthy'] == 1
+    assert admin_client.get('/api/health').get_json()['status'] == 'ok'
+
+
+def test_streaming_requests_do_not_hold_pool_threads():
+    release = threading.Event()
+
+    def app(environ, start_response):
+        if environ['PATH_INFO'] == '/api/events':
+            start_response('200 OK', [('Content-Type', 'text/event-stream')])
+
+            def stream():
+                yield b'retry: 3000\n\n'
+                release.wait(5)
+            return stream()
+        start_response('200 OK', [('Content-Type', 'text/plain')])
+        return [b'ok']
+
+    # 只有一个请求线程：事件流若占用它，后续请求将无法处理
+    httpd = serve.PooledWSGIServer('127.0.0.1', 0, app, threads=1)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    port = httpd.server_address[1]
+    stream = socket.create_connection(('127.0.0.1', port), timeout=5)
+    try:
+        stream.sendall(b'GET /api/events HTTP/1.1\r\nHost: localhost\r\n\r\n')
+        assert stream.recv(1024).startswith(b'HTTP/1.1 200')
+        with urllib.request.urlopen(f'http://127.0.0.1:{port}/api/health', timeout=5) as response:
+            assert response.read() == b'ok'
+    finally:
+        release.set()
+        stream.close()
+        httpd.shutdown()
+        httpd.drain()
@@ -0,0 +1,26 @@
+import config
+import slow_queries
+
+
+def test_normalize_sql_groups_literal_variants():
+    assert slow_queries.normalize_sql(
+        "SELECT *  FROM batches\n WHERE id IN (?, ?, ?) AND batch_number = 'B-1' AND weight > 2.5"
+    ) == 'SELECT * FROM batches WHERE id IN (...) AND batch_number = ? AND weight > ?'
+
+
+def test_slow_statements_are_logged_with_plan(admin_client, tmp_path, monkeypatch):
+    monkeypatch.setattr(config, 'SLOW_QUERY_THRESHOLD_MS', 0.000001)
+    monkeypatch.setattr(config, 'SLOW_QUERY_LOG_PATH', str(tmp_path / 'slow.log'))
+    monkeypatch.setattr(slow_queries, '_logger', None)
+    slow_queries.clear()
+
+    admin_client.get('/api/query?material_code=M1')
+
+    response = admin_client.get('/api/admin/slow_queries')
+    entries = [entry for entry in response.get_json()['entries'] if entry['endpoint'] == 'query_data']
+    assert entries
+    entry = [entry for entry in entries if 'material_code LIKE' in entry['sql']][-1]
+    assert entry['sql'].startswith('SELECT')
+    assert '%M1%' in entry['params'] or 'M1' in entry['params']
+    assert any(step.startswith(('SCAN', 'SEARCH')) for step in entry['plan'])
+    assert (tmp_path / 'slow.log').read_text(encoding='utf-8').count('"query_data"') >= 1
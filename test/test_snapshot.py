@@ -0,0 +1,81 @@
+import os
+import time
+
+import pytest
+
+import config
+import query_cache
+import snapshot
+
+
+@pytest.fixture
+def analytics_snapshot(temp_db, tmp_path, monkeypatch):
+    monkeypatch.setattr(config, 'ANALYTICS_SNAPSHOT_PATH', str(tmp_path / 'snapshot' / 'analytics.db'))
+    # 测试中手动刷新，不启动后台线程
+    monkeypatch.setattr(snapshot.Snapshot, 'ensure_scheduler', lambda self: None)
+    # 各测试库的变更序号相同，避免命中其它测试缓存的结果
+    query_cache.query_results.clear()
+    return snapshot.get_snapshot(temp_db)
+
+
+def _create_batch(client, number):
+    response = client.post('/api/batches', json={'batch_number': number, 'product_name': 'P', 'process_segment': 'TJ'})
+    assert response.status_code == 201
+
+
+def test_refresh_copies_only_when_data_changed(admin_client, temp_db, analytics_snapshot):
+    assert analytics_snapshot.metadata() is None
+    assert analytics_snapshot.refresh() is True
+    first = analytics_snapshot.metadata()
+    assert analytics_snapshot.refresh() is False
+    assert analytics_snapshot.staleness() < 5
+
+    _create_batch(admin_client, 'B-SNAP')
+    assert analytics_snapshot.refresh() is True
+    second = analytics_snapshot.metadata()
+    assert second['change_seq'] > first['change_seq']
+    with analytics_snapshot.get_connection() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM batches WHERE batch_number = 'B-SNAP'").fetchone()[0] == 1
+    assert not [name for name in os.listdir(os.path.dirname(analytics_snapshot.path)) if name.endswith('.part')]
+
+
+def test_query_reads_snapshot_when_enabled(admin_client, analytics_snapshot, monkeypatch):
+    _create_batch(admin_client, 'B-OLD')
+    analytics_snapshot.refresh()
+    _create_batch(admin_client, 'B-NEW')
+
+    response = admin_client.get('/api/query')
+    assert response.headers['X-Data-Source'] == 'primary'
+
+    monkeypatch.setattr(config, 'ANALYTICS_SNAPSHOT_ENABLED', True)
+    response = admin_client.get('/api/query')
+    assert response.headers['X-Data-Source'] == 'snapshot'
+    assert int(response.headers['X-Data-Staleness']) < 5
+    assert response.headers['X-Snapshot-Taken-At'].endswith('Z')
+    assert {row['batch_number'] for row in response.get_json()} == {'B-OLD'}
+
+    dashboard = admin_client.get('/api/dashboard/data')
+    assert dashboard.headers['X-Data-Source'] == 'snapshot'
+
+
+def test_stale_snapshot_falls_back_to_primary(admin_client, analytics_snapshot, monkeypatch):
+    analytics_snapshot.refresh()
+    _create_batch(admin_client, 'B-NEW')
+    monkeypatch.setattr(config, 'ANALYTICS_SNAPSHOT_ENABLED', True)
+    monkeypatch.setattr(config, 'ANALYTICS_SNAPSHOT_MAX_STALENESS', 60)
+    monkeypatch.setattr(analytics_snapshot, 'staleness', lambda: 120.0)
+
+    response = admin_client.get('/api/query')
+    assert response.headers['X-Data-Source'] == 'primary'
+    assert [row['batch_number'] for row in response.get_json()] == ['B-NEW']
+
+
+def test_admin_snapshot_endpoint_refreshes(admin_client, analytics_snapshot):
+    status = admin_client.get('/api/admin/snapshot').get_json()
+    assert status['exists'] is False
+
+    status = admin_client.post('/api/admin/snapshot').get_json()
+    assert status['refreshed'] is True
+    assert status['exists'] is True
+    assert status['staleness_seconds'] < 5
+    assert time.time() - analytics_snapshot.metadata()['taken_at'] < 5
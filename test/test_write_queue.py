@@ -0,0 +1,94 @@
+import sqlite3
+import threading
+
+import pytest
+
+import config
+import write_queue
+
+
+@pytest.fixture
+def slow_window(monkeypatch):
+    # 放宽合并窗口，保证测试中的写操作落在同一组
+    monkeypatch.setattr(config, 'WRITE_QUEUE_WINDOW_MS', 200)
+
+
+def _insert_batch(number):
+    def operation(conn):
+        return conn.execute(
+            "INSERT INTO batches (batch_number, product_name, process_segment, created_by) VALUES (?, 'P', 'TJ', 1)",
+            (number,)
+        ).lastrowid
+    return operation
+
+
+def test_group_commit_isolates_failing_operation(temp_db, slow_window):
+    def failing(conn):
+        _insert_batch('B-FAIL')(conn)
+        raise ValueError('rejected')
+
+    groups_before = write_queue.GROUP_SIZE.count()
+    queue = temp_db._write_queue
+    futures = [
+        queue.submit(_insert_batch('B-1')),
+        queue.submit(failing),
+        queue.submit(_insert_batch('B-2')),
+    ]
+
+    assert futures[0].result(5) > 0
+    with pytest.raises(ValueError):
+        futures[1].result(5)
+    assert futures[2].result(5) > futures[0].result()
+    assert write_queue.GROUP_SIZE.count() == groups_before + 1
+
+    with temp_db.get_connection() as conn:
+        numbers = [row[0] for row in conn.execute('SELECT batch_number FROM batches ORDER BY id')]
+    assert numbers == ['B-1', 'B-2']
+
+
+def test_group_failure_reaches_every_caller(temp_db, slow_window, monkeypatch):
+    # 写锁被其他连接占用时 BEGIN IMMEDIATE 失败，整组都应立即收到该异常
+    monkeypatch.setattr(config, 'DATABASE_BUSY_TIMEOUT', 0.1)
+    blocker = temp_db.get_connection()
+    blocker.isolation_level = None
+    blocker.execute('BEGIN IMMEDIATE')
+    try:
+        queue = temp_db._write_queue
+        futures = [queue.submit(_insert_batch(f'B-LOCK-{index}')) for index in range(3)]
+        for future in futures:
+            with pytest.raises(sqlite3.OperationalError, match='locked'):
+                future.result(5)
+    finally:
+        blocker.execute('ROLLBACK')
+        blocker.close()
+
+    assert temp_db.run_write(_insert_batch('B-AFTER')) > 0
+
+
+def test_nested_write_runs_inline(temp_db):
+    def outer(conn):
+        return temp_db.run_write(_insert_batch('B-NESTED'))
+
+    assert temp_db.run_write(outer) > 0
+
+
+def test_concurrent_record_writes(admin_client, temp_db):
+    response = admin_client.post('/api/batches', json={'batch_number': 'B-W', 'product_name': 'P', 'process_segment': 'TJ'})
+    batch_id = response.get_json()['id']
+
+    statuses = []
+
+    def write(index):
+        statuses.append(admin_client.post(f'/api/batches/{batch_id}/quality', json={
+            'test_item': f'检测{index}', 'test_value': index
+        }).status_code)
+
+    threads = [threading.Thread(target=write, args=(index,)) for index in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert statuses == [201] * 16
+    with temp_db.get_connection() as conn:
+        assert conn.execute('SELECT COUNT(*) FROM quality_records WHERE batch_id = ?', (batch_id,)).fetchone()[0] == 16
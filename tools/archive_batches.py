@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""Move closed batch groups into the per-period archive databases.
+
+See ``archive.py``.  Typical monthly run::
+
+    python tools/archive_batches.py --months 12
+
+``--dry-run`` only reports what would be archived; ``--list`` prints the
+existing archive files.
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+from contextlib import closing
+from pathlib import Path
+from typing import List, Optional
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+import archive  # noqa: E402
+import config  # noqa: E402
+from database import Database  # noqa: E402
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Archive closed MiniMES batch groups")
+    parser.add_argument("--db", default=config.DATABASE, help="hot SQLite file (default: production database)")
+    parser.add_argument("--months", type=int, default=None,
+                        help=f"archive groups finished more than N months ago (default: {config.ARCHIVE_AFTER_MONTHS})")
+    parser.add_argument("--dry-run", action="store_true", help="only report what would be archived")
+    parser.add_argument("--list", action="store_true", help="print the archive index and exit")
+    args = parser.parse_args(argv)
+
+    database = Database(args.db)
+    if args.list:
+        with closing(database.get_connection()) as conn:
+            for entry in archive.list_archives(conn):
+                print(f"{entry['period']}\t{entry['file_name']}\t{entry['min_start_date']}..{entry['max_start_date']}"
+                      f"\t{entry['batch_count']} batches")
+        return 0
+
+    started = time.perf_counter()
+    summary = archive.archive_batches(database, months=args.months, dry_run=args.dry_run)
+    verb = "would archive" if args.dry_run else "archived"
+    print(f"{verb} {summary['groups']} groups / {summary['batches']} batches / {summary['records']} records "
+          f"into {', '.join(summary['periods']) or 'no archives'} in {time.perf_counter() - started:.1f}s",
+          file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""Quarantine attachment files no record references (see ``attachment_gc.py``).
+
+    python tools/attachment_gc.py --dry-run     # report only
+    python tools/attachment_gc.py               # quarantine orphans, purge expired quarantine
+
+Quarantined files keep their relative path under
+``ATTACHMENT_QUARANTINE_DIR/<timestamp>/`` and can be moved back into
+``download/`` until they are purged after ``ATTACHMENT_QUARANTINE_DAYS``.
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+from pathlib import Path
+from typing import List, Optional
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+import attachment_gc  # noqa: E402
+import config  # noqa: E402
+from database import Database  # noqa: E402
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Clean up orphaned MiniMES attachment files")
+    parser.add_argument("--db", default=config.DATABASE, help="SQLite file (default: production database)")
+    parser.add_argument("--root", default=config.UPLOAD_FOLDER, help="attachment directory (default: download/)")
+    parser.add_argument("--dry-run", action="store_true", help="only report what would be quarantined or purged")
+    parser.add_argument("--min-age", type=int, default=None,
+                        help=f"skip files newer than N seconds (default: {config.ATTACHMENT_GC_MIN_AGE})")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    database = Database(args.db)
+    summary = attachment_gc.collect(database, args.root, dry_run=args.dry_run, min_age=args.min_age)
+    summary.update(attachment_gc.purge_quarantine(dry_run=args.dry_run))
+    verb = "would quarantine" if args.dry_run else "quarantined"
+    print(f"scanned {summary['scanned_files']} files: {summary['referenced_files']} referenced, "
+          f"{summary['recent_files']} too recent, {summary['missing_files']} references without file", file=sys.stderr)
+    print(f"{verb} {summary['orphaned_files']} orphaned files ({summary['orphaned_bytes']} bytes)"
+          + (f" into {summary['quarantine_dir']}" if summary['quarantined_files'] else ""), file=sys.stderr)
+    print(f"{'would purge' if args.dry_run else 'purged'} {summary['purged_files']} expired quarantined files, "
+          f"reclaimed {summary['reclaimed_bytes']} bytes in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
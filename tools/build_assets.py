@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+"""Build fingerprinted, minified and precompressed static assets.
+
+Every ``static/js/*.js`` and ``static/css/*.css`` file is minified
+conservatively (comments, indentation and blank lines only; statements and
+line breaks are kept so automatic semicolon insertion is unaffected), named
+after its content hash and written to ``static/dist`` together with ``.gz``
+and, if the ``brotli`` package is installed, ``.br`` siblings.  The mapping
+from source path to built file is stored in ``static/dist/manifest.json``,
+which the templates read through ``asset_url()``.
+
+The manifest is swapped in only after all new files exist.  Files of earlier
+builds stay in place, so pages already served with the old hashes keep
+loading, and are recorded in ``retired.json`` with the time they stopped
+being referenced; they are deleted once ``ASSET_RETIRED_GRACE_HOURS`` have
+passed, or right away with ``--prune``.
+
+Run after changing any script or stylesheet::
+
+    python tools/build_assets.py [--prune]
+"""
+
+from __future__ import annotations
+
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+try:
+    import brotli
+except ImportError:  # 可选依赖
+    brotli = None
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+import config  # noqa: E402
+
+SOURCE_PATTERNS = ("js/*.js", "css/*.css")
+HASH_LENGTH = 10
+
+# 出现在这些字符之后的 "/" 视为正则字面量的开始，而不是除号
+_REGEX_PRECEDERS = set("(,=:[!&|?{};+-*%<>~^")
+_REGEX_KEYWORDS = ("return", "typeof", "case", "do", "else", "in", "of", "void", "yield", "await")
+
+
+def _previous_token_allows_regex(out: List[str]) -> bool:
+    text = "".join(out[-16:]).rstrip()
+    if not text:
+        return True
+    if text[-1] in _REGEX_PRECEDERS:
+        return True
+    return any(
+        text.endswith(keyword) and (len(text) == len(keyword) or not (text[-len(keyword) - 1].isalnum() or text[-len(keyword) - 1] in "_$"))
+        for keyword in _REGEX_KEYWORDS
+    )
+
+
+def minify_js(source: str) -> str:
+    """Strip comments, indentation and blank lines outside of literals."""
+    out: List[str] = []
+    # 模板字符串中 ${...} 的嵌套：栈中记录每层表达式内未闭合的花括号数
+    template_stack: List[int] = []
+    in_template = False
+    i = 0
+    length = len(source)
+    at_line_start = True
+
+    while i < length:
+        ch = source[i]
+
+        if in_template:
+            out.append(ch)
+            if ch == "\\" and i + 1 < length:
+                out.append(source[i + 1])
+                i += 2
+                continue
+            if ch == "`":
+                in_template = False
+            elif ch == "$" and i + 1 < length and source[i + 1] == "{":
+                out.append("{")
+                template_stack.append(0)
+                in_template = False
+                i += 2
+                continue
+            i += 1
+            continue
+
+        if at_line_start and ch in " \t":
+            i += 1
+            continue
+
+        if ch == "\n":
+            while out and out[-1] in " \t":
+                out.pop()
+            if out and out[-1] != "\n":
+                out.append("\n")
+            at_line_start = True
+            i += 1
+            continue
+
+        at_line_start = False
+
+        if ch in "'\"":
+            end = i + 1
+            while end < length and source[end] != ch and source[end] != "\n":
+                end += 2 if source[end] == "\\" else 1
+            out.append(source[i:end + 1])
+            i = end + 1
+            continue
+
+        if ch == "`":
+            out.append(ch)
+            in_template = True
+            i += 1
+            continue
+
+        if ch == "/" and i + 1 < length:
+            nxt = source[i + 1]
+            if nxt == "/":
+                end = source.find("\n", i)
+                i = length if end == -1 else end
+                continue
+            if nxt == "*":
+                end = source.find("*/", i + 2)
+                end = length if end == -1 else end + 2
+                spans_lines = "\n" in source[i:end]
+                i = end
+                if spans_lines:
+                    if out and out[-1] != "\n":
+                        out.append("\n")
+                        at_line_start = True
+                elif out and out[-1] not in " \n":
+                    out.append(" ")
+                continue
+            if _previous_token_allows_regex(out):
+                end = i + 1
+                in_class = False
+                while end < length and source[end] != "\n":
+                    c = source[end]
+                    if c == "\\":
+                        end += 2
+                        continue
+                    if c == "[":
+                        in_class = True
+                    elif c == "]":
+                        in_class = False
+                    elif c == "/" and not in_class:
+                        break
+                    end += 1
+                out.append(source[i:end + 1])
+                i = end + 1
+                continue
+
+        if template_stack:
+            if ch == "{":
+                template_stack[-1] += 1
+            elif ch == "}":
+                if template_stack[-1] == 0:
+                    template_stack.pop()
+                    out.append(ch)
+                    in_template = True
+                    i += 1
+                    continue
+                template_stack[-1] -= 1
+
+        out.append(ch)
+        i += 1
+
+    return "".join(out).strip() + "\n"
+
+
+def minify_css(source: str) -> str:
+    """Remove comments and collapse whitespace outside of strings."""
+    out: List[str] = []
+    i = 0
+    length = len(source)
+    pending_space = False
+
+    while i < length:
+        ch = source[i]
+        if ch == "/" and source.startswith("/*", i):
+            end = source.find("*/", i + 2)
+            i = length if end == -1 else end + 2
+            pending_space = True
+            continue
+        if ch in " \t\r\n\f":
+            pending_space = True
+            i += 1
+            continue
+        if ch in "'\"":
+            end = i + 1
+            while end < length and source[end] != ch:
+                end += 2 if source[end] == "\\" else 1
+            token = source[i:end + 1]
+            i = end + 1
+        else:
+            token = ch
+            i += 1
+
+        if pending_space and out and out[-1] not in "{};," and token not in "{};,":
+            out.append(" ")
+        pending_space = False
+        if token == "}" and out and out[-1] == ";":
+            out.pop()
+        out.append(token)
+
+    return "".join(out).strip() + "\n"
+
+
+MINIFIERS = {".js": minify_js, ".css": minify_css}
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()[:HASH_LENGTH]
+
+
+def iter_sources(static_dir: Path) -> Iterable[Path]:
+    for pattern in SOURCE_PATTERNS:
+        yield from sorted(static_dir.glob(pattern))
+
+
+def _write_json_atomic(path: Path, data) -> None:
+    tmp_path = path.with_suffix(".json.tmp")
+    tmp_path.write_text(json.dumps(data, indent=2, sort_keys=True), encoding="utf-8")
+    os.replace(tmp_path, path)
+
+
+def retire_stale(dist_dir: Path, produced: Iterable[str], grace_seconds: float,
+                 now: Optional[float] = None) -> List[str]:
+    """Track files the current build no longer uses; delete those retired for ``grace_seconds``.
+
+    Returns the relative paths that were deleted.
+    """
+    now = time.time() if now is None else now
+    produced = set(produced) | {"manifest.json", "retired.json"}
+    retired_path = dist_dir / "retired.json"
+    try:
+        retired: Dict[str, float] = json.loads(retired_path.read_text(encoding="utf-8"))
+    except (FileNotFoundError, ValueError):
+        retired = {}
+
+    current: Dict[str, float] = {}
+    removed = []
+    for path in sorted(dist_dir.rglob("*")):
+        relative = path.relative_to(dist_dir).as_posix()
+        if not path.is_file() or relative in produced or relative.endswith(".json.tmp"):
+            continue
+        retired_at = retired.get(relative, now)
+        if now - retired_at >= grace_seconds:
+            path.unlink()
+            removed.append(relative)
+        else:
+            current[relative] = retired_at
+    _write_json_atomic(retired_path, current)
+    return removed
+
+
+def build(static_dir: Path, dist_dir: Path, minify: bool = True, prune: bool = False,
+          grace_seconds: Optional[float] = None) -> Dict[str, str]:
+    """Build the assets and swap in the new manifest, then retire the files of earlier builds.
+
+    ``prune`` deletes every file the new manifest does not reference instead
+    of keeping it for ``grace_seconds`` (default ``ASSET_RETIRED_GRACE_HOURS``).
+    """
+    dist_dir.mkdir(parents=True, exist_ok=True)
+    manifest: Dict[str, str] = {}
+    produced = set()
+
+    for source in iter_sources(static_dir):
+        relative = source.relative_to(static_dir).as_posix()
+        text = source.read_text(encoding="utf-8")
+        if minify:
+            text = MINIFIERS[source.suffix](text)
+        data = text.encode("utf-8")
+
+        hashed = f"{Path(relative).with_suffix('').as_posix()}.{content_hash(data)}{source.suffix}"
+        target = dist_dir / hashed
+        target.parent.mkdir(parents=True, exist_ok=True)
+        if not target.exists():
+            target.write_bytes(data)
+            # mtime=0 使相同内容的构建结果逐字节一致
+            target.with_name(target.name + ".gz").write_bytes(gzip.compress(data, compresslevel=9, mtime=0))
+            if brotli is not None:
+                target.with_name(target.name + ".br").write_bytes(brotli.compress(data, quality=11))
+
+        produced.update({hashed, hashed + ".gz", hashed + ".br"})
+        manifest[relative] = hashed
+        print(f"{relative:<24} {source.stat().st_size:>8} -> {len(data):>8}  {hashed}")
+
+    # 新文件全部就绪后再切换清单，切换前线上清单引用的旧文件始终存在
+    _write_json_atomic(dist_dir / "manifest.json", manifest)
+
+    # 旧指纹文件保留一段时间，已按旧清单渲染的页面仍可加载
+    if grace_seconds is None:
+        grace_seconds = getattr(config, "ASSET_RETIRED_GRACE_HOURS", 7 * 24) * 3600
+    for relative in retire_stale(dist_dir, produced, 0 if prune else grace_seconds):
+        print(f"removed {relative}")
+    return manifest
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Build fingerprinted static assets into static/dist")
+    parser.add_argument("--static-dir", type=Path, default=Path(config.STATIC_DIR))
+    parser.add_argument("--dist-dir", type=Path, default=Path(config.ASSET_DIST_DIR))
+    parser.add_argument("--no-minify", dest="minify", action="store_false",
+                        help="only fingerprint and precompress the files")
+    parser.add_argument("--prune", action="store_true",
+                        help="delete files of earlier builds now instead of after ASSET_RETIRED_GRACE_HOURS")
+    args = parser.parse_args(argv)
+
+    manifest = build(args.static_dir, args.dist_dir, minify=args.minify, prune=args.prune)
+    print(f"{len(manifest)} assets written to {args.dist_dir}")
+    if brotli is None:
+        print("brotli not installed; only .gz variants were generated")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""Run database maintenance tasks now (see ``maintenance.py``).
+
+Typical use from cron or after a large cleanup::
+
+    python tools/db_maintenance.py                      # all tasks
+    python tools/db_maintenance.py --task checkpoint --task optimize
+
+``--list`` prints the last run of every task;
+``--convert-incremental-vacuum`` switches an existing database to
+``auto_vacuum = INCREMENTAL`` with a full VACUUM (needs exclusive access
+and free disk space for a copy of the file; stop the server first).
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+from typing import List, Optional
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+import config  # noqa: E402
+import maintenance  # noqa: E402
+from database import Database  # noqa: E402
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Run MiniMES database maintenance")
+    parser.add_argument("--db", default=config.DATABASE, help="SQLite file (default: production database)")
+    parser.add_argument("--task", action="append", choices=maintenance.TASK_NAMES,
+                        help="task to run; repeat for several (default: all)")
+    parser.add_argument("--list", action="store_true", help="print the last run of every task and exit")
+    parser.add_argument("--convert-incremental-vacuum", action="store_true",
+                        help="switch the file to auto_vacuum=INCREMENTAL (full VACUUM)")
+    args = parser.parse_args(argv)
+
+    database = Database(args.db)
+    if args.list:
+        for name, last in maintenance.last_runs(database).items():
+            print(f"{name}\t{json.dumps(last, ensure_ascii=False) if last else 'never'}")
+        return 0
+
+    if args.convert_incremental_vacuum:
+        started = time.perf_counter()
+        converted = maintenance.convert_to_incremental_vacuum(database)
+        print(f"auto_vacuum={'INCREMENTAL' if converted else 'unchanged'} "
+              f"after VACUUM in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+        return 0 if converted else 1
+
+    try:
+        results = maintenance.run_tasks(database, args.task)
+    except maintenance.MaintenanceBusy as exc:
+        print(exc, file=sys.stderr)
+        return 2
+    failed = False
+    for name, record in results.items():
+        outcome = f"error: {record['error']}" if 'error' in record else json.dumps(record['result'], ensure_ascii=False)
+        failed = failed or 'error' in record
+        print(f"{name}\t{record['seconds']:.3f}s\t{outcome}", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""Export query results from the command line.
+
+Applies the same filters as ``/api/query`` and writes CSV, Parquet or Arrow
+IPC in chunks (see ``exporter.py``; Parquet/Arrow need ``pyarrow``)::
+
+    python tools/export_data.py --format parquet --output q1.parquet \\
+        --filter start_date=2024-01-01 --filter end_date=2024-03-31
+
+Filters use the ``/api/query`` parameter names (``product_name``,
+``process_segment``, ``test_item``, ``quality_<extra>`` ...); ``--output -``
+writes to stdout.
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+from contextlib import closing
+from pathlib import Path
+from typing import List, Optional
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+import config  # noqa: E402
+import exporter  # noqa: E402
+from database import Database  # noqa: E402
+
+
+def _parse_filters(values: List[str]) -> dict:
+    filters = {}
+    for value in values:
+        key, separator, raw = value.partition("=")
+        if not separator or not key.strip():
+            raise ValueError(f"invalid filter {value!r}; expected key=value")
+        filters[key.strip()] = raw
+    return filters
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Export MiniMES query results")
+    parser.add_argument("--db", default=config.DATABASE, help="SQLite file to read (default: production database)")
+    parser.add_argument("--format", choices=sorted(exporter.EXPORT_FORMATS), default="csv")
+    parser.add_argument("--output", required=True, help="output file, or - for stdout")
+    parser.add_argument("--filter", action="append", default=[], metavar="KEY=VALUE",
+                        help="query filter, repeatable (same names as /api/query)")
+    parser.add_argument("--columns", help="comma separated export columns (default: all)")
+    parser.add_argument("--chunk-size", type=int, default=None, help="rows per chunk / Parquet row group")
+    parser.add_argument("--list-columns", action="store_true", help="print the available columns and exit")
+    args = parser.parse_args(argv)
+
+    if args.list_columns:
+        for column in exporter.export_columns():
+            print(f"{column.name}\t{column.type}\t{column.label}")
+        return 0
+
+    try:
+        filters = _parse_filters(args.filter)
+    except ValueError as exc:
+        parser.error(str(exc))
+    selected = [name.strip() for name in args.columns.split(",") if name.strip()] if args.columns else None
+
+    database = Database(args.db)
+    started = time.perf_counter()
+    handle = sys.stdout.buffer if args.output == "-" else open(args.output, "wb")
+    try:
+        with closing(database.get_connection()) as conn:
+            rows = exporter.export_query(conn, filters, args.format, handle,
+                                         selected=selected, chunk_size=args.chunk_size)
+    except exporter.ExportError as exc:
+        print(f"error: {exc}", file=sys.stderr)
+        return 1
+    finally:
+        if handle is not sys.stdout.buffer:
+            handle.close()
+
+    print(f"{rows} rows exported as {args.format} in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,383 @@
+#!/usr/bin/env python3
+"""Generate a realistic, deterministic MiniMES dataset for profiling.
+
+The generator reads ``fields_config.json`` and produces coherent production
+history at any scale:
+
+* every batch number runs through the ``process_segments`` pipeline in
+  order, one ``batches`` row per segment with consecutive time windows;
+* each segment receives the material entries defined for it, with the
+  ``Total input`` / ``Total output`` pair derived from the other inputs and
+  a plausible yield;
+* equipment runs fall inside the segment window and their numeric
+  parameters are drawn around the configured defaults;
+* quality results are drawn around the middle of the spec limits so that a
+  small share falls outside and is marked ``不合格``.
+
+Before every chunk is written the record rows go through the compiled
+``record_validation`` validators (``validate_many``), so bulk data is
+converted and checked exactly like records entered through the API.  Rows
+are written with ``executemany`` in chunks.  The change-journal
+triggers are dropped during the load and recreated afterwards; instead of one
+entry per row the load journals a single synthetic ``dataset`` entry and marks
+everything up to it as pruned, so ETags change and clients holding an older
+``since``/``Last-Event-ID`` reload in full.  The same ``--seed`` always
+produces the same data::
+
+    python tools/generate_dataset.py --db /tmp/minimes_1m.db --batches 100000
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from contextlib import closing
+from datetime import datetime, timedelta
+from itertools import islice
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+import config  # noqa: E402
+import record_validation  # noqa: E402
+from database import Database  # noqa: E402
+
+DEFAULT_PRODUCTS = ("LF-100", "LF-200", "NCM-523", "NCM-811", "LMO-300")
+TOTAL_INPUT_CODE = "Total input"
+TOTAL_OUTPUT_CODE = "Total output"
+CHUNK_SIZE = 20000
+
+BATCH_COLUMNS = "id, batch_number, product_name, process_segment, status, start_time, end_time, created_by"
+MATERIAL_COLUMNS = ("batch_id, material_code, material_name, weight, unit, supplier, lot_number, "
+                    "record_time, recorded_by, attributes_json")
+EQUIPMENT_COLUMNS = "batch_id, equipment_code, equipment_name, parameters_json, start_time, end_time, status, recorded_by"
+QUALITY_COLUMNS = ("batch_id, test_item, test_value, unit, standard_min, standard_max, result, test_time, "
+                   "tested_by, notes, attributes_json")
+
+
+def _fmt(moment: datetime) -> str:
+    return moment.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _to_float(value: Any, default: Optional[float] = None) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+
+class DatasetGenerator:
+    """Produces the rows of one dataset; all randomness comes from ``seed``."""
+
+    def __init__(self, seed: int, batches: int, users: Dict[str, List[int]],
+                 products: Sequence[str] = DEFAULT_PRODUCTS, days: int = 365,
+                 end: Optional[datetime] = None):
+        self.rng = random.Random(seed)
+        self.batch_target = batches
+        self.users = users
+        self.products = list(products)
+        self.days = days
+        # 固定结束时间以保证同一 seed 的结果一致；默认取当天零点
+        self.end = end or datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        self.segments = config.get_process_segments()
+        self.definitions = {segment: config.get_segment_definitions(segment) for segment in self.segments}
+        self.material_extras = config.MATERIAL_RECORD_FIELDS.get("extras", [])
+        self.quality_extras = config.QUALITY_RECORD_FIELDS.get("extras", [])
+
+        self.batches: List[tuple] = []
+        self.materials: List[tuple] = []
+        self.equipment: List[tuple] = []
+        self.quality: List[tuple] = []
+
+    # 扩展字段
+    def _extra_values(self, fields: Iterable[Dict[str, Any]], pool: Sequence[str]) -> str:
+        values: Dict[str, Any] = {}
+        for field in fields:
+            field_type = field.get("type", "text")
+            if field_type == "number":
+                values[field["key"]] = round(abs(self.rng.gauss(2.0, 0.8)), 2)
+            elif field_type == "select" and field.get("options"):
+                values[field["key"]] = self.rng.choice(field["options"])
+            elif field.get("required") or self.rng.random() < 0.3:
+                values[field["key"]] = self.rng.choice(pool)
+        return json.dumps(values, ensure_ascii=False)
+
+    def _parameter_values(self, parameters: Iterable[Dict[str, Any]]) -> str:
+        values: Dict[str, Any] = {}
+        for parameter in parameters:
+            parameter_type = parameter.get("type", "text")
+            if parameter_type == "number":
+                center = _to_float(parameter.get("default"), 50.0)
+                values[parameter["key"]] = round(self.rng.gauss(center, abs(center) * 0.05 or 1.0), 2)
+            elif parameter_type == "select" and parameter.get("options"):
+                values[parameter["key"]] = self.rng.choice(parameter["options"])
+            elif parameter.get("default") not in (None, ""):
+                values[parameter["key"]] = parameter["default"]
+        return json.dumps(values, ensure_ascii=False)
+
+    # 单个工段
+    def _segment_rows(self, batch_id: int, segment: str, start: datetime, end: datetime, operator: int,
+                      inspector: int, batch_scale: float) -> None:
+        rng = self.rng
+        definitions = self.definitions[segment]
+        duration = (end - start).total_seconds()
+
+        inputs = []
+        totals = []
+        for material in definitions.get("materials", []):
+            if material.get("code") in (TOTAL_INPUT_CODE, TOTAL_OUTPUT_CODE):
+                totals.append(material)
+                continue
+            stock = _to_float(material.get("stock"), 0.0) or 200.0
+            weight = round(max(0.1, rng.lognormvariate(0, 0.25) * stock * 0.05 * batch_scale), 2)
+            inputs.append((material, weight))
+
+        total_input = sum(weight for _, weight in inputs) or round(rng.uniform(200, 2000) * batch_scale, 2)
+        total_input = round(total_input * rng.uniform(1.0, 1.03), 2)
+        derived = {
+            TOTAL_INPUT_CODE: total_input,
+            # 收率通常在 90%–99% 之间
+            TOTAL_OUTPUT_CODE: round(total_input * min(0.995, rng.gauss(0.955, 0.015)), 2),
+        }
+
+        entries = inputs + [(material, derived[material["code"]]) for material in totals]
+        for offset, (material, weight) in enumerate(entries):
+            record_time = start + timedelta(seconds=duration * (0.05 + 0.9 * offset / max(1, len(entries))))
+            self.materials.append((
+                batch_id, material.get("code"), material.get("name") or material.get("code"), weight,
+                material.get("unit") or "kg", material.get("supplier"),
+                f"L{start:%y%m%d}{rng.randrange(1000):03d}", _fmt(record_time), operator,
+                self._extra_values(self.material_extras, ("正常", "已复检", "批次混合")),
+            ))
+
+        for equipment in definitions.get("equipment", []):
+            run_start = start + timedelta(seconds=duration * rng.uniform(0.0, 0.2))
+            run_end = run_start + timedelta(seconds=duration * rng.uniform(0.5, 0.8))
+            roll = rng.random()
+            status = "故障" if roll < 0.02 else ("维护" if roll < 0.05 else "正常运行")
+            self.equipment.append((
+                batch_id, equipment.get("code"), equipment.get("name") or equipment.get("code"),
+                self._parameter_values(equipment.get("parameters", [])), _fmt(run_start), _fmt(run_end),
+                status, operator,
+            ))
+
+        for item in definitions.get("quality", []):
+            low = _to_float(item.get("min"))
+            high = _to_float(item.get("max"))
+            if low is not None and high is not None and high > low:
+                # 规格中心附近的正态分布，约 1% 落在规格外
+                value = rng.gauss((low + high) / 2, (high - low) / 5.2)
+            else:
+                value = rng.gauss(_to_float(item.get("standard_value"), 10.0) or 10.0, 1.0)
+            in_spec = (low is None or value >= low) and (high is None or value <= high)
+            test_time = end - timedelta(seconds=duration * rng.uniform(0.0, 0.1))
+            self.quality.append((
+                batch_id, item.get("item"), round(value, 3), item.get("unit"), low, high,
+                "合格" if in_spec else "不合格", _fmt(test_time), inspector, item.get("notes"),
+                self._extra_values(self.quality_extras, ("张工", "李工", item.get("device") or "标准方法")),
+            ))
+
+    def generate(self, first_batch_id: int = 1) -> Iterator[None]:
+        """Yield once per batch group after appending its rows to the buffers."""
+        rng = self.rng
+        segment_count = len(self.segments)
+        groups = -(-self.batch_target // segment_count)
+        span = timedelta(days=self.days).total_seconds()
+        operators = self.users.get("operators") or self.users["admin"]
+        inspectors = self.users.get("inspectors") or self.users["admin"]
+        batch_id = first_batch_id
+        produced = 0
+
+        for group in range(groups):
+            # 按时间顺序均匀分布批号，带少量抖动
+            group_start = self.end - timedelta(seconds=span * (1 - (group + rng.random()) / groups))
+            batch_number = f"{group_start:%y%m%d}-{group:06d}"
+            product = self.products[rng.randrange(len(self.products))]
+            batch_scale = rng.uniform(0.6, 1.4)
+            recent = group >= groups - max(1, groups // 200)
+
+            cursor_time = group_start
+            for index, segment in enumerate(self.segments):
+                if produced >= self.batch_target:
+                    break
+                segment_end = cursor_time + timedelta(hours=rng.uniform(2, 10))
+                is_last = index == segment_count - 1
+                if recent and is_last:
+                    status, end_time = "进行中", None
+                else:
+                    roll = rng.random()
+                    status = "异常" if roll < 0.01 else ("暂停" if roll < 0.02 else "已完成")
+                    end_time = _fmt(segment_end)
+                operator = operators[rng.randrange(len(operators))]
+                self.batches.append((batch_id, batch_number, product, segment, status,
+                                     _fmt(cursor_time), end_time, operator))
+                self._segment_rows(batch_id, segment, cursor_time, segment_end, operator,
+                                   inspectors[rng.randrange(len(inspectors))], batch_scale)
+                batch_id += 1
+                produced += 1
+                cursor_time = segment_end + timedelta(minutes=rng.uniform(10, 90))
+            yield
+
+
+def _drop_journal_triggers(conn) -> None:
+    names = [row[0] for row in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'trg_journal_%'"
+    )]
+    for name in names:
+        conn.execute(f'DROP TRIGGER IF EXISTS "{name}"')
+
+
+def _journal_bulk_load(conn) -> int:
+    """Record the (unjournaled) load as one synthetic journal entry and prune everything before it."""
+    seq = conn.execute(
+        "INSERT INTO change_journal (table_name, row_id, op) VALUES ('dataset', 0, 'insert')"
+    ).lastrowid
+    # since/Last-Event-ID 早于该序号的客户端会收到全量数据
+    conn.execute(
+        "INSERT OR REPLACE INTO app_meta (key, value) VALUES ('change_journal_pruned_seq', ?)", (str(seq),)
+    )
+    return seq
+
+
+def _load_users(conn) -> Dict[str, List[int]]:
+    users: Dict[str, List[int]] = {"admin": [], "operators": [], "inspectors": []}
+    for user_id, role in conn.execute("SELECT id, role FROM users ORDER BY id"):
+        if role == "admin":
+            users["admin"].append(user_id)
+        if role in ("write", "write_material"):
+            users["operators"].append(user_id)
+        if role in ("write", "write_quality"):
+            users["inspectors"].append(user_id)
+    if not users["admin"]:
+        users["admin"] = [row[0] for row in conn.execute("SELECT id FROM users ORDER BY id LIMIT 1")]
+    return users
+
+
+def validate_rows(validator: record_validation.RecordValidator, columns: str, rows: Sequence[tuple],
+                  extras_column: str) -> List[tuple]:
+    """Run ``rows`` (in ``columns`` order) through ``validator.validate_many``.
+
+    Returns the rows with the configured columns and the extras JSON replaced
+    by their converted values; raises ``ValueError`` for the first invalid row.
+    """
+    names = [name.strip() for name in columns.split(",")]
+    payloads = []
+    for row in rows:
+        payload = dict(zip(names, row))
+        payload[validator.extra_section] = json.loads(payload[extras_column] or "{}")
+        payloads.append(payload)
+
+    validated = []
+    for row, payload, (converted, extras, errors) in zip(rows, payloads, validator.validate_many(payloads)):
+        if errors:
+            raise ValueError(f"invalid generated row {row!r}: {'; '.join(errors)}")
+        payload.update(converted)
+        payload[extras_column] = json.dumps(extras, ensure_ascii=False)
+        validated.append(tuple(payload[name] for name in names))
+    return validated
+
+
+def _flush(conn, generator: DatasetGenerator) -> Tuple[int, int, int, int]:
+    counts = (len(generator.batches), len(generator.materials), len(generator.equipment), len(generator.quality))
+    materials = validate_rows(record_validation.material_validator(), MATERIAL_COLUMNS, generator.materials,
+                              "attributes_json")
+    equipment = validate_rows(record_validation.equipment_validator(), EQUIPMENT_COLUMNS, generator.equipment,
+                              "parameters_json")
+    quality = validate_rows(record_validation.quality_validator(), QUALITY_COLUMNS, generator.quality,
+                            "attributes_json")
+    conn.executemany(f"INSERT INTO batches ({BATCH_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", generator.batches)
+    conn.executemany(f"INSERT INTO material_records ({MATERIAL_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                     materials)
+    conn.executemany(f"INSERT INTO equipment_records ({EQUIPMENT_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                     equipment)
+    conn.executemany(f"INSERT INTO quality_records ({QUALITY_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                     quality)
+    for buffer in (generator.batches, generator.materials, generator.equipment, generator.quality):
+        buffer.clear()
+    return counts
+
+
+def generate_dataset(db_path: str, batches: int, seed: int = 1, days: int = 365,
+                     products: Sequence[str] = DEFAULT_PRODUCTS, end: Optional[datetime] = None,
+                     chunk_size: int = CHUNK_SIZE, quiet: bool = True) -> Dict[str, int]:
+    """Append ``batches`` batch rows (plus records) to the database at ``db_path``."""
+    database = Database(db_path)
+    totals = {"batches": 0, "materials": 0, "equipment": 0, "quality": 0}
+    started = time.perf_counter()
+
+    conn = database.get_connection()
+    try:
+        conn.execute("PRAGMA synchronous = OFF")
+        _drop_journal_triggers(conn)
+        conn.commit()
+
+        first_id = (conn.execute("SELECT COALESCE(MAX(id), 0) FROM batches").fetchone()[0] or 0) + 1
+        generator = DatasetGenerator(seed, batches, _load_users(conn), products=products, days=days, end=end)
+        for _ in generator.generate(first_id):
+            if len(generator.materials) + len(generator.quality) + len(generator.equipment) < chunk_size:
+                continue
+            for key, count in zip(totals, _flush(conn, generator)):
+                totals[key] += count
+            conn.commit()
+            if not quiet:
+                elapsed = time.perf_counter() - started
+                print(f"  {totals['batches']:>10} batches  {elapsed:8.1f}s", file=sys.stderr)
+        for key, count in zip(totals, _flush(conn, generator)):
+            totals[key] += count
+        conn.commit()
+    finally:
+        # 重新创建变更日志触发器（迁移方法均为幂等的 IF NOT EXISTS）
+        cursor = conn.cursor()
+        database._migrate_change_journal(cursor)
+        database._migrate_reference_journal(cursor)
+        _journal_bulk_load(conn)
+        conn.commit()
+        conn.close()
+
+    return totals
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Generate a deterministic MiniMES dataset")
+    parser.add_argument("--db", required=True, help="target SQLite file (created when missing)")
+    parser.add_argument("--batches", type=int, default=10000, help="number of batch rows (segments) to create")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--days", type=int, default=365, help="history length the batches are spread over")
+    parser.add_argument("--end-date", help="last day of the history (YYYY-MM-DD); defaults to today")
+    parser.add_argument("--products", help="comma separated product names")
+    parser.add_argument("--config", help="fields_config.json to use instead of the project file")
+    parser.add_argument("--force", action="store_true", help="append even if the database already has batches")
+    args = parser.parse_args(argv)
+
+    if args.config:
+        config.FIELDS_CONFIG_PATH = os.path.abspath(args.config)
+    end = datetime.strptime(args.end_date, "%Y-%m-%d") if args.end_date else None
+    products = [p.strip() for p in args.products.split(",") if p.strip()] if args.products else DEFAULT_PRODUCTS
+
+    if os.path.exists(args.db) and not args.force:
+        existing = Database(args.db)
+        with closing(existing.get_connection()) as conn:
+            if conn.execute("SELECT COUNT(*) FROM batches").fetchone()[0]:
+                parser.error(f"{args.db} already contains batches; use --force to append")
+
+    started = time.perf_counter()
+    totals = generate_dataset(args.db, args.batches, seed=args.seed, days=args.days,
+                              products=products, end=end, quiet=False)
+    elapsed = time.perf_counter() - started
+    rows = sum(totals.values())
+    print(
+        f"{totals['batches']} batches, {totals['materials']} material, {totals['equipment']} equipment and "
+        f"{totals['quality']} quality records written to {args.db} in {elapsed:.1f}s ({rows / elapsed:,.0f} rows/s)"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,134 @@
+"""Single-writer group commit for record writes.
+
+Request handlers pass write operations (``operation(conn)`` callables) to
+``Database.run_write``.  One writer thread per process executes them on its
+own connection: everything queued within ``WRITE_QUEUE_WINDOW_MS`` (up to
+``WRITE_QUEUE_MAX_BATCH`` operations) runs in a single ``BEGIN IMMEDIATE``
+transaction, each operation inside its own savepoint, and is committed
+together, so concurrent terminals share one write lock acquisition and one
+fsync instead of queueing on the SQLite lock.
+
+An operation that raises is rolled back to its savepoint and its exception is
+re-raised in the caller; the other operations of the group still commit.
+Callers only get their result after the commit succeeded.  Operations must
+not commit or open transactions themselves.
+"""
+
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError
+
+import config
+import metrics
+
+logger = logging.getLogger('minimes.write_queue')
+
+GROUP_SIZE = metrics.registry.register(metrics.Histogram(
+    'minimes_write_group_size', 'Write operations committed per group commit.',
+    buckets=metrics.DEFAULT_COUNT_BUCKETS))
+COMMIT_DURATION = metrics.registry.register(metrics.Histogram(
+    'minimes_write_commit_seconds', 'Duration of one group commit transaction, including the commit.'))
+
+
+class WriteQueue:
+    def __init__(self, database):
+        self.database = database
+        self._lock = threading.Lock()
+        self._queue = None
+        self._thread = None
+        self._pid = None
+        self._conn = None
+
+    def submit(self, operation):
+        """Queue ``operation(conn)``; returns a ``Future`` resolved after the commit."""
+        future = Future()
+        self._get_queue().put((future, operation))
+        return future
+
+    def run(self, operation, timeout=None):
+        """Execute ``operation(conn)`` in the next group commit and return its result."""
+        if threading.current_thread() is self._thread:
+            # 在写线程内部嵌套调用时直接执行，避免自己等待自己
+            return operation(self._conn)
+        future = self.submit(operation)
+        try:
+            return future.result(timeout)
+        except TimeoutError:
+            # 已开始执行的操作不能撤回，只能等待其提交结果
+            if future.cancel():
+                raise
+            return future.result()
+
+    def _get_queue(self):
+        pid = os.getpid()
+        # 预派生的工作进程不能复用父进程的队列和线程
+        if self._pid != pid or not self._thread.is_alive():
+            with self._lock:
+                if self._pid != pid or not self._thread.is_alive():
+                    self._queue = queue.SimpleQueue()
+                    self._thread = threading.Thread(
+                        target=self._run, args=(self._queue,), name='db-writer', daemon=True
+                    )
+                    self._pid = pid
+                    self._thread.start()
+        return self._queue
+
+    def _run(self, pending):
+        self._conn = self.database.get_connection()
+        # 手动控制事务
+        self._conn.isolation_level = None
+        window = getattr(config, 'WRITE_QUEUE_WINDOW_MS', 1) / 1000
+        max_batch = max(1, getattr(config, 'WRITE_QUEUE_MAX_BATCH', 64))
+        while True:
+            batch = [pending.get()]
+            deadline = time.monotonic() + window
+            while len(batch) < max_batch:
+                try:
+                    batch.append(pending.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            self._commit_group(batch)
+
+    def _commit_group(self, batch):
+        conn = self._conn
+        outcomes = []
+        started = time.perf_counter()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            for future, operation in batch:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                conn.execute('SAVEPOINT write_op')
+                try:
+                    result = operation(conn)
+                except Exception as exc:
+                    conn.execute('ROLLBACK TO write_op')
+                    conn.execute('RELEASE write_op')
+                    outcomes.append((future, None, exc))
+                else:
+                    conn.execute('RELEASE write_op')
+                    outcomes.append((future, result, None))
+            conn.execute('COMMIT')
+        except Exception as exc:
+            logger.exception('group commit of %d writes failed', len(batch))
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            # 整组回滚：所有调用方都收到提交失败的异常；
+            # BEGIN 失败时操作尚未开始，未取消的也要通知，否则调用方只能等到超时
+            for future, _ in batch:
+                if future.done():
+                    continue
+                if future.running() or future.set_running_or_notify_cancel():
+                    future.set_exception(exc)
+            return
+
+        GROUP_SIZE.observe(len(outcomes))
+        COMMIT_DURATION.observe(time.perf_counter() - started)
+        for future, result, exc in outcomes:
+            if exc is None:
+                future.set_result(result)
+            else:
+                future.set_exception(exc)